@@ -6,6 +6,11 @@ import datetime
 import json
 import time
 import argparse
+import concurrent.futures
+import fcntl
+import hashlib
+import shutil
+import threading
 
 pathlist = os.path.realpath(__file__).split(os.path.sep)
 RTXindex = pathlist.index("RTX")
@@ -14,12 +19,33 @@ from RTXConfiguration import RTXConfiguration
 
 knowledge_sources_filepath = os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'KnowledgeSources'])
 versions_path = os.path.sep.join([knowledge_sources_filepath, 'db_versions.json'])
+config_paths = [os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', config_file_name])
+                for config_file_name in ('config_local.json', 'configv2.json')]
 
 
 class ARAXDatabaseManager:
-    def __init__(self, live = "Production"):
+    max_parallel_downloads = 4
+    checksum_suffix = ".sha256"
+    update_lock_path = os.path.sep.join([knowledge_sources_filepath, 'db_update.lock'])
+    # Indexes and tables built alongside a database and named after its file ((suffix, is_directory) for each), which
+    # are fetched along with it; the databases' readers fall back to the database itself when one is missing or stale.
+    # One that can't be fetched is listed under 'unavailable_companions' in the versions file, so that it is not tried
+    # again until the database itself is updated
+    companion_suffixes = {
+        'node_synonymizer': [('.concept_index', True), ('.category_expansions.json', False)],
+        'autocomplete': [('.term_index', True)],
+    }
+    _version_check_results = dict()
+    _version_check_lock = threading.Lock()
+
+    def __init__(self, live = "Production", source_dir = None):
+        """
+        source_dir: optionally, a local directory to copy databases (and their .sha256 files) from instead of the
+        remote database server (e.g., for testing)
+        """
         self.RTXConfig = RTXConfiguration()
         self.RTXConfig.live = live
+        self.source_dir = source_dir
 
         pathlist = os.path.realpath(__file__).split(os.path.sep)
         RTXindex = pathlist.index("RTX")
@@ -139,81 +165,319 @@ class ARAXDatabaseManager:
             }
         }
 
-    def update_databases(self, debug = False, response = None):
-        if os.path.exists(versions_path): # check if the versions file exists
-            with open(versions_path,"r") as fid:
-                local_versions = json.load(fid)
-            for database_name, local_path in self.local_paths.items(): # iterate through all databases
-                if database_name not in local_versions: # if database is not present locally
-                    if debug:
-                        print(f"{database_name} not present locally, downloading now...")
-                    if response is not None:
-                        response.debug(f"Updating the local file for {database_name}...")
-                    self.download_database(remote_location=self.remote_locations[database_name], local_path=self.local_paths[database_name], remote_path=self.docker_paths[database_name], debug=debug)
-                elif local_versions[database_name]['version'] != self.db_versions[database_name]['version']: # If database is present but wrong version
-                    if debug:
-                        print(f"{database_name} has a local version, '{local_versions[database_name]['version']}', which does not match the remote version, '{self.db_versions[database_name]['version']}'.")
-                        print("downloading remote version...")
-                    if response is not None:
-                        response.debug(f"Updating the local file for {database_name}...")
-                    self.download_database(remote_location=self.remote_locations[database_name], local_path=self.local_paths[database_name], remote_path=self.docker_paths[database_name], debug=debug)
-                    if os.path.exists(self.local_paths[database_name]): # check that download worked if so remove old version
-                        if debug:
-                            print("Download successful. Removing local version...")
-                        if os.path.exists(local_versions[database_name]['path']):
-                            os.system(f"rm {local_versions[database_name]['path']}") 
-                    else:
+    def update_databases(self, debug = False, response = None, verify_checksums = False):
+        """
+        Brings all local databases up to the versions in the config. Outdated or missing databases are fetched in
+        parallel (at most max_parallel_downloads at a time); each is verified and then swapped into place atomically,
+        so processes that are already running keep reading the previous copy until the new one is complete. Only one
+        process updates at a time: if another one already is, this returns right away and the current local copies
+        continue to be used.
+        """
+        local_versions = self._load_local_versions()
+        if local_versions is None: # If database manager has never been run download all databases
+            if debug:
+                print("No local verson json file present. Downloading all databases...")
+            if response is not None:
+                response.debug(f"No local verson json file present. Downloading all databases...")
+            local_versions = dict()
+            databases_to_update = list(self.local_paths)
+        else:
+            databases_to_update = self._get_databases_to_update(local_versions, debug=debug, verify_checksums=verify_checksums)
+        companions_to_update = []
+        for database_name in set(self.local_paths).difference(databases_to_update):
+            if debug:
+                print(f"Local version of {database_name} matches the remote version, skipping...")
+            self.db_versions[database_name] = local_versions[database_name]
+            if self._get_missing_companions(database_name, local_versions[database_name]):
+                companions_to_update.append(database_name)
+        if not databases_to_update and not companions_to_update:
+            return response
+
+        if not self._acquire_update_lock():
+            message = "Another process is already updating the local databases; using the current local copies for now"
+            if debug:
+                print(message)
+            if response is not None:
+                response.warning(message)
+            return response
+        try:
+            if response is not None:
+                response.debug(f"Updating the local files for {', '.join(databases_to_update)}...")
+            download_results = self._download_databases(databases_to_update, debug=debug)
+            failed_databases = set()
+            for database_name in databases_to_update:
+                new_path = self.local_paths[database_name]
+                old_path = local_versions.get(database_name, dict()).get('path')
+                if download_results.get(database_name):
+                    self.db_versions[database_name].update(download_results[database_name])
+                    if old_path and old_path != new_path and os.path.exists(old_path): # download worked so remove old version
                         if debug:
-                            print(f"Error downloading {database_name} leaving local copy.")
-                        if response is not None:
-                            response.warning(f"Error downloading {database_name} reverting to using local copy.") 
-                        self.db_versions[database_name] = local_versions[database_name]
-                elif not os.path.exists(self.local_paths[database_name]): # If database file is missing
+                            print(f"Download of {database_name} successful. Removing local version...")
+                        os.remove(old_path)
+                elif old_path and os.path.exists(old_path):
                     if debug:
-                        print(f"{database_name} not present locally, downloading now...")
+                        print(f"Error downloading {database_name} leaving local copy.")
                     if response is not None:
-                        response.debug(f"Updating the local file for {database_name}...")
-                    self.download_database(remote_location=self.remote_locations[database_name], local_path=self.local_paths[database_name], remote_path=self.docker_paths[database_name], debug=debug)
+                        response.warning(f"Error downloading {database_name} reverting to using local copy.")
+                    self.db_versions[database_name] = local_versions[database_name]
                 else:
                     if debug:
-                        print(f"Local version of {database_name} matches the remote version, skipping...")
-            self.write_db_versions_file()
-        else: # If database manager has never been run download all databases
-            if debug:
-                print("No local verson json file present. Downloading all databases...")
-            if response is not None:
-                response.debug(f"No local verson json file present. Downloading all databases...")
-            self.force_download_all(debug=debug)
-            self.write_db_versions_file()
+                        print(f"Error downloading {database_name}; no local copy is available.")
+                    if response is not None:
+                        response.warning(f"Error downloading {database_name}; no local copy is available.")
+                    failed_databases.add(database_name)
+            for database_name in companions_to_update:
+                if debug:
+                    print(f"Fetching the missing companion files of {database_name}...")
+                failed_suffixes = self.download_companions(database_name, remote_location=self.remote_locations[database_name],
+                                                           local_path=self.local_paths[database_name],
+                                                           remote_path=self.docker_paths[database_name], debug=debug)
+                if failed_suffixes:
+                    unavailable_suffixes = self.db_versions[database_name].get('unavailable_companions', [])
+                    self.db_versions[database_name] = {**self.db_versions[database_name],
+                                                       'unavailable_companions': sorted(set(unavailable_suffixes).union(failed_suffixes))}
+            self.write_db_versions_file(debug=debug, exclude=failed_databases)
+        finally:
+            self._release_update_lock()
         return response
 
+    @classmethod
+    def databases_need_update(cls, live="Production"):
+        """
+        A cheap, process-level version of check_versions() for use on every query: the full check (which parses the
+        config and the versions file and stats every database) is only redone when the versions file, the config file
+        or any of the local databases or their companions (as of the last check) has appeared, disappeared or changed
+        since the last check in this process, or after invalidate_version_check() is called. The result is inherited
+        by forked child processes.
+        """
+        config_key = (live, *(cls._get_mtime(path) for path in [versions_path, *config_paths]))
+        with cls._version_check_lock:
+            cached_result = cls._version_check_results.get(live)
+        if cached_result is not None:
+            cached_config_key, watched_paths, files_key, need_update = cached_result
+            if cached_config_key == config_key and cls._get_files_key(watched_paths) == files_key:
+                return need_update
+        manager = cls(live)
+        watched_paths = manager._get_watched_paths()
+        files_key = cls._get_files_key(watched_paths)
+        need_update = manager.check_versions()
+        with cls._version_check_lock:
+            cls._version_check_results[live] = (config_key, watched_paths, files_key, need_update)
+        return need_update
+
+    @classmethod
+    def invalidate_version_check(cls):
+        with cls._version_check_lock:
+            cls._version_check_results = dict()
+
+    @staticmethod
+    def _get_mtime(file_path):
+        try:
+            return os.stat(file_path).st_mtime_ns
+        except OSError:
+            return None
+
+    @classmethod
+    def _get_files_key(cls, file_paths):
+        return tuple(cls._get_mtime(file_path) for file_path in file_paths)
+
+    def _get_watched_paths(self):
+        # The local databases and their companions, whose existence and modification times the version check depends on
+        watched_paths = []
+        for database_name, local_path in self.local_paths.items():
+            watched_paths.append(local_path)
+            watched_paths.extend(f"{local_path}{suffix}" for suffix, _ in self.companion_suffixes.get(database_name, []))
+        return watched_paths
+
     def check_versions(self, debug=False):
-        download_flag = False
-        if os.path.exists(versions_path):
-            with open(versions_path,"r") as fid:
-                local_versions = json.load(fid)
-            for database_name, local_path in self.local_paths.items():
-                if database_name not in local_versions:
-                    if debug:
-                        print(f"{database_name} not present locally")
-                    download_flag = True
-                elif local_versions[database_name]['version'] != self.db_versions[database_name]['version']:
-                    if debug:
-                        print(f"{database_name} has a local version, '{local_versions[database_name]['version']}', which does not match the remote version, '{self.db_versions[database_name]['version']}'.")
-                    download_flag = True
-                elif not os.path.exists(local_path):
-                    if debug:
-                        print(f"{database_name} not present locally")
-                    download_flag = True
-                else:
+        local_versions = self._load_local_versions()
+        if local_versions is None:
+            if debug:
+                print("No local verson json file present")
+            return True
+        if len(self._get_databases_to_update(local_versions, debug=debug)) > 0:
+            return True
+        return any(self._get_missing_companions(database_name, local_versions[database_name]) for database_name in self.local_paths)
+
+    def verify_checksums(self, debug=False):
+        """
+        Re-computes the checksums of all local databases and returns the names of those that don't match the
+        checksums recorded in the versions file.
+        """
+        local_versions = self._load_local_versions()
+        if local_versions is None:
+            return list(self.local_paths)
+        return self._get_databases_to_update(local_versions, debug=debug, verify_checksums=True)
+
+    def _load_local_versions(self):
+        if not os.path.exists(versions_path): # check if the versions file exists
+            return None
+        try:
+            with open(versions_path, "r") as fid:
+                return json.load(fid)
+        except ValueError:
+            return None
+
+    def _get_databases_to_update(self, local_versions, debug=False, verify_checksums=False):
+        databases_to_update = []
+        for database_name, local_path in self.local_paths.items(): # iterate through all databases
+            local_version = local_versions.get(database_name)
+            if local_version is None: # if database is not present locally
+                if debug:
+                    print(f"{database_name} not present locally")
+                databases_to_update.append(database_name)
+            elif local_version['version'] != self.db_versions[database_name]['version']: # If database is present but wrong version
+                if debug:
+                    print(f"{database_name} has a local version, '{local_version['version']}', which does not match the remote version, '{self.db_versions[database_name]['version']}'.")
+                databases_to_update.append(database_name)
+            elif not os.path.exists(local_path): # If database file is missing
+                if debug:
+                    print(f"{database_name} not present locally")
+                databases_to_update.append(database_name)
+            elif local_version.get('size') is not None and os.path.getsize(local_path) != local_version['size']:
+                if debug:
+                    print(f"{database_name} is not the size recorded in the versions file (it may be incomplete)")
+                databases_to_update.append(database_name)
+            elif verify_checksums and local_version.get('sha256') and self._compute_checksum(local_path) != local_version['sha256']:
+                if debug:
+                    print(f"{database_name} does not match the checksum recorded in the versions file")
+                databases_to_update.append(database_name)
+        return databases_to_update
+
+    def _download_databases(self, database_names, debug=False, remote_locations=None):
+        """
+        Downloads the given databases concurrently. Returns a dictionary mapping each database name to the checksum
+        info of its new local file (or None if its download failed).
+        """
+        remote_locations = remote_locations if remote_locations else self.remote_locations
+        download_results = dict()
+        if not database_names:
+            return download_results
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_parallel_downloads, len(database_names))) as executor:
+            futures = {executor.submit(self._download_database_and_companions, database_name,
+                                       remote_location=remote_locations[database_name],
+                                       local_path=self.local_paths[database_name],
+                                       remote_path=self.docker_paths[database_name], debug=debug): database_name
+                       for database_name in database_names}
+            for future in concurrent.futures.as_completed(futures):
+                database_name = futures[future]
+                try:
+                    download_results[database_name] = future.result()
+                except Exception as e:
                     if debug:
-                        print(f"Local version of {database_name} matches the remote version")
+                        print(f"Error downloading {database_name}: {e}")
+                    download_results[database_name] = None
+        return download_results
+
+    def _download_database_and_companions(self, database_name, remote_location, local_path, remote_path, debug=False):
+        download_result = self.download_database(remote_location=remote_location, local_path=local_path,
+                                                 remote_path=remote_path, debug=debug)
+        if download_result:
+            failed_suffixes = self.download_companions(database_name, remote_location=remote_location, local_path=local_path,
+                                                       remote_path=remote_path, debug=debug)
+            if failed_suffixes:
+                download_result = {**download_result, 'unavailable_companions': failed_suffixes}
+        return download_result
+
+    def _get_missing_companions(self, database_name, local_version):
+        # Those that aren't there, other than those that couldn't be fetched for this version of the database
+        local_path = self.local_paths[database_name]
+        unavailable_suffixes = local_version.get('unavailable_companions', [])
+        return [suffix for suffix, _ in self.companion_suffixes.get(database_name, [])
+                if suffix not in unavailable_suffixes and not os.path.exists(f"{local_path}{suffix}")]
+
+    def download_companions(self, database_name, remote_location, local_path, remote_path, debug=False):
+        """
+        Fetches the companion files of a database that has already been brought up to date. Returns the suffixes of
+        those that could not be fetched (any previous copy of those is removed, since it would be out of date).
+        """
+        failed_suffixes = []
+        for suffix, is_directory in self.companion_suffixes.get(database_name, []):
+            companion_remote_path = f"{remote_path}{suffix}" if remote_path is not None else None
+            if is_directory:
+                download_result = self.download_directory(remote_location=f"{remote_location}{suffix}",
+                                                          local_path=f"{local_path}{suffix}",
+                                                          remote_path=companion_remote_path, database_path=local_path,
+                                                          debug=debug)
+            else:
+                download_result = self.download_database(remote_location=f"{remote_location}{suffix}",
+                                                         local_path=f"{local_path}{suffix}",
+                                                         remote_path=companion_remote_path, debug=debug)
+            if not download_result:
+                if debug:
+                    print(f"Unable to fetch {remote_location.split('/')[-1]}{suffix}; it will be rebuilt or done without")
+                self._remove_path(f"{local_path}{suffix}")
+                failed_suffixes.append(suffix)
+        return failed_suffixes
+
+    def download_directory(self, remote_location, local_path, remote_path, database_path, debug=False):
+        """
+        Like download_database(), but for a directory (an index built alongside a database). The new copy is only
+        swapped in if its metadata.json matches the database at database_path (when it records the database's size).
+        Returns True if the directory was fetched.
+        """
+        partial_path = f"{local_path}.partial"
+        if self.source_dir is None and remote_path is not None and os.path.exists(remote_path): # if on the server symlink instead of downloading
+            self._remove_path(partial_path)
+            self.symlink_database(local_path=partial_path, remote_path=remote_path)
+        elif self.source_dir is not None:
+            source_path = os.path.join(self.source_dir, remote_location.split('/')[-1])
+            if not os.path.isdir(source_path):
+                if debug:
+                    print(f"{source_path} does not exist")
+                return False
+            self._remove_path(partial_path)
+            shutil.copytree(source_path, partial_path)
         else:
+            self._seed_partial(local_path, partial_path)
+            if not self.rsync_database(remote_location=f"{remote_location}/", local_path=f"{partial_path}/", debug=debug, recursive=True):
+                return False  # The partial directory is kept so the next attempt can pick up where this one left off
+        try:
+            with open(os.path.join(partial_path, 'metadata.json'), "r") as fid:
+                metadata = json.load(fid)
+        except (OSError, ValueError):
+            metadata = None
+        if not isinstance(metadata, dict) or metadata.get('database_size', os.path.getsize(database_path)) != os.path.getsize(database_path):
             if debug:
-                print("No local verson json file present")
-            download_flag = True
-        return download_flag
+                print(f"Downloaded {remote_location.split('/')[-1]} does not match {database_path}")
+            self._remove_path(partial_path)
+            return False
+        old_path = f"{local_path}.{os.getpid()}.old"
+        if os.path.lexists(local_path):
+            os.rename(local_path, old_path)
+        os.rename(partial_path, local_path)
+        self._remove_path(old_path)
+        return True
+
+    @staticmethod
+    def _remove_path(path):
+        if os.path.islink(path) or os.path.isfile(path):
+            os.remove(path)
+        elif os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
 
+    def _acquire_update_lock(self):
+        # An flock (rather than the lock file's existence) is what's held, so the kernel releases it if the updating
+        # process dies and there is never a stale lock to take over
+        lock_file_descriptor = os.open(self.update_lock_path, os.O_CREAT | os.O_WRONLY)
+        try:
+            fcntl.flock(lock_file_descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(lock_file_descriptor)
+            return False
+        os.ftruncate(lock_file_descriptor, 0)
+        os.write(lock_file_descriptor, str(os.getpid()).encode())
+        self._update_lock_file_descriptor = lock_file_descriptor
+        return True
+
+    def _release_update_lock(self):
+        # The lock file itself is left in place; removing it would let a process that already opened it lock a file
+        # that a third process can no longer see
+        lock_file_descriptor = getattr(self, "_update_lock_file_descriptor", None)
+        if lock_file_descriptor is not None:
+            self._update_lock_file_descriptor = None
+            fcntl.flock(lock_file_descriptor, fcntl.LOCK_UN)
+            os.close(lock_file_descriptor)
 
     def check_date(self, file_path, max_days = 31):
         if os.path.exists(file_path):
@@ -228,19 +492,100 @@ class ARAXDatabaseManager:
             return True
 
     def download_database(self, remote_location, local_path, remote_path, debug=False):
-        if remote_path is not None and os.path.exists(remote_path): # if on the server symlink instead of downloading
-            self.symlink_database(local_path=local_path, remote_path=remote_path)
+        """
+        Fetches a database into a temporary file next to local_path and only moves it into place once it's complete
+        and its checksum matches the one published alongside it (if any), so an interrupted or corrupted download
+        never replaces a working copy. Returns the new file's checksum info, or None if the download failed.
+        """
+        partial_path = f"{local_path}.partial"
+        if self.source_dir is None and remote_path is not None and os.path.exists(remote_path): # if on the server symlink instead of downloading
+            self.symlink_database(local_path=partial_path, remote_path=remote_path)
+            os.replace(partial_path, local_path)
+            return {'size': os.path.getsize(local_path)}
+        if self.source_dir is not None:
+            source_path = os.path.join(self.source_dir, remote_location.split('/')[-1])
+            if not os.path.exists(source_path):
+                if debug:
+                    print(f"{source_path} does not exist")
+                return None
+            shutil.copyfile(source_path, partial_path)
         else:
-            self.rsync_database(remote_location=remote_location, local_path=local_path, debug=debug)
+            self._seed_partial(local_path, partial_path)
+            if not self.rsync_database(remote_location=remote_location, local_path=partial_path, debug=debug):
+                return None  # The partial file is kept so the next attempt can pick up where this one left off
+        checksum = self._compute_checksum(partial_path)
+        expected_checksum = self._get_published_checksum(remote_location, local_path, debug=debug)
+        if expected_checksum is not None and expected_checksum != checksum:
+            if debug:
+                print(f"Checksum of downloaded {remote_location.split('/')[-1]} ({checksum}) does not match the published checksum ({expected_checksum})")
+            os.remove(partial_path)
+            return None
+        size = os.path.getsize(partial_path)
+        if os.path.exists(local_path) and os.path.samefile(partial_path, local_path):
+            os.remove(partial_path)  # rsync found nothing to change in the seeded copy (and rename() won't replace a file with itself)
+        else:
+            os.replace(partial_path, local_path)
+        return {'sha256': checksum, 'size': size}
+
+    def _seed_partial(self, local_path, partial_path):
+        """
+        Starts a download from the current local copy of a file or directory (hard-linked, or else copied) unless an
+        earlier one left a partial copy, so that rsync only transfers what has changed. rsync writes each file it
+        updates to a temporary file and renames that into place, so the local copy itself is never modified.
+        """
+        if os.path.lexists(partial_path) or os.path.islink(local_path) or not os.path.exists(local_path):
+            return
+        for copy_function in (os.link, shutil.copy2):
+            try:
+                if os.path.isdir(local_path):
+                    shutil.copytree(local_path, partial_path, copy_function=copy_function)
+                else:
+                    copy_function(local_path, partial_path)
+                return
+            except OSError:
+                self._remove_path(partial_path)
+
+    def _get_published_checksum(self, remote_location, local_path, debug=False):
+        """
+        Returns the sha256 published next to the database (in a '<file>.sha256' file, as written by sha256sum), or
+        None if there isn't one.
+        """
+        checksum_location = f"{remote_location}{self.checksum_suffix}"
+        if self.source_dir is not None:
+            checksum_path = os.path.join(self.source_dir, checksum_location.split('/')[-1])
+        else:
+            checksum_path = f"{local_path}{self.checksum_suffix}.partial"
+            if os.system(f"rsync -Lq {checksum_location} {checksum_path} 2>/dev/null") != 0:
+                if debug:
+                    print(f"No published checksum found for {remote_location.split('/')[-1]}")
+                return None
+        if not os.path.exists(checksum_path):
+            return None
+        with open(checksum_path, "r") as fid:
+            contents = fid.read().split()
+        if self.source_dir is None:
+            os.remove(checksum_path)
+        return contents[0].lower() if contents else None
+
+    @staticmethod
+    def _compute_checksum(file_path):
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as fid:
+            for block in iter(lambda: fid.read(8 * 1024 * 1024), b""):
+                sha256.update(block)
+        return sha256.hexdigest()
 
     def symlink_database(self, local_path, remote_path):
-        os.system(f"ln -s {remote_path} {local_path}")
+        if os.path.lexists(local_path):
+            os.remove(local_path)
+        os.symlink(remote_path, local_path)
 
-    def rsync_database(self, remote_location, local_path, debug=False):
+    def rsync_database(self, remote_location, local_path, debug=False, recursive=False):
         verbose = ""
         if debug:
             verbose = "vv"
-        os.system(f"rsync -Lhzc{verbose} --progress {remote_location} {local_path}")
+        recursive_options = " -r --delete" if recursive else ""
+        return os.system(f"rsync -Lhzc{verbose}{recursive_options} --partial --progress {remote_location} {local_path}") == 0
 
     def download_to_mnt(self, debug=False, skip_if_exists=False):
         for database_name in self.remote_locations.keys():
@@ -255,15 +600,16 @@ class ARAXDatabaseManager:
             if not skip_if_exists or not os.path.exists(local_path):
                 remote_location = self.remote_locations[database_name]
                 print(f"Initiating download from location {remote_location}") if debug else None
-                self.download_database(remote_location=remote_location, local_path=local_path, remote_path=None, debug=debug)
+                self._download_database_and_companions(database_name, remote_location=remote_location, local_path=local_path, remote_path=None, debug=debug)
             else:
                 print(f"  Database already exists, no need to download") if debug else None
                 
     def force_download_all(self, debug=False):
-        for database_name in self.remote_locations.keys():
-            if debug:
-                print(f"Downloading {self.remote_locations[database_name].split('/')[-1]}...")
-            self.download_database(remote_location=self.remote_locations[database_name], local_path=self.local_paths[database_name], remote_path=self.docker_paths[database_name], debug=debug)
+        if debug:
+            print(f"Downloading {', '.join(location.split('/')[-1] for location in self.remote_locations.values())}...")
+        for database_name, download_result in self._download_databases(list(self.remote_locations), debug=debug).items():
+            if download_result:
+                self.db_versions[database_name].update(download_result)
     
     def download_slim(self, debug=False):
         for database_name in self.remote_locations.keys():
@@ -285,10 +631,7 @@ class ARAXDatabaseManager:
         metakg_docker_path = "/mnt/data/orangeboard/production/RTX/code/ARAX/ARAXQuery/Expand/meta_map_v2.pickle"
         self.download_database(remote_location=metakg_remote_location, local_path=metakg_filepath, 
                                 remote_path=metakg_docker_path, debug=debug)
-        with open(versions_path,"w") as fid:
-            if debug:
-                print("Saving new version file...")
-            json.dump(self.db_versions, fid)
+        self.write_db_versions_file(debug=debug)
 
     def check_all(self, max_days=31, debug=False):
         update_flag = False
@@ -320,10 +663,13 @@ class ARAXDatabaseManager:
                     print(f"{database_name} not present or older than {max_days} days. Updating file...")
                 self.download_database(remote_location=self.remote_locations[database_name], local_path=local_path, remote_path=self.docker_paths[database_name], debug=debug)
 
-    def write_db_versions_file(self, debug=False):
+    def write_db_versions_file(self, debug=False, exclude=()):
         print(f"saving new version file to {versions_path}") if debug else None
-        with open(versions_path, "w") as fid:
-            json.dump(self.db_versions, fid)
+        temp_versions_path = f"{versions_path}.{os.getpid()}.tmp"
+        with open(temp_versions_path, "w") as fid:
+            json.dump({database_name: db_version for database_name, db_version in self.db_versions.items()
+                       if database_name not in exclude}, fid)
+        os.replace(temp_versions_path, versions_path)
 
         
 def main():
@@ -335,8 +681,13 @@ def main():
     parser.add_argument("-s", "--slim", action='store_true')
     parser.add_argument("-g", "--generate-versions-file", action='store_true', dest="generate_versions_file", required=False, help="just generate the db_versions.json file and do nothing else (ONLY USED IN TESTING/DEBUGGING)")
     parser.add_argument("-e", "--skip-if-exists", action='store_true', dest='skip_if_exists', required=False, help="for -m mode only, do not download a file if it already exists under /mnt/data/orangeboard/databases/KG2.X.X")
+    parser.add_argument("-d", "--source-dir", type=str, dest="source_dir", required=False, help="copy databases from this local directory instead of the remote database server (e.g., for testing)")
+    parser.add_argument("-p", "--parallel", type=int, required=False, help=f"maximum number of databases to download at once (default {ARAXDatabaseManager.max_parallel_downloads})")
+    parser.add_argument("-v", "--verify", action='store_true', required=False, help="also re-compute the checksums of local databases and re-download any that don't match the versions file")
     arguments = parser.parse_args()
-    DBManager = ARAXDatabaseManager(arguments.live)
+    DBManager = ARAXDatabaseManager(arguments.live, source_dir=arguments.source_dir)
+    if arguments.parallel:
+        DBManager.max_parallel_downloads = arguments.parallel
     if arguments.check_local:
         if not DBManager.check_versions(debug=True):
             print("All local versions are up to date")
@@ -349,7 +700,7 @@ def main():
     elif arguments.generate_versions_file:
         DBManager.write_db_versions_file(debug=True)
     else:
-        DBManager.update_databases(debug=True)
+        DBManager.update_databases(debug=True, verify_checksums=arguments.verify)
 
 if __name__ == "__main__":
     main()
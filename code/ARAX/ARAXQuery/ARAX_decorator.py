@@ -3,13 +3,15 @@ import copy
 import os
 import sqlite3
 import sys
-from collections import defaultdict
-from typing import List, Dict, Optional, Tuple, Union
+import threading
+from collections import defaultdict, OrderedDict
+from typing import List, Dict, Optional, Set, Tuple, Union, Iterable
 
 import ujson
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # ARAXQuery directory
 from ARAX_response import ARAXResponse
+from sqlite_connection_registry import SqliteConnectionRegistry
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")  # code directory
 from RTXConfiguration import RTXConfiguration
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
@@ -21,6 +23,22 @@ def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
 
 class ARAXDecorator:
 
+    # KG2c lookups are shared by all decorators in a process: connections come from the shared registry (one per
+    # thread), and decoded node/edge properties are kept in an LRU across queries
+    sqlite_lookup_chunk_size = 900  # Stay under SQLite's default limit on the number of bound parameters
+    node_cache_size = 50000
+    edge_cache_size = 50000
+    _cache_lock = threading.Lock()
+    _cache_sqlite_path = None
+    _node_cache = OrderedDict()
+    _edge_cache = OrderedDict()
+
+    # Bulky attributes that no ARAXi step looks at; in lazy mode these are only added (by
+    # decorate_deferred_attributes()) to the nodes/edges that are still in the answer when the response is returned
+    deferred_node_attributes = {"all_names", "equivalent_curies", "publications"}
+    deferred_edge_attributes = {"publications_info"}
+    _deferred_decorations_attribute = "_deferred_decorations"
+
     def __init__(self):
         self.node_attributes = {"iri": str, "description": str, "all_categories": list, "all_names": list,
                                 "equivalent_curies": list, "publications": list}
@@ -52,59 +70,49 @@ class ARAXDecorator:
         }
         self.array_delimiter_char = "ǂ"
         self.kg2_infores_curie = "infores:rtx-kg2"  # Can't use expand_utilities.py here due to circular imports
+        self.kg2c_sqlite_path = self._get_kg2c_sqlite_path()
 
-    def decorate_nodes(self, response: ARAXResponse) -> ARAXResponse:
+    def decorate_nodes(self, response: ARAXResponse, lazy: Optional[bool] = None) -> ARAXResponse:
+        """
+        Decorates nodes with metadata from KG2c. If lazy is True (it defaults to the response's defer_decoration
+        setting), the deferred_node_attributes are left off for now and are added by decorate_deferred_attributes().
+        """
         message = response.envelope.message
-        response.debug(f"Decorating nodes with metadata from KG2c")
-
-        # Get connected to the local KG2c sqlite database
-        connection, cursor = self._connect_to_kg2c_sqlite()
+        lazy = self._is_lazy(response, lazy)
+        response.debug(f"Decorating nodes with metadata from KG2c{' (deferring bulky attributes)' if lazy else ''}")
 
-        # Extract the KG2c nodes from sqlite
+        # Look up the (decoded) properties of the corresponding KG2c nodes
         response.debug(f"Looking up corresponding KG2c nodes in sqlite")
-        node_attributes_ordered = list(self.node_attributes)
-        node_cols_str = ", ".join([f"N.{property_name}" for property_name in node_attributes_ordered])
-        node_keys = set(node_key.replace("'", "''") for node_key in message.knowledge_graph.nodes)  # Escape quotes
-        node_keys_str = "','".join(node_keys)  # SQL wants ('node1', 'node2') format for string lists
-        sql_query = f"SELECT N.id, {node_cols_str} " \
-                    f"FROM nodes AS N " \
-                    f"WHERE N.id IN ('{node_keys_str}')"
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-        cursor.close()
-        connection.close()
+        node_properties_map = self._get_kg2c_node_properties(message.knowledge_graph.nodes)
 
         # Decorate nodes in the KG with info in these KG2c nodes
         response.debug(f"Adding attributes to nodes in the KG")
-        for row in rows:
-            # First create the attributes for this KG2c node
-            node_id = row[0]
-            trapi_node = message.knowledge_graph.nodes[node_id]
-            kg2c_node_attributes = []
-            for index, property_name in enumerate(node_attributes_ordered):
-                value = self._load_property(property_name, row[index + 1])  # Add one to account for 'id' column
-                if value:
-                    kg2c_node_attributes.append(self.create_attribute(property_name, value))
-
-            # Then decorate the TRAPI node with those attributes it doesn't already have
-            existing_attribute_triples = {self._get_attribute_triple(attribute)
-                                          for attribute in trapi_node.attributes} if trapi_node.attributes else set()
-            novel_attributes = [attribute for attribute in kg2c_node_attributes
-                                if self._get_attribute_triple(attribute) not in existing_attribute_triples]
-            if trapi_node.attributes:
-                trapi_node.attributes += novel_attributes
-            else:
-                trapi_node.attributes = novel_attributes
+        deferred_node_keys = set()
+        for node_id, node_properties in node_properties_map.items():
+            if lazy:
+                if any(property_name in self.deferred_node_attributes for property_name, _ in node_properties):
+                    deferred_node_keys.add(node_id)
+                node_properties = [(property_name, value) for property_name, value in node_properties
+                                   if property_name not in self.deferred_node_attributes]
+            self._add_node_attributes(message.knowledge_graph.nodes[node_id], node_properties)
+        if deferred_node_keys:
+            self._get_deferred_decorations(message)["nodes"].update(deferred_node_keys)
+            response.debug(f"Deferred decorating {len(deferred_node_keys)} nodes with {self.deferred_node_attributes}")
 
         return response
 
-    def decorate_edges(self, response: ARAXResponse, kind: Optional[str] = "RTX-KG2") -> ARAXResponse:
+    def decorate_edges(self, response: ARAXResponse, kind: Optional[str] = "RTX-KG2",
+                       lazy: Optional[bool] = None) -> ARAXResponse:
         """
         Decorates edges with publication sentences and any other available EPC info.
         kind: The kind of edges to decorate, either: "NGD" or "RTX-KG2". For NGD edges, publications info attributes
         are added. For RTX-KG2 edges, attributes for all EPC properties are added.
+        lazy: If True (defaults to the response's defer_decoration setting), the deferred_edge_attributes are left off
+        for now and are added by decorate_deferred_attributes().
         """
-        kg = response.envelope.message.knowledge_graph
+        message = response.envelope.message
+        kg = message.knowledge_graph
+        lazy = self._is_lazy(response, lazy)
         response.debug(f"Decorating edges with EPC info from KG2c")
         supported_kinds = {"RTX-KG2", "NGD"}
         if kind not in supported_kinds:
@@ -141,83 +149,124 @@ class ARAXDecorator:
                 search_key_to_edge_keys_map[search_key].add(edge_key)
             search_key_column = "triple"
 
-        # Extract the proper entries from sqlite
-        connection, cursor = self._connect_to_kg2c_sqlite()
+        # Look up the (joined) EPC properties for these search keys in sqlite
         response.debug(f"Looking up EPC edge info in KG2c sqlite")
-        edge_attributes_ordered = list(self.edge_attributes)
-        edge_cols_str = ", ".join([f"E.{property_name}" for property_name in edge_attributes_ordered])
-        search_keys_set = set(search_key.replace("'", "''") for search_key in set(search_key_to_edge_keys_map))  # Escape quotes
-        search_keys_str = "','".join(search_keys_set)  # SQL wants ('node1', 'node2') format for string lists
-        sql_query = f"SELECT E.{search_key_column}, {edge_cols_str} " \
-                    f"FROM edges AS E " \
-                    f"WHERE E.{search_key_column} IN ('{search_keys_str}')"
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        response.debug(f"Got {len(rows)} rows back from KG2c sqlite")
+        edge_properties_map = self._get_kg2c_edge_properties(search_key_to_edge_keys_map, search_key_column)
+        response.debug(f"Found KG2c edge info for {len(edge_properties_map)} of {len(search_key_to_edge_keys_map)} search keys")
 
         response.debug(f"Adding attributes to edges in the KG")
-        # Create a helper lookup map for easy access to returned rows
-        search_key_to_kg2c_edge_tuples_map = defaultdict(list)
-        for row in rows:
-            search_key = row[0]
-            search_key_to_kg2c_edge_tuples_map[search_key].append(row)
-
-        attribute_type_id_map = {property_name: self.create_attribute(property_name, "something").attribute_type_id
-                                 for property_name in set(self.edge_attributes).difference({"knowledge_source"})}
-        for search_key, kg2c_edge_tuples in search_key_to_kg2c_edge_tuples_map.items():
-            # Join the property values found for all edges matching the given search key
-            merged_kg2c_properties = {property_name: None for property_name in edge_attributes_ordered}
-            for kg2c_edge_tuple in kg2c_edge_tuples:
-                for index, property_name in enumerate(edge_attributes_ordered):
-                    raw_value = kg2c_edge_tuple[index + 1]
-                    if raw_value:  # Skip empty attributes
-                        value = self._load_property(property_name, raw_value)
-                        if not merged_kg2c_properties.get(property_name):
-                            merged_kg2c_properties[property_name] = set() if isinstance(value, list) else dict()
-                        if isinstance(value, list):
-                            merged_kg2c_properties[property_name].update(set(value))
-                        else:
-                            merged_kg2c_properties[property_name].update(value)
-            joined_knowledge_sources = list(merged_kg2c_properties["knowledge_source"]) if merged_kg2c_properties.get("knowledge_source") else set()
-            knowledge_source = joined_knowledge_sources[0] if len(joined_knowledge_sources) == 1 else None
-            joined_kg2_ids = list(merged_kg2c_properties["kg2_ids"]) if merged_kg2c_properties.get("kg2_ids") else set()
-            joined_publications = list(merged_kg2c_properties["publications"]) if merged_kg2c_properties.get("publications") else set()
-            joined_publications_info = merged_kg2c_properties["publications_info"] if merged_kg2c_properties.get("publications_info") else dict()
-
+        property_names = {"publications_info"} if kind == "NGD" else {"kg2_ids", "publications", "publications_info"}
+        if lazy:
+            property_names = property_names.difference(self.deferred_edge_attributes)
+        deferred_edges = dict()
+        for search_key, merged_kg2c_properties in edge_properties_map.items():
             # Add the joined attributes to each of the edges with the given search key (as needed)
-            corresponding_bare_edge_keys = search_key_to_edge_keys_map[search_key]
-            for edge_key in corresponding_bare_edge_keys:
-                bare_edge = kg.edges[edge_key]
-                existing_attribute_type_ids = {attribute.attribute_type_id for attribute in bare_edge.attributes} if bare_edge.attributes else set()
-                new_attributes = []
-                # Create KG2 edge-specific attributes
-                if kind == "RTX-KG2":
-                    if attribute_type_id_map["kg2_ids"] not in existing_attribute_type_ids:
-                        new_attributes.append(self.create_attribute("kg2_ids", list(joined_kg2_ids)))
-                    if joined_publications and attribute_type_id_map["publications"] not in existing_attribute_type_ids:
-                        new_attributes.append(self.create_attribute("publications", list(joined_publications),
-                                                                    attribute_source=knowledge_source))
-                # Create attributes that belong on both KG2 and NGD edges
-                if joined_publications_info and attribute_type_id_map["publications_info"] not in existing_attribute_type_ids:
-                    new_attributes.append(self.create_attribute("publications_info", joined_publications_info,
-                                                                attribute_source=knowledge_source))
-                # Actually tack the new attributes onto the edge
-                if new_attributes:
-                    if not bare_edge.attributes:
-                        bare_edge.attributes = new_attributes
-                    else:
-                        bare_edge.attributes += new_attributes
+            for edge_key in search_key_to_edge_keys_map[search_key]:
+                self._add_edge_attributes(kg.edges[edge_key], merged_kg2c_properties, property_names)
+                if lazy and any(merged_kg2c_properties[property_name] for property_name in self.deferred_edge_attributes):
+                    deferred_edges[edge_key] = (search_key_column, search_key)
+        if deferred_edges:
+            self._get_deferred_decorations(message)["edges"].update(deferred_edges)
+            response.debug(f"Deferred decorating {len(deferred_edges)} edges with {self.deferred_edge_attributes}")
 
         return response
 
+    def decorate_deferred_attributes(self, response: ARAXResponse) -> ARAXResponse:
+        """
+        Adds the attributes that lazy decoration held back, but only to those nodes/edges that are still in the KG and
+        (if the message has results) are bound in a result. Meant to be called once, just before the response is
+        stored or returned, so that it's done after any filtering/truncating of results.
+        """
+        message = response.envelope.message
+        deferred_decorations = getattr(message, self._deferred_decorations_attribute, None)
+        if not deferred_decorations:
+            return response
+        setattr(message, self._deferred_decorations_attribute, None)
+        kg = message.knowledge_graph
+        kg_nodes = kg.nodes if kg and kg.nodes else dict()
+        kg_edges = kg.edges if kg and kg.edges else dict()
+        node_keys = {node_key for node_key in deferred_decorations["nodes"] if node_key in kg_nodes}
+        edge_keys = {edge_key for edge_key in deferred_decorations["edges"] if edge_key in kg_edges}
+        if message.results:
+            node_keys = node_keys.intersection({binding.id for result in message.results
+                                                for bindings in result.node_bindings.values() for binding in bindings})
+            edge_keys = edge_keys.intersection({binding.id for result in message.results if result.edge_bindings
+                                                for bindings in result.edge_bindings.values() for binding in bindings})
+        response.debug(f"Adding deferred attributes to {len(node_keys)} nodes and {len(edge_keys)} edges "
+                       f"(of {len(deferred_decorations['nodes'])} and {len(deferred_decorations['edges'])} deferred)")
+
+        node_properties_map = self._get_kg2c_node_properties(node_keys)
+        for node_key, node_properties in node_properties_map.items():
+            self._add_node_attributes(kg_nodes[node_key], [(property_name, value) for property_name, value in node_properties
+                                                           if property_name in self.deferred_node_attributes])
+
+        search_key_to_edge_keys_maps = defaultdict(lambda: defaultdict(set))
+        for edge_key in edge_keys:
+            search_key_column, search_key = deferred_decorations["edges"][edge_key]
+            search_key_to_edge_keys_maps[search_key_column][search_key].add(edge_key)
+        for search_key_column, search_key_to_edge_keys_map in search_key_to_edge_keys_maps.items():
+            edge_properties_map = self._get_kg2c_edge_properties(search_key_to_edge_keys_map, search_key_column)
+            for search_key, merged_kg2c_properties in edge_properties_map.items():
+                for edge_key in search_key_to_edge_keys_map[search_key]:
+                    self._add_edge_attributes(kg_edges[edge_key], merged_kg2c_properties, self.deferred_edge_attributes)
+
+        return response
+
+    def _add_node_attributes(self, trapi_node, node_properties: Iterable[Tuple[str, any]]):
+        # First create the attributes for this KG2c node
+        kg2c_node_attributes = [self.create_attribute(property_name, self._copy_property_value(value))
+                                for property_name, value in node_properties]
+
+        # Then decorate the TRAPI node with those attributes it doesn't already have
+        if trapi_node.attributes:
+            existing_attribute_triples = {self._get_attribute_triple(attribute)
+                                          for attribute in trapi_node.attributes}
+            novel_attributes = [attribute for attribute in kg2c_node_attributes
+                                if self._get_attribute_triple(attribute) not in existing_attribute_triples]
+            trapi_node.attributes += novel_attributes
+        else:
+            trapi_node.attributes = kg2c_node_attributes
+
+    def _add_edge_attributes(self, bare_edge, merged_kg2c_properties: Dict[str, any], property_names: Set[str]):
+        joined_knowledge_sources = merged_kg2c_properties["knowledge_source"]
+        knowledge_source = joined_knowledge_sources[0] if len(joined_knowledge_sources) == 1 else None
+        existing_attribute_type_ids = {attribute.attribute_type_id for attribute in bare_edge.attributes} if bare_edge.attributes else set()
+        new_attributes = []
+        for property_name in ("kg2_ids", "publications", "publications_info"):
+            if property_name not in property_names or \
+                    self.attribute_shells[property_name].attribute_type_id in existing_attribute_type_ids:
+                continue
+            value = merged_kg2c_properties[property_name]
+            if property_name == "kg2_ids":
+                new_attributes.append(self.create_attribute(property_name, list(value)))
+            elif value:
+                new_attributes.append(self.create_attribute(property_name, self._copy_property_value(value),
+                                                            attribute_source=knowledge_source))
+        # Actually tack the new attributes onto the edge
+        if new_attributes:
+            if not bare_edge.attributes:
+                bare_edge.attributes = new_attributes
+            else:
+                bare_edge.attributes += new_attributes
+
+    @staticmethod
+    def _is_lazy(response: ARAXResponse, lazy: Optional[bool]) -> bool:
+        return getattr(response, "defer_decoration", False) if lazy is None else lazy
+
+    @classmethod
+    def _get_deferred_decorations(cls, message) -> Dict[str, any]:
+        deferred_decorations = getattr(message, cls._deferred_decorations_attribute, None)
+        if deferred_decorations is None:
+            deferred_decorations = {"nodes": set(), "edges": dict()}
+            setattr(message, cls._deferred_decorations_attribute, deferred_decorations)
+        return deferred_decorations
+
     def create_attribute(self, attribute_short_name: str, value: any, attribute_source: Optional[str] = None,
                          log: Optional[ARAXResponse] = ARAXResponse()) -> Attribute:
         if attribute_short_name not in self.attribute_shells:
             log.error(f"{attribute_short_name} is not a recognized short name for an attribute. Options are: "
                       f"{set(self.attribute_shells)}", error_code="UnrecognizedInput")
-        attribute = copy.deepcopy(self.attribute_shells[attribute_short_name])
+        attribute = copy.copy(self.attribute_shells[attribute_short_name])  # Shells only hold scalar fields
         attribute.value = value
         if isinstance(value, str):
             if value.startswith("http"):
@@ -226,17 +275,149 @@ class ARAXDecorator:
             attribute.attribute_source = attribute_source
         return attribute
 
+    def _get_kg2c_node_properties(self, node_keys: Iterable[str]) -> Dict[str, Tuple[Tuple[str, any], ...]]:
+        """
+        Returns a map of node key -> ((property name, decoded value), ...) for all node keys that are in KG2c.
+        Lists are returned as tuples and should be copied (see _copy_property_value) before being handed out.
+        """
+        node_attributes_ordered = list(self.node_attributes)
+        node_cols_str = ", ".join([f"N.{property_name}" for property_name in node_attributes_ordered])
+
+        def decode_node_rows(rows: List[tuple]) -> Dict[str, Tuple[Tuple[str, any], ...]]:
+            decoded_rows = dict()
+            for row in rows:
+                node_properties = []
+                for index, property_name in enumerate(node_attributes_ordered):
+                    value = self._load_property(property_name, row[index + 1])  # Add one to account for 'id' column
+                    if value:
+                        node_properties.append((property_name, self._freeze_property_value(value)))
+                decoded_rows[row[0]] = tuple(node_properties)
+            return decoded_rows
+
+        return self._get_cached_kg2c_lookups(self._node_cache, self.node_cache_size, node_keys,
+                                             f"SELECT N.id, {node_cols_str} FROM nodes AS N WHERE N.id IN ",
+                                             decode_node_rows)
+
+    def _get_kg2c_edge_properties(self, search_keys: Iterable[str], search_key_column: str) -> Dict[str, Dict[str, any]]:
+        """
+        Returns a map of search key -> joined EPC properties of all KG2c edges with that search key (node pair or
+        triple), for all search keys that match at least one KG2c edge.
+        """
+        edge_attributes_ordered = list(self.edge_attributes)
+        edge_cols_str = ", ".join([f"E.{property_name}" for property_name in edge_attributes_ordered])
+
+        def decode_edge_rows(rows: List[tuple]) -> Dict[str, Dict[str, any]]:
+            # Join the property values found for all edges matching the given search key
+            search_key_to_kg2c_edge_tuples_map = defaultdict(list)
+            for row in rows:
+                search_key_to_kg2c_edge_tuples_map[row[0]].append(row)
+            decoded_rows = dict()
+            for search_key, kg2c_edge_tuples in search_key_to_kg2c_edge_tuples_map.items():
+                merged_kg2c_properties = {property_name: None for property_name in edge_attributes_ordered}
+                for kg2c_edge_tuple in kg2c_edge_tuples:
+                    for index, property_name in enumerate(edge_attributes_ordered):
+                        raw_value = kg2c_edge_tuple[index + 1]
+                        if raw_value:  # Skip empty attributes
+                            value = self._load_property(property_name, raw_value)
+                            if not merged_kg2c_properties.get(property_name):
+                                merged_kg2c_properties[property_name] = set() if isinstance(value, list) else dict()
+                            if isinstance(value, list):
+                                merged_kg2c_properties[property_name].update(set(value))
+                            else:
+                                merged_kg2c_properties[property_name].update(value)
+                decoded_rows[search_key] = {
+                    "knowledge_source": tuple(merged_kg2c_properties["knowledge_source"] or ()),
+                    "kg2_ids": tuple(merged_kg2c_properties["kg2_ids"] or ()),
+                    "publications": tuple(merged_kg2c_properties["publications"] or ()),
+                    "publications_info": merged_kg2c_properties["publications_info"] or dict()
+                }
+            return decoded_rows
+
+        return self._get_cached_kg2c_lookups(self._edge_cache, self.edge_cache_size,
+                                             [(search_key_column, search_key) for search_key in search_keys],
+                                             f"SELECT E.{search_key_column}, {edge_cols_str} FROM edges AS E "
+                                             f"WHERE E.{search_key_column} IN ",
+                                             decode_edge_rows)
+
+    def _get_cached_kg2c_lookups(self, cache: OrderedDict, cache_size: int, keys: Iterable, sql_query_prefix: str,
+                                 decode_rows) -> Dict[str, any]:
+        """
+        Serves lookups from the given LRU cache where possible and fetches the rest from KG2c sqlite in chunked,
+        parameterized queries. Keys that aren't in KG2c are cached too (as None) so they aren't looked up again.
+        Cache keys may be (namespace, key) tuples, in which case only the second item is used in the query.
+        """
+        sqlite_file_path = self.kg2c_sqlite_path
+        self._reset_caches_if_kg2c_changed(sqlite_file_path)
+        results = dict()
+        missing_keys = []
+        with self._cache_lock:
+            for cache_key in keys:
+                if cache_key in cache:
+                    cache.move_to_end(cache_key)
+                    value = cache[cache_key]
+                    if value is not None:
+                        results[self._get_lookup_key(cache_key)] = value
+                else:
+                    missing_keys.append(cache_key)
+
+        if missing_keys:
+            lookup_keys = [self._get_lookup_key(cache_key) for cache_key in missing_keys]
+            cursor = self._get_kg2c_connection(sqlite_file_path).cursor()
+            rows = []
+            for start in range(0, len(lookup_keys), self.sqlite_lookup_chunk_size):
+                chunk = lookup_keys[start:start + self.sqlite_lookup_chunk_size]
+                cursor.execute(f"{sql_query_prefix}({', '.join('?' for _ in chunk)})", chunk)
+                rows += cursor.fetchall()
+            cursor.close()
+            decoded_rows = decode_rows(rows)
+            results.update(decoded_rows)
+            with self._cache_lock:
+                for cache_key, lookup_key in zip(missing_keys, lookup_keys):
+                    cache[cache_key] = decoded_rows.get(lookup_key)
+                while len(cache) > cache_size:
+                    cache.popitem(last=False)
+        return results
+
+    @staticmethod
+    def _get_lookup_key(cache_key: Union[str, tuple]) -> str:
+        return cache_key[1] if isinstance(cache_key, tuple) else cache_key
+
+    @classmethod
+    def _reset_caches_if_kg2c_changed(cls, sqlite_file_path: str):
+        with cls._cache_lock:
+            if cls._cache_sqlite_path != sqlite_file_path:
+                cls._node_cache.clear()
+                cls._edge_cache.clear()
+                cls._cache_sqlite_path = sqlite_file_path
+
+    @classmethod
+    def _get_kg2c_connection(cls, sqlite_file_path: str) -> sqlite3.Connection:
+        """
+        Returns this thread's read-only connection to the given KG2c sqlite file, from the shared registry.
+        """
+        return SqliteConnectionRegistry.get_connection(sqlite_file_path)
+
     @staticmethod
-    def _connect_to_kg2c_sqlite() -> Tuple[sqlite3.Connection, sqlite3.Cursor]:
+    def _get_kg2c_sqlite_path() -> str:
         path_list = os.path.realpath(__file__).split(os.path.sep)
         rtx_index = path_list.index("RTX")
         rtxc = RTXConfiguration()
         sqlite_dir_path = os.path.sep.join([*path_list[:(rtx_index + 1)], 'code', 'ARAX', 'KnowledgeSources', 'KG2c'])
         sqlite_name = rtxc.kg2c_sqlite_path.split('/')[-1]
-        sqlite_file_path = f"{sqlite_dir_path}{os.path.sep}{sqlite_name}"
-        connection = sqlite3.connect(sqlite_file_path)
-        cursor = connection.cursor()
-        return connection, cursor
+        return f"{sqlite_dir_path}{os.path.sep}{sqlite_name}"
+
+    @staticmethod
+    def _freeze_property_value(value: any) -> any:
+        return tuple(value) if isinstance(value, list) else value
+
+    @staticmethod
+    def _copy_property_value(value: any) -> any:
+        if isinstance(value, tuple):
+            return list(value)
+        elif isinstance(value, dict):
+            return copy.deepcopy(value)  # E.g., publications_info holds a dict per publication
+        else:
+            return value
 
     def _load_property(self, property_name: str, raw_value: str) -> Union[str, List[str], Dict[str, any], None]:
         attributes_info_lookup = self.node_attributes if property_name in self.node_attributes else self.edge_attributes
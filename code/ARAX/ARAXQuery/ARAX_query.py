@@ -29,6 +29,7 @@ from ARAX_resultify import ARAXResultify
 from ARAX_query_graph_interpreter import ARAXQueryGraphInterpreter
 from ARAX_messenger import ARAXMessenger
 from ARAX_ranker import ARAXRanker
+from ARAX_decorator import ARAXDecorator
 from operation_to_ARAXi import WorkflowToARAXi
 from ARAX_query_tracker import ARAXQueryTracker
 
@@ -80,9 +81,9 @@ class ARAXQuery:
         self.response = None
         self.message = None
         self.rtxConfig = RTXConfiguration()
-        self.DBManager = ARAXDatabaseManager(live = "Production")
         self.lock = None
-        if self.DBManager.check_versions():
+        if ARAXDatabaseManager.databases_need_update(live = "Production"):
+            self.DBManager = ARAXDatabaseManager(live = "Production")
             self.response = ARAXResponse()
             self.response.debug(f"At least one database file is either missing or out of date. Updating now... (This may take a while)")
             self.response = self.DBManager.update_databases(True, response=self.response)
@@ -491,6 +492,8 @@ class ARAXQuery:
 
         response = self.response
         response.debug(f"Entering execute_processing_plan")
+        #### Only the nodes/edges that make it into the final answer get the bulky KG2c attributes (see below)
+        response.defer_decoration = True
         messages = []
         message = None
 
@@ -808,6 +811,9 @@ class ARAXQuery:
             #        for attr in node.attributes:
             #            eprint(f"  - {node_key}.{attr.name} is {type(attr.value)}")
 
+            #### Now that the results are final, add the attributes that decoration deferred
+            ARAXDecorator().decorate_deferred_attributes(response)
+
             # Fill out the message with data
             response.envelope.status = response.error_code
             response.envelope.description = response.message
@@ -892,6 +898,7 @@ class ARAXQuery:
         except:
             response.error(f"Unable to make a connection to URL {callback} at all. Work is lost", error_code="UnreachableCallback")
         self.track_query_finish()
+        ResponseCache.wait_for_pending_responses()
         os._exit(0)
 
 
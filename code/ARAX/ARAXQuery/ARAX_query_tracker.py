@@ -8,13 +8,14 @@ import re
 import signal
 import socket
 
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 import sqlalchemy
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, Float, String, DateTime, PickleType
+from sqlalchemy import Column, Integer, Float, String, DateTime, PickleType, Index
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+from sqlalchemy import text, func
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")
 from RTXConfiguration import RTXConfiguration
@@ -23,10 +24,11 @@ Base = declarative_base()
 
 class ARAXQuery(Base):
     __tablename__ = 'arax_query'
+    __table_args__ = ( Index('ix_arax_query_start_datetime_status', 'start_datetime', 'status'), )
     query_id = Column(Integer, primary_key=True)
     status = Column(String(255), nullable=False)
-    start_datetime = Column(String(25), nullable=False) ## ISO formatted YYYY-MM-DD HH:mm:ss
-    end_datetime = Column(String(25), nullable=True) ## ISO formatted YYYY-MM-DD HH:mm:ss
+    start_datetime = Column(DateTime, nullable=False) ## (older tables stored this as an ISO formatted YYYY-MM-DD HH:mm:ss string)
+    end_datetime = Column(DateTime, nullable=True)
     elapsed = Column(Float, nullable=True) ## seconds
     pid = Column(Integer, nullable=False)
     domain = Column(String(255), nullable=True)
@@ -39,8 +41,19 @@ class ARAXQuery(Base):
     code_description = Column(String(255), nullable=True)
     remote_address = Column(String(50), nullable=False)
 
+#### The columns needed to list queries (i.e., all but the potentially large input_query)
+listing_columns = [ ARAXQuery.query_id, ARAXQuery.status, ARAXQuery.start_datetime, ARAXQuery.end_datetime, ARAXQuery.elapsed,
+    ARAXQuery.pid, ARAXQuery.domain, ARAXQuery.hostname, ARAXQuery.instance_name, ARAXQuery.origin, ARAXQuery.message_id,
+    ARAXQuery.message_code, ARAXQuery.code_description, ARAXQuery.remote_address ]
+
+
 class ARAXQueryTracker:
 
+    summary_ttl = 10  ## seconds to reuse a computed status summary (the status page polls frequently)
+    _upgraded_engine_urls = set()
+    _summary_cache = {}
+    _summary_cache_lock = threading.Lock()
+
    #### Constructor
     def __init__(self):
         self.rtxConfig = RTXConfiguration()
@@ -177,6 +190,33 @@ class ARAXQueryTracker:
         if not database_info.has_table(ARAXQuery.__tablename__):
             eprint(f"WARNING: {self.engine_type} tables do not exist; creating them")
             Base.metadata.create_all(engine)
+        elif str(engine.url) not in ARAXQueryTracker._upgraded_engine_urls:
+            self.upgrade_table(engine, database_info)
+        ARAXQueryTracker._upgraded_engine_urls.add(str(engine.url))
+
+
+    ##################################################################################################
+    #### Bring an older table up to date: store start/end datetimes as real timestamps and add the indexes
+    def upgrade_table(self, engine, database_info):
+        columns = { column['name']: column for column in database_info.get_columns(ARAXQuery.__tablename__) }
+        # Only MySQL columns are converted. An older SQLite table keeps its VARCHAR columns, which is fine: SQLite
+        # columns aren't typed, SQLAlchemy stores DateTime values there as 'YYYY-MM-DD HH:MM:SS.ffffff' strings anyway,
+        # and the older 'YYYY-MM-DD HH:MM:SS' strings both compare in order with those and read back as datetimes
+        if self.engine_type == 'mysql' and not isinstance(columns['start_datetime']['type'], sqlalchemy.types.DateTime):
+            try:
+                eprint(f"WARNING: Converting {ARAXQuery.__tablename__} start/end datetimes to timestamps")
+                with engine.begin() as connection:
+                    connection.execute(text(f"ALTER TABLE {ARAXQuery.__tablename__} MODIFY start_datetime DATETIME NOT NULL, MODIFY end_datetime DATETIME NULL"))
+            except sqlalchemy.exc.SQLAlchemyError as error:
+                eprint(f"ERROR: Unable to convert {ARAXQuery.__tablename__} start/end datetimes: {error}")
+        try:
+            existing_index_names = { index['name'] for index in database_info.get_indexes(ARAXQuery.__tablename__) }
+            for index in ARAXQuery.__table__.indexes:
+                if index.name not in existing_index_names:
+                    eprint(f"WARNING: Creating index {index.name}")
+                    index.create(engine)
+        except sqlalchemy.exc.SQLAlchemyError as error:
+            eprint(f"ERROR: Unable to create indexes on {ARAXQuery.__tablename__}: {error}")
 
 
     ##################################################################################################
@@ -205,9 +245,9 @@ class ARAXQueryTracker:
         tracker_entries = session.query(ARAXQuery).filter(ARAXQuery.query_id==tracker_id).all()
         if len(tracker_entries) > 0:
             tracker_entry = tracker_entries[0]
-            end_datetime = datetime.now()
-            elapsed = end_datetime - datetime.fromisoformat(tracker_entry.start_datetime)
-            tracker_entry.end_datetime = end_datetime.isoformat(' ', 'seconds')
+            end_datetime = datetime.now().replace(microsecond=0)
+            elapsed = end_datetime - tracker_entry.start_datetime
+            tracker_entry.end_datetime = end_datetime
             tracker_entry.elapsed = elapsed.seconds
             tracker_entry.status = attributes['status'][:254]
             tracker_entry.message_id = attributes['message_id']
@@ -258,7 +298,7 @@ class ARAXQueryTracker:
 
         try:
             tracker_entry = ARAXQuery(status="started",
-                start_datetime=datetime.now().isoformat(' ', 'seconds'),
+                start_datetime=datetime.now().replace(microsecond=0),
                 pid=os.getpid(),
                 domain = domain,
                 hostname = hostname,
@@ -278,17 +318,11 @@ class ARAXQueryTracker:
         if self.session is None:
             return
 
+        #### Only select the listing columns and filter on start_datetime directly so the (start_datetime, status) index is used
+        query = self.session.query(*listing_columns).filter(ARAXQuery.start_datetime >= datetime.now() - timedelta(hours=last_n_hours))
         if incomplete_only:
-            return self.session.query(ARAXQuery).filter(
-                text("""status NOT LIKE '%Completed%' 
-                        AND TIMESTAMPDIFF(HOUR, STR_TO_DATE(start_datetime, '%Y-%m-%d %T'), NOW()) < :n""")).params(n=last_n_hours).all()
-        else:
-            if self.engine_type == "mysql":
-                return self.session.query(ARAXQuery).filter(
-                    text("""TIMESTAMPDIFF(HOUR, STR_TO_DATE(start_datetime, '%Y-%m-%d %T'), NOW()) < :n""")).params(n=last_n_hours).all()
-            else:
-                return self.session.query(ARAXQuery).filter(
-                text("""JULIANDAY(start_datetime) - JULIANDAY(datetime('now','localtime')) < :n""")).params(n=last_n_hours/24).all()
+            query = query.filter(ARAXQuery.status.notlike('%Completed%'))
+        return query.order_by(ARAXQuery.start_datetime).all()
 
 
     ##################################################################################################
@@ -306,21 +340,15 @@ class ARAXQueryTracker:
         if entries is None:
             return result
 
+        now = datetime.now()
         for entry in entries:
             elapsed = entry.elapsed
             if elapsed is None or entry.status == 'Running Async':
-                now = datetime.now()
-                then = datetime.strptime(entry.start_datetime, '%Y-%m-%d %H:%M:%S')
-                delta = now - then
-                elapsed = int(delta.total_seconds())
-                elapsed -= 1
-                if elapsed < 0:
-                    elapsed = 0
-                eprint(f"--- {then} {elapsed}")
+                elapsed = max(int((now - entry.start_datetime).total_seconds()) - 1, 0)
             result['recent_queries'].append( {
                 'query_id': entry.query_id,
                 'pid': entry.pid,
-                'start_datetime': entry.start_datetime,
+                'start_datetime': entry.start_datetime.strftime("%Y-%m-%d %H:%M:%S"),
                 'domain': entry.domain,
                 'hostname': entry.hostname,
                 'instance_name': entry.instance_name,
@@ -334,10 +362,50 @@ class ARAXQueryTracker:
             } )
 
         result['recent_queries'].reverse()
+        result['summary'] = self.get_summary(last_n_hours=last_n_hours)
         result['current_datetime'] = datetime.now().strftime("%Y-%m-%d %T")
         return result
 
 
+    ##################################################################################################
+    #### Summarize recent queries: how many are still running and, per submitter, the distribution of elapsed times
+    def get_summary(self, last_n_hours=24):
+        if self.session is None:
+            return
+
+        with ARAXQueryTracker._summary_cache_lock:
+            cached_summary = ARAXQueryTracker._summary_cache.get(last_n_hours)
+        if cached_summary is not None and cached_summary[0] > time.time() - ARAXQueryTracker.summary_ttl:
+            return cached_summary[1]
+
+        since = datetime.now() - timedelta(hours=last_n_hours)
+        n_running = self.session.query(func.count(ARAXQuery.query_id)).filter(ARAXQuery.start_datetime >= since).filter(
+            (ARAXQuery.elapsed == None) | (ARAXQuery.status == 'Running Async') ).scalar()
+        elapsed_by_origin = {}
+        for origin, elapsed in self.session.query(ARAXQuery.origin, ARAXQuery.elapsed).filter(ARAXQuery.start_datetime >= since).filter(
+                ARAXQuery.elapsed != None).filter(ARAXQuery.status != 'Running Async'):
+            elapsed_by_origin.setdefault(origin, []).append(elapsed)
+
+        summary = { 'n_running': n_running, 'n_finished': sum(len(elapsed_list) for elapsed_list in elapsed_by_origin.values()), 'elapsed_by_submitter': {} }
+        for origin, elapsed_list in elapsed_by_origin.items():
+            elapsed_list.sort()
+            summary['elapsed_by_submitter'][origin] = { 'n_queries': len(elapsed_list),
+                'p50': self._get_percentile(elapsed_list, 50), 'p90': self._get_percentile(elapsed_list, 90),
+                'p95': self._get_percentile(elapsed_list, 95), 'max': elapsed_list[-1] }
+
+        with ARAXQueryTracker._summary_cache_lock:
+            ARAXQueryTracker._summary_cache[last_n_hours] = (time.time(), summary)
+        return summary
+
+
+    ##################################################################################################
+    @staticmethod
+    def _get_percentile(sorted_values, percentile):
+        # Nearest-rank percentile of an already sorted list
+        rank = max(int(-(-percentile * len(sorted_values) // 100)), 1)
+        return sorted_values[rank - 1]
+
+
     ##################################################################################################
     def terminate_job(self, terminate_pid, authorization):
         if self.session is None:
@@ -410,10 +478,7 @@ class ARAXQueryTracker:
 
         for entry in entries:
             eprint(f" - {entry.query_id}, {entry.instance_name}, {entry.elapsed}")
-            now = datetime.now()
-            then = datetime.strptime(entry.start_datetime, '%Y-%m-%d %H:%M:%S')
-            delta = now - then
-            elapsed = int(delta.total_seconds())
+            elapsed = int((datetime.now() - entry.start_datetime).total_seconds())
             entry.status = 'Reset'
             entry.message_code = 'Reset'
             entry.code_description = 'Query was terminated by a process restart'
@@ -12,6 +12,7 @@ import re
 from typing import Set, Union, Dict, List, Callable
 from ARAX_response import ARAXResponse
 from query_graph_info import QueryGraphInfo
+from kg_attribute_index import KGAttributeIndex
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.query_graph import QueryGraph
@@ -548,35 +549,31 @@ and [frobenius norm](https://en.wikipedia.org/wiki/Matrix_norm#Frobenius_norm).
         kg_edge_id_to_edge = self.kg_edge_id_to_edge
         score_stats = self.score_stats
         no_non_inf_float_flag = True
-        for edge_key,edge in message.knowledge_graph.edges.items():
-            kg_edge_id_to_edge[edge_key] = edge
-            if edge.attributes is not None:
-                for edge_attribute in edge.attributes:
-                    for attribute_name in self.known_attributes:
-                        if edge_attribute.original_attribute_name == attribute_name or edge_attribute.attribute_type_id == attribute_name:
-                            if edge_attribute.value == "no value!":
-                                edge_attribute.value = 0
-                                value = 0
-                            else:
-                                try:
-                                    value = float(edge_attribute.value)
-                                except ValueError:
-                                    continue
-                                except TypeError:
-                                    continue
-                            # initialize if not None already
-                            if attribute_name not in score_stats:
-                                score_stats[attribute_name] = {'minimum': None, 'maximum': None}  # FIXME: doesn't handle the case when all values are inf|NaN
-                            if not np.isinf(value) and not np.isinf(-value) and not np.isnan(value):  # Ignore inf, -inf, and nan
-                                no_non_inf_float_flag = False
-                                if not score_stats[attribute_name]['minimum']:
-                                    score_stats[attribute_name]['minimum'] = value
-                                if not score_stats[attribute_name]['maximum']:
-                                    score_stats[attribute_name]['maximum'] = value
-                                if value > score_stats[attribute_name]['maximum']:
-                                    score_stats[attribute_name]['maximum'] = value
-                                if value < score_stats[attribute_name]['minimum']:
-                                    score_stats[attribute_name]['minimum'] = value
+        kg_edge_id_to_edge.update(message.knowledge_graph.edges)
+        attribute_index = KGAttributeIndex.for_message(message)
+        for attribute_name in self.known_attributes:
+            edge_column = attribute_index.get_edge_column(attribute_name)
+            if not len(edge_column):
+                continue
+            no_value_positions = [position for position, raw_value in enumerate(edge_column.raw_values) if raw_value == "no value!"]
+            if no_value_positions:
+                for position in no_value_positions:
+                    edge_column.attributes[position].value = 0
+                KGAttributeIndex.invalidate(message)
+                attribute_index = KGAttributeIndex.for_message(message)
+                edge_column = attribute_index.get_edge_column(attribute_name)
+            if not edge_column.is_numeric.any():
+                continue
+            # initialize if not None already
+            if attribute_name not in score_stats:
+                score_stats[attribute_name] = {'minimum': None, 'maximum': None}  # FIXME: doesn't handle the case when all values are inf|NaN
+            finite_values = edge_column.values[np.isfinite(edge_column.values)]  # Ignore inf, -inf, and nan
+            if len(finite_values):
+                no_non_inf_float_flag = False
+                if score_stats[attribute_name]['minimum'] is None or finite_values.min() < score_stats[attribute_name]['minimum']:
+                    score_stats[attribute_name]['minimum'] = float(finite_values.min())
+                if score_stats[attribute_name]['maximum'] is None or finite_values.max() > score_stats[attribute_name]['maximum']:
+                    score_stats[attribute_name]['maximum'] = float(finite_values.max())
 
         if no_non_inf_float_flag:
             response.warning(
@@ -35,6 +35,7 @@ class ARAXResponse:
         self.n_warnings = 0
         self.data = {}
         self.envelope = None
+        self.defer_decoration = False  # If True, ARAXDecorator holds back bulky attributes until the response is returned
 
         self.query_plan = { 'qedge_keys': {}, 'counter': 0 }
 
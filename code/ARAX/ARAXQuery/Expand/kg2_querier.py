@@ -11,6 +11,7 @@ import requests
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import expand_utilities as eu
 from expand_utilities import QGOrganizedKnowledgeGraph
+from kp_query_cache import KPQueryCache
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
 from ARAX_response import ARAXResponse
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")  # ARAX directory
@@ -33,6 +34,7 @@ class KG2Querier:
         self.max_allowed_edges = 1000000
         self.max_edges_per_input_curie = 1000
         self.curie_batch_size = 100
+        self.num_cached_plover_answers = 0
 
     def answer_one_hop_query(self, query_graph: QueryGraph) -> QGOrganizedKnowledgeGraph:
         """
@@ -72,6 +74,7 @@ class KG2Querier:
         log.debug(f"Split {len(input_curies)} input curies into {len(curie_batches)} batches to send to Plover")
         log.info(f"Max edges allowed per input curie for this query is: {self.max_edges_per_input_curie}")
         batch_num = 1
+        self.num_cached_plover_answers = 0
         for curie_batch in curie_batches:
             log.debug(f"Sending batch {batch_num} to Plover (has {len(curie_batch)} input curies)")
             query_graph.nodes[input_qnode_key].ids = curie_batch
@@ -99,6 +102,11 @@ class KG2Querier:
                 return final_kg
             batch_num += 1
 
+        cache_message = f"{self.num_cached_plover_answers} of {len(curie_batches)} Plover batches were answered from cache"
+        log.debug(cache_message)
+        if self.num_cached_plover_answers:
+            log.update_query_plan(qedge_key, self.kg2_infores_curie, "Done",
+                                  f"Returned {len(final_kg.edges_by_qg_id.get(qedge_key, dict()))} edges ({cache_message})")
         return final_kg
 
     def answer_single_node_query(self, single_node_qg: QueryGraph) -> QGOrganizedKnowledgeGraph:
@@ -166,8 +174,7 @@ class KG2Querier:
                     del kg.nodes_by_qg_id[qnode_key][orphan_node_key]
         return kg
 
-    @staticmethod
-    def _answer_query_using_plover(qg: QueryGraph, log: ARAXResponse) -> Tuple[Dict[str, Dict[str, Union[set, dict]]], int]:
+    def _answer_query_using_plover(self, qg: QueryGraph, log: ARAXResponse) -> Tuple[Dict[str, Dict[str, Union[set, dict]]], int]:
         rtxc = RTXConfiguration()
         rtxc.live = "Production"
         # First prep the query graph (requires some minor additions for Plover)
@@ -179,14 +186,35 @@ class KG2Querier:
             if qnode.get("ids") and len(qnode["ids"]) < 5:
                 if "allow_subclasses" not in qnode or qnode["allow_subclasses"] is None:
                     qnode["allow_subclasses"] = True
+        # Use a cached answer if we've recently sent Plover this exact query (Plover's URL stands in for its version)
+        cache_key = KPQueryCache.get_cache_key(self.kg2_infores_curie, dict_qg, f"{rtxc.plover_url}--{rtxc.kg2c_sqlite_version}")
+        cached_entry = KPQueryCache.get(cache_key)
+        if cached_entry:
+            status, cached_value, age = cached_entry
+            if status == "Done":
+                log.debug(f"Using cached answer from Plover (from {age} seconds ago)")
+                self.num_cached_plover_answers += 1
+                return cached_value, 200
+            elif status == "Timed out":
+                raise requests.exceptions.Timeout(f"{cached_value} (cached failure from {age} seconds ago)")
+            else:
+                log.warning(f"Plover returned a status code of {cached_value} {age} seconds ago; not retrying yet")
+                return dict(), int(cached_value)
         # Then send the actual query
-        response = requests.post(f"{rtxc.plover_url}/query", json=dict_qg, timeout=60,
-                                 headers={'accept': 'application/json'})
+        try:
+            response = requests.post(f"{rtxc.plover_url}/query", json=dict_qg, timeout=60,
+                                     headers={'accept': 'application/json'})
+        except requests.exceptions.Timeout:
+            KPQueryCache.store_failure(cache_key, self.kg2_infores_curie, "Timed out", "Plover query timed out after 60 seconds")
+            raise
         if response.status_code == 200:
             log.debug(f"Got response back from Plover")
-            return response.json(), response.status_code
+            plover_answer = response.json()
+            KPQueryCache.store_answer(cache_key, self.kg2_infores_curie, plover_answer)
+            return plover_answer, response.status_code
         else:
             log.warning(f"Plover returned a status code of {response.status_code}. Response was: {response.text}")
+            KPQueryCache.store_failure(cache_key, self.kg2_infores_curie, "Error", str(response.status_code))
             return dict(), response.status_code
 
     def _load_plover_answer_into_object_model(self, plover_answer: Dict[str, Dict[str, Union[set, dict]]],
@@ -0,0 +1,178 @@
+#!/bin/env python3
+# This class keeps a rolling record of how KPs have responded to our queries, which Expand uses to set per-query
+# deadlines and to stop sending queries to KPs that keep failing
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class KPHealthMonitor:
+    """
+    Every query sent to a KP is recorded (KP, query shape, duration, outcome) in a small sqlite file shared by all
+    ARAX processes. From the most recent outcomes it derives:
+      - a deadline for the next query: a high percentile of recent successful response times (per query shape if
+        there's enough history for it, otherwise for the KP as a whole), padded and capped by the default timeout;
+      - a circuit breaker: after several consecutive failures a KP is skipped until a cool-down period has passed,
+        after which queries are let through again (one success closes the circuit).
+    """
+
+    enabled = True
+    sqlite_path = f"{os.path.dirname(os.path.abspath(__file__))}/kp_health.sqlite"
+    window_size = 200  # Number of most recent outcomes per KP (or per KP + query shape) to consider
+    window_seconds = 24 * 60 * 60
+    min_samples = 20  # Need at least this many successful queries before adapting the deadline
+    deadline_percentile = 95
+    deadline_multiplier = 1.5
+    deadline_padding = 5  # Seconds
+    min_deadline = 15  # Seconds
+    circuit_failure_threshold = 5  # Consecutive failures (timeouts/errors) that open a KP's circuit
+    circuit_cooldown = 5 * 60  # Seconds a KP's circuit stays open after its last failure
+    stats_ttl = 30  # Seconds to reuse computed stats within a process
+    _thread_local = threading.local()
+    _stats_cache = dict()
+    _stats_cache_lock = threading.Lock()
+
+    @classmethod
+    def get_query_shape(cls, request_body: dict) -> str:
+        """
+        Summarizes a one-hop request by what tends to drive KP response times: the categories and predicates used,
+        which qnodes are pinned, and (roughly) how many input curies there are.
+        """
+        query_graph = request_body.get("message", dict()).get("query_graph", dict())
+        qnode_parts = []
+        for qnode_key, qnode in sorted(query_graph.get("nodes", dict()).items()):
+            num_ids = len(qnode.get("ids") or [])
+            curie_bucket = f"{2 ** int(np.ceil(np.log2(num_ids)))}ids" if num_ids else "unpinned"
+            qnode_parts.append(f"{','.join(sorted(qnode.get('categories') or []))}({curie_bucket})")
+        predicates = sorted({predicate for qedge in query_graph.get("edges", dict()).values()
+                             for predicate in qedge.get("predicates") or []})
+        return f"{'|'.join(qnode_parts)}|{','.join(predicates)}"
+
+    @classmethod
+    def record_outcome(cls, kp_name: str, query_shape: Optional[str], duration: float, outcome: str):
+        if not cls.enabled:
+            return
+        connection = cls._get_connection()
+        if connection:
+            try:
+                with connection:
+                    connection.execute("INSERT INTO kp_outcomes VALUES (?, ?, ?, ?, ?)",
+                                       (kp_name, query_shape or "", time.time(), duration, outcome))
+                    connection.execute("DELETE FROM kp_outcomes WHERE recorded < ?", (time.time() - cls.window_seconds,))
+            except sqlite3.Error:
+                pass  # Monitoring is best-effort; never let it break a query
+        with cls._stats_cache_lock:
+            cls._stats_cache = {key: value for key, value in cls._stats_cache.items() if key[0] != kp_name}
+
+    @classmethod
+    def get_deadline(cls, kp_name: str, query_shape: Optional[str], default_timeout: int) -> int:
+        """
+        Returns the number of seconds to wait for this KP to answer a query of the given shape.
+        """
+        if not cls.enabled:
+            return default_timeout
+        for shape in (query_shape, None):
+            stats = cls._get_recent_stats(kp_name, shape)
+            durations = stats["successful_durations"]
+            if stats["consecutive_failures"]:
+                # The KP may simply have gotten slower; give it the full timeout so we can learn its new pace
+                return default_timeout
+            elif len(durations) >= cls.min_samples:
+                percentile_duration = float(np.percentile(durations, cls.deadline_percentile))
+                deadline = int(np.ceil(percentile_duration * cls.deadline_multiplier + cls.deadline_padding))
+                return max(min(deadline, default_timeout), min(cls.min_deadline, default_timeout))
+        return default_timeout
+
+    @classmethod
+    def get_open_circuit_message(cls, kp_name: str) -> Optional[str]:
+        """
+        Returns a description of why the KP's circuit is open (meaning it shouldn't be queried right now), or None if
+        it's closed.
+        """
+        if not cls.enabled:
+            return None
+        stats = cls._get_recent_stats(kp_name, None)
+        num_failures = stats["consecutive_failures"]
+        if num_failures >= cls.circuit_failure_threshold:
+            seconds_since_failure = time.time() - stats["last_failure_time"]
+            if seconds_since_failure < cls.circuit_cooldown:
+                return f"Not querying this KP for now; its last {num_failures} queries failed (most recently " \
+                       f"{round(seconds_since_failure)} seconds ago)"
+        return None
+
+    @classmethod
+    def get_latency_summary(cls, kp_name: str, query_shape: Optional[str] = None) -> Dict[str, any]:
+        stats = cls._get_recent_stats(kp_name, query_shape)
+        durations = stats["successful_durations"]
+        summary = {"num_queries": stats["num_queries"],
+                   "num_timeouts": stats["num_timeouts"],
+                   "num_errors": stats["num_errors"],
+                   "consecutive_failures": stats["consecutive_failures"]}
+        if durations:
+            for percentile in (50, 90, 95, 99):
+                summary[f"p{percentile}_seconds"] = round(float(np.percentile(durations, percentile)), 2)
+        return summary
+
+    @classmethod
+    def _get_recent_stats(cls, kp_name: str, query_shape: Optional[str]) -> Dict[str, any]:
+        cache_key = (kp_name, query_shape)
+        with cls._stats_cache_lock:
+            cached_stats = cls._stats_cache.get(cache_key)
+        if cached_stats and cached_stats["computed"] > time.time() - cls.stats_ttl:
+            return cached_stats
+        rows = cls._get_recent_rows(kp_name, query_shape)  # Most recent first
+        consecutive_failures = 0
+        for _, outcome, _ in rows:
+            if outcome == "Done":
+                break
+            consecutive_failures += 1
+        stats = {"computed": time.time(),
+                 "num_queries": len(rows),
+                 "num_timeouts": sum(1 for _, outcome, _ in rows if outcome == "Timed out"),
+                 "num_errors": sum(1 for _, outcome, _ in rows if outcome == "Error"),
+                 "successful_durations": [duration for duration, outcome, _ in rows if outcome == "Done"],
+                 "consecutive_failures": consecutive_failures,
+                 "last_failure_time": rows[0][2] if consecutive_failures else 0}
+        with cls._stats_cache_lock:
+            cls._stats_cache[cache_key] = stats
+        return stats
+
+    @classmethod
+    def _get_recent_rows(cls, kp_name: str, query_shape: Optional[str]) -> List[Tuple[float, str, float]]:
+        connection = cls._get_connection()
+        if not connection:
+            return []
+        shape_clause = "AND query_shape = ? " if query_shape is not None else ""
+        parameters = [kp_name] + ([query_shape] if query_shape is not None else []) + \
+                     [time.time() - cls.window_seconds, cls.window_size]
+        try:
+            rows = connection.execute(f"SELECT duration, outcome, recorded FROM kp_outcomes WHERE kp = ? "
+                                      f"{shape_clause}AND recorded >= ? ORDER BY recorded DESC LIMIT ?",
+                                      parameters).fetchall()
+        except sqlite3.Error:
+            return []
+        return rows
+
+    @classmethod
+    def _get_connection(cls) -> Optional[sqlite3.Connection]:
+        """
+        Returns this thread's connection to the outcomes file (re-opened after a fork), or None if it can't be used.
+        """
+        connection_key = (os.getpid(), cls.sqlite_path)
+        if getattr(cls._thread_local, "connection_key", None) != connection_key:
+            try:
+                connection = sqlite3.connect(cls.sqlite_path, timeout=5)
+                connection.execute("PRAGMA journal_mode = WAL")
+                connection.execute("CREATE TABLE IF NOT EXISTS kp_outcomes (kp TEXT, query_shape TEXT, recorded REAL, "
+                                   "duration REAL, outcome TEXT)")
+                connection.execute("CREATE INDEX IF NOT EXISTS kp_outcomes_by_kp ON kp_outcomes (kp, recorded)")
+                connection.execute("CREATE INDEX IF NOT EXISTS kp_outcomes_by_shape ON kp_outcomes (kp, query_shape, recorded)")
+            except sqlite3.Error:
+                connection = None
+            cls._thread_local.connection = connection
+            cls._thread_local.connection_key = connection_key
+        return cls._thread_local.connection
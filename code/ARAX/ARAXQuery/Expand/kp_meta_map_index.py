@@ -0,0 +1,269 @@
+#!/bin/env python3
+# This class compiles the KP meta map into an index that answers "which KPs can answer this one-hop QG?" quickly
+import os
+import sys
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../BiolinkHelper")
+from biolink_helper import BiolinkHelper
+
+
+class KPMetaMapIndex:
+    """
+    Every KP, category, predicate and id prefix in the meta map gets an integer id, and each meta edge
+    (subject category, predicate, object category) maps to a bitset of the KPs that support it. Descendant closures
+    are precomputed when the index is built: each Biolink category/predicate (or mixin) maps straight to the set of
+    meta map categories/predicates it covers, and each (KP, category) maps to the id prefixes the KP supports for that
+    category and its descendants. So selecting KPs for a QG is a handful of set intersections with no Biolink lookups.
+    The index is saved as a numpy .npz file next to the meta map and loaded once per process.
+    """
+
+    version = 1
+    predicate_required_kps = {"NGD"}  # KPs only selected for QGs whose predicates they support (even if QG has none)
+    memo_size = 10000
+    _loaded_indexes = dict()  # Index file path -> (file modification time, KPMetaMapIndex)
+    _loaded_indexes_lock = threading.Lock()
+
+    def __init__(self, biolink_version: str, kps: List[str], kps_with_prefixes: List[bool], categories: List[str],
+                 predicates: List[str], meta_edges: np.ndarray, category_closures: Dict[str, FrozenSet[int]],
+                 predicate_closures: Dict[str, FrozenSet[int]], symmetric_predicate_closures: Dict[str, FrozenSet[int]],
+                 asymmetric_predicates: Iterable[str], prefix_closures: Dict[Tuple[int, str], FrozenSet[str]]):
+        self.biolink_version = biolink_version
+        self.kps = kps
+        self.kp_ids = {kp: kp_id for kp_id, kp in enumerate(kps)}
+        self.kps_with_prefixes = {kp for kp, has_prefixes in zip(kps, kps_with_prefixes) if has_prefixes}
+        self.categories = categories
+        self.predicates = predicates
+        self.meta_edges = meta_edges
+        self.category_closures = category_closures
+        self.predicate_closures = predicate_closures
+        self.symmetric_predicate_closures = symmetric_predicate_closures
+        self.asymmetric_predicates = frozenset(asymmetric_predicates)  # Predicates with no symmetric descendants
+        self.prefix_closures = prefix_closures
+        self.all_kps_bitset = (1 << len(kps)) - 1
+        self.any_predicate_kps_bitset = self.all_kps_bitset & ~self._to_bitset(self.kp_ids[kp] for kp in self.predicate_required_kps
+                                                                               if kp in self.kp_ids)
+        # Subject id -> object id -> (predicate id -> KP bitset, KP bitset for any predicate)
+        self.kps_by_triple = dict()
+        for subject_id, predicate_id, object_id, kp_id in meta_edges.tolist():
+            objects_dict = self.kps_by_triple.setdefault(subject_id, dict())
+            kps_by_predicate, any_predicate_bitset = objects_dict.get(object_id, (dict(), 0))
+            kps_by_predicate[predicate_id] = kps_by_predicate.get(predicate_id, 0) | (1 << kp_id)
+            objects_dict[object_id] = (kps_by_predicate, any_predicate_bitset | (1 << kp_id))
+        self._memo = dict()
+        self._memo_lock = threading.Lock()
+
+    @classmethod
+    def from_meta_map(cls, meta_map: Dict[str, dict], biolink_version: Optional[str] = None) -> 'KPMetaMapIndex':
+        biolink_helper = BiolinkHelper(biolink_version)
+        kps = sorted(meta_map)
+        categories = sorted({category for kp_meta_map in meta_map.values()
+                             for subject_category, objects_dict in kp_meta_map["predicates"].items()
+                             for category in [subject_category, *objects_dict]})
+        predicates = sorted({predicate for kp_meta_map in meta_map.values()
+                             for objects_dict in kp_meta_map["predicates"].values()
+                             for predicates_set in objects_dict.values() for predicate in predicates_set})
+        category_ids = {category: category_id for category_id, category in enumerate(categories)}
+        predicate_ids = {predicate: predicate_id for predicate_id, predicate in enumerate(predicates)}
+        meta_edges = [(category_ids[subject_category], predicate_ids[predicate], category_ids[object_category], kp_id)
+                      for kp_id, kp in enumerate(kps)
+                      for subject_category, objects_dict in meta_map[kp]["predicates"].items()
+                      for object_category, predicates_set in objects_dict.items() for predicate in predicates_set]
+
+        # Precompute which meta map categories/predicates each Biolink item (or meta map item) covers
+        lookup_index = biolink_helper.biolink_lookup_index
+        category_names = set(categories).union(lookup_index.kind_members["categories"],
+                                               lookup_index.kind_members["category_mixins"])
+        predicate_names = set(predicates).union(lookup_index.kind_members["predicates"],
+                                                lookup_index.kind_members["predicate_mixins"])
+        category_closures = dict()
+        for category in category_names:
+            closure = frozenset(category_ids[descendant] for descendant in biolink_helper.get_descendants(category)
+                                if descendant in category_ids)
+            if closure:
+                category_closures[category] = closure
+        predicate_closures = dict()
+        symmetric_predicate_closures = dict()
+        asymmetric_predicates = set()
+        for predicate in predicate_names:
+            descendants = biolink_helper.get_descendants(predicate)
+            closure = frozenset(predicate_ids[descendant] for descendant in descendants if descendant in predicate_ids)
+            if closure:
+                predicate_closures[predicate] = closure
+            symmetric_descendants = [descendant for descendant in descendants if biolink_helper.is_symmetric(descendant)]
+            if not symmetric_descendants:
+                asymmetric_predicates.add(predicate)
+            symmetric_closure = frozenset(predicate_ids[descendant] for descendant in symmetric_descendants
+                                          if descendant in predicate_ids)
+            if symmetric_closure:
+                symmetric_predicate_closures[predicate] = symmetric_closure
+
+        # Precompute the prefixes each KP supports for each category (including those of the category's descendants)
+        prefix_closures = dict()
+        for kp_id, kp in enumerate(kps):
+            kp_prefixes = meta_map[kp].get("prefixes") or dict()
+            if not kp_prefixes:
+                continue
+            for category in category_names.union(kp_prefixes):
+                supported_prefixes = frozenset(prefix.upper()
+                                               for descendant in biolink_helper.get_descendants(category, include_mixins=False)
+                                               for prefix in kp_prefixes.get(descendant) or [])
+                if supported_prefixes:
+                    prefix_closures[(kp_id, category)] = supported_prefixes
+
+        return cls(biolink_helper.biolink_version, kps, [bool(meta_map[kp].get("prefixes")) for kp in kps],
+                   categories, predicates, np.array(meta_edges, dtype=np.int32).reshape(len(meta_edges), 4),
+                   category_closures, predicate_closures, symmetric_predicate_closures, asymmetric_predicates,
+                   prefix_closures)
+
+    @classmethod
+    def get(cls, file_path: str) -> Optional['KPMetaMapIndex']:
+        """
+        Returns the index saved at the given path, loading it only if this process hasn't already loaded the current
+        version of the file. Returns None if there is no (readable, current) index file.
+        """
+        try:
+            modification_time = os.stat(file_path).st_mtime
+        except OSError:
+            return None
+        with cls._loaded_indexes_lock:
+            loaded_time, index = cls._loaded_indexes.get(file_path, (None, None))
+            if loaded_time != modification_time:
+                try:
+                    index = cls.load(file_path)
+                except (OSError, KeyError, ValueError):
+                    return None
+                cls._loaded_indexes[file_path] = (modification_time, index)
+        return index
+
+    @classmethod
+    def load(cls, file_path: str) -> 'KPMetaMapIndex':
+        with np.load(file_path, allow_pickle=False) as index_file:
+            if int(index_file["version"]) != cls.version:
+                raise ValueError(f"Index at {file_path} is not version {cls.version}")
+            category_closures = cls._unpack_closures(index_file, "category")
+            predicate_closures = cls._unpack_closures(index_file, "predicate")
+            symmetric_predicate_closures = cls._unpack_closures(index_file, "symmetric_predicate")
+            prefixes = index_file["prefixes"].tolist()
+            prefix_closures = dict()
+            for kp_and_category, prefix_ids in cls._unpack_closures(index_file, "prefix").items():
+                kp_id, category = kp_and_category.split("|", 1)
+                prefix_closures[(int(kp_id), category)] = frozenset(prefixes[prefix_id] for prefix_id in prefix_ids)
+            return cls(str(index_file["biolink_version"]), index_file["kps"].tolist(),
+                       index_file["kps_with_prefixes"].tolist(), index_file["categories"].tolist(),
+                       index_file["predicates"].tolist(), index_file["meta_edges"], category_closures,
+                       predicate_closures, symmetric_predicate_closures, index_file["asymmetric_predicates"].tolist(),
+                       prefix_closures)
+
+    def save(self, file_path: str):
+        prefixes = sorted({prefix for prefix_set in self.prefix_closures.values() for prefix in prefix_set})
+        prefix_ids = {prefix: prefix_id for prefix_id, prefix in enumerate(prefixes)}
+        numbered_prefix_closures = {f"{kp_id}|{category}": [prefix_ids[prefix] for prefix in prefix_set]
+                                    for (kp_id, category), prefix_set in self.prefix_closures.items()}
+        # Write to a temporary file first so that other processes never load a partially written index
+        temp_file_path = f"{file_path}.{os.getpid()}.tmp.npz"
+        np.savez(temp_file_path, version=np.array(self.version), biolink_version=np.array(self.biolink_version),
+                 kps=np.array(self.kps, dtype=str), kps_with_prefixes=np.array([kp in self.kps_with_prefixes for kp in self.kps], dtype=bool),
+                 categories=np.array(self.categories, dtype=str), predicates=np.array(self.predicates, dtype=str),
+                 meta_edges=self.meta_edges, prefixes=np.array(prefixes, dtype=str),
+                 asymmetric_predicates=np.array(sorted(self.asymmetric_predicates), dtype=str),
+                 **self._pack_closures(self.category_closures, "category"),
+                 **self._pack_closures(self.predicate_closures, "predicate"),
+                 **self._pack_closures(self.symmetric_predicate_closures, "symmetric_predicate"),
+                 **self._pack_closures(numbered_prefix_closures, "prefix"))
+        os.replace(temp_file_path, file_path)
+
+    def get_accepting_kps(self, subject_categories: Iterable[str], predicates: Iterable[str],
+                          object_categories: Iterable[str]) -> Set[str]:
+        """
+        Returns the KPs whose meta map has at least one triple covered by the given (un-expanded) QG categories and
+        predicates, in either direction for symmetric predicates. Empty inputs mean 'any'.
+        """
+        subject_categories = frozenset(subject_categories or [])
+        predicates = frozenset(predicates or [])
+        object_categories = frozenset(object_categories or [])
+        memo_key = (subject_categories, predicates, object_categories)
+        kps_bitset = self._memo.get(memo_key)
+        if kps_bitset is None:
+            subject_ids = self._get_closure(subject_categories, self.category_closures)
+            object_ids = self._get_closure(object_categories, self.category_closures)
+            predicate_ids = self._get_closure(predicates, self.predicate_closures)
+            kps_bitset = self._get_kps_bitset(subject_ids, predicate_ids, object_ids)
+            if kps_bitset != self.all_kps_bitset:
+                # Account for symmetric predicates by checking the swapped subject and object categories
+                # (Unrecognized predicates count as symmetric; if there are no symmetric predicates, any predicate goes)
+                if predicates.difference(self.asymmetric_predicates):
+                    symmetric_predicate_ids = self._get_closure(predicates, self.symmetric_predicate_closures)
+                else:
+                    symmetric_predicate_ids = None
+                kps_bitset |= self._get_kps_bitset(object_ids, symmetric_predicate_ids, subject_ids)
+            with self._memo_lock:
+                if len(self._memo) >= self.memo_size:
+                    self._memo.clear()
+                self._memo[memo_key] = kps_bitset
+        return {kp for kp_id, kp in enumerate(self.kps) if kps_bitset & (1 << kp_id)}
+
+    def get_supported_prefixes(self, categories: Iterable[str], kp: str) -> Set[str]:
+        kp_id = self.kp_ids.get(kp)
+        if kp_id is None:
+            return set()
+        return {prefix for category in categories or [] for prefix in self.prefix_closures.get((kp_id, category), [])}
+
+    def _get_kps_bitset(self, subject_ids: Optional[FrozenSet[int]], predicate_ids: Optional[FrozenSet[int]],
+                        object_ids: Optional[FrozenSet[int]]) -> int:
+        # None means 'any' for each of the inputs
+        kps_bitset = 0
+        subject_ids = self.kps_by_triple.keys() if subject_ids is None else subject_ids
+        for subject_id in subject_ids:
+            objects_dict = self.kps_by_triple.get(subject_id)
+            if not objects_dict:
+                continue
+            object_id_candidates = objects_dict.keys() if object_ids is None else object_ids
+            for object_id in object_id_candidates:
+                entry = objects_dict.get(object_id)
+                if entry is None:
+                    continue
+                kps_by_predicate, any_predicate_bitset = entry
+                if predicate_ids is None:
+                    kps_bitset |= any_predicate_bitset & self.any_predicate_kps_bitset
+                else:
+                    for predicate_id in predicate_ids:
+                        kps_bitset |= kps_by_predicate.get(predicate_id, 0)
+                if kps_bitset == self.all_kps_bitset:
+                    return kps_bitset
+        return kps_bitset
+
+    @staticmethod
+    def _get_closure(items: FrozenSet[str], closures: Dict[str, FrozenSet[int]]) -> Optional[FrozenSet[int]]:
+        if not items:
+            return None
+        return frozenset().union(*[closures.get(item, frozenset()) for item in items])
+
+    @staticmethod
+    def _pack_closures(closures: Dict[str, Iterable[int]], prefix: str) -> Dict[str, np.ndarray]:
+        # Stores a map of name -> ids as a names array plus CSR-style offsets into one flat array of ids
+        names = list(closures)
+        id_lists = [sorted(closures[name]) for name in names]
+        offsets = np.cumsum([0] + [len(id_list) for id_list in id_lists])
+        flat_ids = [item_id for id_list in id_lists for item_id in id_list]
+        return {f"{prefix}_closure_names": np.array(names, dtype=str),
+                f"{prefix}_closure_offsets": np.array(offsets, dtype=np.int64),
+                f"{prefix}_closure_ids": np.array(flat_ids, dtype=np.int32)}
+
+    @staticmethod
+    def _unpack_closures(index_file, prefix: str) -> Dict[str, FrozenSet[int]]:
+        names = index_file[f"{prefix}_closure_names"].tolist()
+        offsets = index_file[f"{prefix}_closure_offsets"].tolist()
+        flat_ids = index_file[f"{prefix}_closure_ids"].tolist()
+        return {name: frozenset(flat_ids[offsets[position]:offsets[position + 1]])
+                for position, name in enumerate(names)}
+
+    @staticmethod
+    def _to_bitset(item_ids: Iterable[int]) -> int:
+        bitset = 0
+        for item_id in item_ids:
+            bitset |= 1 << item_id
+        return bitset
@@ -0,0 +1,175 @@
+#!/bin/env python3
+# This class caches KPs' answers to one-hop (sub-)queries so that repeated queries can skip the remote round trip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class KPQueryCache:
+    """
+    Entries are keyed by a hash of (KP, normalized request body, KP version) and hold either the KP's (compacted)
+    JSON answer or, for a recent timeout/error, a 'negative' entry recording the failure. Since each ARAX query runs
+    in its own forked process, entries are kept in a small sqlite file shared by all processes, fronted by a
+    per-process LRU of compressed payloads. Answers are decoded afresh on every hit, so callers may modify them.
+    """
+
+    enabled = True
+    default_ttl = 60 * 60  # Seconds
+    ttl_by_kp = {"infores:rtx-kg2": 6 * 60 * 60,
+                 "infores:arax-normalized-google-distance": 6 * 60 * 60,
+                 "infores:cohd": 6 * 60 * 60,
+                 "infores:connections-hypothesis": 15 * 60}
+    failure_ttls = {"Timed out": 5 * 60, "Error": 2 * 60}
+    memory_cache_size = 64 * 2 ** 20  # Bytes of compressed payloads to keep in memory per process
+    max_disk_entries = 20000
+    prune_interval = 100  # Prune expired/excess entries from the sqlite file every this many writes
+    sqlite_path = f"{os.path.dirname(os.path.abspath(__file__))}/kp_query_cache.sqlite"
+    _memory_cache = OrderedDict()
+    _memory_cache_bytes = 0
+    _lock = threading.Lock()
+    _thread_local = threading.local()
+    _num_writes = 0
+
+    @classmethod
+    def get_cache_key(cls, kp_name: str, request_body: dict, kp_version: Optional[str]) -> str:
+        normalized_body = cls._normalize(request_body)
+        key_json = json.dumps([kp_name, kp_version, normalized_body], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(key_json.encode()).hexdigest()
+
+    @classmethod
+    def get(cls, cache_key: str) -> Optional[Tuple[str, any, int]]:
+        """
+        Returns (status, value, age in seconds) for a live entry, or None if there isn't one. Status is "Done" for a
+        cached answer (the value is the decoded answer) or "Timed out"/"Error" for a cached failure (the value is
+        the description of what went wrong).
+        """
+        if not cls.enabled:
+            return None
+        entry = cls._get_from_memory(cache_key)
+        if entry is None:
+            entry = cls._get_from_disk(cache_key)
+            if entry is None:
+                return None
+            cls._add_to_memory(cache_key, entry)
+        status, payload, created, expires = entry
+        now = time.time()
+        if expires < now:
+            return None
+        value = json.loads(zlib.decompress(payload)) if status == "Done" else payload.decode()
+        return status, value, round(now - created)
+
+    @classmethod
+    def store_answer(cls, cache_key: str, kp_name: str, answer: dict):
+        payload = zlib.compress(json.dumps(answer, separators=(",", ":")).encode())
+        cls._store(cache_key, kp_name, "Done", payload, cls.ttl_by_kp.get(kp_name, cls.default_ttl))
+
+    @classmethod
+    def store_failure(cls, cache_key: str, kp_name: str, status: str, description: str):
+        cls._store(cache_key, kp_name, status, description.encode(), cls.failure_ttls.get(status, cls.failure_ttls["Error"]))
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._memory_cache.clear()
+            cls._memory_cache_bytes = 0
+        connection = cls._get_connection()
+        if connection:
+            with connection:
+                connection.execute("DELETE FROM kp_query_cache")
+
+    @classmethod
+    def _store(cls, cache_key: str, kp_name: str, status: str, payload: bytes, ttl: int):
+        if not cls.enabled:
+            return
+        created = time.time()
+        entry = (status, payload, created, created + ttl)
+        cls._add_to_memory(cache_key, entry)
+        connection = cls._get_connection()
+        if connection:
+            try:
+                with connection:
+                    connection.execute("INSERT OR REPLACE INTO kp_query_cache VALUES (?, ?, ?, ?, ?, ?)",
+                                       (cache_key, kp_name, status, payload, created, created + ttl))
+                cls._num_writes += 1
+                if cls._num_writes % cls.prune_interval == 0:
+                    cls._prune_disk(connection)
+            except sqlite3.Error:
+                pass  # The cache is just an optimization; carry on with the in-memory copy
+
+    @classmethod
+    def _prune_disk(cls, connection: sqlite3.Connection):
+        with connection:
+            connection.execute("DELETE FROM kp_query_cache WHERE expires < ?", (time.time(),))
+            connection.execute("DELETE FROM kp_query_cache WHERE cache_key NOT IN "
+                               "(SELECT cache_key FROM kp_query_cache ORDER BY created DESC LIMIT ?)",
+                               (cls.max_disk_entries,))
+
+    @classmethod
+    def _get_from_memory(cls, cache_key: str) -> Optional[tuple]:
+        with cls._lock:
+            entry = cls._memory_cache.get(cache_key)
+            if entry is not None:
+                cls._memory_cache.move_to_end(cache_key)
+            return entry
+
+    @classmethod
+    def _add_to_memory(cls, cache_key: str, entry: tuple):
+        with cls._lock:
+            old_entry = cls._memory_cache.pop(cache_key, None)
+            if old_entry is not None:
+                cls._memory_cache_bytes -= len(old_entry[1])
+            cls._memory_cache[cache_key] = entry
+            cls._memory_cache_bytes += len(entry[1])
+            while cls._memory_cache_bytes > cls.memory_cache_size and len(cls._memory_cache) > 1:
+                _, evicted_entry = cls._memory_cache.popitem(last=False)
+                cls._memory_cache_bytes -= len(evicted_entry[1])
+
+    @classmethod
+    def _get_from_disk(cls, cache_key: str) -> Optional[tuple]:
+        connection = cls._get_connection()
+        if not connection:
+            return None
+        try:
+            row = connection.execute("SELECT status, payload, created, expires FROM kp_query_cache "
+                                     "WHERE cache_key = ? AND expires >= ?", (cache_key, time.time())).fetchone()
+        except sqlite3.Error:
+            return None
+        return (row[0], bytes(row[1]), row[2], row[3]) if row else None
+
+    @classmethod
+    def _get_connection(cls) -> Optional[sqlite3.Connection]:
+        """
+        Returns this thread's connection to the cache file (re-opened after a fork), or None if it can't be used.
+        """
+        connection_key = (os.getpid(), cls.sqlite_path)
+        if getattr(cls._thread_local, "connection_key", None) != connection_key:
+            try:
+                connection = sqlite3.connect(cls.sqlite_path, timeout=5)
+                connection.execute("PRAGMA journal_mode = WAL")
+                connection.execute("CREATE TABLE IF NOT EXISTS kp_query_cache (cache_key TEXT PRIMARY KEY, kp TEXT, "
+                                   "status TEXT, payload BLOB, created REAL, expires REAL)")
+            except sqlite3.Error:
+                connection = None
+            cls._thread_local.connection = connection
+            cls._thread_local.connection_key = connection_key
+        return cls._thread_local.connection
+
+    @classmethod
+    def _normalize(cls, item: any) -> any:
+        # Order doesn't matter for lists of curies/categories/predicates, so sort those to make the key canonical
+        if isinstance(item, dict):
+            return {key: cls._normalize(value) for key, value in item.items()}
+        elif isinstance(item, list):
+            normalized_items = [cls._normalize(value) for value in item]
+            if all(isinstance(value, str) for value in normalized_items):
+                return sorted(set(normalized_items))
+            return normalized_items
+        else:
+            return item
+
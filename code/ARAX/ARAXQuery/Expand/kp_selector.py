@@ -1,18 +1,21 @@
 #!/bin/env python3
+import argparse
+import concurrent.futures
 import pickle
+import subprocess
 from datetime import datetime, timedelta
 import os
 import pathlib
 import sys
 from typing import Set, Dict, List, Optional
 from collections import defaultdict
-from itertools import product
 
 import requests
 import requests_cache
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import expand_utilities as eu
+from kp_meta_map_index import KPMetaMapIndex
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
 from ARAX_response import ARAXResponse
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../BiolinkHelper")
@@ -23,14 +26,20 @@ from openapi_server.models.query_graph import QueryGraph
 
 class KPSelector:
 
+    max_cached_curies = 10000
+    refresh_lock_max_age = timedelta(minutes=10)
+
     def __init__(self, log: ARAXResponse = ARAXResponse()):
         self.meta_map_path = f"{os.path.dirname(os.path.abspath(__file__))}/meta_map_v2.pickle"
+        self.meta_map_index_path = f"{os.path.dirname(os.path.abspath(__file__))}/meta_map_index_v{KPMetaMapIndex.version}.npz"
         self.timeout_record_path = f"{os.path.dirname(os.path.abspath(__file__))}/kp_timeout_record.pickle"
+        self.refresh_lock_path = f"{os.path.dirname(os.path.abspath(__file__))}/meta_map_refresh.lock"
         self.log = log
         self.all_kps = eu.get_all_kps()
-        self.timeout_record = self._load_timeout_record()
-        self.meta_map = self._load_meta_map()
         self.biolink_helper = BiolinkHelper()
+        self.timeout_record = self._load_timeout_record()
+        self.meta_map_index = self._load_meta_map()
+        self.equivalent_curies_by_prefix = dict()  # Input curie -> uppercase prefix -> equivalent curies (shared by KPs)
 
     def get_kps_for_single_hop_qg(self, qg: QueryGraph) -> Optional[Set[str]]:
         """
@@ -44,22 +53,11 @@ class KPSelector:
         if len(qg.edges) > 1:
             self.log.error(f"Query graph can only have one edge, but instead has {len(qg.edges)}.", error_code="UnexpectedQG")
             return None
-        # isolate possible subject predicate object from qg
-        sub_categories = set(self.biolink_helper.get_descendants(qg.nodes[qedge.subject].categories))
-        obj_categories = set(self.biolink_helper.get_descendants(qg.nodes[qedge.object].categories))
-        predicates = set(self.biolink_helper.get_descendants(qedge.predicates))
-
-        symmetrical_predicates = set(filter(self.biolink_helper.is_symmetric, predicates))
-
-        # use metamap to check kp for predicate triple
-        accepting_kps = set()
-        for kp in self.meta_map:
-            if self._triple_is_in_meta_map(kp, sub_categories, predicates, obj_categories):
-                accepting_kps.add(kp)
-            # account for symmetrical predicates by checking if kp accepts with swapped sub and obj categories
-            elif self._triple_is_in_meta_map(kp, obj_categories, symmetrical_predicates, sub_categories):
-                accepting_kps.add(kp)
-            else:
+        # use the meta map index to find KPs with a matching triple (the index accounts for descendants and symmetry)
+        accepting_kps = self.meta_map_index.get_accepting_kps(qg.nodes[qedge.subject].categories, qedge.predicates,
+                                                              qg.nodes[qedge.object].categories)
+        for kp in self.meta_map_index.kps:
+            if kp not in accepting_kps:
                 self.log.update_query_plan(qedge_key, kp, "Skipped", "MetaKG indicates this qedge is unsupported")
 
         return accepting_kps
@@ -76,28 +74,28 @@ class KPSelector:
                            error_code="UnexpectedQG")
             return None
 
-        qedge = list(qg.edges.values())[0]
-        sub_categories = set(self.biolink_helper.get_descendants(qg.nodes[qedge.subject].categories))
-        obj_categories = set(self.biolink_helper.get_descendants(qg.nodes[qedge.object].categories))
-        predicates = set(self.biolink_helper.get_descendants(qedge.predicates))
-        kp_accepts = self._triple_is_in_meta_map(kp, sub_categories, predicates, obj_categories)
-
-        # account for symmetrical predicates by checking if kp accepts with swapped sub and obj categories
-        symmetrical_predicates = set(filter(self.biolink_helper.is_symmetric, predicates))
-        kp_accepts = kp_accepts or self._triple_is_in_meta_map(kp, obj_categories, symmetrical_predicates, sub_categories)
+        if kp not in self.meta_map_index.kp_ids:
+            if kp not in self.all_kps:
+                self.log.error(f"{kp} does not seem to be a valid KP for ARAX. Valid KPs are: {self.all_kps}", error_code="InvalidKP")
+            else:
+                self.log.warning(f"Somehow missing meta info for {kp}.")
+            return False
 
-        return kp_accepts
+        qedge = list(qg.edges.values())[0]
+        accepting_kps = self.meta_map_index.get_accepting_kps(qg.nodes[qedge.subject].categories, qedge.predicates,
+                                                              qg.nodes[qedge.object].categories)
+        return kp in accepting_kps
 
     def get_desirable_equivalent_curies(self, curies: List[str], categories: Optional[List[str]], kp: str) -> List[str]:
         """
         For each input curie, this function returns an equivalent curie(s) that uses a prefix the KP supports.
         """
         self.log.debug(f"{kp}: Converting curies in the QG to kinds that {kp} can answer")
-        if not self.meta_map.get(kp):
+        if kp not in self.meta_map_index.kp_ids:
             self.log.warning(f"{kp}: Somehow missing meta info for {kp}. Cannot do curie prefix conversion; will send "
                              f"curies as they are.")
             return curies
-        elif not self.meta_map[kp].get("prefixes"):
+        elif kp not in self.meta_map_index.kps_with_prefixes:
             self.log.warning(f"{kp}: No supported prefix info is available for {kp}. Will send curies as they are.")
             return curies
         else:
@@ -106,15 +104,11 @@ class KPSelector:
                            f"{supported_prefixes}")
             converted_curies = set()
             unsupported_curies = set()
-            synonyms_dict = eu.get_curie_synonyms_dict(curies)
             # Convert each input curie to a preferred, supported prefix
-            for input_curie, equivalent_curies in synonyms_dict.items():
+            for input_curie, equiv_curies_by_prefix in self._get_equivalent_curies_by_prefix(curies).items():
                 input_curie_prefix = self._get_uppercase_prefix(input_curie)
-                supported_equiv_curies_by_prefix = defaultdict(set)
-                for curie in equivalent_curies:
-                    prefix = self._get_uppercase_prefix(curie)
-                    if prefix in supported_prefixes:
-                        supported_equiv_curies_by_prefix[prefix].add(curie)
+                supported_equiv_curies_by_prefix = {prefix: equiv_curies for prefix, equiv_curies in equiv_curies_by_prefix.items()
+                                                    if prefix in supported_prefixes}
                 if supported_equiv_curies_by_prefix:
                     # Grab equivalent curies with the same prefix as the input curie, if available
                     if input_curie_prefix in supported_equiv_curies_by_prefix:
@@ -130,76 +124,91 @@ class KPSelector:
                                  f"{unsupported_curies}; will not send these to KP")
             return list(converted_curies)
 
-    # returns True if at least one possible triple exists in the KP's meta map
-    def _triple_is_in_meta_map(self, kp: str, subject_categories: Set[str], predicates: Set[str], object_categories: Set[str]) -> bool:
-        kp_meta_map = self.meta_map.get(kp)
-        if not kp_meta_map:
-            if kp not in self.all_kps:
-                self.log.error(f"{kp} does not seem to be a valid KP for ARAX. Valid KPs are: {self.all_kps}", error_code="InvalidKP")
-            else:
-                self.log.warning(f"Somehow missing meta info for {kp}.")
-            return False
-        else:
-            predicates_map = kp_meta_map["predicates"]
-            # handle potential emptiness of sub, obj, predicate lists
-            if not subject_categories:  # any subject
-                subject_categories = set(predicates_map.keys())
-            if not object_categories:  # any object
-                object_set = set()
-                _ = [object_set.add(obj) for obj_dict in predicates_map.values() for obj in obj_dict.keys()]
-                object_categories = object_set
-            any_predicate = False if predicates or kp == "NGD" else True
-
-            # handle combinations of subject and objects using cross product
-            qg_sub_obj_dict = defaultdict(lambda: set())
-            for sub, obj in list(product(subject_categories, object_categories)):
-                qg_sub_obj_dict[sub].add(obj)
-
-            # check for subjects
-            kp_allowed_subs = set(predicates_map.keys())
-            accepted_subs = kp_allowed_subs.intersection(set(qg_sub_obj_dict.keys()))
-
-            # check for objects
-            for sub in accepted_subs:
-                kp_allowed_objs = set(predicates_map[sub].keys())
-                accepted_objs = kp_allowed_objs.intersection(qg_sub_obj_dict[sub])
-                if len(accepted_objs) > 0:
-                    # check predicates
-                    for obj in accepted_objs:
-                        if any_predicate or predicates.intersection(predicates_map[sub][obj]):
-                            return True
-            return False
+    def refresh_meta_map(self):
+        """
+        Fetches fresh meta info from all KPs (concurrently), saves the new meta map and index, and starts using them.
+        """
+        meta_map = self._refresh_meta_map()
+        self.meta_map_index = self._compile_meta_map_index(meta_map)
 
-    def _load_meta_map(self):
-        # This function loads the meta map and updates it as needed
+    def _load_meta_map(self) -> KPMetaMapIndex:
+        # This function loads the (indexed) meta map, kicking off a background refresh of it as needed
         meta_map_file = pathlib.Path(self.meta_map_path)
-        one_day_ago = datetime.now() - timedelta(hours=24)
         if not meta_map_file.exists():
+            # There's no snapshot to fall back on, so we have to wait for this one
             self.log.debug(f"Creating local copy of meta map for all KPs")
-            meta_map = self._refresh_meta_map()
-        elif datetime.fromtimestamp(meta_map_file.stat().st_mtime) < one_day_ago:
-            self.log.debug(f"Doing a refresh of local meta map for all KPs")
-            meta_map = self._refresh_meta_map()
+            return self._compile_meta_map_index(self._refresh_meta_map())
+
+        # Use the compiled index if it's up to date (the usual case)
+        meta_map_index = self._get_current_meta_map_index()
+        if meta_map_index and not set(meta_map_index.kps).difference(self.all_kps):
+            self.log.debug(f"Loaded meta map index")
         else:
-            self.log.debug(f"Loading meta map (already exists and isn't due for a refresh)")
+            self.log.debug(f"Loading meta map")
             with open(self.meta_map_path, "rb") as map_file:
                 meta_map = pickle.load(map_file)
-            # Check for any missing KPs
-            missing_kps = self.all_kps.difference(set(meta_map))
-            if missing_kps:
-                self.log.debug(f"Missing meta info for {missing_kps}")
-                meta_map = self._refresh_meta_map(missing_kps, meta_map)
+            meta_map_index = self._compile_meta_map_index(meta_map)
 
-        # Make sure the map doesn't contain any 'stale' KPs
+        # Queries keep using this snapshot while a fresh one is fetched in the background
+        one_day_ago = datetime.now() - timedelta(hours=24)
+        missing_kps = self.all_kps.difference(meta_map_index.kps).difference(self._get_non_functioning_kps(self.all_kps))
+        if datetime.fromtimestamp(meta_map_file.stat().st_mtime) < one_day_ago:
+            self.log.debug(f"Meta map is more than 24 hours old; will refresh it in the background")
+            self._start_background_refresh()
+        elif missing_kps:
+            self.log.debug(f"Missing meta info for {missing_kps}; will refresh meta map in the background")
+            self._start_background_refresh()
+
+        return meta_map_index
+
+    def _compile_meta_map_index(self, meta_map: Dict[str, dict]) -> KPMetaMapIndex:
+        # Make sure the index doesn't contain any 'stale' KPs
         stale_kps = set(meta_map).difference(self.all_kps)
-        if stale_kps:
-            for stale_kp in stale_kps:
-                self.log.debug(f"Detected a stale KP in meta map ({stale_kp}) - deleting it")
-                del meta_map[stale_kp]
-            with open(self.meta_map_path, "wb") as map_file:
-                pickle.dump(meta_map, map_file)  # Save these changes
-
-        return meta_map
+        for stale_kp in stale_kps:
+            self.log.debug(f"Detected a stale KP in meta map ({stale_kp}) - leaving it out")
+        meta_map = {kp: kp_meta_map for kp, kp_meta_map in meta_map.items() if kp not in stale_kps}
+
+        self.log.debug(f"Compiling meta map index")
+        meta_map_index = KPMetaMapIndex.from_meta_map(meta_map, self.biolink_helper.biolink_version)
+        meta_map_index.save(self.meta_map_index_path)
+        return meta_map_index
+
+    def _get_current_meta_map_index(self) -> Optional[KPMetaMapIndex]:
+        # The index is only current if it was compiled (for our Biolink version) from the latest meta map file
+        meta_map_index = KPMetaMapIndex.get(self.meta_map_index_path)
+        if meta_map_index and meta_map_index.biolink_version == self.biolink_helper.biolink_version and \
+                os.path.getmtime(self.meta_map_index_path) >= os.path.getmtime(self.meta_map_path):
+            return meta_map_index
+        return None
+
+    def _start_background_refresh(self):
+        """
+        Launches a detached process (running this module) that refreshes the meta map, unless one is already running.
+        The process outlives the query that started it; the lock file it holds is considered abandoned after a while.
+        """
+        try:
+            if datetime.fromtimestamp(os.path.getmtime(self.refresh_lock_path)) < datetime.now() - self.refresh_lock_max_age:
+                self.log.debug(f"Removing abandoned meta map refresh lock")
+                os.remove(self.refresh_lock_path)
+        except OSError:
+            pass  # No lock file
+        try:
+            lock_file_descriptor = os.open(self.refresh_lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            self.log.debug(f"A background refresh of the meta map is already underway")
+            return
+        os.close(lock_file_descriptor)
+        try:
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), "--refresh", "--lock", self.refresh_lock_path],
+                             stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                             start_new_session=True)
+        except Exception:
+            self.log.warning(f"Unable to start a background refresh of the meta map")
+            os.remove(self.refresh_lock_path)
+
+    def _get_non_functioning_kps(self, kps: Set[str]) -> Set[str]:
+        ten_minutes_ago = datetime.now() - timedelta(minutes=10)
+        return {kp for kp in kps if self.timeout_record.get(kp) and self.timeout_record[kp] > ten_minutes_ago}
 
     def _refresh_meta_map(self, kps: Optional[Set[str]] = None, meta_map: Optional[Dict[str, dict]] = None):
         # Create an up to date version of the meta map
@@ -215,36 +224,29 @@ class KPSelector:
                 meta_map = dict()
 
         # Then (try to) get updated meta info from each KP
-        ten_minutes_ago = datetime.now() - timedelta(minutes=10)
-        non_functioning_kps = [kp for kp in kps_to_update if self.timeout_record.get(kp) and
-                               self.timeout_record[kp] > ten_minutes_ago]
+        non_functioning_kps = self._get_non_functioning_kps(kps_to_update)
         if non_functioning_kps:
-            self.log.debug(f"Not trying to grab meta info for {non_functioning_kps} because they timed out "
+            self.log.debug(f"Not trying to grab meta info for {non_functioning_kps} because they timed out or failed "
                            f"within the last 10 minutes")
-        functioning_kps_to_update = set(kps_to_update).difference(set(non_functioning_kps))
-        for kp in functioning_kps_to_update:
-            kp_endpoint = eu.get_kp_endpoint_url(kp)
-            if kp_endpoint:
-                try:
-                    self.log.debug(f"Getting meta info from {kp}")
-                    with requests_cache.disabled():
-                        kp_response = requests.get(f"{kp_endpoint}/meta_knowledge_graph", timeout=10)
-                except requests.exceptions.Timeout:
-                    self.log.warning(f"Timed out when trying to hit {kp}'s /meta_knowledge_graph endpoint "
-                                     f"(waited 10 seconds)")
-                    self.timeout_record[kp] = datetime.now()
-                except Exception:
-                    self.log.warning(f"Ran into a problem getting {kp}'s meta info")
+        functioning_kps_to_update = set(kps_to_update).difference(non_functioning_kps)
+        kp_endpoints = {kp: eu.get_kp_endpoint_url(kp) for kp in functioning_kps_to_update}
+        kps_with_endpoints = [kp for kp, kp_endpoint in kp_endpoints.items() if kp_endpoint]
+        if kps_with_endpoints:
+            self.log.debug(f"Getting meta info from {len(kps_with_endpoints)} KPs concurrently")
+            with requests_cache.disabled():
+                with concurrent.futures.ThreadPoolExecutor(max_workers=len(kps_with_endpoints)) as executor:
+                    meta_kgs = dict(zip(kps_with_endpoints, executor.map(self._get_kp_meta_kg,
+                                                                         kps_with_endpoints,
+                                                                         [kp_endpoints[kp] for kp in kps_with_endpoints])))
+            for kp, kp_meta_kg in meta_kgs.items():
+                if kp_meta_kg:
+                    meta_map[kp] = {"predicates": self._convert_to_meta_map(kp_meta_kg),
+                                    "prefixes": {category: meta_node["id_prefixes"]
+                                                 for category, meta_node in kp_meta_kg["nodes"].items()}}
                 else:
-                    if kp_response.status_code == 200:
-                        kp_meta_kg = kp_response.json()
-                        meta_map[kp] = {"predicates": self._convert_to_meta_map(kp_meta_kg),
-                                        "prefixes": {category: meta_node["id_prefixes"]
-                                                     for category, meta_node in kp_meta_kg["nodes"].items()}}
-                    else:
-                        self.log.warning(f"Unable to access {kp}'s /meta_knowledge_graph endpoint (returned status of "
-                                         f"{kp_response.status_code})")
-            elif kp == "infores:arax-drug-treats-disease":
+                    self.timeout_record[kp] = datetime.now()
+        for kp in functioning_kps_to_update.difference(kps_with_endpoints):
+            if kp == "infores:arax-drug-treats-disease":
                 meta_map[kp] = {"predicates": self._get_dtd_meta_map(),
                                 "prefixes": dict()}
             elif kp == "infores:arax-normalized-google-distance":
@@ -253,14 +255,42 @@ class KPSelector:
                 meta_map[kp] = {"predicates": predicates,
                                 "prefixes": dict()}
 
-        # Save our big combined metamap to a local json file
-        with open(self.meta_map_path, "wb") as map_file:
-            pickle.dump(meta_map, map_file)
-        with open(self.timeout_record_path, "wb") as timeout_file:
-            pickle.dump(self.timeout_record, timeout_file)
+        # Drop any 'stale' KPs and save our big combined metamap (atomically, since other processes may be reading it)
+        meta_map = {kp: kp_meta_map for kp, kp_meta_map in meta_map.items() if kp in self.all_kps}
+        self._save_pickle(meta_map, self.meta_map_path)
+        self._save_pickle(self.timeout_record, self.timeout_record_path)
 
         return meta_map
 
+    def _get_kp_meta_kg(self, kp: str, kp_endpoint: str) -> Optional[dict]:
+        # Returns the KP's meta knowledge graph, or None if we couldn't get it
+        try:
+            self.log.debug(f"Getting meta info from {kp}")
+            kp_response = requests.get(f"{kp_endpoint}/meta_knowledge_graph", timeout=10)
+        except requests.exceptions.Timeout:
+            self.log.warning(f"Timed out when trying to hit {kp}'s /meta_knowledge_graph endpoint "
+                             f"(waited 10 seconds)")
+        except Exception:
+            self.log.warning(f"Ran into a problem getting {kp}'s meta info")
+        else:
+            if kp_response.status_code == 200:
+                try:
+                    return kp_response.json()
+                except ValueError:
+                    self.log.warning(f"{kp}'s /meta_knowledge_graph endpoint returned invalid JSON")
+            else:
+                self.log.warning(f"Unable to access {kp}'s /meta_knowledge_graph endpoint (returned status of "
+                                 f"{kp_response.status_code})")
+        return None
+
+    @staticmethod
+    def _save_pickle(obj: any, file_path: str):
+        # Write to a temporary file first so that readers never load a partially written file
+        temp_file_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_file_path, "wb") as temp_file:
+            pickle.dump(obj, temp_file)
+        os.replace(temp_file_path, file_path)
+
     @staticmethod
     def _convert_to_meta_map(kp_meta_kg: dict) -> dict:
         kp_meta_map = dict()
@@ -334,8 +364,38 @@ class KPSelector:
         return curie.split(":")[0].upper()
 
     def _get_supported_prefixes(self, categories: List[str], kp: str) -> Set[str]:
-        bh = BiolinkHelper()
-        categories_with_descendants = bh.get_descendants(eu.convert_to_list(categories), include_mixins=False)
-        supported_prefixes = {prefix.upper() for category in categories_with_descendants
-                              for prefix in self.meta_map[kp]["prefixes"].get(category, set())}
-        return supported_prefixes
+        # The index already accounts for the prefixes supported for the categories' descendants
+        return self.meta_map_index.get_supported_prefixes(eu.convert_to_list(categories), kp)
+
+    def _get_equivalent_curies_by_prefix(self, curies: List[str]) -> Dict[str, Dict[str, Set[str]]]:
+        # Equivalent curies are looked up and grouped by prefix once per KPSelector, rather than once per KP
+        uncached_curies = [curie for curie in curies if curie not in self.equivalent_curies_by_prefix]
+        if uncached_curies:
+            if len(self.equivalent_curies_by_prefix) > self.max_cached_curies:
+                self.equivalent_curies_by_prefix = dict()
+            for input_curie, equivalent_curies in eu.get_curie_synonyms_dict(uncached_curies).items():
+                equiv_curies_by_prefix = defaultdict(set)
+                for curie in equivalent_curies:
+                    equiv_curies_by_prefix[self._get_uppercase_prefix(curie)].add(curie)
+                self.equivalent_curies_by_prefix[input_curie] = dict(equiv_curies_by_prefix)
+        return {curie: self.equivalent_curies_by_prefix[curie] for curie in curies
+                if curie in self.equivalent_curies_by_prefix}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Refreshes the meta map that Expand uses to select KPs")
+    arg_parser.add_argument("--refresh", action="store_true", help="fetch fresh meta info from all KPs")
+    arg_parser.add_argument("--lock", help="path of a lock file to remove once the refresh is done")
+    args = arg_parser.parse_args()
+    try:
+        if args.refresh:
+            kp_selector = KPSelector()
+            kp_selector.refresh_meta_map()
+            print(f"Refreshed meta map for {len(kp_selector.meta_map_index.kps)} KPs")
+    finally:
+        if args.lock and os.path.exists(args.lock):
+            os.remove(args.lock)
+
+
+if __name__ == "__main__":
+    main()
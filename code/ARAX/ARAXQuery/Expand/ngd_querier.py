@@ -2,15 +2,13 @@
 import copy
 import sys
 import os
-import traceback
-import ast
-from typing import List, Dict, Tuple
+from typing import Tuple
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import expand_utilities as eu
 from expand_utilities import QGOrganizedKnowledgeGraph
+from kg2_querier import KG2Querier
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
-from ARAX_query import ARAXQuery
 from ARAX_response import ARAXResponse
 from ARAX_decorator import ARAXDecorator
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../Overlay/")
@@ -20,8 +18,6 @@ from openapi_server.models.node import Node
 from openapi_server.models.edge import Edge
 from openapi_server.models.attribute import Attribute
 from openapi_server.models.query_graph import QueryGraph
-from openapi_server.models.q_node import QNode
-from openapi_server.models.message import Message
 
 
 class NGDQuerier:
@@ -57,50 +53,45 @@ class NGDQuerier:
         source_qnode_key = qedge.subject
         target_qnode_key = qedge.object
 
-        # Find potential answers using KG2
+        # Find potential answers using KG2 (queried directly, in this process)
         log.debug(f"Finding potential answers using KG2")
         modified_qg = copy.deepcopy(query_graph)
         for qedge in modified_qg.edges.values():
             qedge.predicates = None
-
-        request_body = {"message": {"query_graph": modified_qg.to_dict()}}
-        kg2_response, kg2_message = self._run_arax_query(request_body, log)
-        if log.status != 'OK':
+        kg2_log = ARAXResponse()  # Keep KG2's query plan updates etc. separate from those for this qedge
+        kg2_answer_kg = KG2Querier(kg2_log).answer_one_hop_query(modified_qg)
+        if kg2_log.status != 'OK':
+            log.error(f"Encountered an error getting potential answers from KG2: {kg2_log.show(level=kg2_log.DEBUG)}")
             return final_kg
 
-        # Go through those answers from KG2 and calculate ngd for each edge
-        log.debug(f"Calculating NGD between each potential node pair")
-        kg2_answer_kg = kg2_message.knowledge_graph
-        cngd = ComputeNGD(log, kg2_message, None)
-        cngd.load_curie_to_pmids_data(kg2_answer_kg.nodes)
-        kg2_edge_ngd_map = dict()
-        for kg2_edge_key, kg2_edge in kg2_answer_kg.edges.items():
-            kg2_node_1_key = kg2_edge.subject
-            kg2_node_2_key = kg2_edge.object
-            kg2_node_1 = kg2_answer_kg.nodes.get(kg2_node_1_key)  # These are already canonicalized (default behavior)
-            kg2_node_2 = kg2_answer_kg.nodes.get(kg2_node_2_key)
-            # Figure out which node corresponds to source qnode (don't necessarily match b/c query was bidirectional)
-            if source_qnode_key in kg2_node_1.qnode_keys and target_qnode_key in kg2_node_2.qnode_keys:
-                ngd_subject = kg2_node_1_key
-                ngd_object = kg2_node_2_key
+        # Figure out the node pairs to calculate ngd for (KG2 edges go either direction, and are already canonicalized)
+        source_nodes = kg2_answer_kg.nodes_by_qg_id.get(source_qnode_key, dict())
+        target_nodes = kg2_answer_kg.nodes_by_qg_id.get(target_qnode_key, dict())
+        kg2_nodes = {**target_nodes, **source_nodes}
+        node_pairs = set()
+        for kg2_edge in kg2_answer_kg.edges_by_qg_id.get(qedge_key, dict()).values():
+            if kg2_edge.subject == kg2_edge.object:
+                continue  # Skip self-edges
+            elif kg2_edge.subject in source_nodes and kg2_edge.object in target_nodes:
+                node_pairs.add((kg2_edge.subject, kg2_edge.object))
             else:
-                ngd_subject = kg2_node_2_key
-                ngd_object = kg2_node_1_key
-            ngd_value, pmid_set = cngd.calculate_ngd_fast(ngd_subject, ngd_object)
-            kg2_edge_ngd_map[kg2_edge_key] = {"ngd_value": ngd_value, "subject": ngd_subject, "object": ngd_object, "pmids": [f"PMID:{pmid}" for pmid in pmid_set]}
+                node_pairs.add((kg2_edge.object, kg2_edge.subject))
+
+        # Calculate ngd for all of those pairs in one batch
+        log.debug(f"Calculating NGD between {len(node_pairs)} potential node pairs")
+        cngd = ComputeNGD(log, None, None)
+        cngd.load_curie_to_pmids_data({node_key for node_pair in node_pairs for node_key in node_pair})
+        ngd_by_node_pair = cngd.calculate_ngd_for_pairs(node_pairs)
 
         # Create edges for those from KG2 found to have a low enough ngd value
         threshold = 0.5
         log.debug(f"Creating edges between node pairs with NGD below the threshold ({threshold})")
-        for kg2_edge_key, ngd_info_dict in kg2_edge_ngd_map.items():
-            ngd_value = ngd_info_dict['ngd_value']
+        for (subject, object), (ngd_value, pmid_set) in ngd_by_node_pair.items():
             if ngd_value is not None and ngd_value < threshold:  # TODO: Make determination of the threshold much more sophisticated
-                subject = ngd_info_dict["subject"]
-                object = ngd_info_dict["object"]
-                pmid_list = ngd_info_dict["pmids"]
+                pmid_list = [f"PMID:{pmid}" for pmid in pmid_set]
                 ngd_edge_key, ngd_edge = self._create_ngd_edge(ngd_value, subject, object, pmid_list)
-                ngd_source_node_key, ngd_source_node = self._create_ngd_node(ngd_edge.subject, kg2_answer_kg.nodes.get(ngd_edge.subject))
-                ngd_target_node_key, ngd_target_node = self._create_ngd_node(ngd_edge.object, kg2_answer_kg.nodes.get(ngd_edge.object))
+                ngd_source_node_key, ngd_source_node = self._create_ngd_node(ngd_edge.subject, kg2_nodes.get(ngd_edge.subject))
+                ngd_target_node_key, ngd_target_node = self._create_ngd_node(ngd_edge.object, kg2_nodes.get(ngd_edge.object))
                 final_kg.add_edge(ngd_edge_key, ngd_edge, qedge_key)
                 final_kg.add_node(ngd_source_node_key, ngd_source_node, source_qnode_key)
                 final_kg.add_node(ngd_target_node_key, ngd_target_node, target_qnode_key)
@@ -131,14 +122,6 @@ class NGDQuerier:
         ngd_node.categories = kg2_node.categories
         return ngd_node_key, ngd_node
 
-    @staticmethod
-    def _run_arax_query(request_body: dict, log: ARAXResponse) -> Tuple[ARAXResponse, Message]:
-        araxq = ARAXQuery()
-        sub_query_response = araxq.query(request_body, mode="RTXKG2")
-        if sub_query_response.status != 'OK':
-            log.error(f"Encountered an error running ARAXQuery within Expand: {sub_query_response.show(level=sub_query_response.DEBUG)}")
-        return sub_query_response, araxq.message
-
     @staticmethod
     def _verify_one_hop_query_graph_is_valid(query_graph: QueryGraph, log: ARAXResponse):
         if len(query_graph.edges) != 1:
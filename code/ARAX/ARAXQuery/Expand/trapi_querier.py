@@ -16,6 +16,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import Expand.expand_utilities as eu
 from Expand.expand_utilities import QGOrganizedKnowledgeGraph
 from Expand.kp_selector import KPSelector
+from Expand.kp_query_cache import KPQueryCache
+from Expand.kp_health_monitor import KPHealthMonitor
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
 from ARAX_response import ARAXResponse
 from ARAX_messenger import ARAXMessenger
@@ -174,11 +176,26 @@ class TRAPIQuerier:
     async def _answer_query_using_kp_async(self, query_graph: QueryGraph) -> QGOrganizedKnowledgeGraph:
         request_body = self._get_prepped_request_body(query_graph)
         query_sent = copy.deepcopy(request_body)
-        query_timeout = self._get_query_timeout_length()
+        query_shape = KPHealthMonitor.get_query_shape(request_body)
+        query_timeout = self._get_query_timeout_length(query_shape)
         qedge_key = next(qedge_key for qedge_key in query_graph.edges)
 
         # Avoid calling the KG2 TRAPI endpoint if the 'force_local' flag is set (used only for testing/dev work)
         num_input_curies = max([len(eu.convert_to_list(qnode.ids)) for qnode in query_graph.nodes.values()])
+
+        # Skip the round trip if we've recently sent this exact query to this KP
+        cache_key = self._get_cache_key(request_body)
+        if cache_key:
+            cached_answer_kg = self._get_cached_answer(cache_key, qedge_key, query_sent)
+            if cached_answer_kg is not None:
+                return cached_answer_kg
+
+        # Don't hold up the rest of the query waiting on a KP that has been failing recently
+        open_circuit_message = self._get_open_circuit_message()
+        if open_circuit_message:
+            self.log.update_query_plan(qedge_key, self.kp_name, "Skipped", open_circuit_message, query=query_sent)
+            return QGOrganizedKnowledgeGraph()
+
         waiting_message = f"Query with {num_input_curies} curies sent: waiting for response"
         self.log.update_query_plan(qedge_key, self.kp_name, "Waiting", waiting_message, query=query_sent)
         start = time.time()
@@ -200,20 +217,28 @@ class TRAPIQuerier:
                             http_error_message = f"Returned HTTP error {response.status} after {wait_time} seconds"
                             self.log.warning(f"{self.kp_name}: {http_error_message}. Query sent to KP was: {request_body}")
                             self.log.update_query_plan(qedge_key, self.kp_name, "Error", http_error_message)
+                            self._cache_failure(cache_key, "Error", http_error_message)
+                            self._record_outcome(query_shape, start, "Error")
                             return QGOrganizedKnowledgeGraph()
                 except concurrent.futures._base.TimeoutError:
                     timeout_message = f"Query timed out after {query_timeout} seconds"
                     self.log.warning(f"{self.kp_name}: {timeout_message}")
                     self.log.update_query_plan(qedge_key, self.kp_name, "Timed out", timeout_message)
+                    self._cache_failure(cache_key, "Timed out", timeout_message)
+                    self._record_outcome(query_shape, start, "Timed out")
                     return QGOrganizedKnowledgeGraph()
                 except Exception as ex:
                     wait_time = round(time.time() - start)
                     exception_message = f"Request threw exception after {wait_time} seconds: {type(ex)}"
                     self.log.warning(f"{self.kp_name}: {exception_message}")
                     self.log.update_query_plan(qedge_key, self.kp_name, "Error", exception_message)
+                    self._cache_failure(cache_key, "Error", exception_message)
+                    self._record_outcome(query_shape, start, "Error")
                     return QGOrganizedKnowledgeGraph()
+            self._record_outcome(query_shape, start, "Done")
 
         wait_time = round(time.time() - start)
+        self._cache_answer(cache_key, json_response)
         answer_kg = self._load_kp_json_response(json_response)
         done_message = f"Returned {len(answer_kg.edges_by_qg_id.get(qedge_key, dict()))} edges in {wait_time} seconds"
         self.log.update_query_plan(qedge_key, self.kp_name, "Done", done_message)
@@ -222,7 +247,22 @@ class TRAPIQuerier:
     def _answer_query_using_kp(self, query_graph: QueryGraph) -> QGOrganizedKnowledgeGraph:
         # TODO: Delete this method once we're ready to let go of the multiprocessing (vs. asyncio) option
         request_body = self._get_prepped_request_body(query_graph)
-        query_timeout = self._get_query_timeout_length()
+        query_shape = KPHealthMonitor.get_query_shape(request_body)
+        query_timeout = self._get_query_timeout_length(query_shape)
+
+        # Skip the round trip if we've recently sent this exact query to this KP
+        cache_key = self._get_cache_key(request_body)
+        if cache_key:
+            qedge_key = next(qedge_key for qedge_key in query_graph.edges)
+            cached_answer_kg = self._get_cached_answer(cache_key, qedge_key, copy.deepcopy(request_body))
+            if cached_answer_kg is not None:
+                return cached_answer_kg
+
+        # Don't hold up the rest of the query waiting on a KP that has been failing recently
+        open_circuit_message = self._get_open_circuit_message()
+        if open_circuit_message:
+            self.log.warning(f"{self.kp_name}: {open_circuit_message}")
+            return QGOrganizedKnowledgeGraph()
 
         # Avoid calling the KG2 TRAPI endpoint if the 'force_local' flag is set (used only for testing/dev work)
         if self.force_local and self.kp_name == 'infores:rtx-kg2':
@@ -230,9 +270,9 @@ class TRAPIQuerier:
         # Otherwise send the query graph to the KP's TRAPI API
         else:
             self.log.debug(f"{self.kp_name}: Sending query to {self.kp_name} API")
+            start = time.time()
             try:
                 with requests_cache.disabled():
-                    start = time.time()
                     kp_response = requests.post(f"{self.kp_endpoint}/query",
                                                 json=request_body,
                                                 headers={'accept': 'application/json'},
@@ -242,14 +282,20 @@ class TRAPIQuerier:
                 timeout_message = f"Query timed out after {query_timeout} seconds"
                 self.log.warning(f"{self.kp_name}: {timeout_message}")
                 self.log.timed_out = query_timeout
+                self._cache_failure(cache_key, "Timed out", timeout_message)
+                self._record_outcome(query_shape, start, "Timed out")
                 return QGOrganizedKnowledgeGraph()
             if kp_response.status_code != 200:
                 self.log.warning(f"{self.kp_name} API returned response of {kp_response.status_code}. "
                                  f"Response from KP was: {kp_response.text}")
                 self.log.http_error = f"HTTP {kp_response.status_code}"
+                self._cache_failure(cache_key, "Error", f"Returned HTTP error {kp_response.status_code}")
+                self._record_outcome(query_shape, start, "Error")
                 return QGOrganizedKnowledgeGraph()
             else:
                 json_response = kp_response.json()
+                self._cache_answer(cache_key, json_response)
+                self._record_outcome(query_shape, start, "Done")
 
         answer_kg = self._load_kp_json_response(json_response)
         return answer_kg
@@ -274,6 +320,59 @@ class TRAPIQuerier:
             # TODO: Later add submitter for all KP queries (isn't yet supported by all KPs - part of TRAPI 1.2.1) #1654
         return body
 
+    def _get_cache_key(self, request_body: dict) -> Optional[str]:
+        if self.force_local and self.kp_name == 'infores:rtx-kg2':
+            return None  # Local KG2 queries are only used for testing/dev work, so don't cache them
+        # The KP's endpoint URL stands in for its version (it changes with the KP's TRAPI version)
+        return KPQueryCache.get_cache_key(self.kp_name, request_body, self.kp_endpoint)
+
+    def _get_cached_answer(self, cache_key: str, qedge_key: str, query_sent: dict) -> Optional[QGOrganizedKnowledgeGraph]:
+        cached_entry = KPQueryCache.get(cache_key)
+        if not cached_entry:
+            self.log.debug(f"{self.kp_name}: No cached answer for this query")
+            return None
+        status, cached_value, age = cached_entry
+        if status == "Done":
+            self.log.debug(f"{self.kp_name}: Using cached answer to this query (from {age} seconds ago)")
+            answer_kg = self._load_kp_json_response(cached_value)
+            cached_message = f"Returned {len(answer_kg.edges_by_qg_id.get(qedge_key, dict()))} edges from cache " \
+                             f"(answer is {age} seconds old)"
+        elif self.user_timeout:
+            return None  # Let the user's own timeout decide whether this KP gets another try
+        else:
+            answer_kg = QGOrganizedKnowledgeGraph()
+            cached_message = f"{cached_value} (cached failure from {age} seconds ago; not retrying yet)"
+            self.log.warning(f"{self.kp_name}: {cached_message}")
+        self.log.update_query_plan(qedge_key, self.kp_name, status, cached_message, query=query_sent)
+        return answer_kg
+
+    def _cache_answer(self, cache_key: Optional[str], json_response: dict):
+        if cache_key and json_response.get("message"):
+            KPQueryCache.store_answer(cache_key, self.kp_name, self._get_compact_answer(json_response))
+
+    def _record_outcome(self, query_shape: Optional[str], start: float, outcome: str):
+        # Under the user's own timeout, a failure may just mean the user was impatient; recording it would skew the
+        # KP's deadline estimate and could trip its circuit breaker for everyone (successes are still real latencies)
+        if outcome == "Done" or not self.user_timeout:
+            KPHealthMonitor.record_outcome(self.kp_name, query_shape, time.time() - start, outcome)
+
+    def _cache_failure(self, cache_key: Optional[str], status: str, description: str):
+        # A failure under the user's own timeout may just mean the user was impatient, and the cache key doesn't
+        # include the timeout, so caching it would hold this query back from every later caller
+        if cache_key and not self.user_timeout:
+            KPQueryCache.store_failure(cache_key, self.kp_name, status, description)
+
+    @staticmethod
+    def _get_compact_answer(json_response: dict) -> dict:
+        # Keep only what _load_kp_json_response() uses: the KG and the ids in each result's node/edge bindings
+        message = json_response["message"]
+        compact_results = [{"node_bindings": {qnode_key: [{"id": binding["id"]} for binding in bindings]
+                                              for qnode_key, bindings in (result.get("node_bindings") or dict()).items()},
+                            "edge_bindings": {qedge_key: [{"id": binding["id"]} for binding in bindings]
+                                              for qedge_key, bindings in (result.get("edge_bindings") or dict()).items()}}
+                           for result in message.get("results") or []]
+        return {"message": {"knowledge_graph": message.get("knowledge_graph"), "results": compact_results}}
+
     def _answer_query_force_local(self, request_body: dict) -> dict:
         self.log.debug(f"{self.kp_name}: Pretending to send query to KG2 API (really it will be run locally)")
         arax_query = ARAXQuery()
@@ -352,11 +451,16 @@ class TRAPIQuerier:
     def _get_arax_edge_key(self, edge: Edge) -> str:
         return f"{self.kp_name}:{edge.subject}-{edge.predicate}-{edge.object}"
 
-    def _get_query_timeout_length(self) -> int:
+    def _get_query_timeout_length(self, query_shape: Optional[str] = None) -> int:
         # Returns the number of seconds we should wait for a response
         if self.user_timeout:
             return self.user_timeout
-        elif self.kp_name == "infores:rtx-kg2":
-            return 600
-        else:
-            return 120
+        default_timeout = 600 if self.kp_name == "infores:rtx-kg2" else 120
+        # Otherwise base the deadline on how quickly this KP has answered similar queries lately
+        return KPHealthMonitor.get_deadline(self.kp_name, query_shape, default_timeout)
+
+    def _get_open_circuit_message(self) -> Optional[str]:
+        # We always query KPs the user asked for explicitly (and locally-answered KG2 queries never fail this way)
+        if self.user_specified_kp or (self.force_local and self.kp_name == "infores:rtx-kg2"):
+            return None
+        return KPHealthMonitor.get_open_circuit_message(self.kp_name)
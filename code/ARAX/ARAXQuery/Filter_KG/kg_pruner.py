@@ -0,0 +1,141 @@
+#!/bin/env python3
+# This class applies a batch of node/edge deletions to a message's knowledge graph (and results) in one pass
+from typing import Dict, Iterable, Optional, Set
+
+
+class KGPruner:
+
+    #### Constructor
+    def __init__(self, response, message):
+        self.response = response
+        self.message = message
+        self.removed_node_keys = set()
+        self.removed_edge_keys = set()
+        self.removed_qnode_keys_by_node_key = dict()
+        self.removed_qedge_keys_by_edge_key = dict()
+
+    def prune(self, edge_keys: Iterable[str] = (), node_keys: Iterable[str] = (),
+              qnode_keys_to_drop: Optional[Dict[str, Set[str]]] = None, qedge_keys: Optional[Iterable[str]] = None,
+              remove_orphaned_nodes: bool = False, update_results: bool = True):
+        """
+        Remove the given edges and nodes from the knowledge graph. Any edge attached to a removed node is removed too,
+        so the KG never ends up with dangling edges.
+        :param edge_keys: keys of edges to remove. If qedge_keys is given, only those qedge_keys are stripped from these
+        edges, and an edge is only removed once it has no qedge_keys left.
+        :param node_keys: keys of nodes to remove outright.
+        :param qnode_keys_to_drop: map of node key -> qnode keys the node should no longer fulfill; a node that is left
+        with no qnode_keys is removed.
+        :param qedge_keys: see edge_keys.
+        :param remove_orphaned_nodes: also remove nodes that were left without any edges by this pruning.
+        :param update_results: drop result bindings that refer to removed nodes/edges (or to qnode/qedge keys the
+        node/edge no longer fulfills), and drop results that are left with an empty set of bindings for a query node/edge.
+        """
+        knowledge_graph = self.message.knowledge_graph
+        kg_nodes = knowledge_graph.nodes if knowledge_graph.nodes is not None else dict()
+        kg_edges = knowledge_graph.edges if knowledge_graph.edges is not None else dict()
+        nodes_to_remove = {node_key for node_key in node_keys if node_key in kg_nodes}
+        edges_to_remove = set()
+
+        # strip qnode_keys from nodes, marking those left with none for removal
+        for node_key, qnode_keys in (qnode_keys_to_drop or dict()).items():
+            node = kg_nodes.get(node_key)
+            if node is None or node_key in nodes_to_remove:
+                continue
+            if node.qnode_keys is None:
+                nodes_to_remove.add(node_key)
+                continue
+            remaining_qnode_keys = [qnode_key for qnode_key in node.qnode_keys if qnode_key not in qnode_keys]
+            dropped_qnode_keys = set(node.qnode_keys).difference(remaining_qnode_keys)
+            if not remaining_qnode_keys:
+                nodes_to_remove.add(node_key)
+            elif dropped_qnode_keys:
+                node.qnode_keys = remaining_qnode_keys
+                self.removed_qnode_keys_by_node_key.setdefault(node_key, set()).update(dropped_qnode_keys)
+
+        # strip qedge_keys from edges (or mark them for removal outright)
+        qedge_keys = set(qedge_keys) if qedge_keys is not None else None
+        for edge_key in edge_keys:
+            edge = kg_edges.get(edge_key)
+            if edge is None:
+                continue
+            if qedge_keys is None:
+                edges_to_remove.add(edge_key)
+            elif getattr(edge, 'qedge_keys', None) is not None:
+                remaining_qedge_keys = [qedge_key for qedge_key in edge.qedge_keys if qedge_key not in qedge_keys]
+                dropped_qedge_keys = set(edge.qedge_keys).difference(remaining_qedge_keys)
+                if not remaining_qedge_keys:
+                    edges_to_remove.add(edge_key)
+                elif dropped_qedge_keys:
+                    edge.qedge_keys = remaining_qedge_keys
+                    self.removed_qedge_keys_by_edge_key.setdefault(edge_key, set()).update(dropped_qedge_keys)
+            else:
+                self.response.warning(f"The edge {edge_key} does not have a qedge_keys property. Since a value was supplied for the qedge_keys parameter the edge was not removed.")
+
+        # cascade: edges attached to removed nodes go too, then (optionally) nodes orphaned by the removed edges
+        if nodes_to_remove or remove_orphaned_nodes:
+            edge_keys_by_node_key = self._get_edge_keys_by_node_key(kg_edges)
+            for node_key in nodes_to_remove:
+                edges_to_remove.update(edge_keys_by_node_key.get(node_key, set()))
+            if remove_orphaned_nodes:
+                candidate_node_keys = {node_key for edge_key in edges_to_remove
+                                       for node_key in (kg_edges[edge_key].subject, kg_edges[edge_key].object)}
+                for node_key in candidate_node_keys.difference(nodes_to_remove):
+                    if node_key in kg_nodes and not edge_keys_by_node_key.get(node_key, set()).difference(edges_to_remove):
+                        nodes_to_remove.add(node_key)
+
+        for node_key in nodes_to_remove:
+            del kg_nodes[node_key]
+        for edge_key in edges_to_remove:
+            del kg_edges[edge_key]
+        self.removed_node_keys.update(nodes_to_remove)
+        self.removed_edge_keys.update(edges_to_remove)
+        self.response.debug(f"Pruned {len(nodes_to_remove)} nodes and {len(edges_to_remove)} edges from the knowledge graph")
+
+        if update_results:
+            self.update_results()
+        return self.response
+
+    def update_results(self):
+        """
+        Remove result bindings made stale by prune() and drop any results that are no longer complete
+        """
+        results = self.message.results
+        if not results or not (self.removed_node_keys or self.removed_edge_keys or
+                               self.removed_qnode_keys_by_node_key or self.removed_qedge_keys_by_edge_key):
+            return
+        kept_results = []
+        for result in results:
+            node_bindings_ok = self._update_bindings(result.node_bindings, self.removed_node_keys,
+                                                     self.removed_qnode_keys_by_node_key)
+            edge_bindings_ok = self._update_bindings(result.edge_bindings, self.removed_edge_keys,
+                                                     self.removed_qedge_keys_by_edge_key)
+            if node_bindings_ok and edge_bindings_ok:
+                kept_results.append(result)
+        if len(kept_results) < len(results):
+            self.response.info(f"Removed {len(results) - len(kept_results)} results that referred to pruned nodes/edges")
+            self.message.results = kept_results
+            if getattr(self.message, 'n_results', None) is not None:
+                self.message.n_results = len(kept_results)
+
+    @staticmethod
+    def _update_bindings(bindings_by_qg_key: dict, removed_keys: Set[str], removed_qg_keys_by_key: Dict[str, Set[str]]) -> bool:
+        if not bindings_by_qg_key:
+            return True
+        for qg_key, bindings in bindings_by_qg_key.items():
+            kept_bindings = [binding for binding in bindings if binding.id not in removed_keys and
+                             qg_key not in removed_qg_keys_by_key.get(binding.id, ())]
+            if len(kept_bindings) < len(bindings):
+                if not kept_bindings:
+                    return False
+                bindings_by_qg_key[qg_key] = kept_bindings
+        return True
+
+    @staticmethod
+    def _get_edge_keys_by_node_key(kg_edges: dict) -> Dict[str, Set[str]]:
+        edge_keys_by_node_key = dict()
+        for edge_key, edge in kg_edges.items():
+            for node_key in (edge.subject, edge.object):
+                if node_key not in edge_keys_by_node_key:
+                    edge_keys_by_node_key[node_key] = set()
+                edge_keys_by_node_key[node_key].add(edge_key)
+        return edge_keys_by_node_key
@@ -12,6 +12,10 @@ from openapi_server.models.attribute import Attribute as EdgeAttribute
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../reasoningtool/kg-construction/")
 from NormGoogleDistance import NormGoogleDistance as NGD
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
+from kg_attribute_index import KGAttributeIndex
+from Filter_KG.kg_pruner import KGPruner
+
 
 class RemoveEdges:
 
@@ -34,6 +38,63 @@ class RemoveEdges:
                 self.response.error(f"Fiter removed all of the nodes in the knowledge graph with the qnode id {k}", error_code="RemovedQueryNode")
 
 
+    def _mark_connected_nodes(self, edge, node_keys_to_remove, edge_qid_dict):
+        for qedge_key in edge.qedge_keys:
+            if edge.subject not in node_keys_to_remove:
+                node_keys_to_remove[edge.subject] = {edge_qid_dict[qedge_key]['subject']}
+            else:
+                node_keys_to_remove[edge.subject].add(edge_qid_dict[qedge_key]['subject'])
+            if edge.object not in node_keys_to_remove:
+                node_keys_to_remove[edge.object] = {edge_qid_dict[qedge_key]['object']}
+            else:
+                node_keys_to_remove[edge.object].add(edge_qid_dict[qedge_key]['object'])
+
+    def _remove_marked_edges(self, edges_to_remove, node_keys_to_remove):
+        """
+        Remove the edges marked by one of the remove_edges_by_* methods (and, with remove_connected_nodes, the nodes
+        they connect, along with those nodes' other edges) in a single pass over the KG and results.
+        """
+        edge_params = self.edge_parameters
+        qnode_keys_to_drop = dict()
+        if edge_params['remove_connected_nodes']:
+            self.response.debug(f"Removing Nodes")
+            self.response.info(f"Removing connected nodes and their edges from the knowledge graph")
+            detached_node_keys = set()
+            for key, qnode_keys in node_keys_to_remove.items():
+                node = self.message.knowledge_graph.nodes.get(key)
+                if node is None:
+                    continue
+                if 'qnode_keys' in edge_params:
+                    # only the specified qnode_keys are stripped, and the node's edges only go if it fulfilled all of them
+                    if node.qnode_keys is None:
+                        continue
+                    node_qnode_keys_to_drop = set(edge_params['qnode_keys']).intersection(node.qnode_keys)
+                    if node_qnode_keys_to_drop:
+                        qnode_keys_to_drop[key] = node_qnode_keys_to_drop
+                    if len(node_qnode_keys_to_drop) == len(set(edge_params['qnode_keys'])):
+                        detached_node_keys.add(key)
+                else:
+                    if node.qnode_keys is None or len(node.qnode_keys) == 1:
+                        qnode_keys_to_drop[key] = set(node.qnode_keys) if node.qnode_keys else set()
+                    else:
+                        qnode_keys_to_drop[key] = qnode_keys
+                    detached_node_keys.add(key)
+            # iterate over edges find edges connected to the nodes
+            for key, edge in self.message.knowledge_graph.edges.items():
+                if edge.subject in detached_node_keys or edge.object in detached_node_keys:
+                    edges_to_remove.add(key)
+        KGPruner(self.response, self.message).prune(edge_keys=edges_to_remove,
+                                                    qnode_keys_to_drop=qnode_keys_to_drop,
+                                                    qedge_keys=edge_params.get('qedge_keys', None))
+        if edge_params['remove_connected_nodes']:
+            self.check_kg_nodes()
+
+    def _get_numeric_edge_column(self, edge_attribute):
+        edge_column = KGAttributeIndex.for_message(self.message).get_edge_column(edge_attribute)
+        if not edge_column.all_numeric():
+            raise ValueError(f"could not convert {edge_attribute} value to float: {edge_column.first_non_numeric_value()!r}")
+        return edge_column
+
     def remove_edges_by_predicate(self):
         """
         Iterate over all the edges in the knowledge graph, remove any edges matching the discription provided.
@@ -52,74 +113,9 @@ class RemoveEdges:
             for key, edge in self.message.knowledge_graph.edges.items():
                 if edge_params['edge_predicate'] == edge.predicate:
                     edges_to_remove.add(key)
-                    if edge_params['remove_connected_nodes']:
-                        for qedge_key in edge.qedge_keys:
-                            if edge.subject not in node_keys_to_remove:
-                                node_keys_to_remove[edge.subject] = {edge_qid_dict[qedge_key]['subject']}
-                            else:
-                                node_keys_to_remove[edge.subject].add(edge_qid_dict[qedge_key]['subject'])
-                            if edge.object not in node_keys_to_remove:
-                                node_keys_to_remove[edge.object] = {edge_qid_dict[qedge_key]['object']}
-                            else:
-                                node_keys_to_remove[edge.object].add(edge_qid_dict[qedge_key]['object'])
-            if edge_params['remove_connected_nodes']:
-                self.response.debug(f"Removing Nodes")
-                self.response.info(f"Removing connected nodes and their edges from the knowledge graph")
-                i = 0
-                nodes_to_remove = set()
-                skipped_qnode_keys = set()
-                # iterate over nodes find adjacent connected nodes
-                for key, node in self.message.knowledge_graph.nodes.items():
-                    if key in node_keys_to_remove:
-                        if 'qnode_keys' in edge_params:
-                            if node.qnode_keys is not None:
-                                for param_qnode_key in edge_params['qnode_keys']:
-                                    if param_qnode_key in node.qnode_keys:
-                                        if len(node.qnode_keys) == 1:
-                                            nodes_to_remove.add(key)
-                                        else:
-                                            node.qnode_keys.remove(param_qnode_key)
-                                    else:
-                                        # del node_keys_to_remove[key]
-                                        skipped_qnode_keys.add(key)
-                            else:
-                                # del node_keys_to_remove[key]
-                                skipped_qnode_keys.add(key)
-                        else:
-                            if len(node.qnode_keys) == 1:
-                                nodes_to_remove.add(key)
-                            else:
-                                for node_key in node_keys_to_remove[key]:
-                                    node.qnode_keys.remove(node_key)
-                                if len(node.qnode_keys) == 0:
-                                    nodes_to_remove.add(key)
-                for key in skipped_qnode_keys:
-                    del node_keys_to_remove[key]
-                # remove connected nodes
-                #self.message.knowledge_graph.nodes = [val for idx,val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-                for key in nodes_to_remove:
-                    del self.message.knowledge_graph.nodes[key]
-                # iterate over edges find edges connected to the nodes
-                for key, edge in self.message.knowledge_graph.edges.items():
-                    if edge.subject in node_keys_to_remove or edge.object in node_keys_to_remove:
-                        edges_to_remove.add(key)
-                self.check_kg_nodes()
-            # remove edges
-            #self.message.knowledge_graph.edges = [val for idx,val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
-            for key in edges_to_remove:
-                if edge_params.get('qedge_keys',None) is not None:
-                    if hasattr(self.message.knowledge_graph.edges[key],'qedge_keys') and self.message.knowledge_graph.edges[key].qedge_keys is not None:
-                        qedge_key_diff = set(self.message.knowledge_graph.edges[key].qedge_keys) - set(edge_params['qedge_keys'])
-                        if len(qedge_key_diff) < 1:
-                            del self.message.knowledge_graph.edges[key]
-                        else:
-                            self.message.knowledge_graph.edges[key].qedge_keys = list(qedge_key_diff)
-                    else:
-                        self.response.warning(
-                            f"The edge {key} does not have a qedge_keys property. Since a value was supplied for the qedge_keys parameter the edge was not removed.")
-                else:
-                    del self.message.knowledge_graph.edges[key]
-                    
+                    if edge_params['remove_connected_nodes']:  # if you want to remove the connected nodes, mark those too
+                        self._mark_connected_nodes(edge, node_keys_to_remove, edge_qid_dict)
+            self._remove_marked_edges(edges_to_remove, node_keys_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -177,85 +173,14 @@ class RemoveEdges:
                     if type(edge_dict[edge_params['edge_attribute']]) == list or type(edge_dict[edge_params['edge_attribute']]) == set:
                         if edge_params['value'] in edge_dict[edge_params['edge_attribute']]:
                             edges_to_remove.add(key)
-                            if edge_params['remove_connected_nodes']:
-                                for qedge_key in edge.qedge_keys:
-                                    if edge.subject not in node_keys_to_remove:
-                                        node_keys_to_remove[edge.subject] = {edge_qid_dict[qedge_key]['subject']}
-                                    else:
-                                        node_keys_to_remove[edge.subject].add(edge_qid_dict[qedge_key]['subject'])
-                                    if edge.object not in node_keys_to_remove:
-                                        node_keys_to_remove[edge.object] = {edge_qid_dict[qedge_key]['object']}
-                                    else:
-                                        node_keys_to_remove[edge.object].add(edge_qid_dict[qedge_key]['object'])
+                            if edge_params['remove_connected_nodes']:  # if you want to remove the connected nodes, mark those too
+                                self._mark_connected_nodes(edge, node_keys_to_remove, edge_qid_dict)
                     else:
                         if edge_dict[edge_params['edge_attribute']] == edge_params['value']:
                             edges_to_remove.add(key)
-                            if edge_params['remove_connected_nodes']:
-                                for qedge_key in edge.qedge_keys:
-                                    if edge.subject not in node_keys_to_remove:
-                                        node_keys_to_remove[edge.subject] = {edge_qid_dict[qedge_key]['subject']}
-                                    else:
-                                        node_keys_to_remove[edge.subject].add(edge_qid_dict[qedge_key]['subject'])
-                                    if edge.object not in node_keys_to_remove:
-                                        node_keys_to_remove[edge.object] = {edge_qid_dict[qedge_key]['object']}
-                                    else:
-                                        node_keys_to_remove[edge.object].add(edge_qid_dict[qedge_key]['object'])
-            if edge_params['remove_connected_nodes']:
-                self.response.debug(f"Removing Nodes")
-                self.response.info(f"Removing connected nodes and their edges from the knowledge graph")
-                nodes_to_remove = set()
-                skipped_qnode_keys = set()
-                # iterate over nodes find adjacent connected nodes
-                for key, node in self.message.knowledge_graph.nodes.items():
-                    if key in node_keys_to_remove:
-                        if 'qnode_keys' in edge_params:
-                            if node.qnode_keys is not None:
-                                for param_qnode_key in edge_params['qnode_keys']:
-                                    if param_qnode_key in node.qnode_keys:
-                                        if len(node.qnode_keys) == 1:
-                                            nodes_to_remove.add(key)
-                                        else:
-                                            node.qnode_keys.remove(param_qnode_key)
-                                    else:
-                                        # del node_keys_to_remove[key]
-                                        skipped_qnode_keys.add(key)
-                            else:
-                                # del node_keys_to_remove[key]
-                                skipped_qnode_keys.add(key)
-                        else:
-                            if len(node.qnode_keys) == 1:
-                                nodes_to_remove.add(key)
-                            else:
-                                for node_key in node_keys_to_remove[key]:
-                                    node.qnode_keys.remove(node_key)
-                                if len(node.qnode_keys) == 0:
-                                    nodes_to_remove.add(key)
-                for key in skipped_qnode_keys:
-                    del node_keys_to_remove[key]
-                # remove connected nodes
-                #self.message.knowledge_graph.nodes = [val for idx,val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-                for key in nodes_to_remove:
-                    del self.message.knowledge_graph.nodes[key]
-                # iterate over edges find edges connected to the nodes
-                for key, edge in self.message.knowledge_graph.edges.items():
-                    if edge.subject in node_keys_to_remove or edge.object in node_keys_to_remove:
-                        edges_to_remove.add(key)
-                self.check_kg_nodes()
-            # remove edges
-            #self.message.knowledge_graph.edges = [val for idx,val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
-            for key in edges_to_remove:
-                if edge_params.get('qedge_keys',None) is not None:
-                    if hasattr(self.message.knowledge_graph.edges[key],'qedge_keys') and self.message.knowledge_graph.edges[key].qedge_keys is not None:
-                        qedge_key_diff = set(self.message.knowledge_graph.edges[key].qedge_keys) - set(edge_params['qedge_keys'])
-                        if len(qedge_key_diff) < 1:
-                            del self.message.knowledge_graph.edges[key]
-                        else:
-                            self.message.knowledge_graph.edges[key].qedge_keys = list(qedge_key_diff)
-                    else:
-                        self.response.warning(
-                            f"The edge {key} does not have a qedge_keys property. Since a value was supplied for the qedge_keys parameter the edge was not removed.")
-                else:
-                    del self.message.knowledge_graph.edges[key]
+                            if edge_params['remove_connected_nodes']:  # if you want to remove the connected nodes, mark those too
+                                self._mark_connected_nodes(edge, node_keys_to_remove, edge_qid_dict)
+            self._remove_marked_edges(edges_to_remove, node_keys_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -287,85 +212,14 @@ class RemoveEdges:
             edge_qid_dict = {}
             for key, q_edge in self.message.query_graph.edges.items():
                 edge_qid_dict[key] = {'subject':q_edge.subject, 'object':q_edge.object}
-            # iterate over the edges find the edges to remove
-            for key, edge in self.message.knowledge_graph.edges.items():  # iterate over the edges
-                if hasattr(edge, 'attributes'):  # check if they have attributes
-                    if edge.attributes:  # if there are any edge attributes
-                        for attribute in edge.attributes:  # for each attribute
-                            if (hasattr(attribute, "original_attribute_name") and attribute.original_attribute_name == edge_params['edge_attribute']) or (hasattr(attribute, "attribute_type_id") and attribute.attribute_type_id == edge_params['edge_attribute']):  # check if it's the desired one
-                                if compare(float(attribute.value), edge_params['threshold']):  # check if it's above/below the threshold
-                                    edges_to_remove.add(key)  # mark it to be removed
-                                    if edge_params['remove_connected_nodes']:  # if you want to remove the connected nodes, mark those too
-                                        for qedge_key in edge.qedge_keys:
-                                            if edge.subject not in node_keys_to_remove:
-                                                node_keys_to_remove[edge.subject] = {edge_qid_dict[qedge_key]['subject']}
-                                            else:
-                                                node_keys_to_remove[edge.subject].add(edge_qid_dict[qedge_key]['subject'])
-                                            if edge.object not in node_keys_to_remove:
-                                                node_keys_to_remove[edge.object] = {edge_qid_dict[qedge_key]['object']}
-                                            else:
-                                                node_keys_to_remove[edge.object].add(edge_qid_dict[qedge_key]['object'])
-            if edge_params['remove_connected_nodes']:
-                self.response.debug(f"Removing Nodes")
-                self.response.info(f"Removing connected nodes and their edges from the knowledge graph")
-                nodes_to_remove = set()
-                skipped_qnode_keys = set()
-                # iterate over nodes find adjacent connected nodes
-                for key, node in self.message.knowledge_graph.nodes.items():
-                    if key in node_keys_to_remove:
-                        if 'qnode_keys' in edge_params:
-                            if node.qnode_keys is not None:
-                                for param_qnode_key in edge_params['qnode_keys']:
-                                    if param_qnode_key in node.qnode_keys:
-                                        if len(node.qnode_keys) == 1:
-                                            nodes_to_remove.add(key)
-                                        else:
-                                            node.qnode_keys.remove(param_qnode_key)
-                                    else:
-                                        # del node_keys_to_remove[key]
-                                        skipped_qnode_keys.add(key)
-                            else:
-                                # del node_keys_to_remove[key]
-                                skipped_qnode_keys.add(key)
-                        else:
-                            if len(node.qnode_keys) == 1:
-                                nodes_to_remove.add(key)
-                            else:
-                                for node_key in node_keys_to_remove[key]:
-                                    node.qnode_keys.remove(node_key)
-                                if len(node.qnode_keys) == 0:
-                                    nodes_to_remove.add(key)
-                for key in skipped_qnode_keys:
-                    del node_keys_to_remove[key]
-                # remove connected nodes
-                #self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-                for key in nodes_to_remove:
-                    del self.message.knowledge_graph.nodes[key]
-                #i = 0
-                c = 0
-                # iterate over edges find edges connected to the nodes
-                for key, edge in self.message.knowledge_graph.edges.items():
-                    if edge.subject in node_keys_to_remove or edge.object in node_keys_to_remove:
-                        edges_to_remove.add(key)
-                    else:
-                        c += 1
-                    #i += 1
-                self.check_kg_nodes()
-            # remove edges
-            #self.message.knowledge_graph.edges = [val for idx,val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
-            for key in edges_to_remove:
-                if edge_params.get('qedge_keys',None) is not None:
-                    if hasattr(self.message.knowledge_graph.edges[key],'qedge_keys') and self.message.knowledge_graph.edges[key].qedge_keys is not None:
-                        qedge_key_diff = set(self.message.knowledge_graph.edges[key].qedge_keys) - set(edge_params['qedge_keys'])
-                        if len(qedge_key_diff) < 1:
-                            del self.message.knowledge_graph.edges[key]
-                        else:
-                            self.message.knowledge_graph.edges[key].qedge_keys = list(qedge_key_diff)
-                    else:
-                        self.response.warning(
-                            f"The edge {key} does not have a qedge_keys property. Since a value was supplied for the qedge_keys parameter the edge was not removed.")
-                else:
-                    del self.message.knowledge_graph.edges[key]
+            # look up the values of the desired attribute and find the edges to remove
+            edge_column = self._get_numeric_edge_column(edge_params['edge_attribute'])
+            for key in dict.fromkeys(edge_column.keys[compare(edge_column.values, edge_params['threshold'])]):  # check which are above/below the threshold
+                edge = self.message.knowledge_graph.edges[key]
+                edges_to_remove.add(key)  # mark it to be removed
+                if edge_params['remove_connected_nodes']:  # if you want to remove the connected nodes, mark those too
+                    self._mark_connected_nodes(edge, node_keys_to_remove, edge_qid_dict)
+            self._remove_marked_edges(edges_to_remove, node_keys_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -390,125 +244,43 @@ class RemoveEdges:
             edge_qid_dict = {}
             for key, q_edge in self.message.query_graph.edges.items():
                 edge_qid_dict[key] = {'subject':q_edge.subject, 'object':q_edge.object}
-            values = []
-            # iterate over the edges find the edges to remove
-            for key, edge in self.message.knowledge_graph.edges.items():  # iterate over the edges
-                if hasattr(edge, 'attributes'):  # check if they have attributes
-                    if edge.attributes:  # if there are any edge attributes
-                        for attribute in edge.attributes:  # for each attribute
-                            if (hasattr(attribute, "original_attribute_name") and attribute.original_attribute_name == edge_params['edge_attribute']) or (hasattr(attribute, "attribute_type_id") and attribute.attribute_type_id == edge_params['edge_attribute']):  # check if it's the desired one
-                                values.append((key,float(attribute.value), edge.subject, edge.object))
+            # look up the values of the desired attribute (one entry per matching attribute)
+            edge_column = self._get_numeric_edge_column(edge_params['edge_attribute'])
+            values = edge_column.values
+            selected_positions = np.arange(len(values))
             if len(values) > 0:
-                #print(edge_params)
                 if edge_params['stat'] == 'n':
-                    #vals = [x[1] for x in values]
-                    #print(np.min(vals),np.max(vals))
-                    values.sort(key=lambda x:x[1])
+                    selected_positions = np.argsort(values, kind='stable')
                     if edge_params['top']:
-                        values.reverse()
+                        selected_positions = selected_positions[::-1]
                     edge_params['threshold'] = int(edge_params['threshold'])
-                    values = values[edge_params['threshold']:]
-                    #vals = [x[1] for x in values]
-                    #print(np.min(vals),np.max(vals))
+                    selected_positions = selected_positions[edge_params['threshold']:]
                 elif edge_params['stat'] == 'std':
-                    vals = [x[1] for x in values]
-                    #print(np.min(vals),np.max(vals))
-                    mean = np.mean(vals)
-                    std = np.std(vals)
-                    #print(mean)
-                    #print(std)
+                    mean = np.mean(values)
+                    std = np.std(values)
                     if edge_params['top']:
                         i = 1 * edge_params['threshold']
                     else:
                         i = -1 * edge_params['threshold']
                     val = mean + i*std
-                    #print(val)
                     if edge_params['direction'] == 'above':
-                        values = [x for x in values if x[1]>val]
+                        selected_positions = np.flatnonzero(values > val)
                     elif edge_params['direction'] == 'below':
-                        values = [x for x in values if x[1]<val]
-                    #vals = [x[1] for x in values]
-                    #print(np.min(vals),np.max(vals))
+                        selected_positions = np.flatnonzero(values < val)
                 elif edge_params['stat'] == 'percentile':
-                    vals = [x[1] for x in values]
-                    val = np.percentile(vals, edge_params['threshold'], interpolation='linear')
+                    val = np.percentile(values, edge_params['threshold'], interpolation='linear')
                     if edge_params['direction'] == 'above':
-                        values = [x for x in values if x[1]>val]
+                        selected_positions = np.flatnonzero(values > val)
                     elif edge_params['direction'] == 'below':
-                        values = [x for x in values if x[1]<val]
+                        selected_positions = np.flatnonzero(values < val)
 
-            for edge in values: # here edge = (edge index, value, subject id, object id)
-                edges_to_remove.add(edge[0])  # mark it to be removed
+            for key in dict.fromkeys(edge_column.keys[selected_positions]):
+                edge = self.message.knowledge_graph.edges[key]
+                edges_to_remove.add(key)  # mark it to be removed
                 if edge_params['remove_connected_nodes']:  # if you want to remove the connected nodes, mark those too
-                    for qedge_key in self.message.knowledge_graph.edges[edge[0]].qedge_keys:
-                        if edge[2] not in node_keys_to_remove: # edge[2] = edge subect
-                            node_keys_to_remove[edge[2]] = {edge_qid_dict[qedge_key]['subject']}
-                        else:
-                            node_keys_to_remove[edge[2]].add(edge_qid_dict[qedge_key]['subject'])
-                        if edge[3] not in node_keys_to_remove: # edge[2] = edge object
-                            node_keys_to_remove[edge[3]] = {edge_qid_dict[qedge_key]['object']}
-                        else:
-                            node_keys_to_remove[edge[3]].add(edge_qid_dict[qedge_key]['object'])
+                    self._mark_connected_nodes(edge, node_keys_to_remove, edge_qid_dict)
 
-            if edge_params['remove_connected_nodes']:
-                self.response.debug(f"Removing Nodes")
-                self.response.info(f"Removing connected nodes and their edges from the knowledge graph")
-                nodes_to_remove = set()
-                skipped_qnode_keys = set()
-                # iterate over nodes find adjacent connected nodes
-                for key, node in self.message.knowledge_graph.nodes.items():
-                    if key in node_keys_to_remove:
-                        if 'qnode_keys' in edge_params:
-                            if node.qnode_keys is not None:
-                                for param_qnode_key in edge_params['qnode_keys']:
-                                    if param_qnode_key in node.qnode_keys:
-                                        if len(node.qnode_keys) == 1:
-                                            nodes_to_remove.add(key)
-                                        else:
-                                            node.qnode_keys.remove(param_qnode_key)
-                                    else:
-                                        # del node_keys_to_remove[key]
-                                        skipped_qnode_keys.add(key)
-                            else:
-                                # del node_keys_to_remove[key]
-                                skipped_qnode_keys.add(key)
-                        else:
-                            if len(node.qnode_keys) == 1:
-                                nodes_to_remove.add(key)
-                            else:
-                                for node_key in node_keys_to_remove[key]:
-                                    node.qnode_keys.remove(node_key)
-                                if len(node.qnode_keys) == 0:
-                                    nodes_to_remove.add(key)
-                for key in skipped_qnode_keys:
-                    del node_keys_to_remove[key]
-                # remove connected nodes
-                #self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-                for key in nodes_to_remove:
-                    del self.message.knowledge_graph.nodes[key]
-                c = 0
-                # iterate over edges find edges connected to the nodes
-                for key, edge in self.message.knowledge_graph.edges.items():
-                    if edge.subject in node_keys_to_remove or edge.object in node_keys_to_remove:
-                        edges_to_remove.add(key)
-                    else:
-                        c += 1
-                self.check_kg_nodes()
-            # remove edges
-            #self.message.knowledge_graph.edges = [val for idx,val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
-            for key in edges_to_remove:
-                if edge_params.get('qedge_keys',None) is not None:
-                    if hasattr(self.message.knowledge_graph.edges[key],'qedge_keys') and self.message.knowledge_graph.edges[key].qedge_keys is not None:
-                        qedge_key_diff = set(self.message.knowledge_graph.edges[key].qedge_keys) - set(edge_params['qedge_keys'])
-                        if len(qedge_key_diff) < 1:
-                            del self.message.knowledge_graph.edges[key]
-                        else:
-                            self.message.knowledge_graph.edges[key].qedge_keys = list(qedge_key_diff)
-                    else:
-                        self.response.warning(
-                            f"The edge {key} does not have a qedge_keys property. Since a value was supplied for the qedge_keys parameter the edge was not removed.")
-                else:
-                    del self.message.knowledge_graph.edges[key]
+            self._remove_marked_edges(edges_to_remove, node_keys_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
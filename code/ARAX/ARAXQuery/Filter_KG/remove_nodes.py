@@ -5,6 +5,9 @@ import os
 import traceback
 import numpy as np
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
+from Filter_KG.kg_pruner import KGPruner
+
 
 class RemoveNodes:
 
@@ -30,18 +33,8 @@ class RemoveNodes:
                 if self.node_parameters['node_category'] in node.categories:
                     nodes_to_remove.add(key)
                     #node_keys_to_remove.add(key)
-            #self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-            for key in nodes_to_remove:
-                del self.message.knowledge_graph.nodes[key]
-            edges_to_remove = set()
-            # iterate over edges find edges connected to the nodes
-            for key, edge in self.message.knowledge_graph.edges.items():
-                if edge.subject in nodes_to_remove or edge.object in nodes_to_remove:
-                    edges_to_remove.add(key)
-            # remove edges
-            #self.message.knowledge_graph.edges = [val for idx, val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
-            for key in edges_to_remove:
-                del self.message.knowledge_graph.edges[key]
+            # remove the nodes along with the edges connected to them
+            KGPruner(self.response, self.message).prune(node_keys=nodes_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -75,18 +68,8 @@ class RemoveNodes:
                     else:
                         if node_dict[node_params['node_property']] == node_params['property_value']:
                             nodes_to_remove.add(key)
-            #self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-            for key in nodes_to_remove:
-                del self.message.knowledge_graph.nodes[key]
-            edges_to_remove = set()
-            # iterate over edges find edges connected to the nodes
-            for key, edge in self.message.knowledge_graph.edges.items():
-                if edge.subject in nodes_to_remove or edge.object in nodes_to_remove:
-                    edges_to_remove.add(key)
-            # remove edges
-            #self.message.knowledge_graph.edges = [val for idx, val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
-            for key in edges_to_remove:
-                del self.message.knowledge_graph.edges[key]
+            # remove the nodes along with the edges connected to them
+            KGPruner(self.response, self.message).prune(node_keys=nodes_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -124,9 +107,7 @@ class RemoveNodes:
                         nodes_to_remove.add(key)
 
             # remove the orphaned nodes
-            #self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in node_indexes_to_remove]
-            for key in nodes_to_remove:
-                del self.message.knowledge_graph.nodes[key]
+            KGPruner(self.response, self.message).prune(node_keys=nodes_to_remove)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -13,6 +13,10 @@ from openapi_server.models.attribute import Attribute as EdgeAttribute
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../reasoningtool/kg-construction/")
 from NormGoogleDistance import NormGoogleDistance as NGD
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
+from kg_attribute_index import KGAttributeIndex
+from Filter_KG.kg_pruner import KGPruner
+
 
 def sort_index(lst, desc):
     #modified from http://stackoverflow.com/questions/3382352/equivalent-of-numpy-argsort-in-basic-python/, answer by the user unutbu
@@ -61,24 +65,18 @@ class SortResults:
         params = self.parameters
         try:
             edge_values = {}
-            # iterate over the edges find the attribute values
-            for key, edge in self.message.knowledge_graph.edges.items():  # iterate over the edges
-                edge_relation = None
-                edge_values[key] = {'value': None, 'relation': None}
-                if 'qedge_keys' in params and params['qedge_keys'] is not None and len(params['qedge_keys']) > 0:
-                    if key not in params['qedge_keys']:
-                        continue
-                if hasattr(edge, 'attributes'):  # check if they have attributes
-                    if edge.attributes:  # if there are any edge attributes
-                        for attribute in edge.attributes:  # for each attribute
-                            if attribute.original_attribute_name == params['edge_attribute'] or attribute.attribute_type_id == params['edge_attribute']:  # check if it's the desired one
-                                try:
-                                    edge_values[key] = {'value': float(attribute.value), 'relation': None}
-                                except ValueError:
-                                    edge_values[key] = {'value': attribute.value, 'relation': None}
-                            if attribute.original_attribute_name == "virtual_relation_label":
-                                edge_relation = attribute.value
-                        edge_values[key]['relation'] = edge_relation
+            # look up the attribute values (and virtual relation labels) in the message's attribute index
+            attribute_index = KGAttributeIndex.for_message(self.message)
+            attribute_values = attribute_index.get_edge_column(params['edge_attribute']).last_value_by_key()
+            relation_column = attribute_index.get_edge_column("virtual_relation_label")
+            edge_relations = {key: attribute.value for key, attribute in zip(relation_column.keys, relation_column.attributes)
+                              if attribute.original_attribute_name == "virtual_relation_label"}
+            restrict_to_keys = 'qedge_keys' in params and params['qedge_keys'] is not None and len(params['qedge_keys']) > 0
+            for key in self.message.knowledge_graph.edges:
+                if restrict_to_keys and key not in params['qedge_keys']:
+                    edge_values[key] = {'value': None, 'relation': None}
+                else:
+                    edge_values[key] = {'value': attribute_values.get(key), 'relation': edge_relations.get(key)}
             if params['descending']:
                 value_list=[-math.inf]*len(self.message.results)
             else:
@@ -195,23 +193,19 @@ class SortResults:
         params = self.parameters
         try:
             node_values = {}
-            # iterate over the nodes find the attribute values
-            for key, node in self.message.knowledge_graph.nodes.items():  # iterate over the nodes
-                node_values[key] = {'value': None, 'category': node.categories}
-                if 'qnode_keys' in params and params['qnode_keys'] is not None and len(params['qnode_keys']) > 0:
-                    if key not in params['qnode_keys']:
-                        continue
-                if hasattr(node, 'attributes'):  # check if they have attributes
-                    if node.attributes:  # if there are any node attributes
-                        for attribute in node.attributes:  # for each attribute
-                            if attribute.original_attribute_name == params['node_attribute'] or attribute.attribute_type_id == params['node_attribute']:  # check if it's the desired one
-                                if attribute.original_attribute_name == 'pubmed_ids':
-                                    node_values[key] = {'value': attribute.value.count("PMID"), 'category': node.categories}
-                                else:
-                                    try:
-                                        node_values[key] = {'value': float(attribute.value), 'category': node.categories}
-                                    except ValueError:
-                                        node_values[key] = {'value': attribute.value, 'category': node.categories}
+            # look up the attribute values in the message's attribute index
+            node_column = KGAttributeIndex.for_message(self.message).get_node_column(params['node_attribute'])
+            attribute_values = node_column.last_value_by_key()
+            for key, attribute in zip(node_column.keys, node_column.attributes):
+                if attribute.original_attribute_name == 'pubmed_ids':
+                    # pubmed_ids are scored by how many there are (assumes this is the only matching attribute)
+                    attribute_values[key] = attribute.value.count("PMID")
+            restrict_to_keys = 'qnode_keys' in params and params['qnode_keys'] is not None and len(params['qnode_keys']) > 0
+            for key, node in self.message.knowledge_graph.nodes.items():
+                if restrict_to_keys and key not in params['qnode_keys']:
+                    node_values[key] = {'value': None, 'category': node.categories}
+                else:
+                    node_values[key] = {'value': attribute_values.get(key), 'category': node.categories}
             if params['descending']:
                 value_list=[-math.inf]*len(self.message.results)
             else:
@@ -292,8 +286,6 @@ class SortResults:
         try:
             node_keys = set()
             edge_keys = set()
-            nodes_to_remove = set()
-            edges_to_remove = set()
             for result in self.message.results:
                 for node_binding_list in result.node_bindings.values():
                     for node_binding in node_binding_list:
@@ -301,23 +293,11 @@ class SortResults:
                 for edge_binding_list in result.edge_bindings.values():
                     for edge_binding in edge_binding_list:
                         edge_keys.add(edge_binding.id)
-            #node_keys_to_remove = set()
-            for key, node in self.message.knowledge_graph.nodes.items():
-                if key not in node_keys:
-                    nodes_to_remove.add(key)
-                    #node_keys_to_remove.add(node.id)
-            #self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in nodes_to_remove]
-            for key in nodes_to_remove:
-                del self.message.knowledge_graph.nodes[key]
-            edges_to_remove = set()
-            # iterate over edges find edges connected to the nodes
-            for key, edge in self.message.knowledge_graph.edges.items():
-                if key not in edge_keys or edge.subject in nodes_to_remove or edge.object in nodes_to_remove:
-                    edges_to_remove.add(key)
-            # remove edges
-            #self.message.knowledge_graph.edges = [val for idx, val in enumerate(self.message.knowledge_graph.edges) if idx not in edges_to_remove]
-            for key in edges_to_remove:
-                del self.message.knowledge_graph.edges[key]
+            nodes_to_remove = set(self.message.knowledge_graph.nodes).difference(node_keys)
+            edges_to_remove = set(self.message.knowledge_graph.edges).difference(edge_keys)
+            # the results only bind the nodes/edges being kept, so they don't need updating
+            KGPruner(self.response, self.message).prune(edge_keys=edges_to_remove, node_keys=nodes_to_remove,
+                                                        update_results=False)
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
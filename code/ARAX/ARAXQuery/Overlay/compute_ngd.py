@@ -6,11 +6,12 @@ import math
 import subprocess
 import sys
 import os
-import sqlite3
+import threading
 import traceback
 import numpy as np
+from collections import OrderedDict
 from datetime import datetime
-from typing import List
+from typing import Dict, Iterable, List, Set, Tuple
 import itertools
 
 import random
@@ -36,10 +37,17 @@ RTXConfig.live = "Production"
 
 sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code']))
 from ARAX_database_manager import ARAXDatabaseManager
+from sqlite_connection_registry import SqliteConnectionRegistry
 
 
 class ComputeNGD:
 
+    # PMID lists looked up so far (curie -> PMID list, or None if the database has none), shared by all instances in
+    # the process so that e.g. an NGD expand followed by an NGD overlay only reads each curie's PMIDs once
+    pmids_cache_size = 100000
+    _pmids_cache = OrderedDict()
+    _pmids_cache_lock = threading.Lock()
+
     #### Constructor
     def __init__(self, response, message, parameters):
         self.response = response
@@ -219,7 +227,17 @@ class ComputeNGD:
 
     def load_curie_to_pmids_data(self, canonicalized_curies):
         self.response.debug(f"Extracting PMID lists from sqlite database for relevant nodes")
-        curies = list(set(canonicalized_curies))
+        curies = []
+        with self._pmids_cache_lock:
+            for curie in set(canonicalized_curies):
+                if curie in self._pmids_cache:
+                    self._pmids_cache.move_to_end(curie)
+                    if self._pmids_cache[curie] is not None:
+                        self.curie_to_pmids_map[curie] = self._pmids_cache[curie]
+                else:
+                    curies.append(curie)
+        self.response.debug(f"Found PMID info for {len(set(canonicalized_curies)) - len(curies)} curies in cache; "
+                            f"will look up the other {len(curies)}")
         chunk_size = 20000
         num_chunks = len(curies) // chunk_size if len(curies) % chunk_size == 0 else (len(curies) // chunk_size) + 1
         start_index = 0
@@ -231,9 +249,42 @@ class ComputeNGD:
             rows = self.cursor.fetchall()
             for row in rows:
                 self.curie_to_pmids_map[row[0]] = json.loads(row[1])  # PMID list is stored as JSON string in sqlite db
+            self._add_to_pmids_cache({curie: self.curie_to_pmids_map.get(curie) for curie in chunk})
             start_index += chunk_size
             stop_index += chunk_size
 
+    def calculate_ngd_for_pairs(self, curie_pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple[float, Set[int]]]:
+        """
+        Calculates NGD for many (subject, object) curie pairs at once (as calculate_ngd_fast() would for each pair),
+        converting each curie's PMID list to a set only once. Returns a map of curie pair -> (NGD value, PMID set).
+        """
+        pmid_sets = dict()
+        ngd_by_pair = dict()
+        for subject_curie, object_curie in set(curie_pairs):
+            if subject_curie in self.curie_to_pmids_map and object_curie in self.curie_to_pmids_map:
+                for curie in (subject_curie, object_curie):
+                    if curie not in pmid_sets:
+                        pmid_sets[curie] = set(self.curie_to_pmids_map[curie])
+                pubmed_id_set = pmid_sets[subject_curie].intersection(pmid_sets[object_curie])
+                ngd_value = self._compute_multiway_ngd_from_counts([len(pmid_sets[subject_curie]), len(pmid_sets[object_curie])],
+                                                                   len(pubmed_id_set))
+                if len(pubmed_id_set) > 30:
+                    if self.first_ngd_log:
+                        self.response.debug(f"More than 30 publications found for some edges limiting to 30...")
+                        self.first_ngd_log = False
+                    pubmed_id_set = set(itertools.islice(pubmed_id_set, 30))
+                ngd_by_pair[(subject_curie, object_curie)] = (ngd_value, pubmed_id_set)
+            else:
+                ngd_by_pair[(subject_curie, object_curie)] = (math.nan, set())
+        return ngd_by_pair
+
+    @classmethod
+    def _add_to_pmids_cache(cls, pmids_by_curie: Dict[str, List[int]]):
+        with cls._pmids_cache_lock:
+            cls._pmids_cache.update(pmids_by_curie)
+            while len(cls._pmids_cache) > cls.pmids_cache_size:
+                cls._pmids_cache.popitem(last=False)
+
     def calculate_ngd_fast(self, subject_curie, object_curie):
         if subject_curie in self.curie_to_pmids_map and object_curie in self.curie_to_pmids_map:
             pubmed_ids_for_curies = [self.curie_to_pmids_map.get(subject_curie),
@@ -319,13 +370,12 @@ class ComputeNGD:
         #         os.system(f"scp {RTXConfig.curie_to_pmids_username}@{RTXConfig.curie_to_pmids_host}:{RTXConfig.curie_to_pmids_path} {db_path_local}")
         #     else:
         #         self.response.debug(f"Confirmed local NGD database is current")
-        DBmanager = ARAXDatabaseManager()
-        if DBmanager.check_versions():
+        if ARAXDatabaseManager.databases_need_update():
             self.response.debug(f"Downloading databases because mismatch in local versions and remote versions was found... (will take a few minutes)")
-            self.response = DBmanager.update_databases(response=self.response)
+            self.response = ARAXDatabaseManager().update_databases(response=self.response)
         # Set up a connection to the database so it's ready for use
         try:
-            connection = sqlite3.connect(db_path_local)
+            connection = SqliteConnectionRegistry.get_connection(db_path_local)
             cursor = connection.cursor()
         except Exception:
             self.response.error(f"Encountered an error connecting to ngd sqlite database", error_code="DatabaseSetupIssue")
@@ -334,8 +384,7 @@ class ComputeNGD:
             return connection, cursor
 
     def _close_database(self):
+        # The connection itself is shared (by the registry), so only the cursor is closed
         if self.cursor:
             self.cursor.close()
-        if self.connection:
-            self.connection.close()
 
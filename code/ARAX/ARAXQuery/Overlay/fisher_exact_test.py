@@ -17,6 +17,7 @@ RTXConfig = RTXConfiguration()
 RTXConfig.live = "Production"
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")
 from ARAX_query import ARAXQuery
+from sqlite_connection_registry import SqliteConnectionRegistry
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.attribute import Attribute as EdgeAttribute
 from openapi_server.models.edge import Edge
@@ -26,7 +27,6 @@ from node_synonymizer import NodeSynonymizer
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import overlay_utilities as ou
 import collections
-import sqlite3
 class ComputeFTEST:
 
     #### Constructor
@@ -456,9 +456,8 @@ class ComputeFTEST:
             query_nodes = [curie_id.replace("'", "''") if "'" in curie_id else curie_id for curie_id in query_nodes]
             # special_curie_ids = [curie_id for curie_id in query_nodes if "'" in curie_id]
 
-            # Get connected to kg2c sqlite
-            connection = sqlite3.connect(self.sqlite_file_path)
-            cursor = connection.cursor()
+            # Get this thread's read-only connection to kg2c sqlite
+            cursor = SqliteConnectionRegistry.get_connection(self.sqlite_file_path).cursor()
 
             # Extract the neighbor count data
             node_keys_str = "','".join(query_nodes)  # SQL wants ('node1', 'node2') format for string lists
@@ -468,7 +467,7 @@ class ComputeFTEST:
             cursor.execute(sql_query)
             rows = cursor.fetchall()
             rows = [curie_id.replace("\'","'").replace("''", "'") if "'" in curie_id else curie_id for curie_id in rows]
-            connection.close()
+            cursor.close()
 
             # Load the counts into a dictionary
             neighbor_counts_dict = {row[0]:eval(row[1]) for row in rows}
@@ -567,9 +566,8 @@ class ComputeFTEST:
         node_type = ComputeFTEST.convert_string_to_snake_case(node_type.replace('biolink:',''))
         node_type = ComputeFTEST.convert_string_biolinkformat(node_type)
 
-        # Get connected to kg2c sqlite
-        connection = sqlite3.connect(self.sqlite_file_path)
-        cursor = connection.cursor()
+        # Get this thread's read-only connection to kg2c sqlite
+        cursor = SqliteConnectionRegistry.get_connection(self.sqlite_file_path).cursor()
 
         # Extract total count of nodes with certain type in kg2c
         sql_query = f"SELECT C.count " \
@@ -579,7 +577,7 @@ class ComputeFTEST:
         cursor.execute(sql_query)
         rows = cursor.fetchall()
         size_of_total = rows[0][0]
-        connection.close()
+        cursor.close()
 
         return size_of_total
 
@@ -124,9 +124,11 @@ class OverlayClinicalInfo:
             object_type = node_curie_to_type[object_curie]
             # figure out which knowledge provider to use  # TODO: should handle this in a more structured fashion, does there exist a standardized KP API format?
             KP_to_use = None
+            subject_descendants = self.biolink_helper.get_descendants(subject_type, include_mixins=False)
+            object_descendants = self.biolink_helper.get_descendants(object_type, include_mixins=False)
             for KP in self.who_knows_about_what:
                 # see which KP's can label both subjects of information
-                if self.in_common(self.biolink_helper.get_descendants(subject_type, include_mixins=False), self.who_knows_about_what[KP]) and self.in_common(self.biolink_helper.get_descendants(object_type, include_mixins=False), self.who_knows_about_what[KP]):
+                if self.in_common(subject_descendants, self.who_knows_about_what[KP]) and self.in_common(object_descendants, self.who_knows_about_what[KP]):
                     KP_to_use = KP
 
             if KP_to_use == 'COHD':
@@ -1,7 +1,6 @@
 import os
 import pandas as pd
 import numpy as np
-import sqlite3
 try:
     from sklearn.externals import joblib
 except:
@@ -16,6 +15,8 @@ pathlist = os.path.realpath(__file__).split(os.path.sep)
 RTXindex = pathlist.index("RTX")
 sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code']))
 from RTXConfiguration import RTXConfiguration
+sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'ARAXQuery']))
+from sqlite_connection_registry import SqliteConnectionRegistry
 RTXConfig = RTXConfiguration()
 RTXConfig.live = "Production"
 
@@ -29,7 +30,7 @@ class predictor():
             DTD_prob_file = os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'KnowledgeSources', 'Prediction', RTXConfig.dtd_prob_path.split('/')[-1]])
         self.use_prob_db = use_prob_db
         if self.use_prob_db is True:
-            self.connection = sqlite3.connect(DTD_prob_file)
+            self.connection = SqliteConnectionRegistry.get_connection(DTD_prob_file)
         else:
             self.model = joblib.load(model_file)
             self.graph_cur = None
@@ -85,7 +86,7 @@ class predictor():
             graph_database = os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'KnowledgeSources', 'Prediction', RTXConfig.graph_database_path.split('/')[-1]])
         
         if self.use_prob_db is not True:
-            conn = sqlite3.connect(graph_database)
+            conn = SqliteConnectionRegistry.get_connection(graph_database)
             self.graph_cur = conn.cursor()
 
             if file is not None:
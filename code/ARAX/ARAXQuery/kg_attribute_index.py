@@ -0,0 +1,145 @@
+#!/bin/env python3
+# This file contains a per-message index of knowledge graph attribute values, shared by filter_kg, filter_results
+# and the ranker so that consecutive steps of a workflow don't each have to sweep every edge's attribute list
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class AttributeColumn:
+    """
+    All occurrences of a single attribute name in the knowledge graph, in KG iteration order. An attribute is
+    recorded under both its original_attribute_name and its attribute_type_id (once if they are the same), so a
+    column holds exactly the attributes the filter/sort code used to match with its hasattr/== checks. An edge or
+    node with several matching attributes appears once per matching attribute.
+    """
+
+    def __init__(self, keys: List[str], attributes: list):
+        self.keys = np.array(keys, dtype=object)
+        self.attributes = attributes
+        self.raw_values = [attribute.value for attribute in attributes]
+        self.values = np.full(len(attributes), np.nan, dtype=float)
+        self.is_numeric = np.zeros(len(attributes), dtype=bool)
+        for position, raw_value in enumerate(self.raw_values):
+            try:
+                self.values[position] = float(raw_value)
+                self.is_numeric[position] = True
+            except (TypeError, ValueError):
+                pass
+
+    def __len__(self):
+        return len(self.attributes)
+
+    def all_numeric(self) -> bool:
+        return bool(self.is_numeric.all())
+
+    def first_non_numeric_value(self):
+        non_numeric_positions = np.flatnonzero(~self.is_numeric)
+        return self.raw_values[non_numeric_positions[0]] if len(non_numeric_positions) else None
+
+    def last_value_by_key(self, numeric_only: bool = False) -> dict:
+        """
+        Returns a map of key -> value where later attributes on the same edge/node win (matching the old loops,
+        which overwrote the value each time another matching attribute was found). Values that can be converted
+        to float are returned as floats, the rest as their raw value (unless numeric_only is set).
+        """
+        values_by_key = dict()
+        for position, key in enumerate(self.keys):
+            if self.is_numeric[position]:
+                values_by_key[key] = float(self.values[position])
+            elif not numeric_only:
+                values_by_key[key] = self.raw_values[position]
+        return values_by_key
+
+
+class KGAttributeIndex:
+    """
+    Lazily built index of attribute name -> AttributeColumn for the edges and nodes of a knowledge graph. Use
+    KGAttributeIndex.for_message() to get the index cached on a message; it is rebuilt automatically when the KG
+    is replaced, when the set of edge/node keys changes (compared exactly, against a snapshot of the keys taken when
+    the index was built), or when attributes are added to existing edges/nodes. Code that changes attribute values
+    in place should call KGAttributeIndex.invalidate(message).
+    """
+
+    _message_attribute = "_kg_attribute_index"
+
+    def __init__(self, knowledge_graph):
+        self.knowledge_graph = knowledge_graph
+        self.fingerprint = self._get_fingerprint(knowledge_graph)
+        self.edge_keys = set(self._get_edges())
+        self.node_keys = set(self._get_nodes())
+        self._edge_attributes_by_name = None
+        self._node_attributes_by_name = None
+        self._edge_columns = dict()
+        self._node_columns = dict()
+
+    @classmethod
+    def for_message(cls, message) -> 'KGAttributeIndex':
+        knowledge_graph = message.knowledge_graph
+        index = getattr(message, cls._message_attribute, None)
+        if index is None or index.knowledge_graph is not knowledge_graph or not index._has_same_keys() or \
+                index.fingerprint != cls._get_fingerprint(knowledge_graph):
+            index = cls(knowledge_graph)
+            setattr(message, cls._message_attribute, index)
+        return index
+
+    @classmethod
+    def invalidate(cls, message):
+        if getattr(message, cls._message_attribute, None) is not None:
+            setattr(message, cls._message_attribute, None)
+
+    def get_edge_column(self, attribute_name: str) -> AttributeColumn:
+        if attribute_name not in self._edge_columns:
+            if self._edge_attributes_by_name is None:
+                self._edge_attributes_by_name = self._group_attributes_by_name(self._get_edges())
+            keys, attributes = self._edge_attributes_by_name.get(attribute_name, ([], []))
+            self._edge_columns[attribute_name] = AttributeColumn(keys, attributes)
+        return self._edge_columns[attribute_name]
+
+    def get_node_column(self, attribute_name: str) -> AttributeColumn:
+        if attribute_name not in self._node_columns:
+            if self._node_attributes_by_name is None:
+                self._node_attributes_by_name = self._group_attributes_by_name(self._get_nodes())
+            keys, attributes = self._node_attributes_by_name.get(attribute_name, ([], []))
+            self._node_columns[attribute_name] = AttributeColumn(keys, attributes)
+        return self._node_columns[attribute_name]
+
+    def _has_same_keys(self) -> bool:
+        # Compares the dict views with the snapshot sets directly (no per-key Python work)
+        return self._get_edges().keys() == self.edge_keys and self._get_nodes().keys() == self.node_keys
+
+    def _get_edges(self) -> dict:
+        return self.knowledge_graph.edges if self.knowledge_graph and self.knowledge_graph.edges else dict()
+
+    def _get_nodes(self) -> dict:
+        return self.knowledge_graph.nodes if self.knowledge_graph and self.knowledge_graph.nodes else dict()
+
+    @staticmethod
+    def _group_attributes_by_name(items: dict) -> Dict[str, Tuple[List[str], list]]:
+        attributes_by_name = dict()
+        for key, item in items.items():
+            item_attributes = getattr(item, "attributes", None)
+            if not item_attributes:
+                continue
+            for attribute in item_attributes:
+                original_attribute_name = getattr(attribute, "original_attribute_name", None)
+                attribute_type_id = getattr(attribute, "attribute_type_id", None)
+                for name in {original_attribute_name, attribute_type_id}:
+                    if name is None:
+                        continue
+                    if name not in attributes_by_name:
+                        attributes_by_name[name] = ([], [])
+                    attributes_by_name[name][0].append(key)
+                    attributes_by_name[name][1].append(attribute)
+        return attributes_by_name
+
+    @staticmethod
+    def _get_fingerprint(knowledge_graph) -> Optional[tuple]:
+        if knowledge_graph is None:
+            return None
+        edges = knowledge_graph.edges if knowledge_graph.edges else dict()
+        nodes = knowledge_graph.nodes if knowledge_graph.nodes else dict()
+        num_edge_attributes = sum(len(edge.attributes) for edge in edges.values() if edge.attributes)
+        num_node_attributes = sum(len(node.attributes) for node in nodes.values() if node.attributes)
+        return (id(knowledge_graph.edges), len(edges), num_edge_attributes,
+                id(knowledge_graph.nodes), len(nodes), num_node_attributes)
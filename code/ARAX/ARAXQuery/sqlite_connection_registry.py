@@ -0,0 +1,70 @@
+#!/bin/env python3
+# This class hands out shared read-only connections to the sqlite databases behind ARAX's knowledge sources
+import os
+import pathlib
+import sqlite3
+import threading
+from typing import Dict
+
+
+class SqliteConnectionRegistry:
+    """
+    The knowledge-source databases (KG2c, NGD, COHD, DTD, the NodeSynonymizer, ...) are never written to while ARAX
+    runs; they are only ever replaced whole by ARAXDatabaseManager. So each one is opened with mode=ro&immutable=1
+    (no locking or change detection) and with mmap_size/cache_size pragmas, so all processes read it through the page
+    cache. Since a sqlite connection can't be used by more than one thread, each thread gets its own connection per
+    database, which is kept for the life of the thread and re-opened after a fork or when the file is replaced.
+    Callers must not close the connections they are given.
+    """
+
+    mmap_size = 2 ** 30  # Bytes
+    cache_size = 64 * 2 ** 10  # KiB per connection
+    _thread_local = threading.local()
+    _lock = threading.Lock()
+    _statistics = dict()
+
+    @classmethod
+    def get_connection(cls, database_path: str) -> sqlite3.Connection:
+        """
+        Returns this thread's read-only connection to the given sqlite file, opening it if needed. Raises
+        sqlite3.OperationalError if the file can't be opened.
+        """
+        database_path = os.path.abspath(database_path)
+        try:
+            file_stat = os.stat(database_path)
+            connection_key = (os.getpid(), file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+        except OSError:
+            connection_key = None
+        connections = getattr(cls._thread_local, "connections", None)
+        if connections is None:
+            connections = cls._thread_local.connections = dict()
+
+        cached = connections.get(database_path)
+        if cached is not None and connection_key is not None and cached[0] == connection_key:
+            cls._count(database_path, "num_hits")
+            return cached[1]
+
+        sqlite_uri = f"{pathlib.Path(database_path).as_uri()}?mode=ro&immutable=1"
+        connection = sqlite3.connect(sqlite_uri, uri=True)
+        connection.execute(f"PRAGMA mmap_size = {cls.mmap_size}")
+        connection.execute(f"PRAGMA cache_size = -{cls.cache_size}")
+        # A connection inherited across a fork is just dropped; only close our own (one to a replaced file)
+        if cached is not None and cached[0] is not None and cached[0][0] == os.getpid():
+            cached[1].close()
+        connections[database_path] = (connection_key, connection)
+        cls._count(database_path, "num_opens")
+        return connection
+
+    @classmethod
+    def get_statistics(cls) -> Dict[str, Dict[str, int]]:
+        """
+        Returns the number of connections opened and reused (hits) in this process, per database.
+        """
+        with cls._lock:
+            return {database_path: dict(counts) for database_path, counts in cls._statistics.items()}
+
+    @classmethod
+    def _count(cls, database_path: str, count_name: str):
+        with cls._lock:
+            counts = cls._statistics.setdefault(database_path, {"num_opens": 0, "num_hits": 0})
+            counts[count_name] += 1
@@ -2,24 +2,146 @@
 import json
 import os
 import pathlib
-import pickle
+import threading
 from collections import defaultdict
-from typing import Optional, List, Set, Dict, Union, Tuple
+from typing import Optional, List, Set, Dict, Union, Tuple, FrozenSet, Iterable
 
+import numpy as np
 import requests
 import yaml
 from treelib import Tree
 
 
+class BiolinkLookupIndex:
+    """
+    Compiled form of the Biolink lookup map. Every category, predicate and mixin gets an integer id, and its
+    ancestors, descendants and (for mixins) direct mappings are stored as bitsets over those ids: Python ints in
+    memory, packed bit matrices in a numpy .npz file on disk (which loads much faster than the pickled map of sets).
+    An index is loaded once per process and shared by all BiolinkHelper instances for that Biolink version, along
+    with a memo of ancestor/descendant lookups.
+    """
+
+    kinds = ("categories", "predicates", "category_mixins", "predicate_mixins")
+    bitset_properties = ("ancestors", "ancestors_with_mixins", "descendants", "descendants_with_mixins",
+                         "direct_mappings")
+    memo_size = 20000
+
+    def __init__(self, names: List[str], kind_flags: List[int], bitsets: Dict[str, List[int]],
+                 canonical_ids: List[int], symmetric: List[bool]):
+        self.names = names
+        self.ids = {name: item_id for item_id, name in enumerate(names)}
+        self.kind_flags = kind_flags
+        self.bitsets = bitsets
+        self.canonical_ids = canonical_ids
+        self.symmetric = symmetric
+        self.kind_members = {kind: frozenset(name for name, flags in zip(names, kind_flags) if flags & (1 << kind_index))
+                             for kind_index, kind in enumerate(self.kinds)}
+        self._memo = dict()
+        self._memo_lock = threading.Lock()
+
+    @classmethod
+    def from_lookup_map(cls, biolink_lookup_map: Dict[str, Dict[str, Dict[str, any]]]) -> 'BiolinkLookupIndex':
+        names = set()
+        for kind in cls.kinds:
+            for name, info in biolink_lookup_map[kind].items():
+                names.add(name)
+                for property_name in cls.bitset_properties:
+                    names.update(info.get(property_name, set()))
+        names = sorted(names)
+        ids = {name: item_id for item_id, name in enumerate(names)}
+
+        kind_flags = [0] * len(names)
+        bitsets = {property_name: [0] * len(names) for property_name in cls.bitset_properties}
+        canonical_ids = [-1] * len(names)
+        symmetric = [False] * len(names)
+        for kind_index, kind in enumerate(cls.kinds):
+            is_mixin_kind = kind.endswith("mixins")
+            for name, info in biolink_lookup_map[kind].items():
+                item_id = ids[name]
+                kind_flags[item_id] |= 1 << kind_index
+                for property_name in cls.bitset_properties:
+                    if is_mixin_kind and property_name != "direct_mappings":
+                        # Mixins don't have mixin-inclusive variants; their plain ancestors/descendants are used either way
+                        source_property = property_name.replace("_with_mixins", "")
+                    else:
+                        source_property = property_name
+                    related_items = info.get(source_property, set())
+                    if property_name == "direct_mappings" and is_mixin_kind:
+                        # Only mappings onto regular categories/predicates are ever used
+                        mapped_kind = "categories" if kind == "category_mixins" else "predicates"
+                        related_items = set(related_items).intersection(biolink_lookup_map[mapped_kind])
+                    bitsets[property_name][item_id] |= cls._to_bitset(ids[related_item] for related_item in related_items)
+                if kind == "predicates":
+                    canonical_ids[item_id] = ids[info["canonical_predicate"]] if info["canonical_predicate"] in ids else item_id
+                    symmetric[item_id] = info["is_symmetric"]
+        return cls(names, kind_flags, bitsets, canonical_ids, symmetric)
+
+    @classmethod
+    def load(cls, file_path: str) -> 'BiolinkLookupIndex':
+        with np.load(file_path, allow_pickle=False) as index_file:
+            names = index_file["names"].tolist()
+            bitsets = {property_name: [int.from_bytes(row.tobytes(), "little") for row in index_file[property_name]]
+                       for property_name in cls.bitset_properties}
+            return cls(names, index_file["kind_flags"].tolist(), bitsets, index_file["canonical_ids"].tolist(),
+                       index_file["symmetric"].tolist())
+
+    def save(self, file_path: str):
+        num_items = len(self.names)
+        num_bytes = (num_items + 7) // 8
+        packed_bitsets = {property_name: np.array([np.frombuffer(bitset.to_bytes(num_bytes, "little"), dtype=np.uint8)
+                                                   for bitset in self.bitsets[property_name]],
+                                                  dtype=np.uint8).reshape(num_items, num_bytes)
+                          for property_name in self.bitset_properties}
+        # Write to a temporary file first so that other processes never load a partially written index
+        temp_file_path = f"{file_path}.{os.getpid()}.tmp.npz"
+        np.savez(temp_file_path, names=np.array(self.names, dtype=str),
+                 kind_flags=np.array(self.kind_flags, dtype=np.uint8),
+                 canonical_ids=np.array(self.canonical_ids, dtype=np.int32),
+                 symmetric=np.array(self.symmetric, dtype=bool), **packed_bitsets)
+        os.replace(temp_file_path, file_path)
+
+    def get_union(self, items: Iterable[str], property_name: str) -> int:
+        bitset = 0
+        property_bitsets = self.bitsets[property_name]
+        for item in items:
+            item_id = self.ids.get(item)
+            if item_id is not None:
+                bitset |= property_bitsets[item_id]
+        return bitset
+
+    def get_names(self, bitset: int) -> List[str]:
+        return [self.names[item_id] for item_id, bit in enumerate(reversed(bin(bitset)[2:])) if bit == "1"]
+
+    def get_memo(self, key: tuple) -> Optional[FrozenSet[str]]:
+        return self._memo.get(key)
+
+    def set_memo(self, key: tuple, value: FrozenSet[str]):
+        with self._memo_lock:
+            if len(self._memo) >= self.memo_size:
+                self._memo.clear()
+            self._memo[key] = value
+
+    @staticmethod
+    def _to_bitset(item_ids: Iterable[int]) -> int:
+        bitset = 0
+        for item_id in item_ids:
+            bitset |= 1 << item_id
+        return bitset
+
+
 class BiolinkHelper:
 
+    _loaded_indexes = dict()  # Index file path -> BiolinkLookupIndex (shared by all instances in the process)
+    _loaded_indexes_lock = threading.Lock()
+
     def __init__(self, biolink_version: Optional[str] = None):
         self.biolink_version = biolink_version if biolink_version else self.get_current_arax_biolink_version()
         self.root_category = "biolink:NamedThing"
         self.root_predicate = "biolink:related_to"
         biolink_helper_dir = os.path.dirname(os.path.abspath(__file__))
-        self.biolink_lookup_map_path = f"{biolink_helper_dir}/biolink_lookup_map_{self.biolink_version}_v3.pickle"
-        self.biolink_lookup_map = self._load_biolink_lookup_map()
+        self.biolink_lookup_map_path = f"{biolink_helper_dir}/biolink_lookup_map_{self.biolink_version}_v3.json"
+        self.biolink_lookup_index_path = f"{biolink_helper_dir}/biolink_lookup_index_{self.biolink_version}_v1.npz"
+        self.biolink_lookup_index = self._load_biolink_lookup_index()
         protein_like_categories = {"biolink:Protein", "biolink:Gene"}
         disease_like_categories = {"biolink:Disease", "biolink:PhenotypicFeature", "biolink:DiseaseOrPhenotypicFeature"}
         self.arax_conflations = {
@@ -38,24 +160,8 @@ class BiolinkHelper:
         conflations (e.g., gene == protein) can be controlled via the include_conflations parameter.
         """
         # TODO: Make the include_mixins work for mixin inputs? (return only categories/predicates)
-        input_item_set = self._convert_to_set(biolink_items)
-        categories = input_item_set.intersection(set(self.biolink_lookup_map["categories"]))
-        predicates = input_item_set.intersection(set(self.biolink_lookup_map["predicates"]))
-        category_mixins = input_item_set.intersection(set(self.biolink_lookup_map["category_mixins"]))
-        predicate_mixins = input_item_set.intersection(set(self.biolink_lookup_map["predicate_mixins"]))
-        ancestors = input_item_set.copy()
         ancestor_property = "ancestors_with_mixins" if include_mixins else "ancestors"
-        if include_conflations:
-            categories = set(self.add_conflations(categories))
-        for category in categories:
-            ancestors.update(self.biolink_lookup_map["categories"][category][ancestor_property])
-        for predicate in predicates:
-            ancestors.update(self.biolink_lookup_map["predicates"][predicate][ancestor_property])
-        for category_mixin in category_mixins:
-            ancestors.update(self.biolink_lookup_map["category_mixins"][category_mixin]["ancestors"])
-        for predicate_mixin in predicate_mixins:
-            ancestors.update(self.biolink_lookup_map["predicate_mixins"][predicate_mixin]["ancestors"])
-        return list(ancestors)
+        return list(self._get_related_items(biolink_items, ancestor_property, include_conflations))
 
     def get_descendants(self, biolink_items: Union[str, List[str], Set[str]], include_mixins: bool = True, include_conflations: bool = True) -> List[str]:
         """
@@ -65,24 +171,8 @@ class BiolinkHelper:
         conflations (e.g., gene == protein) can be controlled via the include_conflations parameter.
         """
         # TODO: Make the include_mixins work for mixin inputs? (return only categories/predicates)
-        input_item_set = self._convert_to_set(biolink_items)
-        categories = input_item_set.intersection(set(self.biolink_lookup_map["categories"]))
-        predicates = input_item_set.intersection(set(self.biolink_lookup_map["predicates"]))
-        category_mixins = input_item_set.intersection(set(self.biolink_lookup_map["category_mixins"]))
-        predicate_mixins = input_item_set.intersection(set(self.biolink_lookup_map["predicate_mixins"]))
-        descendants = input_item_set.copy()
         descendant_property = "descendants_with_mixins" if include_mixins else "descendants"
-        if include_conflations:
-            categories = set(self.add_conflations(categories))
-        for category in categories:
-            descendants.update(self.biolink_lookup_map["categories"][category][descendant_property])
-        for predicate in predicates:
-            descendants.update(self.biolink_lookup_map["predicates"][predicate][descendant_property])
-        for category_mixin in category_mixins:
-            descendants.update(self.biolink_lookup_map["category_mixins"][category_mixin]["descendants"])
-        for predicate_mixin in predicate_mixins:
-            descendants.update(self.biolink_lookup_map["predicate_mixins"][predicate_mixin]["descendants"])
-        return list(descendants)
+        return list(self._get_related_items(biolink_items, descendant_property, include_conflations))
 
     def get_canonical_predicates(self, predicates: Union[str, List[str], Set[str]]) -> List[str]:
         """
@@ -90,44 +180,39 @@ class BiolinkHelper:
         input and always returns the canonical predicate(s) in a list.
         """
         # TODO: Add canonical predicates for predicate mixins?
+        index = self.biolink_lookup_index
         input_predicate_set = self._convert_to_set(predicates)
-        valid_predicates = input_predicate_set.intersection(self.biolink_lookup_map["predicates"])
+        valid_predicates = input_predicate_set.intersection(index.kind_members["predicates"])
         invalid_predicates = input_predicate_set.difference(valid_predicates)
         if invalid_predicates:
             print(f"WARNING: Provided predicate(s) {invalid_predicates} do not exist in Biolink {self.biolink_version}")
-        canonical_predicates = {self.biolink_lookup_map["predicates"][predicate]["canonical_predicate"]
+        canonical_predicates = {index.names[index.canonical_ids[index.ids[predicate]]]
                                 for predicate in valid_predicates}
         canonical_predicates.update(invalid_predicates)  # Go ahead and include those we don't have canonical info for
         return list(canonical_predicates)
 
     def is_symmetric(self, predicate: str) -> bool:
-        if predicate in self.biolink_lookup_map["predicates"]:
-            return self.biolink_lookup_map["predicates"][predicate]["is_symmetric"]
+        index = self.biolink_lookup_index
+        if predicate in index.kind_members["predicates"]:
+            return index.symmetric[index.ids[predicate]]
         else:
             return True  # Consider unrecognized predicates symmetric (rather than throw error)
 
     def replace_mixins_with_direct_mappings(self, biolink_items: Union[str, List[str], Set[str]]) -> List[str]:
+        index = self.biolink_lookup_index
         input_item_set = self._convert_to_set(biolink_items)
-        category_mixins = input_item_set.intersection(set(self.biolink_lookup_map["category_mixins"]))
-        predicate_mixins = input_item_set.intersection(set(self.biolink_lookup_map["predicate_mixins"]))
-        non_mixins = input_item_set.difference(category_mixins).difference(predicate_mixins)
-        mixin_direct_mappings = set()
-        for category_mixin in category_mixins:
-            raw_direct_mappings = self.biolink_lookup_map["category_mixins"][category_mixin]["direct_mappings"]
-            mixin_direct_mappings.update(raw_direct_mappings.intersection(self.biolink_lookup_map["categories"]))
-        for predicate_mixin in predicate_mixins:
-            raw_direct_mappings = self.biolink_lookup_map["predicate_mixins"][predicate_mixin]["direct_mappings"]
-            mixin_direct_mappings.update(raw_direct_mappings.intersection(self.biolink_lookup_map["predicates"]))
+        mixins = input_item_set.intersection(index.kind_members["category_mixins"].union(index.kind_members["predicate_mixins"]))
+        non_mixins = input_item_set.difference(mixins)
+        mixin_direct_mappings = index.get_names(index.get_union(mixins, "direct_mappings"))
         return list(non_mixins.union(mixin_direct_mappings))
 
     def filter_out_mixins(self, biolink_items: Union[List[str], Set[str]]) -> List[str]:
         """
         Removes any predicate or category mixins in the input list.
         """
+        index = self.biolink_lookup_index
         input_item_set = self._convert_to_set(biolink_items)
-        all_predicate_mixins = set(self.biolink_lookup_map["predicate_mixins"])
-        all_category_mixins = set(self.biolink_lookup_map["category_mixins"])
-        non_mixin_items = input_item_set.difference(all_predicate_mixins).difference(all_category_mixins)
+        non_mixin_items = input_item_set.difference(index.kind_members["predicate_mixins"]).difference(index.kind_members["category_mixins"])
         return list(non_mixin_items)
 
     def add_conflations(self, categories: Union[str, List[str], Set[str]]) -> List[str]:
@@ -158,16 +243,33 @@ class BiolinkHelper:
 
     # ------------------------------------- Internal methods -------------------------------------------------- #
 
-    def _load_biolink_lookup_map(self):
-        lookup_map_file = pathlib.Path(self.biolink_lookup_map_path)
-        if not lookup_map_file.exists():
-            # Parse the relevant Biolink yaml file and create/save local indexes
-            return self._create_biolink_lookup_map()
-        else:
-            # A local file already exists for this Biolink version, so just load it
-            with open(self.biolink_lookup_map_path, "rb") as biolink_map_file:
-                biolink_lookup_map = pickle.load(biolink_map_file)
-            return biolink_lookup_map
+    def _get_related_items(self, biolink_items: Union[str, List[str], Set[str]], property_name: str,
+                           include_conflations: bool) -> FrozenSet[str]:
+        index = self.biolink_lookup_index
+        input_item_set = frozenset(self._convert_to_set(biolink_items))
+        memo_key = (input_item_set, property_name, include_conflations)
+        related_items = index.get_memo(memo_key)
+        if related_items is None:
+            lookup_items = set(input_item_set)
+            if include_conflations:
+                lookup_items.update(self.add_conflations(set(input_item_set.intersection(index.kind_members["categories"]))))
+            related_items = input_item_set.union(index.get_names(index.get_union(lookup_items, property_name)))
+            index.set_memo(memo_key, related_items)
+        return related_items
+
+    def _load_biolink_lookup_index(self) -> BiolinkLookupIndex:
+        with self._loaded_indexes_lock:
+            index = self._loaded_indexes.get(self.biolink_lookup_index_path)
+            if index is None:
+                if pathlib.Path(self.biolink_lookup_index_path).exists():
+                    # A local file already exists for this Biolink version, so just load it
+                    index = BiolinkLookupIndex.load(self.biolink_lookup_index_path)
+                else:
+                    # Parse the relevant Biolink yaml file and create/save a local index
+                    index = BiolinkLookupIndex.from_lookup_map(self._create_biolink_lookup_map())
+                    index.save(self.biolink_lookup_index_path)
+                self._loaded_indexes[self.biolink_lookup_index_path] = index
+        return index
 
     def _create_biolink_lookup_map(self) -> Dict[str, Dict[str, Dict[str, Union[str, List[str], bool]]]]:
         print(f"INFO: Building local Biolink {self.biolink_version} ancestor/descendant lookup map because one "
@@ -243,12 +345,8 @@ class BiolinkHelper:
                     "direct_mixins": category_to_mixins_map[category],
                 }
 
-            # And cache it (never needs to be refreshed for the given Biolink version)
-            with open(self.biolink_lookup_map_path, "wb") as output_file:
-                pickle.dump(biolink_lookup_map, output_file)  # Use pickle so we can save Sets
-            # Also save a JSON version to help with debugging
-            json_file_path = self.biolink_lookup_map_path.replace(".pickle", ".json")
-            with open(json_file_path, "w+") as output_json_file:
+            # Save a JSON version to help with debugging (the compiled index is what's actually cached/used)
+            with open(self.biolink_lookup_map_path, "w+") as output_json_file:
                 json.dump(biolink_lookup_map, output_json_file, default=self._serialize_with_sets, indent=4)
         else:
             raise RuntimeError(f"ERROR: Request to get Biolink {self.biolink_version} YAML file returned "
@@ -8,7 +8,6 @@ import sys
 import re
 import timeit
 import argparse
-import sqlite3
 import pickle
 import itertools
 import requests
@@ -25,6 +24,8 @@ RTXindex = pathlist.index("RTX")
 sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'reasoningtool', 'QuestionAnswering']))
 sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'NodeSynonymizer']))
 from node_synonymizer import NodeSynonymizer
+sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'ARAXQuery']))
+from sqlite_connection_registry import SqliteConnectionRegistry
 
 DEBUG = True
 
@@ -52,7 +53,7 @@ class COHDIndex:
         database = f"{self.databaseLocation}/{self.databaseName}"
 
         if os.path.exists(database):
-            self.connection = sqlite3.connect(database)
+            self.connection = SqliteConnectionRegistry.get_connection(database)
             print("INFO: Connecting to database", flush=True)
             return True
         else:
@@ -74,16 +75,15 @@ class COHDIndex:
             # os.system(f"scp rtxconfig@arax.ncats.io:/data/orangeboard/databases/KG2.3.4/{self.databaseName} {database}")
             os.system(f"scp {RTXConfig.cohd_database_username}@{RTXConfig.cohd_database_host}:{RTXConfig.cohd_database_path} {database}")
 
-            self.connection = sqlite3.connect(database)
+            self.connection = SqliteConnectionRegistry.get_connection(database)
             print("INFO: Connecting to database", flush=True)
             return True
 
-    # Destroy the database connection
+    # Let go of the database connection (it is shared, through the registry, so it is not closed)
     def disconnect(self):
 
         if self.success_con is True:
-            self.connection.commit()
-            self.connection.close()
+            self.connection = None
             print("INFO: Disconnecting from database", flush=True)
             self.success_con = False
         else:
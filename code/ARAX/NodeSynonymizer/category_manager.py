@@ -12,6 +12,7 @@ import time
 import pickle
 import re
 import copy
+import threading
 
 import requests
 import requests_cache
@@ -20,10 +21,18 @@ import requests_cache
 # Class that provides a simple interface to BioLink categories and their ancestors and approved conflations
 class CategoryManager:
 
+    biolink_version = '2.2.6'
 
-    # Constructor
-    def __init__(self):
+    # Expansion tables loaded in this process, by path, and expansions computed in this process, by categories
+    _expansion_tables = {}
+    _computed_expansions = {}
+    _lock = threading.Lock()
+
+    # Constructor. If given the path of a precomputed expansion table (see build_expansion_table()), expansions are
+    # looked up there rather than computed
+    def __init__(self, expansion_table_path=None):
         self.location = os.path.dirname(os.path.abspath(__file__))
+        self.expansion_table = self.get_expansion_table(expansion_table_path) if expansion_table_path is not None else {}
         requests_cache.install_cache(self.location + '/category_manager.cache')
 
         self.categories = {
@@ -87,7 +96,7 @@ class CategoryManager:
             return self.categories['ancestors'][category]
 
         # Build the URL and fetch the result
-        url = f"https://bl-lookup-sri.renci.org/bl/{category}/ancestors?version=2.2.6"
+        url = f"https://bl-lookup-sri.renci.org/bl/{category}/ancestors?version={self.biolink_version}"
         response_content = requests.get(url, headers={'accept': 'application/json'})
         status_code = response_content.status_code
 
@@ -107,21 +116,52 @@ class CategoryManager:
 
 
     # ############################################################################################
-    # Retrieve the ancestors of a biolink category
+    # Retrieve the descendants of a biolink category from SRI web service (or None if that fails)
+    def get_descendants(self, category):
+
+        url = f"https://bl-lookup-sri.renci.org/bl/{category}/descendants?version={self.biolink_version}"
+        response_content = requests.get(url, headers={'accept': 'application/json'})
+        if response_content.status_code != 200:
+            eprint(f"WARNING: returned with status {response_content.status_code} while retrieving descendants for {category}")
+            return None
+        return response_content.json()
+
+
+    # ############################################################################################
+    # Return the expansive categories (the categories themselves, their ancestors and the approved conflations of all
+    # those) of a category or list of categories, as a tuple that is shared by all callers
     def get_expansive_categories(self, categories):
 
         # If no categories are provided, then there's nothing to do
         if categories is None:
             return
 
-        # If the supplied categories is just a string, then turn is into the expected list
+        # A single category is normally in the precomputed table
         if isinstance(categories,str):
+            expansive_categories = self.expansion_table.get(categories)
+            if expansive_categories is not None:
+                return expansive_categories
             categories = [ categories ]
 
         # If the supplied categories is not a list, then error out
         if not isinstance(categories,list):
             raise(f"ERROR: categories {categories} must be type list or str")
 
+        # Otherwise compute it, once per process
+        key = (self.biolink_version, tuple(categories))
+        with CategoryManager._lock:
+            expansive_categories = CategoryManager._computed_expansions.get(key)
+        if expansive_categories is None:
+            expansive_categories = tuple(self._compute_expansive_categories(categories))
+            with CategoryManager._lock:
+                CategoryManager._computed_expansions[key] = expansive_categories
+        return expansive_categories
+
+
+    # ############################################################################################
+    # Compute the expansive categories of a list of categories, as a dict with the categories as keys (in order)
+    def _compute_expansive_categories(self, categories):
+
         # Create a dict to store of the computed expansive categories
         expansive_categories = {}
 
@@ -157,6 +197,57 @@ class CategoryManager:
         return expansive_categories
 
 
+    # ############################################################################################
+    # Compute the expansive categories of every Biolink category (plus any other given categories) and store them in
+    # a table file for this Biolink version
+    def build_expansion_table(self, expansion_table_path, categories=None):
+
+        all_categories = {}
+        descendants = self.get_descendants('biolink:NamedThing')
+        for category in (descendants or []) + list(categories or []):
+            if category is not None:
+                all_categories[category] = True
+        print(f"INFO: Computing expansive categories for {len(all_categories)} categories of Biolink {self.biolink_version}")
+
+        expansions = { category: list(self._compute_expansive_categories([ category ])) for category in all_categories }
+        temp_path = f"{expansion_table_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as outfile:
+            json.dump({ 'biolink_version': self.biolink_version, 'expansions': expansions }, outfile, indent=1, sort_keys=True)
+        os.replace(temp_path, expansion_table_path)
+        print(f"INFO: Wrote {expansion_table_path}")
+
+
+    # ############################################################################################
+    # Return the expansion table at this path as a dict of category to tuple of expansive categories (loaded once per
+    # process and file version), or an empty dict if there isn't one for this Biolink version
+    @classmethod
+    def get_expansion_table(cls, expansion_table_path):
+
+        try:
+            mtime = os.stat(expansion_table_path).st_mtime_ns
+        except OSError:
+            return {}
+        with cls._lock:
+            cached = cls._expansion_tables.get(expansion_table_path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+        expansion_table = {}
+        try:
+            with open(expansion_table_path) as infile:
+                contents = json.load(infile)
+            if contents.get('biolink_version') == cls.biolink_version:
+                expansion_table = { category: tuple(expansive_categories) for category, expansive_categories in contents['expansions'].items() }
+            else:
+                eprint(f"WARNING: Category expansion table {expansion_table_path} is for Biolink {contents.get('biolink_version')}, not {cls.biolink_version}; not using it")
+        except (OSError, ValueError, KeyError, AttributeError) as error:
+            eprint(f"WARNING: Unable to load category expansion table {expansion_table_path}: {error}")
+
+        with cls._lock:
+            cls._expansion_tables[expansion_table_path] = (mtime, expansion_table)
+        return expansion_table
+
+
 
 
 # ############################################################################################
@@ -172,9 +263,11 @@ def main():
                         help="Look up the ancestors for the supplied category", default=False)
     parser.add_argument('-c', '--categories', action="store",
                         help="Get the full list of exansive categories for the supplied category", default=False)
+    parser.add_argument('-e', '--expansion_table', action="store",
+                        help="Build the category expansion table at the supplied path", default=False)
     args = parser.parse_args()
 
-    if not args.build and not args.ancestors and not args.categories:
+    if not args.build and not args.ancestors and not args.categories and not args.expansion_table:
         parser.print_help()
         sys.exit(2)
 
@@ -190,6 +283,10 @@ def main():
         print(json.dumps(categories, indent=2, sort_keys=True))
         return
 
+    if args.expansion_table:
+        catman.build_expansion_table(args.expansion_table)
+        return
+
 if __name__ == "__main__": main()
 
 
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+#
+# Class to build and read a memory-mapped index of the NodeSynonymizer's curies, names and concepts
+#
+import sys
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+import numpy as np
+
+
+class ConceptIndex:
+    """
+    A read-only companion to the NodeSynonymizer sqlite database for the hot lookups (canonical curies, equivalent
+    nodes, curie names). It is a directory of .npy arrays next to the database that are memory-mapped when loaded, so
+    all ARAX processes share one copy in the page cache and lookups need no SQL:
+      - every distinct string is stored once in a string table (a byte blob plus offsets); records refer to strings by
+        integer id (-1 for NULL)
+      - concepts (the unique_concepts table) are numbered in row order, with their curie, name and category
+      - the curies, nodes and names tables are stored as packed record arrays, with each node and curie also listed
+        under its concept (CSR-style offsets into a row list)
+      - each table's normalized keys (uc_curie or lc_name) are looked up through a sorted array of 64-bit key hashes
+        (a sorted hash table: binary search for the hash, then check the key string itself)
+    """
+
+    version = 1
+    array_names = [ 'string_offsets', 'string_blob',
+                    'concept_curies', 'concept_names', 'concept_categories',
+                    'curie_hashes', 'curie_key_ids', 'curie_rows', 'curie_concepts', 'curie_categories',
+                    'concept_curie_offsets', 'concept_curie_rows',
+                    'node_hashes', 'node_key_ids', 'node_rows', 'node_curies', 'node_labels', 'node_categories',
+                    'concept_node_offsets', 'concept_node_rows',
+                    'name_hashes', 'name_key_ids', 'name_rows', 'name_concepts' ]
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, arrays):
+        for array_name in self.array_names:
+            setattr(self, array_name, arrays[array_name])
+
+
+    # ############################################################################################
+    @staticmethod
+    def get_index_path(database_path):
+        return f"{database_path}.concept_index"
+
+
+    # ############################################################################################
+    # Return the (shared, per-process) index for this database, or None if there isn't a current one
+    @classmethod
+    def get(cls, database_path):
+
+        index_path = cls.get_index_path(database_path)
+        try:
+            cache_key = (os.stat(f"{index_path}/metadata.json").st_mtime_ns, os.path.getsize(database_path))
+        except OSError:
+            return None
+        with cls._instances_lock:
+            cached = cls._instances.get(index_path)
+            if cached is not None and cached[0] == cache_key:
+                return cached[1]
+
+        try:
+            with open(f"{index_path}/metadata.json") as infile:
+                metadata = json.load(infile)
+            if metadata.get('version') != cls.version or metadata.get('database_size') != cache_key[1]:
+                eprint(f"WARNING: Concept index {index_path} is out of date with respect to {database_path}; not using it")
+                index = None
+            else:
+                index = cls({ array_name: np.load(f"{index_path}/{array_name}.npy", mmap_mode='r', allow_pickle=False) for array_name in cls.array_names })
+        except (OSError, ValueError) as error:
+            eprint(f"WARNING: Unable to load concept index {index_path}: {error}")
+            index = None
+
+        with cls._instances_lock:
+            cls._instances[index_path] = (cache_key, index)
+        return index
+
+
+    # ############################################################################################
+    # Build the index from a (complete) NodeSynonymizer database and write it next to the database
+    @classmethod
+    def build(cls, connection, database_path):
+
+        print(f"INFO: Building concept index for {database_path}")
+        string_ids = {}
+        def get_string_id(string):
+            if string is None:
+                return -1
+            string_id = string_ids.get(string)
+            if string_id is None:
+                string_id = len(string_ids)
+                string_ids[string] = string_id
+            return string_id
+
+        arrays = {}
+        cursor = connection.cursor()
+
+        # Concepts
+        concept_ids = {}
+        concept_curies, concept_names, concept_categories = [], [], []
+        for uc_curie, curie, name, category in cursor.execute("SELECT uc_curie, curie, name, category FROM unique_concepts ORDER BY rowid"):
+            if uc_curie in concept_ids:
+                continue
+            concept_ids[uc_curie] = len(concept_ids)
+            concept_curies.append(get_string_id(curie))
+            concept_names.append(get_string_id(name))
+            concept_categories.append(get_string_id(category))
+        arrays['concept_curies'] = np.array(concept_curies, dtype=np.int64)
+        arrays['concept_names'] = np.array(concept_names, dtype=np.int64)
+        arrays['concept_categories'] = np.array(concept_categories, dtype=np.int64)
+        print(f"INFO: Indexed {len(concept_ids)} concepts")
+
+        # Curies
+        keys, curie_concepts, curie_categories = [], [], []
+        for uc_curie, unique_concept_curie, category in cursor.execute("SELECT uc_curie, unique_concept_curie, category FROM curies ORDER BY rowid"):
+            keys.append(uc_curie)
+            curie_concepts.append(concept_ids.get(unique_concept_curie, -1))
+            curie_categories.append(get_string_id(category))
+        arrays['curie_concepts'] = np.array(curie_concepts, dtype=np.int64)
+        arrays['curie_categories'] = np.array(curie_categories, dtype=np.int64)
+        cls._add_key_arrays(arrays, 'curie', keys, get_string_id)
+        cls._add_concept_rows(arrays, 'concept_curie', arrays['curie_concepts'], len(concept_ids))
+        print(f"INFO: Indexed {len(keys)} curies")
+
+        # Nodes
+        keys, node_curies, node_labels, node_categories, node_concepts = [], [], [], [], []
+        for uc_curie, curie, adjusted_name, category, unique_concept_curie in cursor.execute("SELECT uc_curie, curie, adjusted_name, category, unique_concept_curie FROM nodes ORDER BY rowid"):
+            keys.append(uc_curie)
+            node_curies.append(get_string_id(curie))
+            node_labels.append(get_string_id(adjusted_name))
+            node_categories.append(get_string_id(category))
+            node_concepts.append(concept_ids.get(unique_concept_curie, -1))
+        arrays['node_curies'] = np.array(node_curies, dtype=np.int64)
+        arrays['node_labels'] = np.array(node_labels, dtype=np.int64)
+        arrays['node_categories'] = np.array(node_categories, dtype=np.int64)
+        cls._add_key_arrays(arrays, 'node', keys, get_string_id)
+        cls._add_concept_rows(arrays, 'concept_node', np.array(node_concepts, dtype=np.int64), len(concept_ids))
+        print(f"INFO: Indexed {len(keys)} nodes")
+
+        # Names
+        keys, name_concepts = [], []
+        for lc_name, unique_concept_curie in cursor.execute("SELECT lc_name, unique_concept_curie FROM names ORDER BY rowid"):
+            keys.append(lc_name)
+            name_concepts.append(concept_ids.get(unique_concept_curie, -1))
+        arrays['name_concepts'] = np.array(name_concepts, dtype=np.int64)
+        cls._add_key_arrays(arrays, 'name', keys, get_string_id)
+        print(f"INFO: Indexed {len(keys)} names")
+
+        # The string table
+        encoded_strings = [ string.encode('utf-8') for string in string_ids ]
+        string_offsets = np.zeros(len(encoded_strings) + 1, dtype=np.int64)
+        string_offsets[1:] = np.cumsum([ len(encoded_string) for encoded_string in encoded_strings ], dtype=np.int64)
+        arrays['string_offsets'] = string_offsets
+        arrays['string_blob'] = np.frombuffer(b''.join(encoded_strings), dtype=np.uint8)
+        print(f"INFO: Stored {len(encoded_strings)} distinct strings ({string_offsets[-1]} bytes)")
+
+        # Write everything into a new directory and then swap it in place of any previous one
+        index_path = cls.get_index_path(database_path)
+        new_index_path = f"{index_path}.{os.getpid()}.tmp"
+        shutil.rmtree(new_index_path, ignore_errors=True)
+        os.makedirs(new_index_path)
+        for array_name in cls.array_names:
+            np.save(f"{new_index_path}/{array_name}.npy", arrays[array_name], allow_pickle=False)
+        with open(f"{new_index_path}/metadata.json", 'w') as outfile:
+            json.dump({ 'version': cls.version, 'database_size': os.path.getsize(database_path) }, outfile)
+        old_index_path = f"{index_path}.{os.getpid()}.old"
+        if os.path.exists(index_path):
+            os.rename(index_path, old_index_path)
+        os.rename(new_index_path, index_path)
+        shutil.rmtree(old_index_path, ignore_errors=True)
+        print(f"INFO: Wrote concept index to {index_path}")
+
+
+    # ############################################################################################
+    @staticmethod
+    def _hash_key(key):
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+    # ############################################################################################
+    @classmethod
+    def _add_key_arrays(cls, arrays, kind, keys, get_string_id):
+        hashes = np.array([ cls._hash_key(key) for key in keys ], dtype=np.uint64)
+        order = np.argsort(hashes, kind='stable')  # Stable, so the first row for a key comes first, as in the table
+        arrays[f"{kind}_hashes"] = hashes[order]
+        arrays[f"{kind}_key_ids"] = np.array([ get_string_id(keys[row]) for row in order ], dtype=np.int64)
+        arrays[f"{kind}_rows"] = order.astype(np.int64)
+
+
+    # ############################################################################################
+    @staticmethod
+    def _add_concept_rows(arrays, name, row_concepts, n_concepts):
+        order = np.argsort(row_concepts, kind='stable')
+        order = order[row_concepts[order] >= 0]
+        offsets = np.zeros(n_concepts + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(row_concepts[order], minlength=n_concepts))
+        arrays[f"{name}_offsets"] = offsets
+        arrays[f"{name}_rows"] = order.astype(np.int64)
+
+
+    # ############################################################################################
+    # Return the string with this id (None for -1)
+    def get_string(self, string_id):
+        if string_id < 0:
+            return None
+        return bytes(self.string_blob[self.string_offsets[string_id]:self.string_offsets[string_id + 1]]).decode('utf-8')
+
+
+    # ############################################################################################
+    # Find the row of the first record with each key (or -1 if there is none)
+    def _lookup_rows(self, kind, keys):
+
+        sorted_hashes = getattr(self, f"{kind}_hashes")
+        key_ids = getattr(self, f"{kind}_key_ids")
+        rows = getattr(self, f"{kind}_rows")
+        if len(keys) == 0:
+            return []
+        hashes = np.array([ self._hash_key(key) for key in keys ], dtype=np.uint64)
+        positions = np.searchsorted(sorted_hashes, hashes)
+        found_rows = []
+        for key, key_hash, position in zip(keys, hashes, positions):
+            found_row = -1
+            while position < len(sorted_hashes) and sorted_hashes[position] == key_hash:
+                if self.get_string(key_ids[position]) == key:
+                    found_row = int(rows[position])
+                    break
+                position += 1
+            found_rows.append(found_row)
+        return found_rows
+
+
+    # ############################################################################################
+    # Return the concept id for each upper-cased curie (or -1 if not found)
+    def get_curie_concepts(self, uc_curies):
+        return [ int(self.curie_concepts[row]) if row >= 0 else -1 for row in self._lookup_rows('curie', uc_curies) ]
+
+
+    # ############################################################################################
+    # Return the concept id for each lower-cased name (or -1 if not found)
+    def get_name_concepts(self, lc_names):
+        return [ int(self.name_concepts[row]) if row >= 0 else -1 for row in self._lookup_rows('name', lc_names) ]
+
+
+    # ############################################################################################
+    # Return the concept's preferred curie, name and category
+    def get_concept(self, concept_id):
+        return ( self.get_string(self.concept_curies[concept_id]), self.get_string(self.concept_names[concept_id]),
+                 self.get_string(self.concept_categories[concept_id]) )
+
+
+    # ############################################################################################
+    # Return (curie, category) for each node of the concept
+    def get_concept_nodes(self, concept_id):
+        node_rows = self.concept_node_rows[self.concept_node_offsets[concept_id]:self.concept_node_offsets[concept_id + 1]]
+        return [ (self.get_string(self.node_curies[row]), self.get_string(self.node_categories[row])) for row in node_rows ]
+
+
+    # ############################################################################################
+    # Return the categories of all the concept's curies, with how many curies have each (None if it has no curies)
+    def get_concept_curie_categories(self, concept_id):
+        curie_rows = self.concept_curie_rows[self.concept_curie_offsets[concept_id]:self.concept_curie_offsets[concept_id + 1]]
+        if len(curie_rows) == 0:
+            return None
+        categories = {}
+        for row in curie_rows:
+            category = self.get_string(self.curie_categories[row])
+            if category is not None:
+                categories[category] = categories.get(category, 0) + 1
+        return categories
+
+
+    # ############################################################################################
+    # Return (curie, label) of the node with each upper-cased curie (or None if not found)
+    def get_nodes(self, uc_curies):
+        return [ (self.get_string(self.node_curies[row]), self.get_string(self.node_labels[row])) if row >= 0 else None
+                 for row in self._lookup_rows('node', uc_curies) ]
@@ -0,0 +1,931 @@
+#!/usr/bin/env python3
+#
+# Class to build the NodeSynonymizer database tables from the KG2 node, equivalency and synonym files
+#
+import sys
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+import os
+import io
+import json
+import pickle
+import timeit
+import platform
+import collections
+import multiprocessing
+from array import array
+
+import numpy as np
+
+from sri_node_normalizer import SriNodeNormalizer
+
+# Testing and debugging flags
+DEBUG = False
+
+# The builder whose settings the node-parsing worker processes use (inherited when the pool forks)
+_active_builder = None
+
+
+def _parse_node_lines(chunk):
+    return _active_builder.parse_node_lines(chunk)
+
+
+class KGMapBuilder:
+    """
+    Builds the contents of the NodeSynonymizer tables in one streaming pass over the KG2 files:
+      - lines of kg2_node_info.tsv are parsed, scrubbed and looked up in the SRI node normalizer cache by a pool of
+        worker processes, in chunks, and the results are folded into the map in file order (so the result does not
+        depend on the number of processes)
+      - curies, nodes, unique concepts and names are numbered as they are first seen, and their fields are kept in
+        flat columns (lists and integer arrays) indexed by those numbers rather than in one dict per entry
+      - concepts that share a curie (or a name of at least 3 characters) are merged with a union-find over the
+        concept numbers; the best-scoring concept curie (by uc_curie_prefix_scores) leads each merged set
+      - each merged concept's preferred curie, name and category are then chosen from its nodes, and all the rows
+        are bulk-loaded into freshly created tables (the indexes are created afterwards by the NodeSynonymizer)
+    """
+
+    node_lines_per_chunk = 20000
+    state_filename = 'node_synonymizer_map_state.pickle'
+
+    # The SRI NodeNormalizer conflates genes and proteins, so have a special lookup table to try to disambiguate them
+    curie_prefix_categories = {
+        'NCBIGene:': 'biolink:Gene',
+        'NCBIGENE:': 'biolink:Gene',
+        'ENSEMBL:ENSG': 'biolink:Gene',
+        'HGNC:': 'biolink:Gene',
+        'UniProtKB:': 'biolink:Protein',
+    }
+
+    exceptions_isnot = {
+        'UniProtKB:P00390': 'GR',
+        'UniProtKB:P04150': 'GR',
+        'UniProtKB:P01137': 'LAP',
+        'UniProtKB:P61812': 'LAP',
+        'UniProtKB:P10600': 'LAP',
+    }
+
+    def __init__(self, synonymizer, processes=None):
+
+        self.synonymizer = synonymizer
+        self.processes = processes if processes else os.cpu_count()
+        self.normalizer = None
+        self.normalizer_supported_prefixes = None
+        self.test_identifiers = None
+
+        # Curies, numbered in the order first seen (curie_ids maps uc_curie to its number)
+        self.curie_ids = {}
+        self.curie_curies = []
+        self.curie_concepts = array('q')
+        self.curie_names = []
+        self.curie_full_names = []
+        self.curie_categories = []
+        self.curie_normalizer_names = []
+        self.curie_normalizer_categories = []
+        self.curie_sources = []
+        self.curie_nodes = array('q')  # The curie's node number, or -1 if it isn't a KG2 node
+
+        # KG2 nodes
+        self.node_curie_ids = array('q')
+        self.node_curies = []
+        self.node_original_names = []
+        self.node_adjusted_names = []
+        self.node_full_names = []
+        self.node_categories = []
+        self.node_concepts = array('q')
+
+        # Unique concepts, with the union-find parent of each, and all the (concept, curie) memberships
+        self.concept_ids = {}
+        self.concept_uc_curies = []
+        self.concept_curies = []
+        self.concept_names = []
+        self.concept_categories = []
+        self.concept_normalizer_curies = []
+        self.concept_normalizer_names = []
+        self.concept_normalizer_categories = []
+        self.concept_parents = array('q')
+        self.concept_keys = None  # The final uc_curie of each merged concept, set by reprioritize_concepts()
+        self.member_concepts = array('q')
+        self.member_curies = array('q')
+
+        # Names (name_ids maps lc_name to its number), with any other concepts each name has been seen with
+        self.name_ids = {}
+        self.name_names = []
+        self.name_concepts = array('q')
+        self.name_sources = []
+        self.name_member_names = array('q')
+        self.name_member_concepts = array('q')
+
+        # Name to curie provenance
+        self.name_curie_keys = set()
+        self.name_curie_names = []
+        self.name_curie_curie_ids = array('q')
+        self.name_curie_concepts = array('q')
+
+
+    # ############################################################################################
+    def _set_curie(self, uc_curie, curie, concept_id, name, full_name, category, normalizer_name, normalizer_category, source):
+        curie_id = self.curie_ids.get(uc_curie)
+        if curie_id is None:
+            curie_id = len(self.curie_curies)
+            self.curie_ids[uc_curie] = curie_id
+            self.curie_curies.append(curie)
+            self.curie_concepts.append(concept_id)
+            self.curie_names.append(name)
+            self.curie_full_names.append(full_name)
+            self.curie_categories.append(category)
+            self.curie_normalizer_names.append(normalizer_name)
+            self.curie_normalizer_categories.append(normalizer_category)
+            self.curie_sources.append(source)
+            self.curie_nodes.append(-1)
+        else:
+            self.curie_curies[curie_id] = curie
+            self.curie_concepts[curie_id] = concept_id
+            self.curie_names[curie_id] = name
+            self.curie_full_names[curie_id] = full_name
+            self.curie_categories[curie_id] = category
+            self.curie_normalizer_names[curie_id] = normalizer_name
+            self.curie_normalizer_categories[curie_id] = normalizer_category
+            self.curie_sources[curie_id] = source
+        return curie_id
+
+
+    # ############################################################################################
+    def _add_concept(self, uc_curie, curie, name, category, normalizer_curie, normalizer_name, normalizer_category):
+        concept_id = len(self.concept_uc_curies)
+        self.concept_ids[uc_curie] = concept_id
+        self.concept_uc_curies.append(uc_curie)
+        self.concept_curies.append(curie)
+        self.concept_names.append(name)
+        self.concept_categories.append(category)
+        self.concept_normalizer_curies.append(normalizer_curie)
+        self.concept_normalizer_names.append(normalizer_name)
+        self.concept_normalizer_categories.append(normalizer_category)
+        self.concept_parents.append(concept_id)
+        return concept_id
+
+
+    # ############################################################################################
+    def _add_member(self, concept_id, curie_id):
+        self.member_concepts.append(concept_id)
+        self.member_curies.append(curie_id)
+
+
+    # ############################################################################################
+    def _add_name(self, lc_name, name, concept_id, source):
+        name_id = len(self.name_names)
+        self.name_ids[lc_name] = name_id
+        self.name_names.append(name)
+        self.name_concepts.append(concept_id)
+        self.name_sources.append(source)
+        return name_id
+
+
+    # ############################################################################################
+    def _add_name_member(self, name_id, concept_id):
+        self.name_member_names.append(name_id)
+        self.name_member_concepts.append(concept_id)
+
+
+    # ############################################################################################
+    # Read the KG2 nodes file, using a pool of worker processes to parse, scrub and normalize the lines
+    def read_nodes(self, filter_file=None):
+
+        global _active_builder
+
+        filename = 'kg2_node_info.tsv'
+        filesize = os.path.getsize(filename)
+
+        logfile = 'node_synonymizer_build_log.txt'
+        outfile = open(logfile,'w')
+
+        # Correction for Windows line endings
+        extra_bytes = 0
+        if platform.system() == 'Windows':
+            with open(filename, 'rb') as fh:
+                if b'\r\n' in fh.read():
+                    print('WARNING: Windows line ending requires size compenstation')
+                    extra_bytes = 1
+
+        #### Import exceptions for processing
+        self.synonymizer.import_exceptions()
+
+        # Set up the SriNormalizer
+        if self.synonymizer.normalizer is not None:
+            self.normalizer = self.synonymizer.normalizer
+        else:
+            self.normalizer = SriNodeNormalizer()
+            self.normalizer.load_cache()
+
+        normalizer_supported_categories = self.normalizer.get_supported_types()
+        if normalizer_supported_categories is None:
+            return False
+        self.normalizer_supported_prefixes = self.normalizer.get_supported_prefixes()
+        if self.normalizer_supported_prefixes is None:
+            return False
+
+        # For some modes of debugging, import a set of CURIEs to track
+        if filter_file is not None and filter_file != False:
+            print(f"INFO: Reading special testing filter_file {filter_file} for a tiny little test database")
+            with open(filter_file) as debugfile:
+                test_set = json.load(debugfile)
+            self.test_identifiers = set()
+            for key in test_set:
+                for equivalence in test_set[key]['equivalent_identifiers']:
+                    self.test_identifiers.add(equivalence['identifier'])
+
+        # The workers inherit this builder (and its normalizer) when the pool forks, so only use them where that is possible
+        processes = self.processes
+        if processes > 1 and multiprocessing.get_start_method() != 'fork':
+            print(f"WARNING: Worker processes can't inherit the builder on this platform, so parsing in a single process")
+            processes = 1
+
+        print(f"INFO: Reading {filename} with {processes} processes to create the NodeSynonymizer")
+        t0 = timeit.default_timer()
+        previous_percentage = -1
+        bytes_read = 0
+        with open(filename, 'r', encoding="latin-1", errors="replace") as fh:
+            chunks = self._get_line_chunks(fh, extra_bytes)
+            if processes > 1:
+                _active_builder = self
+                pool = multiprocessing.Pool(processes)
+                results = self._get_pool_results(pool, chunks, processes)
+            else:
+                pool = None
+                results = map(self.parse_node_lines, chunks)
+            try:
+                for parsed_nodes, n_bytes, log_text in results:
+                    outfile.write(log_text)
+                    for parsed_node in parsed_nodes:
+                        self._add_node(*parsed_node)
+                    bytes_read += n_bytes
+                    percentage = int(bytes_read*100.0/filesize)
+                    if percentage > previous_percentage:
+                        previous_percentage = percentage
+                        print(str(percentage)+"%..", end='', flush=True)
+            except ValueError as error:
+                eprint(f"ERROR: {error}")
+                raise
+            finally:
+                if pool is not None:
+                    pool.terminate()
+                _active_builder = None
+
+        outfile.close()
+        print("")
+
+        print(f"INFO: Releasing SRI node normalizer cache")
+        self.normalizer = None
+        self.synonymizer.normalizer = None
+
+        print(f"INFO: Reading of KG2 node files complete in {timeit.default_timer() - t0:.1f} sec")
+        self.print_counts()
+        return True
+
+
+    # ############################################################################################
+    # Yield the parsed chunks in order, keeping only a few chunks per process in flight so the file isn't read ahead
+    @staticmethod
+    def _get_pool_results(pool, chunks, processes):
+        pending_results = collections.deque()
+        for chunk in chunks:
+            pending_results.append(pool.apply_async(_parse_node_lines, (chunk,)))
+            if len(pending_results) >= 2 * processes:
+                yield pending_results.popleft().get()
+        while pending_results:
+            yield pending_results.popleft().get()
+
+
+    # ############################################################################################
+    def _get_line_chunks(self, fh, extra_bytes):
+        lines = []
+        n_bytes = 0
+        for line in fh:
+            lines.append(line)
+            n_bytes += len(line) + extra_bytes
+            if len(lines) >= self.node_lines_per_chunk:
+                yield lines, n_bytes
+                lines = []
+                n_bytes = 0
+        if len(lines) > 0:
+            yield lines, n_bytes
+
+
+    # ############################################################################################
+    # Parse, scrub and normalize a chunk of node lines. This is the part of reading the nodes that doesn't depend on
+    # previous lines, so it runs in the worker processes
+    def parse_node_lines(self, chunk):
+
+        lines, n_bytes = chunk
+        synonymizer = self.synonymizer
+        synonymizer.logfile_handle = io.StringIO()
+        rename_exceptions = synonymizer.exceptions['rename']
+
+        parsed_nodes = []
+        for line in lines:
+
+            #### Skip blank lines
+            line = line.strip()
+            if line == '':
+                continue
+
+            #### Extract the columns
+            columns = line.split("\t")
+            if len(columns) != 4:
+                raise ValueError(f"line only has {len(columns)} columns at '{line}'")
+            node_curie, node_name, node_full_name, node_category = columns
+            uc_node_curie = node_curie.upper()
+            original_node_name = node_name
+
+            #### Skip some known problems
+            if self.exceptions_isnot.get(node_curie) == node_name:
+                continue
+            if DEBUG is True and 'biolink:' in node_curie:
+                continue
+
+            # Apply renaming for problem nodes
+            if uc_node_curie in rename_exceptions:
+                node_name = rename_exceptions[uc_node_curie]
+                print(f"INFO: Based on manual exception, renaming {uc_node_curie} from {original_node_name} to {node_name}")
+
+            #### If we're in test subset mode, only continue the the node_curie is in the test subset
+            if self.test_identifiers is not None and node_curie not in self.test_identifiers:
+                continue
+
+            if DEBUG:
+                print("===============================================")
+                print(f"Input: {line}")
+
+            # Perform some data scrubbing
+            scrubbed_values = synonymizer.scrub_input(node_curie, node_name, node_category, DEBUG)
+            node_curie = scrubbed_values['node_curie']
+            node_name = scrubbed_values['node_name']
+            node_category = scrubbed_values['node_category']
+            names = list(scrubbed_values['names'])
+            if DEBUG:
+                print(f"Final name list: ",names)
+
+            parsed_nodes.append( ( node_curie, original_node_name, node_name, node_full_name, node_category, names, self._get_equivalence(node_curie) ) )
+
+        log_text = synonymizer.logfile_handle.getvalue()
+        synonymizer.logfile_handle = None
+        return parsed_nodes, n_bytes, log_text
+
+
+    # ############################################################################################
+    # Look up the curie in the SRI normalizer cache, returning
+    # (status, normalizer_curie, normalizer_name, normalizer_category, [ (identifier, label) ], [ name ])
+    def _get_equivalence(self, node_curie):
+
+        curie_prefix = node_curie.split(':')[0]
+        exceptions = self.synonymizer.exceptions
+
+        # Check to see if this is a supported prefix or in the translation table
+        if curie_prefix not in self.normalizer.curie_prefix_tx_arax2sri and curie_prefix not in self.normalizer_supported_prefixes:
+            if DEBUG:
+                print(f"WARNING: CURIE prefix '{curie_prefix}' not supported by normalizer. Skipped.")
+            return ( 'category not supported', '', '', '', [], [] )
+
+        if node_curie in exceptions['skip_SRI']:
+            print(f"WARNING: Skipping SRI NN lookup for {node_curie} due to directive in Exceptions.txt file")
+            equivalence = { 'status': 'SRI NN skipped per exceptions', 'equivalent_identifiers': [], 'equivalent_names': [],
+                'preferred_curie': '', 'preferred_curie_name': '', 'type': ''
+            }
+        else:
+            equivalence = self.normalizer.get_curie_equivalence(node_curie, cache_only=True)
+            if DEBUG:
+                print("DEBUG: SRI normalizer returned: ", json.dumps(equivalence, indent=2, sort_keys=True))
+
+        # Apply renaming for problem nodes
+        uc_preferred_curie = equivalence['preferred_curie'].upper()
+        if uc_preferred_curie in exceptions['rename']:
+            print(f"INFO: Based on manual exception, renaming SRI node normalizer result {uc_preferred_curie} from {equivalence['preferred_curie_name']} to {exceptions['rename'][uc_preferred_curie]}")
+            equivalence['preferred_curie_name'] = exceptions['rename'][uc_preferred_curie]
+            equivalence['equivalent_names'] = [ exceptions['rename'][uc_preferred_curie] ]
+
+        equivalent_identifiers = [ (equivalent_concept['identifier'], equivalent_concept.get('label')) for equivalent_concept in equivalence['equivalent_identifiers'] ]
+        return ( equivalence['status'], equivalence['preferred_curie'], equivalence['preferred_curie_name'], equivalence['type'],
+                 equivalent_identifiers, equivalence['equivalent_names'] )
+
+
+    # ############################################################################################
+    # Fold one parsed node into the map. This must be done in file order, since which unique concept a node joins
+    # can depend on the nodes before it
+    def _add_node(self, node_curie, original_node_name, node_name, node_full_name, node_category, names, equivalence):
+
+        status, normalizer_curie, normalizer_name, normalizer_category, equivalent_identifiers, equivalent_names = equivalence
+        uc_node_curie = node_curie.upper()
+
+        # If the normalizer has something for us, then use that as the unique concept
+        concept_id = None
+        overridden_normalizer_category = normalizer_category
+        if status == 'OK':
+
+            # Unless the normalizer category is a gene and the current category is a protein. Then keep it a protein because we are protein-centric
+            if normalizer_category == 'biolink:Gene' and node_category == 'biolink:Protein':
+                unique_concept_curie = node_curie
+                overridden_normalizer_category = node_category
+            else:
+                unique_concept_curie = normalizer_curie
+
+        # Else if we've already seen this name, then join that unique concept, or else this node becomes its own
+        else:
+            name_id = self.name_ids.get(node_name.lower())
+            if name_id is not None:
+                concept_id = self.name_concepts[name_id]
+            else:
+                unique_concept_curie = node_curie
+
+        if concept_id is None:
+            uc_unique_concept_curie = unique_concept_curie.upper()
+            concept_id = self.concept_ids.get(uc_unique_concept_curie)
+            if concept_id is None:
+                if status == 'OK':
+                    concept_id = self._add_concept(uc_unique_concept_curie, unique_concept_curie, normalizer_name, overridden_normalizer_category,
+                                                   normalizer_curie, normalizer_name, normalizer_category)
+                else:
+                    concept_id = self._add_concept(uc_unique_concept_curie, unique_concept_curie, node_name, node_category, None, None, None)
+
+        # Place this curie in the index
+        curie_id = self._set_curie(uc_node_curie, node_curie, concept_id, node_name, node_full_name, node_category, normalizer_name, normalizer_category, 'KG2')
+        self._add_member(concept_id, curie_id)
+
+        # Add the equivalent identifiers from the SRI normalizer
+        for equivalent_identifier, equivalent_name in equivalent_identifiers:
+
+            # Try to deconflate gene and protein
+            this_category = normalizer_category
+            if this_category == '':
+                this_category = node_category
+            for curie_prefix, curie_prefix_category in self.curie_prefix_categories.items():
+                if equivalent_identifier.startswith(curie_prefix):
+                    this_category = curie_prefix_category
+
+            # If this equivalent identifier is already there (either from KG2 or previous SRI NN encounter), store the normalizer information
+            uc_equivalent_identifier = equivalent_identifier.upper()
+            equivalent_curie_id = self.curie_ids.get(uc_equivalent_identifier)
+            if equivalent_curie_id is not None:
+                self.curie_normalizer_names[equivalent_curie_id] = equivalent_name
+                self.curie_normalizer_categories[equivalent_curie_id] = this_category
+                if 'SRI_NN' not in self.curie_sources[equivalent_curie_id]:
+                    self.curie_sources[equivalent_curie_id] += ',SRI_NN'
+            else:
+                equivalent_curie_id = self._set_curie(uc_equivalent_identifier, equivalent_identifier, concept_id, None, None, None, equivalent_name, this_category, 'SRI_NN')
+                self._add_member(concept_id, equivalent_curie_id)
+
+        # Add the equivalent names from the SRI normalizer
+        for equivalent_name in equivalent_names:
+            if equivalent_name == '':
+                raise ValueError(f"SRI normalizer equivalent_name is '' for {self.concept_uc_curies[concept_id]}")
+            name_id = self.name_ids.get(equivalent_name.lower())
+            if name_id is not None:
+                self._add_name_member(name_id, concept_id)
+            else:
+                self._add_name(equivalent_name.lower(), equivalent_name, concept_id, 'SRI')
+
+        # If there is already a node for this curie, then its names go with that node's concept
+        node_id = self.curie_nodes[curie_id]
+        if node_id >= 0:
+            concept_id = self.node_concepts[node_id]
+        else:
+            self.curie_nodes[curie_id] = len(self.node_curies)
+            self.node_curie_ids.append(curie_id)
+            self.node_curies.append(node_curie)
+            self.node_original_names.append(original_node_name)
+            self.node_adjusted_names.append(node_name)
+            self.node_full_names.append(node_full_name)
+            self.node_categories.append(node_category)
+            self.node_concepts.append(concept_id)
+
+        # Add all the scrubbed names for this node
+        for equivalent_name in names:
+
+            #### If the name is empty or otherwise blank, then we will not add it
+            if equivalent_name is None or equivalent_name == '':
+                continue
+            if equivalent_name.isspace():
+                print(f"WARNING: equivalent_name for {node_curie} is whitespace but not empty ({equivalent_name})")
+                continue
+
+            name_id = self.name_ids.get(equivalent_name.lower())
+            if name_id is not None:
+                if concept_id != self.name_concepts[name_id]:
+                    self._add_name_member(name_id, concept_id)
+            else:
+                self._add_name(equivalent_name.lower(), equivalent_name, concept_id, 'KG2')
+
+
+    # ############################################################################################
+    def import_equivalencies(self):
+
+        filename = 'kg2_equivalencies.tsv'
+        if not os.path.exists(filename):
+            print(f"WARNING: Did not find equivalencies file {filename}. Skipping import")
+            return
+        print(f"INFO: Reading equivalencies from {filename}")
+
+        stats = { 'already equivalent': 0, 'add new linked curie': 0, 'neither curie found': 0, 'association conflict': 0 }
+
+        iline = 0
+        with open(filename) as infile:
+            for line in infile:
+
+                #### Skip the column titles
+                if iline == 0 and "n1.id" in line:
+                    iline += 1
+                    continue
+
+                #### Strip and skip blank lines
+                line = line.strip()
+                if line == '':
+                    continue
+                iline += 1
+
+                columns = line.split("\t")
+                node1_curie = columns[0]
+                node2_curie = columns[1]
+
+                linking_curie_id = self.curie_ids.get(node1_curie.upper())
+                second_curie = node2_curie
+                if linking_curie_id is None:
+                    linking_curie_id = self.curie_ids.get(node2_curie.upper())
+                    second_curie = node1_curie
+                if linking_curie_id is None:
+                    stats['neither curie found'] += 1
+                    continue
+
+                linking_concept_id = self.curie_concepts[linking_curie_id]
+                uc_second_curie = second_curie.upper()
+                second_curie_id = self.curie_ids.get(uc_second_curie)
+
+                if second_curie_id is not None:
+                    if 'KG2equivs' not in self.curie_sources[second_curie_id]:
+                        self.curie_sources[second_curie_id] += ',KG2equivs'
+
+                    #### If the two curies already share the same unique concept
+                    second_concept_id = self.curie_concepts[second_curie_id]
+                    if linking_concept_id == second_concept_id:
+                        stats['already equivalent'] += 1
+
+                    #### But if they have different unique concepts, link them so that they are merged later
+                    else:
+                        stats['association conflict'] += 1
+                        self._add_member(linking_concept_id, second_curie_id)
+                        second_concept_curie_id = self.curie_ids.get(self.concept_uc_curies[second_concept_id])
+                        if second_concept_curie_id is not None:
+                            self._add_member(linking_concept_id, second_concept_curie_id)
+
+                else:
+                    print(f"Adding a new curie based on line '{line}'")
+                    stats['add new linked curie'] += 1
+                    second_curie_id = self._set_curie(uc_second_curie, second_curie, linking_concept_id, None, None, self.curie_categories[linking_curie_id],
+                                                      None, None, 'KG2equivs')
+                    self._add_member(linking_concept_id, second_curie_id)
+
+        print(f"INFO: Read {iline} equivalencies from {filename}")
+        for stat_name,stat in stats.items():
+            print(f"      - {stat_name}: {stat}")
+
+
+    # ############################################################################################
+    def import_synonyms(self):
+
+        filename = 'kg2_synonyms.json'
+        if not os.path.exists(filename):
+            print(f"WARNING: Did not find synonyms file {filename}. Skipping import")
+            return
+        print(f"INFO: Reading synonyms from {filename}")
+
+        stats = { 'curie_found': 0, 'curie_not_found': 0 }
+
+        with open(filename) as infile:
+            node_synonyms = json.load(infile)
+        inode = 0
+        for curie,curie_names in node_synonyms.items():
+            inode += 1
+
+            curie_id = self.curie_ids.get(curie.upper())
+            if curie_id is None:
+                stats['curie_not_found'] += 1
+                continue
+            stats['curie_found'] += 1
+            concept_id = self.curie_concepts[curie_id]
+
+            for name in curie_names:
+                lc_name = name.lower()
+
+                #### If we don't have this name yet, add it
+                name_id = self.name_ids.get(lc_name)
+                if name_id is None:
+                    name_id = self._add_name(lc_name, name, concept_id, 'KG2syn')
+
+                #### If this provenance record is not there yet, add it
+                name_curie_key = (name_id << 32) | curie_id
+                if name_curie_key not in self.name_curie_keys:
+                    self.name_curie_keys.add(name_curie_key)
+                    self.name_curie_names.append(name)
+                    self.name_curie_curie_ids.append(curie_id)
+                    self.name_curie_concepts.append(concept_id)
+
+        print(f"INFO: Read {inode} synonyms from {filename}")
+        for stat_name,stat in stats.items():
+            print(f"      - {stat_name}: {stat}")
+
+
+    # ############################################################################################
+    # Save the state after reading the source data, for a subsequent --recollate
+    def save_state(self):
+
+        print(f"INFO: Writing the state to {self.state_filename}")
+        state = { key: value for key, value in self.__dict__.items() if key not in ( 'synonymizer', 'normalizer' ) }
+        try:
+            with open(self.state_filename, "wb") as outfile:
+                pickle.dump(state, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+            return True
+        except (OSError, pickle.PicklingError) as error:
+            print(f"ERROR: Unable to save state to {self.state_filename}: {error}")
+            return None
+
+
+    # ############################################################################################
+    @classmethod
+    def reload_state(cls, synonymizer, processes=None):
+
+        print(f"INFO: Loading previous data structure state from {cls.state_filename}")
+        builder = cls(synonymizer, processes=processes)
+        try:
+            with open(cls.state_filename, "rb") as infile:
+                builder.__dict__.update(pickle.load(infile))
+        except (OSError, pickle.UnpicklingError, EOFError) as error:
+            print(f"ERROR: Unable to reload previous state from {cls.state_filename}: {error}")
+            return None
+        print(f"INFO: Finished loading previous data structure state from {cls.state_filename}. Have {len(builder.node_curies)} nodes.")
+        return builder
+
+
+    # ############################################################################################
+    def _get_curie_score(self, uc_curie):
+        uc_curie_prefix = uc_curie.split(':')[0]
+        score = self.synonymizer.uc_curie_prefix_scores.get(uc_curie_prefix, 0)
+        if uc_curie_prefix == 'UNIPROTKB':
+            if ':P' in uc_curie:
+                score += 2
+            if ':Q' in uc_curie:
+                score += 1
+        return score
+
+
+    # ############################################################################################
+    def _find(self, concept_id):
+        parents = self.concept_parents
+        while parents[concept_id] != concept_id:
+            parents[concept_id] = parents[parents[concept_id]]
+            concept_id = parents[concept_id]
+        return concept_id
+
+
+    # ############################################################################################
+    # Merge the two concepts' sets, led by whichever leader has the higher-scoring curie (or sorts first on a tie)
+    def _union(self, concept_id1, concept_id2):
+        root1 = self._find(concept_id1)
+        root2 = self._find(concept_id2)
+        if root1 == root2:
+            return False
+        uc_curie1 = self.concept_uc_curies[root1]
+        uc_curie2 = self.concept_uc_curies[root2]
+        if (-self._get_curie_score(uc_curie2), uc_curie2) < (-self._get_curie_score(uc_curie1), uc_curie1):
+            root1, root2 = root2, root1
+        self.concept_parents[root2] = root1
+        return True
+
+
+    # ############################################################################################
+    #### Merge all unique concepts that share a curie or a name
+    def merge_concepts(self):
+
+        print("INFO: Merging unique concepts that share curies...")
+        n_merges = 0
+        first_curie_concepts = array('q', [-1]) * len(self.curie_curies)
+        for concept_id, curie_id in zip(self.member_concepts, self.member_curies):
+            first_concept_id = first_curie_concepts[curie_id]
+            if first_concept_id < 0:
+                first_curie_concepts[curie_id] = concept_id
+            elif self._union(first_concept_id, concept_id):
+                n_merges += 1
+        print(f"INFO: Merged {n_merges} unique concepts by shared curies")
+
+        print("INFO: Merging unique concepts by name...")
+        n_merges = 0
+        lc_names = list(self.name_ids)
+        for name_id, concept_id in zip(self.name_member_names, self.name_member_concepts):
+            if len(lc_names[name_id]) < 3:
+                continue
+            if self._union(self.name_concepts[name_id], concept_id):
+                n_merges += 1
+        print(f"INFO: Merged {n_merges} unique concepts by name")
+        self.print_counts()
+
+
+    # ############################################################################################
+    #### Go through all merged unique concepts and set the lead curie, name and category based on a set of rules
+    def reprioritize_concepts(self):
+
+        print("INFO: Reprioritizing the unique concepts leaders...")
+        roots = np.array([ self._find(concept_id) for concept_id in range(len(self.concept_uc_curies)) ], dtype=np.int64)
+
+        # Group all the member curies by merged concept, keeping the order they were added in
+        member_roots = roots[np.frombuffer(self.member_concepts, dtype=np.int64)]
+        order = np.argsort(member_roots, kind='stable')
+        sorted_roots = member_roots[order]
+        sorted_curie_ids = np.frombuffer(self.member_curies, dtype=np.int64)[order]
+        group_starts = np.flatnonzero(np.r_[True, sorted_roots[1:] != sorted_roots[:-1]]) if len(sorted_roots) > 0 else np.array([], dtype=np.int64)
+        group_ends = np.r_[group_starts[1:], len(sorted_roots)]
+
+        uc_curie_prefix_scores = self.synonymizer.uc_curie_prefix_scores
+        concept_keys = list(self.concept_uc_curies)
+        # Every merged concept starts out known by its root's key, so a rename must not take any of those
+        used_keys = { self.concept_uc_curies[root]: root for root in np.unique(roots).tolist() }
+        outfile = open('Problems.tsv', 'w')
+
+        for group_start, group_end in zip(group_starts, group_ends):
+            root = int(sorted_roots[group_start])
+            uc_unique_concept_curie = self.concept_uc_curies[root]
+
+            #### Don't do anything fancy to meta nodes
+            if self.concept_curies[root].split(':')[0].upper() == 'BIOLINK':
+                continue
+
+            concept = { 'category': self.concept_categories[root], 'name': self.concept_names[root], 'all_categories': {}, 'all_curie_prefixes': {},
+                'best_curie_score': -1, 'best_curie': self.concept_curies[root], 'best_category': self.concept_categories[root], 'best_name': self.concept_names[root] }
+            manual_exception = False
+
+            seen_curie_ids = set()
+            for curie_id in sorted_curie_ids[group_start:group_end].tolist():
+                if curie_id in seen_curie_ids:
+                    continue
+                seen_curie_ids.add(curie_id)
+                node_id = self.curie_nodes[curie_id]
+                if node_id < 0:
+                    continue
+
+                node_category = self.node_categories[node_id]
+                node_curie = self.node_curies[node_id]
+                node_name = self.node_adjusted_names[node_id]
+                node_full_name = self.node_full_names[node_id]
+                node_curie_prefix = node_curie.split(':')[0].upper()
+
+                if node_curie_prefix != 'OMIM':
+                    concept['all_categories'][node_category] = concept['all_categories'].get(node_category, 0) + 1
+                concept['all_curie_prefixes'][node_curie_prefix] = concept['all_curie_prefixes'].get(node_curie_prefix, 0) + 1
+
+                this_score = uc_curie_prefix_scores.get(node_curie_prefix, 0)
+                if this_score > concept['best_curie_score']:
+                    concept['best_curie_score'] = this_score
+                    concept['best_curie'] = node_curie
+                    concept['best_category'] = node_category
+                    concept['best_name'] = node_name
+
+                if node_curie_prefix == 'NCBIGENE' and node_full_name.startswith('Genetic locus associated with'):
+                    manual_exception = True
+                    concept['best_curie_score'] = 9999
+                    concept['best_curie'] = node_curie
+                    concept['best_category'] = node_category
+                    concept['best_name'] = node_full_name
+
+            if not manual_exception:
+                self._check_concept_categories(uc_unique_concept_curie, concept, outfile)
+
+            #### Record the new lead curie, unless another concept already has it
+            new_key = concept['best_curie'].upper()
+            if new_key != uc_unique_concept_curie:
+                if new_key in used_keys and used_keys[new_key] != root:
+                    print(f"WARNING: Unable to rename unique concept {uc_unique_concept_curie} to {new_key}, which is already another unique concept")
+                else:
+                    del used_keys[uc_unique_concept_curie]
+                    used_keys[new_key] = root
+                    concept_keys[root] = new_key
+
+            #### Update the unique concept with the final normalized information
+            self.concept_curies[root] = concept['best_curie']
+            self.concept_names[root] = concept['best_name']
+            self.concept_categories[root] = concept['best_category']
+
+        outfile.close()
+
+        # Every concept is now known by its merged concept's key
+        self.concept_keys = [ concept_keys[root] for root in roots.tolist() ]
+
+
+    # ############################################################################################
+    #### Look for concepts whose nodes' categories conflict (a sign of trouble) and record them in Problems.tsv
+    def _check_concept_categories(self, uc_unique_concept_curie, concept, outfile):
+
+        all_categories = concept['all_categories']
+        all_curie_prefixes = concept['all_curie_prefixes']
+        drug_score = 0
+        disease_score = 0
+        protein_score = 0
+        if 'biolink:Drug' in all_categories or 'biolink:ChemicalEntity' in all_categories or 'biolink:SmallMolecule' in all_categories or 'biolink:MolecularEntity' in all_categories:
+            drug_score = 1
+        if 'biolink:Disease' in all_categories or 'biolink:PhenotypicFeature' in all_categories or 'biolink:DiseaseOrPhenotypicFeature' in all_categories:
+            disease_score = 1
+        if 'biolink:Gene' in all_categories or 'biolink:Protein' in all_categories or 'biolink:GeneOrProtein' in all_categories or 'biolink:GenomicEntity' in all_categories:
+            protein_score = 1
+
+        #### Looks for concepts that are both a protein and a disease
+        if protein_score > 0 and disease_score > 0:
+            print("==== Protein-Disease CONFLICT! ===================================")
+            print(f"{uc_unique_concept_curie} '{concept['name']}' is a {concept['category']}")
+            print(f"  concept = {concept}")
+            outfile.write("\t".join([ uc_unique_concept_curie, concept['name'], concept['category']]) + "\n")
+
+        if drug_score > 0 and disease_score > 0:
+
+            if 'CHEMBL.COMPOUND' in all_curie_prefixes or 'CHEBI' in all_curie_prefixes or 'DRUGBANK' in all_curie_prefixes or 'RXNORM' in all_curie_prefixes or 'VANDF' in all_curie_prefixes:
+                drug_score += 1
+            if 'MONDO' in all_curie_prefixes or 'DOID' in all_curie_prefixes:
+                disease_score += 1
+
+            if drug_score > disease_score:
+                final_category = 'biolink:Drug'
+            elif disease_score > drug_score:
+                final_category = 'biolink:Disease'
+            elif disease_score == 1:
+                final_category = 'ambiguous'
+            else:
+                final_category = 'CONFLICT'
+
+            is_problem = False
+            if final_category == 'biolink:Drug' and concept['best_category'] not in ( 'biolink:Drug', 'biolink:ChemicalEntity', 'biolink:MolecularEntity', 'biolink:SmallMolecule' ):
+                is_problem = True
+            if final_category == 'biolink:Disease' and concept['best_category'] not in ( 'biolink:PhenotypicFeature', 'biolink:DiseaseOrPhenotypicFeature' ):
+                is_problem = True
+            if final_category == 'CONFLICT':
+                is_problem = True
+
+            if is_problem:
+                print("***** PROBLEM ***************************")
+                print(f"{uc_unique_concept_curie} '{concept['name']}' is a {concept['category']}")
+                print(f"  concept = {concept}")
+                print(f"  drug_score={drug_score}, disease_score={disease_score}, final_category={final_category}")
+                outfile.write("\t".join([ uc_unique_concept_curie, concept['name'], concept['category']]) + "\n")
+
+
+    # ############################################################################################
+    #### Bulk-load everything into the (freshly created, not yet indexed) tables
+    def store(self):
+
+        connection = self.synonymizer.connection
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        concept_keys = self.concept_keys
+        uc_curies = list(self.curie_ids)
+
+        self._insert_rows('nodes', [ 'uc_curie', 'curie', 'original_name', 'adjusted_name', 'full_name', 'category', 'unique_concept_curie' ],
+            ( ( uc_curies[curie_id], curie, original_name, adjusted_name, full_name, category, concept_keys[concept_id] )
+              for curie_id, curie, original_name, adjusted_name, full_name, category, concept_id in
+              zip(self.node_curie_ids, self.node_curies, self.node_original_names, self.node_adjusted_names, self.node_full_names, self.node_categories, self.node_concepts) ) )
+
+        self._insert_rows('unique_concepts', [ 'uc_curie', 'curie', 'name', 'category', 'normalizer_curie', 'normalizer_name', 'normalizer_category' ],
+            ( ( concept_keys[concept_id], self.concept_curies[concept_id], self.concept_names[concept_id], self.concept_categories[concept_id],
+                self.concept_normalizer_curies[concept_id], self.concept_normalizer_names[concept_id], self.concept_normalizer_categories[concept_id] )
+              for concept_id in range(len(self.concept_uc_curies)) if self.concept_parents[concept_id] == concept_id ) )
+
+        self._insert_rows('curies', [ 'uc_curie', 'curie', 'unique_concept_curie', 'name', 'full_name', 'category', 'normalizer_name', 'normalizer_category', 'source' ],
+            ( ( uc_curie, curie, concept_keys[concept_id], name, full_name, category, normalizer_name, normalizer_category, source )
+              for uc_curie, curie, concept_id, name, full_name, category, normalizer_name, normalizer_category, source in
+              zip(uc_curies, self.curie_curies, self.curie_concepts, self.curie_names, self.curie_full_names, self.curie_categories,
+                  self.curie_normalizer_names, self.curie_normalizer_categories, self.curie_sources) ) )
+
+        self._insert_rows('names', [ 'lc_name', 'name', 'unique_concept_curie', 'source', 'lc_first_word' ],
+            ( ( lc_name, name, concept_keys[concept_id], source, lc_name.split(' ')[0] )
+              for lc_name, name, concept_id, source in zip(self.name_ids, self.name_names, self.name_concepts, self.name_sources) ) )
+
+        self._insert_rows('name_curies', [ 'lc_name', 'name', 'uc_curie', 'unique_concept_curie', 'source' ],
+            ( ( name.lower(), name, uc_curies[curie_id], concept_keys[concept_id], 'KG2syn' )
+              for name, curie_id, concept_id in zip(self.name_curie_names, self.name_curie_curie_ids, self.name_curie_concepts) ) )
+
+
+    # ############################################################################################
+    def _insert_rows(self, table_name, column_names, rows):
+        t0 = timeit.default_timer()
+        connection = self.synonymizer.connection
+        cursor = connection.cursor()
+        cursor.executemany(f"INSERT INTO {table_name} ({', '.join(column_names)}) VALUES ({','.join('?' * len(column_names))})", rows)
+        connection.commit()
+        print(f"INFO: Wrote {cursor.rowcount} rows to {table_name} in {timeit.default_timer() - t0:.1f} sec")
+
+
+    # ############################################################################################
+    def get_counts(self):
+        return { 'nodes': len(self.node_curies),
+                 'unique concepts': sum(1 for concept_id, parent in enumerate(self.concept_parents) if concept_id == parent),
+                 'curies': len(self.curie_curies),
+                 'names and abbreviations': len(self.name_names),
+                 'name to curie provenance associations': len(self.name_curie_names) }
+
+
+    # ############################################################################################
+    def print_counts(self):
+        print(f"INFO: Current entity counts")
+        for entity_type, count in self.get_counts().items():
+            print(f"  {count} {entity_type}")
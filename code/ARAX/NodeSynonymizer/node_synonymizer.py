@@ -11,11 +11,10 @@ import timeit
 import argparse
 import sqlite3
 import json
-import pickle
-import platform
 
-from sri_node_normalizer import SriNodeNormalizer
 from category_manager import CategoryManager
+from concept_index import ConceptIndex
+from kg_map_builder import KGMapBuilder
 
 # Testing and debugging flags
 DEBUG = False
@@ -25,6 +24,8 @@ pathlist = os.path.realpath(__file__).split(os.path.sep)
 RTXindex = pathlist.index("RTX")
 sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code']))
 from RTXConfiguration import RTXConfiguration
+sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'ARAXQuery']))
+from sqlite_connection_registry import SqliteConnectionRegistry
 
 
 # ################################################################################################
@@ -36,13 +37,6 @@ class NodeSynonymizer:
 
         self.databaseLocation = os.path.dirname(os.path.abspath(__file__))
         self.options = {}
-        self.kg_map = {
-            'kg_nodes': {},
-            'kg_unique_concepts': {},
-            'kg_curies': {},
-            'kg_names': {},
-            'kg_name_curies': {}
-        }
         self.normalizer = None
         self.exceptions = {
             'skip_SRI': {},
@@ -58,9 +52,13 @@ class NodeSynonymizer:
 
         self.logfile_handle = None
 
-        self.connection = None
+        self._connection = None
+        self.read_only_database_path = None
         self.connect()
 
+        # Maximum number of values to bind in one batched query (SQLite's lowest default limit is 999)
+        self.max_sql_variables = 900
+
         #### Define a priority of curie prefixes. Higher is better
         self.uc_curie_prefix_scores = {
             'UMLS_STY': 5000,
@@ -85,25 +83,63 @@ class NodeSynonymizer:
 
 
     # ############################################################################################
-    # Create and store a database connection
-    def connect(self):
+    # Create and store a database connection: by default a read-only one from the shared registry (opened on first
+    # use, one per thread), or a writable one of our own for building
+    def connect(self, read_only=True):
 
         # If already connected, don't need to do it again
-        if self.connection is not None:
+        if self._connection is not None or self.read_only_database_path is not None:
             return
 
         # Create an engine object
         if DEBUG is True:
             print("INFO: Connecting to database")
 
-        self.connection = sqlite3.connect(f"{self.databaseLocation}/{self.databaseName}")
+        if read_only:
+            self.read_only_database_path = f"{self.databaseLocation}/{self.databaseName}"
+        else:
+            self._connection = sqlite3.connect(f"{self.databaseLocation}/{self.databaseName}")
+
+
+    # ############################################################################################
+    # The database connection (for a read-only connection, this thread's own)
+    @property
+    def connection(self):
+        if self.read_only_database_path is not None:
+            return SqliteConnectionRegistry.get_connection(self.read_only_database_path)
+        return self._connection
+
+
+    # ############################################################################################
+    # Return the memory-mapped concept index for the database, or None if there isn't a current one
+    def get_concept_index(self):
+        return ConceptIndex.get(f"{self.databaseLocation}/{self.databaseName}")
+
+
+    # ############################################################################################
+    # (Re)build the concept index from the current contents of the database
+    def build_concept_index(self):
+        ConceptIndex.build(self.connection, f"{self.databaseLocation}/{self.databaseName}")
+
+
+    # ############################################################################################
+    # Return the path of the category expansion table that goes with the database
+    def get_category_expansion_table_path(self):
+        return f"{self.databaseLocation}/{self.databaseName}.category_expansions.json"
+
+
+    # ############################################################################################
+    # (Re)build the category expansion table for all Biolink categories and the concept categories in the database
+    def build_category_expansion_table(self):
+        categories = [ row[0] for row in self.connection.execute("SELECT DISTINCT category FROM unique_concepts") ]
+        CategoryManager().build_expansion_table(self.get_category_expansion_table_path(), categories)
 
 
     # ############################################################################################
     # Destroy the database connection
     def disconnect(self):
 
-        if self.connection is None:
+        if self._connection is None and self.read_only_database_path is None:
             if DEBUG is True:
                 print("INFO: Skip disconnecting from database")
             return
@@ -111,8 +147,11 @@ class NodeSynonymizer:
         if DEBUG is True:
             print("INFO: Disconnecting from database")
 
-        self.connection.close()
-        self.connection = None
+        # A read-only connection is shared, so is left open in the registry
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = None
+        self.read_only_database_path = None
 
 
     # ############################################################################################
@@ -191,777 +230,12 @@ class NodeSynonymizer:
                     eprint(f"ERROR: Unable to interpret {line} in Exceptions.txt")
 
 
-    # ############################################################################################
-    def import_equivalencies(self):
-
-        filename = 'kg2_equivalencies.tsv'
-        if not os.path.exists(filename):
-            print(f"WARNING: Did not find equivalencies file {filename}. Skipping import")
-            return
-        print(f"INFO: Reading equivalencies from {filename}")
-        filesize = os.path.getsize(filename)
-        bytes_read = 0
-        previous_percentage = -1
-        problem_counter = 0
-
-        kg_curies = self.kg_map['kg_curies']
-        kg_unique_concepts = self.kg_map['kg_unique_concepts']
-
-        stats = { 'already equivalent': 0, 'add new linked curie': 0, 'neither curie found': 0, 'association conflict': 0 }
-
-        iline = 0
-        with open(filename) as infile:
-            for line in infile:
-
-                bytes_read += len(line)
-
-                #### Skip the column titles
-                if iline == 0 and "n1.id" in line:
-                    iline += 1
-                    continue
-
-                #### Strip and skip blank lines
-                line = line.strip()
-                match = re.match(r'\s*$',line)
-                if match:
-                    continue
-                iline += 1
-
-                #print(f"line={line}")
-                columns = line.split("\t")
-                node1_curie = columns[0]
-                node2_curie = columns[1]
-                #print(f"{node1_curie}  -  {node2_curie}")
-
-                uc_node1_curie = node1_curie.upper()
-                uc_node2_curie = node2_curie.upper()
-
-                linking_curie = None
-                uc_linking_curie = None
-                done = False
-
-                if uc_node1_curie in kg_curies:
-                    linking_curie = node1_curie
-                    uc_linking_curie = linking_curie.upper()
-                    second_curie = node2_curie
-                    uc_second_curie = second_curie.upper()
-
-                elif uc_node2_curie in kg_curies:
-                    linking_curie = node2_curie
-                    uc_linking_curie = linking_curie.upper()
-                    second_curie = node1_curie
-                    uc_second_curie = second_curie.upper()
-
-                else:
-                    #print(f"ERROR: Niether {uc_node1_curie} nor {uc_node2_curie} found in kg_curies at line {iline+1}")
-                    stats['neither curie found'] += 1
-                    done = True
-
-                if not done:
-                    uc_linking_unique_concept_curie = kg_curies[uc_linking_curie]['uc_unique_concept_curie']
-                    linking_category = kg_curies[uc_linking_curie]['category']
-
-                    if uc_second_curie in kg_curies:
-                        uc_second_unique_concept_curie = kg_curies[uc_second_curie]['uc_unique_concept_curie']
-                        if 'KG2equivs' not in kg_curies[uc_second_curie]['source']:
-                            kg_curies[uc_second_curie]['source'] += ',KG2equivs'
-
-                        #### If the two kg_curies already share the same unique concept
-                        if uc_linking_unique_concept_curie == uc_second_unique_concept_curie:
-                            stats['already equivalent'] += 1
-
-                        #### But if they have different unique concepts, this potentially a problem, but one that will be cleaned up later probably
-                        else:
-                            stats['association conflict'] += 1
-                            #print(f"WARNING: Association conflict: {linking_curie}->{uc_linking_unique_concept_curie} and {second_curie}->{uc_second_unique_concept_curie}")
-                            kg_unique_concepts[uc_linking_unique_concept_curie]['all_uc_curies'][uc_second_curie] = 'KG2equivs'
-                            kg_unique_concepts[uc_linking_unique_concept_curie]['all_uc_curies'][uc_second_unique_concept_curie] = 'KG2equivs'
-
-                            # This probably isn't needed, but things are not working the way that I want. FIXME
-                            #kg_unique_concepts[uc_second_unique_concept_curie]['all_uc_curies'][uc_linking_curie] = 1
-                            #kg_unique_concepts[uc_second_unique_concept_curie]['all_uc_curies'][uc_linking_unique_concept_curie] = 1
-
-                    else:
-                        print(f"Adding a new curie based on line '{line}'")
-                        problem_counter += 1
-                        #if problem_counter > 100:
-                        #    exit()
-                        stats['add new linked curie'] += 1
-                        kg_curies[uc_second_curie] = { 
-                            'curie': second_curie, 
-                            'uc_unique_concept_curie': uc_linking_unique_concept_curie, 
-                            'name': None,
-                            'full_name': None,
-                            'category': linking_category,
-                            'normalizer_name': None,
-                            'normalizer_category': None,
-                            'source': 'KG2equivs' }
-                        kg_unique_concepts[uc_linking_unique_concept_curie]['all_uc_curies'][uc_second_curie] = 'KG2equivs'
-
-                percentage = int(bytes_read*100.0/filesize)
-                if percentage > previous_percentage:
-                    previous_percentage = percentage
-                    print(str(percentage)+"%..", end='', flush=True)
-
-
-        print("")
-        print(f"INFO: Read {iline} equivalencies from {filename}")
-        for stat_name,stat in stats.items():
-            print(f"      - {stat_name}: {stat}")
-        return
-
-
-    # ############################################################################################
-    def import_synonyms(self):
-
-        filename = 'kg2_synonyms.json'
-        if not os.path.exists(filename):
-            print(f"WARNING: Did not find synonyms file {filename}. Skipping import")
-            return
-        print(f"INFO: Reading synonyms from {filename}")
-
-        kg_curies = self.kg_map['kg_curies']
-        kg_unique_concepts = self.kg_map['kg_unique_concepts']
-        kg_names = self.kg_map['kg_names']
-        kg_name_curies = self.kg_map['kg_name_curies']
-
-        stats = { 'curie_found': 0, 'curie_not_found': 0 }
-
-        with open(filename) as infile:
-            node_synonyms = json.load(infile)
-            inode = 0
-            for curie,curie_names in node_synonyms.items():
-                #print(f"{node} has synonyms {node_data}")
-                inode += 1
-
-                uc_curie = curie.upper()
-                if uc_curie in kg_curies:
-                    stats['curie_found'] += 1
-
-                    uc_unique_concept_curie = kg_curies[uc_curie]['uc_unique_concept_curie']
-
-                    for name in curie_names:
-                        #print(f"- {uc_curie} is also {name}")
-                        lc_name = name.lower()
-                        combined_key = lc_name + '---' + uc_curie
-
-                        #### If we don't have this name yet, add it
-                        if lc_name not in kg_names:
-                            lc_first_word = lc_name.split(' ')[0]
-                            kg_names[lc_name] = {
-                                'name': name,
-                                'uc_unique_concept_curie': uc_unique_concept_curie,
-                                'source': 'KG2syn',
-                                'uc_unique_concept_curies': { uc_unique_concept_curie: True },
-                                'lc_first_word': lc_first_word
-                            }
-                            kg_unique_concepts[uc_unique_concept_curie]['all_lc_names'][lc_name] = True
-
-                        #### If this provenance record is not there yet, add it
-                        if combined_key not in kg_name_curies:
-                            kg_name_curies[combined_key] = {
-                                'name': name,
-                                'uc_curie': uc_curie,
-                                'uc_unique_concept_curie': uc_unique_concept_curie,
-                                'source': 'KG2syn'
-                            }
-
-                else:
-                    #print(f"ERROR: {filename} has a curie {curie} that was not previously recorded!")
-                    stats['curie_not_found'] += 1
-
-
-        print("")
-        print(f"INFO: Read {inode} synonyms from {filename}")
-        for stat_name,stat in stats.items():
-            print(f"      - {stat_name}: {stat}")
-        return
-
-
-    # ############################################################################################
-    def save_state(self):
-
-        filename = f"node_synonymizer_map_state.pickle"
-        print(f"INFO: Writing the state to {filename}")
-
-        try:
-            with open(filename, "wb") as outfile:
-                pickle.dump(self.kg_map, outfile)
-            return True
-        except:
-            print(f"ERROR: Unable to save state to {filename}")
-            return None
-
-
-    # ############################################################################################
-    def reload_state(self):
-
-        filename = f"node_synonymizer_map_state.pickle"
-        print(f"INFO: Loading previous data structure state from {filename}")
-
-        try:
-            with open(filename, "rb") as infile:
-                self.kg_map = pickle.load(infile)
-            print(f"INFO: Finished loading previous data structure state from {filename}. Have {len(self.kg_map[kg_nodes])} kg_nodes.")
-            return True
-        except:
-            print(f"ERROR: Unable to reload previous state from {filename}")
-            return None
-
-
-    # ############################################################################################
-    #### Store the built-up in-memory index to the database
-    def store_kg_map(self):
-
-        kg_nodes = self.kg_map['kg_nodes']
-        kg_unique_concepts = self.kg_map['kg_unique_concepts']
-        kg_curies = self.kg_map['kg_curies']
-        kg_names = self.kg_map['kg_names']
-        kg_name_curies = self.kg_map['kg_name_curies']
-
-        # Write all nodes
-        n_rows = len(kg_nodes)
-        i_rows = 0
-        previous_percentage = -1
-        rows = []
-        print(f"INFO: Writing {n_rows} nodes to the database")
-        for uc_curie,node in kg_nodes.items():
-            rows.append( [ uc_curie, node['curie'], node['original_name'], node['adjusted_name'], node['full_name'], node['category'], node['uc_unique_concept_curie'] ] )
-            i_rows += 1
-            if i_rows == int(i_rows/5000.0)*5000 or i_rows == n_rows:
-                self.connection.executemany(f"INSERT INTO nodes (uc_curie, curie, original_name, adjusted_name, full_name, category, unique_concept_curie) values (?,?,?,?,?,?,?)", rows)
-                self.connection.commit()
-                rows = []
-                percentage = int(i_rows*100.0/n_rows)
-                if percentage > previous_percentage:
-                    previous_percentage = percentage
-                    print(str(percentage)+"%..", end='', flush=True)
-
-        # Write all unique concepts
-        n_rows = len(kg_unique_concepts)
-        i_rows = 0
-        previous_percentage = -1
-        rows = []
-        print(f"\nINFO: Writing {n_rows} unique_concepts to the database")
-        for uc_curie,concept in kg_unique_concepts.items():
-            rows.append( [ uc_curie, concept['curie'], concept['name'], concept['category'], concept['normalizer_curie'], concept['normalizer_name'], concept['normalizer_category'] ] )
-            i_rows += 1
-            if i_rows == int(i_rows/5000.0)*5000 or i_rows == n_rows:
-                self.connection.executemany(f"INSERT INTO unique_concepts (uc_curie, curie, name, category, normalizer_curie, normalizer_name, normalizer_category) values (?,?,?,?,?,?,?)", rows)
-                self.connection.commit()
-                rows = []
-                percentage = int(i_rows*100.0/n_rows)
-                if percentage > previous_percentage:
-                    previous_percentage = percentage
-                    print(str(percentage)+"%..", end='', flush=True)
-
-        # Write all curies
-        n_rows = len(kg_curies)
-        i_rows = 0
-        previous_percentage = -1
-        rows = []
-        print(f"\nINFO: Writing {n_rows} curies to the database")
-        for uc_curie,concept in kg_curies.items():
-            rows.append( [ uc_curie, concept['curie'], concept['uc_unique_concept_curie'], concept['name'], concept['full_name'], concept['category'], concept['normalizer_name'], concept['normalizer_category'], concept['source'] ] )
-            i_rows += 1
-            if i_rows == int(i_rows/5000.0)*5000 or i_rows == n_rows:
-                self.connection.executemany(f"INSERT INTO curies (uc_curie, curie, unique_concept_curie, name, full_name, category, normalizer_name, normalizer_category, source) values (?,?,?,?,?,?,?,?,?)", rows)
-                self.connection.commit()
-                rows = []
-                percentage = int(i_rows*100.0/n_rows)
-                if percentage > previous_percentage:
-                    previous_percentage = percentage
-                    print(str(percentage)+"%..", end='', flush=True)
-
-        # Write all synonyms
-        n_rows = len(kg_names)
-        i_rows = 0
-        previous_percentage = -1
-        rows = []
-        print(f"\nINFO: Writing {n_rows} names to the database")
-        for lc_synonym_name,synonym in kg_names.items():
-            rows.append( [ lc_synonym_name, synonym['name'], synonym['uc_unique_concept_curie'], synonym['source'], synonym['lc_first_word'] ] )
-            i_rows += 1
-            if i_rows == int(i_rows/5000.0)*5000 or i_rows == n_rows:
-                self.connection.executemany(f"INSERT INTO names (lc_name, name, unique_concept_curie, source, lc_first_word) values (?,?,?,?,?)", rows)
-                self.connection.commit()
-                rows = []
-                percentage = int(i_rows*100.0/n_rows)
-                if percentage > previous_percentage:
-                    previous_percentage = percentage
-                    print(str(percentage)+"%..", end='', flush=True)
-        print("")
-
-        # Write all name-curies
-        n_rows = len(kg_name_curies)
-        i_rows = 0
-        previous_percentage = -1
-        rows = []
-        print(f"\nINFO: Writing {n_rows} name_curies to the database")
-        for lc_name_uc_curie, synonym in kg_name_curies.items():
-            rows.append( [ synonym['name'].lower(), synonym['name'], synonym['uc_curie'], synonym['uc_unique_concept_curie'], synonym['source'] ] )
-            i_rows += 1
-            if i_rows == int(i_rows/5000.0)*5000 or i_rows == n_rows:
-                self.connection.executemany(f"INSERT INTO name_curies (lc_name, name, uc_curie, unique_concept_curie, source) values (?,?,?,?,?)", rows)
-                self.connection.commit()
-                rows = []
-                percentage = int(i_rows*100.0/n_rows)
-                if percentage > previous_percentage:
-                    previous_percentage = percentage
-                    print(str(percentage)+"%..", end='', flush=True)
-        print("")
-
-
-
-
-
-
-
-
-
-
     # ############################################################################################
     # ############################################################################################
     # ############################################################################################
 
     # Main building methods
 
-    # ############################################################################################
-    # Create the KG node table
-    def build_kg_map(self, filter_file=None):
-
-        filename = 'kg2_node_info.tsv'
-        filesize = os.path.getsize(filename)
-
-        logfile = 'node_synonymizer_build_log.txt'
-        outfile = open(logfile,'w')
-        self.logfile_handle = outfile
-
-        # Correction for Windows line endings
-        extra_bytes = 0
-        fh = open(filename, 'rb')
-        if platform.system() == 'Windows' and b'\r\n' in fh.read():
-            print('WARNING: Windows line ending requires size compenstation')
-            extra_bytes = 1
-        fh.close()
-
-        #### Import exceptions for processing
-        self.import_exceptions()
-
-        exceptions_isnot = {
-            'UniProtKB:P00390': 'GR',
-            'UniProtKB:P04150': 'GR',
-            'UniProtKB:P01137': 'LAP',
-            'UniProtKB:P61812': 'LAP',
-            'UniProtKB:P10600': 'LAP',
-        }
-
-
-        # Set up the SriNormalizer
-        if self.normalizer is not None:
-            normalizer = self.normalizer
-        else:
-            normalizer = SriNodeNormalizer()
-            normalizer.load_cache()
-            self.normalizer = normalizer
-
-        normalizer_supported_categories = normalizer.get_supported_types()
-        if normalizer_supported_categories is None:
-            return
-        normalizer_supported_prefixes = normalizer.get_supported_prefixes()
-        if normalizer_supported_prefixes is None:
-            return
-
-        # The SRI NodeNormalizer conflates genes and proteins, so have a special lookup table to try to disambiguate them
-        curie_prefix_categories = {
-            'NCBIGene:': 'biolink:Gene',
-            'NCBIGENE:': 'biolink:Gene',
-            'ENSEMBL:ENSG': 'biolink:Gene',
-            'HGNC:': 'biolink:Gene',
-            'UniProtKB:': 'biolink:Protein',
-        }
-
-        # Open the file and organize all the data
-        fh = open(filename, 'r', encoding="latin-1", errors="replace")
-        print(f"INFO: Reading {filename} to create the NodeSynonymizer")
-        lineCounter = 0
-        previous_percentage = -1
-        bytes_read = 0
-
-        # Create dicts to hold all the information
-        kg_nodes = self.kg_map['kg_nodes']
-        kg_unique_concepts = self.kg_map['kg_unique_concepts']
-        kg_curies = self.kg_map['kg_curies']
-        kg_names = self.kg_map['kg_names']
-        kg_name_curies = self.kg_map['kg_name_curies']
-
-        # For some modes of debugging, import a set of CURIEs to track
-        debug_flag = DEBUG
-        test_subset_flag = False
-        test_set = { 'identifiers': {} }
-        if filter_file is not None and filter_file != False:
-            print(f"INFO: Reading special testing filter_file {filter_file} for a tiny little test database")
-            debug_flag = DEBUG
-            test_subset_flag = True
-            with open(filter_file) as debugfile:
-                test_set = json.load(debugfile)
-                test_set['identifiers'] = {}
-                for key in test_set:
-                    if key == 'identifiers':
-                        continue
-                    for equivalence in test_set[key]['equivalent_identifiers']:
-                        id = equivalence['identifier']
-                        test_set['identifiers'][id] = 1
-
-        # Loop over each line in the file
-        for line in fh:
-
-            #### Track the number of bytes read for progress display
-            bytes_read += len(line) + extra_bytes
-
-            #### Skip blank lines
-            match = re.match(r'^\s*$',line)
-            if match:
-                continue
-
-            #### Extract the columns
-            columns = line.strip().split("\t")
-            if len(columns) != 4:
-                eprint(f"ERROR: line only has {len(columns)} at 'line'")
-                exit()
-            node_curie, node_name, node_full_name, node_category = columns
-            uc_node_curie = node_curie.upper()
-            original_node_name = node_name
-
-            #### Skip some known problems
-            if node_curie in exceptions_isnot and exceptions_isnot[node_curie] == node_name:
-                continue
-            if debug_flag is True and 'biolink:' in node_curie:
-                continue
-
-            # Apply renaming for problem nodes
-            if uc_node_curie in self.exceptions['rename']:
-                node_name = self.exceptions['rename'][uc_node_curie]
-                print(f"INFO: Based on manual exception, renaming {uc_node_curie} from {original_node_name} to {node_name}")
-
-            #### If we're in test subset mode, only continue the the node_curie is in the test subset
-            if test_subset_flag:
-                if node_curie not in test_set['identifiers']:
-                    continue
-
-            #### For debugging problems
-            #debug_flag = False
-            #if 'HGNC:29603' in node_curie: debug_flag = True
-            #if node_name.lower() == 'ache': debug_flag = True
-
-            if debug_flag:
-                print("===============================================")
-                print(f"Input: {line.strip()}")
-
-            # Perform some data scrubbing
-            scrubbed_values = self.scrub_input(node_curie, node_name, node_category, debug_flag)
-            node_curie = scrubbed_values['node_curie']
-            uc_node_curie = node_curie.upper()
-            node_name = scrubbed_values['node_name']
-            node_category = scrubbed_values['node_category']
-            names = scrubbed_values['names']
-            curie_prefix = node_curie.split(':')[0]
-            if debug_flag:
-                print(f"Final name list: ",names)
-
-            # See if this curie is already a curie we've encountered before, figure out its unique_concept_curie
-            unique_concept_curie = None
-            equivalence = None
-            if uc_node_curie in kg_curies:
-                unique_concept_curie = kg_curies[uc_node_curie]['curie']
-                uc_unique_concept_curie = kg_curies[uc_node_curie]['uc_unique_concept_curie']
-                if debug_flag:
-                    print(f"DEBUG: This curie was already seen. Setting to its uc_unique_concept_curie to {uc_unique_concept_curie}")
-
-            # Check to see if this is a supported prefix or in the translation table
-            if curie_prefix in normalizer.curie_prefix_tx_arax2sri or curie_prefix in normalizer_supported_prefixes:
-                if node_curie in self.exceptions['skip_SRI']:
-                    print(f"WARNING: Skipping SRI NN lookup for {node_curie} due to directive in Exceptions.txt file")
-                    equivalence = { 'status': 'SRI NN skipped per exceptions', 'equivalent_identifiers': [], 'equivalent_names': [],
-                        'preferred_curie': '', 'preferred_curie_name': '', 'type': ''
-                    }
-
-                else:
-                    equivalence = normalizer.get_curie_equivalence(node_curie, cache_only=True)
-                    if debug_flag:
-                        print("DEBUG: SRI normalizer returned: ", json.dumps(equivalence, indent=2, sort_keys=True))
-
-                # Apply renaming for problem nodes
-                uc_preferred_curie = equivalence['preferred_curie'].upper()
-                if uc_preferred_curie in self.exceptions['rename']:
-                    print(f"INFO: Based on manual exception, renaming SRI node normalizer result {uc_preferred_curie} from {equivalence['preferred_curie_name']} to {self.exceptions['rename'][uc_preferred_curie]}")
-                    equivalence['preferred_curie_name'] = self.exceptions['rename'][uc_preferred_curie]
-                    equivalence['equivalent_names'] = [ self.exceptions['rename'][uc_preferred_curie] ]
-
-                # Extract the preferred designation of the normalizer
-                normalizer_curie = equivalence['preferred_curie']
-                normalizer_name = equivalence['preferred_curie_name']
-                normalizer_category = equivalence['type']
-
-            # Else just warn that there's nothing to look for
-            else:
-                if debug_flag:
-                    print(f"WARNING: CURIE prefix '{curie_prefix}' not supported by normalizer. Skipped.")
-                equivalence = { 'status': 'category not supported', 'equivalent_identifiers': [], 'equivalent_names': [] }
-                normalizer_curie = ''
-                normalizer_name = ''
-                normalizer_category = ''
-
-
-            # If the normalizer has something for us, then use that as the unique_concept_curie
-            overridden_normalizer_category = normalizer_category
-            if equivalence['status'] == 'OK':
-
-                # Unless the normalizer category is a gene and the current category is a protein. Then keep it a protein because we are protein-centric
-                if normalizer_category == 'biolink:Gene' and node_category == 'biolink:Protein':
-                    if debug_flag:
-                        print(f"DEBUG: Since this is protein and the normalizer says gene, stay with this one as the unique_concept {node_curie}")
-                    unique_concept_curie = node_curie
-                    uc_unique_concept_curie = node_curie.upper()
-                    overridden_normalizer_category = node_category
-                else:
-                    if debug_flag:
-                        print(f"DEBUG: Using the SRI normalizer normalized unique_concept {normalizer_curie}")
-                    unique_concept_curie = normalizer_curie
-                    uc_unique_concept_curie = normalizer_curie.upper()
-
-            # And if the normalizer did not have anything for us
-            else:
-
-                # If we've already seen this synonym, then switch to that unique concept
-                # I hope this will save RAM by not creating so many unique concepts that must be coalesced later
-                if node_name.lower() in kg_names:
-                    uc_unique_concept_curie = kg_names[node_name.lower()]['uc_unique_concept_curie']
-                    unique_concept_curie = kg_unique_concepts[uc_unique_concept_curie]['curie']
-                    if debug_flag:
-                        print(f"DEBUG: Found an existing unique concept by synonym as {unique_concept_curie}")
-
-                # Else this node becomes the unique_concept_curie
-                else:
-                    if debug_flag:
-                        print(f"DEBUG: This node will become its own unique concept")
-                    unique_concept_curie = node_curie
-                    uc_unique_concept_curie = node_curie.upper()
-
-            # Place this curie in the index
-            kg_curies[uc_node_curie] = { 
-                'curie': node_curie,
-                'uc_unique_concept_curie': uc_unique_concept_curie,
-                'name': node_name,
-                'full_name': node_full_name,
-                'category': node_category,
-                'normalizer_name': normalizer_name,
-                'normalizer_category': normalizer_category,
-                'source': 'KG2'
-            }
-
-            # If this unique_concept_curie already exists, embrace it
-            if uc_unique_concept_curie in kg_unique_concepts:
-                # Put the current curie in there. Names will be done below.
-                kg_unique_concepts[uc_unique_concept_curie]['all_uc_curies'][uc_node_curie] = 1
-
-            # Otherwise, create the entry
-            else:
-
-                # If we got something from the SRI normalizer, start with that
-                if equivalence['status'] == 'OK':
-                    if debug_flag:
-                        print(f"DEBUG: Create new unique concept based on SRI normalizer info")
-                    kg_unique_concepts[uc_unique_concept_curie] = {
-                        'curie': unique_concept_curie,
-                        'name': normalizer_name,
-                        'category': overridden_normalizer_category,
-                        'normalizer_curie': normalizer_curie,
-                        'normalizer_name': normalizer_name,
-                        'normalizer_category': normalizer_category,
-                        'all_uc_curies': { uc_node_curie: True },
-                        'all_lc_names': { node_name.lower(): True }
-                    }
-
-                # Otherwise, we use this node
-                else:
-                    if debug_flag:
-                        print(f"DEBUG: Create new unique concept based on this node")
-                    kg_unique_concepts[uc_unique_concept_curie] = {
-                        'curie': unique_concept_curie,
-                        'name': node_name,
-                        'category': node_category,
-                        'normalizer_curie': None,
-                        'normalizer_name': None,
-                        'normalizer_category': None,
-                        'all_uc_curies': { uc_node_curie: True },
-                        'all_lc_names': { node_name.lower(): True }
-                    }
-
-            # Loop through the equivalent identifiers from the SRI normalizer and add those to the list
-            for equivalent_concept in equivalence['equivalent_identifiers']:
-
-                equivalent_identifier = equivalent_concept['identifier']
-                equivalent_name = None
-                if 'label' in equivalent_concept:
-                    equivalent_name = equivalent_concept['label']
-
-                # Try to deconflate gene and protein
-                this_category = normalizer_category
-                if this_category == '':
-                    this_category = node_category
-                for curie_prefix_category in curie_prefix_categories:
-                    if equivalent_identifier.startswith(curie_prefix_category):
-                        this_category = curie_prefix_categories[curie_prefix_category]
-                uc_equivalent_identifier = equivalent_identifier.upper()
-
-                # If this equivalient identifier is already there (either from KG2 or previous SRI NN encounter), store the normalizer information
-                if uc_equivalent_identifier in kg_curies:
-                    kg_curies[uc_equivalent_identifier]['normalizer_name'] = equivalent_name
-                    kg_curies[uc_equivalent_identifier]['normalizer_category'] = this_category
-                    if 'SRI_NN' not in kg_curies[uc_equivalent_identifier]['source']:
-                        kg_curies[uc_equivalent_identifier]['source'] += ',SRI_NN'
-
-                    # Turns out this is not always true as one would have expected. One example is HSFX1 and HSFX2 with
-                    # NCBIGene:100130086 and NCBIGene:100506164 but yet they are tied by one protein UniProtKB:Q9UBD0
-                    # This system will coalesce them, although the normalizer has them separate
-                    if 0 and uc_unique_concept_curie != kg_curies[uc_equivalent_identifier]['uc_unique_concept_curie']:
-                        print(f"ERROR 247: at node_curie={node_curie}, expected {uc_unique_concept_curie} == {kg_curies[uc_equivalent_identifier]['uc_unique_concept_curie']}, but no.")
-                        if debug_flag:
-                            print(f"kg_curies[{uc_equivalent_identifier}] = " + json.dumps(kg_curies[uc_equivalent_identifier], indent=2, sort_keys=True))
-                            print(f"kg_unique_concepts[{uc_equivalent_identifier}] = " + json.dumps(kg_unique_concepts[uc_equivalent_identifier], indent=2, sort_keys=True))
-                            sys.exit(1)
-
-                # If we haven't seen this CURIE before, and we first hear about from the SRI NN, then create are record for it
-                else:
-                    kg_curies[uc_equivalent_identifier] = {
-                        'curie': equivalent_identifier,
-                        'uc_unique_concept_curie': uc_unique_concept_curie,
-                        'name': None,
-                        'full_name': None,
-                        'category': None,
-                        'normalizer_name': equivalent_name,
-                        'normalizer_category': this_category,
-                        'source': 'SRI_NN'
-                    }
-                    kg_unique_concepts[uc_unique_concept_curie]['all_uc_curies'][uc_equivalent_identifier] = True
-
-
-            # Loop through the equivalent names from the SRI normalizer and add those to the list
-            for equivalent_name in equivalence['equivalent_names']:
-
-                if equivalent_name == '':
-                    print(f"ERROR: SRI normalizer equivalent_name is '' for {uc_unique_concept_curie}");
-                    exit()
-
-                # If this equivalent name is already there, just make sure the unique_concept_curie is the same
-                lc_equivalent_name = equivalent_name.lower()
-                if lc_equivalent_name in kg_names:
-                    #print(f"INFO: Adding {unique_concept_curie} to synonym {lc_equivalent_name}")
-                    kg_names[lc_equivalent_name]['uc_unique_concept_curies'][uc_unique_concept_curie] = 1
-                # If not, then create it
-                else:
-                    lc_first_word = lc_equivalent_name.split(' ')[0]
-                    kg_names[lc_equivalent_name] = {
-                        'name': equivalent_name,
-                        'uc_unique_concept_curie': uc_unique_concept_curie,
-                        'source': 'SRI',
-                        'uc_unique_concept_curies': { uc_unique_concept_curie: 1 },
-                        'lc_first_word': lc_first_word
-                    }
-                    kg_unique_concepts[uc_unique_concept_curie]['all_lc_names'][lc_equivalent_name] = 1               # FIXME. A count would be fun
-
-
-            # If there is already a kg_nodes entry for this curie, then assume this is a synonym
-            if uc_node_curie in kg_nodes:
-                uc_unique_concept_curie = kg_nodes[uc_node_curie]['uc_unique_concept_curie']
-
-                # For now, just ignore cases where the categories are different. It happens alot
-                #if node_category != kg_nodes[uc_node_curie]['category']:
-                #    print(f"ERROR 249: at node_curie={node_curie}, expected {node_category} == {kg_nodes[uc_node_curie]['category']}, but no.")
-
-                # Update the KG presence. If the current value is not the current KG, then it much be both
-                #if kg_nodes[uc_node_curie]['kg_presence'] != kg_name:
-                #    kg_nodes[uc_node_curie]['kg_presence'] = 'KG1,KG2'
-
-            # Otherwise, create the entry
-            else:
-                kg_nodes[uc_node_curie] = {
-                    'curie': node_curie,
-                    'original_name': original_node_name,
-                    'adjusted_name': node_name,
-                    'full_name': node_full_name,
-                    'category': node_category,
-                    'uc_unique_concept_curie': uc_unique_concept_curie
-                }
-
-            # Loop over all scrubbed names for this node to insert kg_names
-            for equivalent_name in names:
-                lc_equivalent_name = equivalent_name.lower()
-
-                #### If the name is empty or otherwise blank, then we will not add it to kg_names
-                if equivalent_name is None or equivalent_name == '':
-                    #print(f"INFO: Will not record blank name for {node_curie} in kg_names")
-                    continue
-                match = re.match(r'^\s+$',equivalent_name)
-                if match:
-                    print(f"WARNING: equivalent_name for {node_curie} is whitespace but not empty ({equivalent_name})")
-                    continue
-
-                # If this equivalent name is already there, just make sure the unique_concept_curie is the same
-                if lc_equivalent_name in kg_names:
-                    if debug_flag:
-                        print(f"DEBUG: Name '{lc_equivalent_name}' already in kg_names")
-                    if uc_unique_concept_curie != kg_names[lc_equivalent_name]['uc_unique_concept_curie']:
-                        kg_names[lc_equivalent_name]['uc_unique_concept_curies'][uc_unique_concept_curie] = 1
-                        if debug_flag:
-                            print(f"INFO: uc_unique_concept_curie={uc_unique_concept_curie}, but kg_names already has {kg_names[lc_equivalent_name]['uc_unique_concept_curie']}. Oh well, this will be cleaned up later.")
-                            print(f"INFO: * Adding {uc_unique_concept_curie} to kg_names {lc_equivalent_name}")
-                            print(f"INFO: **** {lc_equivalent_name} has {kg_names[lc_equivalent_name]['uc_unique_concept_curies']}")
-
-                # If not, then create it
-                else:
-                    if debug_flag:
-                        print(f"DEBUG: Name '{lc_equivalent_name}' is not in kg_names. Add it")
-                        print(f"       node_curie={node_curie}, uc_node_curie={uc_node_curie}, uc_unique_concept_curie={uc_unique_concept_curie}, lc_equivalent_name={lc_equivalent_name}")
-                    lc_first_word = lc_equivalent_name.split(' ')[0]
-                    kg_names[lc_equivalent_name] = {
-                        'name': equivalent_name,
-                        'uc_unique_concept_curie': uc_unique_concept_curie,
-                        'source': 'KG2',
-                        'uc_unique_concept_curies': { uc_unique_concept_curie: 1 },
-                        'lc_first_word': lc_first_word
-                    }
-                    kg_unique_concepts[uc_unique_concept_curie]['all_lc_names'][lc_equivalent_name] = 1
-
-            # Debugging
-            if debug_flag:
-                print(f"kg_nodes['{uc_node_curie}'] = ",json.dumps(kg_nodes[uc_node_curie], indent=2, sort_keys=True))
-                print(f"kg_unique_concepts['{uc_unique_concept_curie}'] = ",json.dumps(kg_unique_concepts[uc_unique_concept_curie], indent=2, sort_keys=True))
-                #input("Enter to continue...")
-
-            #debug_flag = False
-            lineCounter += 1
-            percentage = int(bytes_read*100.0/filesize)
-            if percentage > previous_percentage:
-                previous_percentage = percentage
-                print(str(percentage)+"%..", end='', flush=True)
-
-        fh.close()
-        self.logfile_handle.close()
-        self.logfile_handle = None
-        print("")
-
-        print(f"INFO: Freeing SRI node normalizer cache from memory")
-        self.normalizer = None
-        del normalizer
-
-        print(f"INFO: Reading of KG2 node files complete")
-        print(f"INFO: Current entity counts\n  {len(kg_nodes)} nodes\n  {len(kg_unique_concepts)} unique concepts\n" +
-            f"  {len(kg_curies)} curies\n  {len(kg_names)} names and abbreviations\n" +
-            f"  {len(kg_name_curies)} name to curie provenance associations")
-
-
     # ############################################################################################
     #### The input lines are a bit messy. Here is special code to tidy things up a bit using hand curated heuristics
     def scrub_input(self, node_curie, node_name, node_category, debug_flag):
@@ -1090,489 +364,6 @@ class NodeSynonymizer:
 
     # Finishing / Reorg methods
 
-    #############################################################################################
-    #### Go through all unique concepts and merge any that are split due to build order issues
-    def merge_unique_concepts(self):
-
-        print("INFO: Merging unique concepts by existing uc_curie associations...")
-
-        kg_nodes = self.kg_map['kg_nodes']
-        kg_unique_concepts = self.kg_map['kg_unique_concepts']
-        kg_curies = self.kg_map['kg_curies']
-        kg_names = self.kg_map['kg_names']
-        kg_name_curies = self.kg_map['kg_name_curies']
-
-        all_uc_curies_to_unique_concepts = {}
-
-        debug_flag = DEBUG
-
-        #### Progress tracking
-        counter = 0
-        n_items = len(kg_unique_concepts)
-        previous_percentage = 0
-
-        #### Loop over all unique_concepts to see if they need coalescing
-        print("INFO: Looping over all unique_concepts...")
-        for uc_curie, concept in kg_unique_concepts.items():
-
-            if debug_flag:
-                print("====================================================================")
-                print(f"==== {uc_curie}  {concept['name']}  {concept['category']} has {len(concept['all_uc_curies'])} items")
-                print(json.dumps(concept, indent=2, sort_keys=True))
-
-            #### Loop over all the uc_curies that map to this concept, recording the mapping in all_uc_curies_to_unique_concepts
-            #### and scoring the unique_concept curie prefixes
-            for uc_equivalent_curie in concept['all_uc_curies']:
-
-                #### If this curie hasn't been encountered yet, add an entry to the dict
-                if uc_equivalent_curie not in all_uc_curies_to_unique_concepts:
-                    all_uc_curies_to_unique_concepts[uc_equivalent_curie] = {}
-
-                #### Compute a score for this uc_unique_concept_curie
-                score = 0
-                #uc_curie_prefix = uc_curie.split(':')[0]
-                uc_curie_prefix = uc_equivalent_curie.split(':')[0]
-                if uc_curie_prefix in self.uc_curie_prefix_scores:
-                    score = self.uc_curie_prefix_scores[uc_curie_prefix]
-                if uc_curie_prefix == 'UNIPROTKB':
-                    if ':P' in uc_curie:
-                        score += 2
-                    if ':Q' in uc_curie:
-                        score += 1
-
-                #### Store the mapping and score
-                all_uc_curies_to_unique_concepts[uc_equivalent_curie][uc_curie] = {
-                    'category': kg_unique_concepts[uc_curie]['category'],
-                    'score': score
-                }
-
-                if debug_flag:
-                    print(f"{uc_equivalent_curie} -> {uc_curie} = {score}")
-
-            counter += 1
-            percentage = int(counter * 100.0 / n_items)
-            if percentage > previous_percentage:
-                previous_percentage = percentage
-                print(str(percentage)+"%..", end='', flush=True)
-
-        print(f"INFO: After scanning {n_items} distinct unique_concepts, all_uc_curies_to_unique_concepts has {len(all_uc_curies_to_unique_concepts)} items")
-
-        #### Loop through all the mappings to find and prioritize the sets
-        print("INFO: Looping over all all_uc_curies_to_unique_concepts...")
-        concept_remap = {}
-        for uc_unique_concept_curie, group in all_uc_curies_to_unique_concepts.items():
-            if len(group) > 1:
-                if debug_flag:
-                    print(f"Assessing {uc_unique_concept_curie}")
-                    print(f"Need to resolve a group {group}")
-                best_score = -1
-                best_curie = uc_unique_concept_curie
-
-                #### Determine the best scoring one (also sorted in case of ties)
-                for member_curie in sorted(group):
-                    member = group[member_curie]
-                    if member['score'] > best_score:
-                        best_score = member['score']
-                        best_curie = member_curie
-
-                #### Remap all the others to the best scoring one
-                for member_curie in group:
-                    if member_curie != best_curie:
-                        concept_remap[member_curie] = best_curie
-                        if debug_flag:
-                            print(f"  ** {member_curie} -> {best_curie}")
-        #### Perform the remapping
-        self.remap_concepts(concept_remap)
-
-
-
-    #############################################################################################
-    #### Given a concept_remap dict, go ahead and perform all the remapping
-    def remap_concepts(self, concept_remap):
-
-        print("INFO: Remapping concepts using concept translation map...")
-
-        kg_nodes = self.kg_map['kg_nodes']
-        kg_unique_concepts = self.kg_map['kg_unique_concepts']
-        kg_curies = self.kg_map['kg_curies']
-        kg_names = self.kg_map['kg_names']
-        kg_name_curies = self.kg_map['kg_name_curies']
-
-        #### At this point, there is remapping information, but it's possible to have
-        #### A->B, B->C and we want, A->C, B->C
-        #### So we need to iterate through and look for targets that are also sources
-        iteration = 0
-        n_prev_forward_entries = -1
-        while True:
-            new_concept_remap = {}
-            forwarded_entries = {}
-            is_new_map_changed = False
-            iteration += 1
-            for uc_unique_concept_curie, target_curie in concept_remap.items():
-                if target_curie in concept_remap and target_curie != concept_remap[target_curie]:
-                    forwarded_entries[target_curie] = concept_remap[target_curie]
-                    target_curie = concept_remap[target_curie]
-                    is_new_map_changed = True
-                new_concept_remap[uc_unique_concept_curie] = target_curie
-            if is_new_map_changed:
-                concept_remap = new_concept_remap
-                print(f"- After iteration {iteration}, there are {len(forwarded_entries)} forwarded entries")
-                if len(forwarded_entries) < 10:
-                    print(json.dumps(forwarded_entries,sort_keys=True,indent=2))
-            else:
-                break
-            if len(forwarded_entries) == n_prev_forward_entries:
-                print(f"- Stopped iterating. Two iterations with {len(forwarded_entries)} forwarded entries")
-                break
-            if iteration > 123:
-                eprint("ERROR: E98123: Reached 123 iterations")
-                exit()
-            n_prev_forward_entries = len(forwarded_entries)
-
-        #### Show the mapping
-        for uc_unique_concept_curie, target_curie in concept_remap.items():
-            #print(f"{uc_unique_concept_curie} --> {target_curie}")
-            # Transfer the all_uc_curies entries
-            for uc_curie in kg_unique_concepts[uc_unique_concept_curie]['all_uc_curies']:
-                if uc_curie not in kg_unique_concepts[target_curie]['all_uc_curies']:
-                    kg_unique_concepts[target_curie]['all_uc_curies'][uc_curie] = True
-                if DEBUG:
-                    print(f"INFO: Transferring {uc_curie} ({kg_curies[uc_curie]['name']}) from all_uc_curies in {uc_unique_concept_curie} ({kg_unique_concepts[uc_unique_concept_curie]['name']}) to {target_curie} ({kg_unique_concepts[target_curie]['name']})")
-
-        #### Remap kg_nodes
-        for uc_curie, element in kg_nodes.items():
-            if element['uc_unique_concept_curie'] in concept_remap:
-                element['uc_unique_concept_curie'] = concept_remap[element['uc_unique_concept_curie']]
-
-        #### Remap kg_curies
-        for uc_curie, element in kg_curies.items():
-            if element['uc_unique_concept_curie'] in concept_remap:
-                element['uc_unique_concept_curie'] = concept_remap[element['uc_unique_concept_curie']]
-
-        #### Remap kg_names
-        for lc_name, element in kg_names.items():
-            if element['uc_unique_concept_curie'] in concept_remap:
-                #### Reassign the uc_unique_concept_curie
-                element['uc_unique_concept_curie'] = concept_remap[element['uc_unique_concept_curie']]
-
-            #### Add in the new one
-            element['uc_unique_concept_curies'][element['uc_unique_concept_curie']] = True
-
-            #### Remove any remapped uc_curies
-            new_uc_unique_concept_curies = {}
-            for uc_curie in element['uc_unique_concept_curies']:
-                if uc_curie not in new_concept_remap:
-                    new_uc_unique_concept_curies[uc_curie] = True
-            element['uc_unique_concept_curies'] = new_uc_unique_concept_curies
-
-        #### Remap kg_name_curies
-        for lc_name_uc_curie, element in kg_name_curies.items():
-            if element['uc_unique_concept_curie'] in concept_remap:
-                element['uc_unique_concept_curie'] = concept_remap[element['uc_unique_concept_curie']]
-
-        #### And delete the obsolete unique_concepts
-        for uc_curie in concept_remap:
-            del kg_unique_concepts[uc_curie]
-
-        print("INFO: Done remapping")
-        print(f"INFO: Current entity counts\n  {len(kg_nodes)} nodes\n  {len(kg_unique_concepts)} unique concepts\n" +
-            f"  {len(kg_curies)} curies\n  {len(kg_names)} names and abbreviations\n" +
-            f"  {len(kg_name_curies)} name to curie provenance associations")
-
-
-
-    #############################################################################################
-    #### Go through all unique concepts and merge any that are split due to build order issues
-    def merge_unique_concepts_by_name(self):
-
-        print("INFO: Merging unique concepts by name...")
-
-        kg_nodes = self.kg_map['kg_nodes']
-        kg_unique_concepts = self.kg_map['kg_unique_concepts']
-        kg_curies = self.kg_map['kg_curies']
-        kg_names = self.kg_map['kg_names']
-
-        all_lc_names_to_unique_concepts = {}
-        n_concepts_to_merge = 0
-
-        debug_flag = DEBUG
-
-        #### Progress tracking
-        counter = 0
-        n_items = len(kg_names)
-        previous_percentage = 0
-
-        # Loop over all names
-        print("INFO: Looping over all names...")
-        for lc_name, concept in kg_names.items():
-
-            #if lc_name == 'losartan':
-            #    debug_flag = True
-
-            if len(lc_name) < 3:
-                continue
-
-
-            if debug_flag:
-                print("====================================================================")
-                print(f"==== {lc_name}  {concept['name']}  {concept['uc_unique_concept_curie']}")
-                print(json.dumps(concept, indent=2, sort_keys=True))
-
-            # Loop over all the equivalences, picking the best ones
-            for uc_curie in concept['uc_unique_concept_curies']:
-
-                #### If this curie hasn't been seen yet, then add it to the dict
-                if lc_name not in all_lc_names_to_unique_concepts:
-                    all_lc_names_to_unique_concepts[lc_name] = {}
-
-                #### Compute a score for this uc_unique_concept_curie
-                score = 0
-                uc_curie_prefix = uc_curie.split(':')[0]
-                if uc_curie_prefix in self.uc_curie_prefix_scores:
-                    score = self.uc_curie_prefix_scores[uc_curie_prefix]
-                if uc_curie_prefix == 'UNIPROTKB':
-                    if ':P' in uc_curie: score += 2
-                    if ':Q' in uc_curie: score += 1
-
-                #### Store the mapping and score
-                all_lc_names_to_unique_concepts[lc_name][uc_curie] = {
-                    'category': kg_unique_concepts[uc_curie]['category'],
-                    'score': score
-                }
-
-                #debug_flag = False
-                if debug_flag:
-                    print(f"{lc_name} -> {uc_curie} = {score}")
-
-
-            counter += 1
-            percentage = int(counter * 100.0 / n_items)
-            if percentage > previous_percentage:
-                previous_percentage = percentage
-                print(str(percentage)+"%..", end='', flush=True)
-
-        print(f"INFO: After scanning {n_items} distinct names, all_lc_names_to_unique_concepts has {len(all_lc_names_to_unique_concepts)} items")
-
-        #### Loop through all the mappings to find and prioritize the sets
-        print("INFO: Looping over all all_lc_names_to_unique_concepts...")
-        concept_remap = {}
-        for lc_name, group in all_lc_names_to_unique_concepts.items():
-            if len(group) > 1:
-                if debug_flag:
-                    print(f"Need to resolve a group {group}")
-                best_score = -1
-                best_curie = ''
-
-                #### Determine the best scoring one (also sorted in case of ties)
-                for member_curie in sorted(group):
-                    member = group[member_curie]
-                    if member['score'] > best_score:
-                        best_score = member['score']
-                        best_curie = member_curie
-
-                #### Remap all the others to the best scoring one
-                for member_curie in group:
-                    if member_curie != best_curie:
-                        concept_remap[member_curie] = best_curie
-
-        #### Perform the remapping
-        self.remap_concepts(concept_remap)
-
-
-    #############################################################################################
-    #### Go through all unique concepts and reset the lead unique_concept out of all the options based on a set of rules
-    def reprioritize_unique_concepts(self):
-
-        print("INFO: Reprioritizing the unique concepts leaders...")
-        kg_nodes = self.kg_map['kg_nodes']
-        kg_unique_concepts = self.kg_map['kg_unique_concepts']
-        kg_curies = self.kg_map['kg_curies']
-        kg_names = self.kg_map['kg_names']
-        kg_name_curies = self.kg_map['kg_name_curies']
-
-        outfile = open('Problems.tsv', 'w')
-
-        concept_remap = {}
-
-        debug_flag = DEBUG
-
-        #### Progress tracking
-        counter = 0
-        n_items = len(kg_unique_concepts)
-        previous_percentage = 0
-
-        #### Loop over all unique_concepts to see if they need coalescing
-        print("INFO: Looping over all unique_concepts...")
-        for uc_unique_concept_curie, unique_concept in kg_unique_concepts.items():
-
-            curie = unique_concept['curie']
-            curie_prefix = curie.split(':')[0].upper()
-
-            #### Don't do anything fancy to meta nodes
-            if curie_prefix == 'BIOLINK':
-                continue
-
-            concept = { 'category': unique_concept['category'], 'name': unique_concept['name'], 'all_categories': {}, 'all_curie_prefixes': {},
-                'best_curie_score': -1, 'best_curie': unique_concept['curie'], 'best_category': unique_concept['category'], 'best_name': unique_concept['name'] }
-            manual_exception = False
-
-            if debug_flag:
-                print("===============================================")
-                print(f"Considering {uc_unique_concept_curie}")
-
-            for related_uc_curie in unique_concept['all_uc_curies']:
-
-                if related_uc_curie in kg_nodes:
-                    node_category = kg_nodes[related_uc_curie]['category']
-                    node_curie = kg_nodes[related_uc_curie]['curie']
-                    node_name = kg_nodes[related_uc_curie]['adjusted_name']
-                    node_full_name = kg_nodes[related_uc_curie]['full_name']
-                    node_curie_prefix = node_curie.split(':')[0].upper()
-
-                    ignore_category = False
-                    if node_curie_prefix == 'OMIM':
-                        ignore_category = True
-
-                    if not ignore_category:
-                        if node_category not in concept['all_categories']:
-                            concept['all_categories'][node_category] = 0
-                        concept['all_categories'][node_category] += 1
-
-                    if node_curie_prefix not in concept['all_curie_prefixes']:
-                        concept['all_curie_prefixes'][node_curie_prefix] = 0
-                    concept['all_curie_prefixes'][node_curie_prefix] += 1
-
-                    this_score = 0
-                    if node_curie_prefix in self.uc_curie_prefix_scores:
-                        this_score = self.uc_curie_prefix_scores[node_curie_prefix]
-                    if this_score > concept['best_curie_score']:
-                        concept['best_curie_score'] = this_score
-                        concept['best_curie'] = node_curie
-                        concept['best_category'] = node_category
-                        concept['best_name'] = node_name
-
-                    if node_curie_prefix == 'NCBIGENE' and node_full_name.startswith('Genetic locus associated with'):
-                        manual_exception = True
-                        concept['best_curie_score'] = 9999
-                        concept['best_curie'] = node_curie
-                        concept['best_category'] = node_category
-                        concept['best_name'] = node_full_name
-
-                    if debug_flag:
-                        print(f"  - After considering related {related_uc_curie}, concept = {concept}")
-
-
-            drug_score = 0
-            disease_score = 0
-            protein_score = 0
-            if 'biolink:Drug' in concept['all_categories'] or 'biolink:ChemicalEntity' in concept['all_categories'] or 'biolink:SmallMolecule' in concept['all_categories'] or 'biolink:MolecularEntity' in concept['all_categories']:
-                drug_score = 1
-            if 'biolink:Disease' in concept['all_categories'] or 'biolink:PhenotypicFeature' in concept['all_categories'] or 'biolink:DiseaseOrPhenotypicFeature' in concept['all_categories']:
-                disease_score = 1
-            if 'biolink:Gene' in concept['all_categories'] or 'biolink:Protein' in concept['all_categories'] or 'biolink:GeneOrProtein' in concept['all_categories'] or 'biolink:GenomicEntity' in concept['all_categories']:
-                protein_score = 1
-
-            #### Looks for concepts that are both a protein and a disease. A sign of trouble
-            if protein_score > 0 and disease_score > 0 and not manual_exception:
-                if True:
-                    print("==== Protein-Disease CONFLICT! ===================================")
-                    print(f"{uc_unique_concept_curie} '{concept['name']}' is a {concept['category']}")
-                    print(f"  concept = {concept}")
-                    outfile.write("\t".join([ uc_unique_concept_curie, concept['name'], concept['category']]) + "\n")
-
-
-            if drug_score > 0 and disease_score > 0 and not manual_exception:
-
-                if 'CHEMBL.COMPOUND' in concept['all_curie_prefixes'] or 'CHEBI' in concept['all_curie_prefixes'] or 'DRUGBANK' in concept['all_curie_prefixes'] or 'RXNORM' in concept['all_curie_prefixes'] or 'VANDF' in concept['all_curie_prefixes']:
-                    drug_score += 1
-                if 'MONDO' in concept['all_curie_prefixes'] or 'DOID' in concept['all_curie_prefixes']:
-                    disease_score += 1
-
-                if drug_score > disease_score:
-                    final_category = 'biolink:Drug'
-                elif disease_score > drug_score:
-                    final_category = 'biolink:Disease'
-                elif disease_score == 1:
-                    final_category = 'ambiguous'
-                else:
-                    final_category = 'CONFLICT'
-
-                is_problem = False
-                if final_category == 'biolink:Drug' and concept['best_category'] != 'biolink:Drug' and concept['best_category'] != 'biolink:ChemicalEntity' and concept['best_category'] != 'biolink:MolecularEntity' and concept['best_category'] != 'biolink:SmallMolecule':
-                    is_problem = True
-                if final_category == 'biolink:Disease' and concept['best_category'] != 'biolink:PhenotypicFeature' and concept['best_category'] != 'biolink:DiseaseOrPhenotypicFeature':
-                    is_problem = True
-                if final_category == 'CONFLICT':
-                    is_problem = True
-
-                if is_problem:
-                    print("***** PROBLEM ***************************")
-                    print(f"{uc_unique_concept_curie} '{concept['name']}' is a {concept['category']}")
-                    print(f"  concept = {concept}")
-                    print(f"  drug_score={drug_score}, disease_score={disease_score}, final_category={final_category}")
-                    outfile.write("\t".join([ uc_unique_concept_curie, concept['name'], concept['category']]) + "\n")
-
-            if debug_flag:
-                print("========================================================")
-                print(f"{uc_unique_concept_curie} '{concept['name']}' is a {concept['category']}")
-                print(f"  concept = {concept}")
-
-            #### Record the necessary remapping
-            if concept['best_curie'].upper() != uc_unique_concept_curie:
-                concept_remap[uc_unique_concept_curie] = concept['best_curie'].upper()
-
-            #### Update the kg_unique_concept with the final normalized information
-            unique_concept['curie'] = concept['best_curie']
-            unique_concept['name'] = concept['best_name']
-            unique_concept['category'] = concept['best_category']
-
-            #### Show progress information
-            counter += 1
-            percentage = int(counter * 100.0 / n_items)
-            if percentage > previous_percentage:
-                previous_percentage = percentage
-                print(str(percentage)+"%..", end='', flush=True)
-
-
-        #### Remap kg_nodes
-        for uc_curie, element in kg_nodes.items():
-            if element['uc_unique_concept_curie'] in concept_remap:
-                element['uc_unique_concept_curie'] = concept_remap[element['uc_unique_concept_curie']]
-
-        #### Remap kg_curies
-        for uc_curie, element in kg_curies.items():
-            if element['uc_unique_concept_curie'] in concept_remap:
-                element['uc_unique_concept_curie'] = concept_remap[element['uc_unique_concept_curie']]
-
-        #### Remap kg_names
-        for lc_name, element in kg_names.items():
-            if element['uc_unique_concept_curie'] in concept_remap:
-                element['uc_unique_concept_curie'] = concept_remap[element['uc_unique_concept_curie']]
-
-            #### Add in the new one                                                                         Maybe should be done, but not used any more anyway?
-            #element['uc_unique_concept_curies'][element['uc_unique_concept_curie']] = True
-
-            #### Remove any remapped uc_curies
-            #new_uc_unique_concept_curies = {}
-            #for uc_curie in element['uc_unique_concept_curies']:
-            #    if uc_curie not in new_concept_remap:
-            #        new_uc_unique_concept_curies[uc_curie] = True
-            #element['uc_unique_concept_curies'] = new_uc_unique_concept_curies
-
-        #### Remap kg_name_curies
-        for lc_name_uc_curie, element in kg_name_curies.items():
-            if element['uc_unique_concept_curie'] in concept_remap:
-                element['uc_unique_concept_curie'] = concept_remap[element['uc_unique_concept_curie']]
-
-        #### And update the unique_concepts
-        for uc_curie, uc_new_curie in concept_remap.items():
-            kg_unique_concepts[uc_new_curie] = kg_unique_concepts[uc_curie]
-            del kg_unique_concepts[uc_curie]
-
-        outfile.close()
-
-
-
     # ############################################################################################
     # This is just for testing. Doesn't actually do anything
     def update_categories(self):
@@ -1910,13 +701,18 @@ class NodeSynonymizer:
         if isinstance(names,str):
             names = [ names ]
 
+        # Set up the category manager, with the expansion table for this database
+        category_manager = CategoryManager(self.get_category_expansion_table_path()) if return_all_categories else None
+
+        # If there is a concept index for this database, answer from that instead
+        concept_index = self.get_concept_index()
+        if concept_index is not None:
+            return self._get_canonical_curies_from_index(concept_index, category_manager, curies, names, return_all_categories, return_type)
+
         # Set up containers for the batches and results
         batches = []
         results = {}
 
-        # Set up the category manager
-        category_manager = CategoryManager()
-
         # Make sets of comma-separated list strings for the curies and set up the results dict with all the input values
         uc_curies = []
         curie_map = {}
@@ -2078,8 +874,88 @@ class NodeSynonymizer:
         return results
 
 
+    # ############################################################################################
+    # The same as get_canonical_curies(), but using the concept index
+    def _get_canonical_curies_from_index(self, concept_index, category_manager, curies, names, return_all_categories, return_type):
+
+        results = {}
+        entity_concepts = {}
+        if curies is not None:
+            curies = [ curie for curie in curies if curie is not None ]
+            for curie in curies:
+                results[curie] = None
+            entity_concepts.update(zip(curies, concept_index.get_curie_concepts([ curie.upper() for curie in curies ])))
+        if names is not None:
+            names = [ name for name in names if name is not None ]
+            for name in names:
+                results[name] = None
+            entity_concepts.update(zip(names, concept_index.get_name_concepts([ name.lower() for name in names ])))
+        name_set = set(names) if names is not None else set()
+
+        for entity, concept_id in entity_concepts.items():
+            if concept_id < 0:
+                continue
+            preferred_curie, preferred_name, preferred_category = concept_index.get_concept(concept_id)
+
+            if return_type == 'equivalent_nodes':
+                if entity in name_set:
+                    # As with the SQL version, names are resolved to the concept itself
+                    results[entity] = { preferred_curie: preferred_name }
+                else:
+                    nodes = concept_index.get_concept_nodes(concept_id)
+                    if len(nodes) == 0:
+                        continue
+                    results[entity] = { node_curie: node_category for node_curie, node_category in nodes }
+            else:
+                results[entity] = {
+                    'preferred_curie': preferred_curie,
+                    'preferred_name': preferred_name,
+                    'preferred_category': preferred_category
+                }
+
+            if return_all_categories:
+                results[entity]['expanded_categories'] = category_manager.get_expansive_categories(preferred_category)
+                all_categories = concept_index.get_concept_curie_categories(concept_id)
+                if all_categories is not None:
+                    results[entity]['all_categories'] = all_categories
+
+        return results
+
+
+    # ############################################################################################
+    # Return the name (label) of the node with each curie, or None if there is no node with exactly that curie
+    def get_curie_names(self, curies):
+
+        if isinstance(curies,str):
+            curies = [ curies ]
+        curies = [ curie for curie in curies if curie is not None ]
+        uc_curies = [ curie.upper() for curie in curies ]
+
+        concept_index = self.get_concept_index()
+        if concept_index is not None:
+            nodes = dict(zip(uc_curies, concept_index.get_nodes(uc_curies)))
+        else:
+            nodes = {}
+            cursor = self.connection.cursor()
+            distinct_uc_curies = list(set(uc_curies))
+            for start in range(0, len(distinct_uc_curies), self.max_sql_variables):
+                batch = distinct_uc_curies[start:start + self.max_sql_variables]
+                cursor.execute( f"SELECT uc_curie, curie, adjusted_name FROM nodes WHERE uc_curie IN ({','.join('?' * len(batch))}) ORDER BY rowid", batch )
+                for uc_curie, curie, adjusted_name in cursor.fetchall():
+                    if uc_curie not in nodes:
+                        nodes[uc_curie] = (curie, adjusted_name)
+
+        curie_names = {}
+        for curie, uc_curie in zip(curies, uc_curies):
+            node = nodes.get(uc_curie)
+            curie_names[curie] = node[1] if node is not None and node[0] == curie else None
+        return curie_names
+
+
     # ############################################################################################
     # Return results in the Node Normalizer format, either from SRI or KG1 or KG2
+    # All entities are resolved together: one batched lookup of curies (then names for the rest), then one batched query
+    # per table for all of the matched concepts
     def get_normalizer_results(self, entities=None):
 
         # If no entity was passed, then nothing to do
@@ -2090,146 +966,158 @@ class NodeSynonymizer:
         if isinstance(entities,str):
             entities = [ entities ]
 
-        # Loop over all entities and get the results
+        # Find the unique concept for each entity, first by curie and then by name for those that aren't curies
+        entity_concepts = {}
+        concepts_by_uc_curie = self._get_first_values_by_key("curies", "uc_curie", "unique_concept_curie",
+                                                             { entity.upper() for entity in entities if entity is not None })
+        unmatched_entities = [ entity for entity in entities if entity is not None and entity.upper() not in concepts_by_uc_curie ]
+        concepts_by_lc_name = self._get_first_values_by_key("names", "lc_name", "unique_concept_curie",
+                                                            { entity.lower() for entity in unmatched_entities })
+        for entity in entities:
+            if entity is None:
+                continue
+            if entity.upper() in concepts_by_uc_curie:
+                entity_concepts[entity] = concepts_by_uc_curie[entity.upper()]
+            elif entity.lower() in concepts_by_lc_name:
+                entity_concepts[entity] = concepts_by_lc_name[entity.lower()]
+
+        # Get everything linked to those concepts, grouped by concept
+        unique_concept_curies = set(entity_concepts.values())
+        concept_nodes = self._get_rows_by_concept("SELECT unique_concept_curie, curie, category, adjusted_name, original_name FROM nodes", "unique_concept_curie", unique_concept_curies)
+        concept_curies = self._get_rows_by_concept("SELECT unique_concept_curie, curie, name, full_name, category, normalizer_name, normalizer_category, source FROM curies", "unique_concept_curie", unique_concept_curies)
+        concept_info = self._get_rows_by_concept("SELECT uc_curie, curie, name, category, normalizer_curie, normalizer_name, normalizer_category FROM unique_concepts", "uc_curie", unique_concept_curies)
+        concept_synonym_provenance = self._get_rows_by_concept("SELECT unique_concept_curie, name, uc_curie, source FROM name_curies", "unique_concept_curie", unique_concept_curies)
+
+        # Assemble the results for each entity
         results = {}
         for entity in entities:
-
-            # Search the curie table for the provided entity
-            cursor = self.connection.cursor()
-            cursor.execute( f"SELECT unique_concept_curie FROM curies WHERE uc_curie = ?", (entity.upper(),) )
-            rows = cursor.fetchall()
-
-            # If no rows came back, see if it matches a name
-            if len(rows) == 0:
-                cursor = self.connection.cursor()
-                cursor.execute( f"SELECT unique_concept_curie FROM names WHERE lc_name = ?", (entity.lower(),) )
-                rows = cursor.fetchall()
-
-            # If there are still no rows, then just move on
-            if len(rows) == 0:
+            if entity not in entity_concepts:
                 results[entity] = None
                 continue
+            unique_concept_curie = entity_concepts[entity]
+            results[entity] = self._assemble_normalizer_result(unique_concept_curie,
+                concept_nodes.get(unique_concept_curie, []), concept_curies.get(unique_concept_curie, []),
+                concept_info.get(unique_concept_curie, []),
+                concept_synonym_provenance.get(unique_concept_curie, []))
 
-            # If multiple rows come back, this is probably an error in the database
-            if len(rows) > 1:
-                print(f"ERROR: Search in NodeSynonymizer for '{entity}' turned up more than one unique_concept. This shouldn't be.")
+        return results
 
-            # Extract the CURIE for the unique concept
-            unique_concept_curie = rows[0][0]
 
-            # Get the list of nodes that link to this concept
-            cursor = self.connection.cursor()
-            cursor.execute( f"SELECT * FROM nodes WHERE unique_concept_curie = ?", (unique_concept_curie,) )
-            rows = cursor.fetchall()
-            nodes = []
-            for row in rows:
-                nodes.append( {'identifier': row[1], 'category': row[5], "label": row[3], 'original_label': row[2] } )
+    # ############################################################################################
+    # Build the Node Normalizer format result for one concept from its rows in each table
+    def _assemble_normalizer_result(self, unique_concept_curie, node_rows, curie_rows, concept_rows, synonym_provenance_rows):
 
-            # Get the list of curies that link to this concept
-            cursor = self.connection.cursor()
-            cursor.execute( f"SELECT * FROM curies WHERE unique_concept_curie = ?", (unique_concept_curie,) )
-            rows = cursor.fetchall()
-            curies = []
-            categories = {}
-            names = {}
-            for row in rows:
-                #### Store the curies
-                curies.append( {'identifier': row[1], 'name': row[3], 'full_name': row[4], 'category': row[5], 'normalizer_name': row[6], 'normalizer_category': row[7], 'source': row[8] } )
-
-                #### Store the categories
-                category = row[5]
-                if category == '':
-                    category = None
-                if category is not None:
-                    if category not in categories:
-                        categories[category] = 0
-                    categories[category] += 1
-                normalizer_category = row[7]
-                if normalizer_category == '':
-                    normalizer_category = None
-                if normalizer_category is not None:
-                    if category is None or normalizer_category != category:
-                        if normalizer_category not in categories:
-                            categories[normalizer_category] = 0
-                        categories[normalizer_category] += 1
-
-                #### Store the names
-                name = row[3]
-                if name == '':
-                    name = None
-                if name is not None:
-                    if name not in names:
-                        names[name] = 0
-                    names[name] += 1
-                normalizer_name = row[6]
-                if normalizer_name == '':
-                    normalizer_name = None
-                if normalizer_name is not None:
-                    if name is None or normalizer_name != name:
-                        if normalizer_name not in names:
-                            names[normalizer_name] = 0
-                        names[normalizer_name] += 1
-                full_name = row[4]
-                if full_name == '':
-                    full_name = None
-                if full_name is not None and full_name != '':
-                    if full_name != name:
-                        if normalizer_name is None or normalizer_name != full_name:
-                            if full_name not in names:
-                                names[full_name] = 0
-                            names[full_name] += 1
-
-
-            # Get the list of synonyms that link to this concept
-            cursor = self.connection.cursor()
-            cursor.execute( f"SELECT * FROM names WHERE unique_concept_curie = ?", (unique_concept_curie,) )
-            rows = cursor.fetchall()
-            synonyms = []
-            for row in rows:
-                synonyms.append( {'name': row[1], 'source': row[3] } )
+        nodes = []
+        for row in node_rows:
+            nodes.append( {'identifier': row[0], 'category': row[1], "label": row[2], 'original_label': row[3] } )
 
+        curies = []
+        categories = {}
+        names = {}
+        for row in curie_rows:
+            #### Store the curies
+            curies.append( {'identifier': row[0], 'name': row[1], 'full_name': row[2], 'category': row[3], 'normalizer_name': row[4], 'normalizer_category': row[5], 'source': row[6] } )
+
+            #### Store the categories
+            category = row[3]
+            if category == '':
+                category = None
+            if category is not None:
+                if category not in categories:
+                    categories[category] = 0
+                categories[category] += 1
+            normalizer_category = row[5]
+            if normalizer_category == '':
+                normalizer_category = None
+            if normalizer_category is not None:
+                if category is None or normalizer_category != category:
+                    if normalizer_category not in categories:
+                        categories[normalizer_category] = 0
+                    categories[normalizer_category] += 1
+
+            #### Store the names
+            name = row[1]
+            if name == '':
+                name = None
+            if name is not None:
+                if name not in names:
+                    names[name] = 0
+                names[name] += 1
+            normalizer_name = row[4]
+            if normalizer_name == '':
+                normalizer_name = None
+            if normalizer_name is not None:
+                if name is None or normalizer_name != name:
+                    if normalizer_name not in names:
+                        names[normalizer_name] = 0
+                    names[normalizer_name] += 1
+            full_name = row[2]
+            if full_name == '':
+                full_name = None
+            if full_name is not None and full_name != '':
+                if full_name != name:
+                    if normalizer_name is None or normalizer_name != full_name:
+                        if full_name not in names:
+                            names[full_name] = 0
+                        names[full_name] += 1
 
-            # Get the unique concept information
-            cursor = self.connection.cursor()
-            cursor.execute( f"SELECT * FROM unique_concepts WHERE uc_curie = ?", (unique_concept_curie,) )
-            rows = cursor.fetchall()
+        # If multiple rows come back, this is probably an error in the database
+        if len(concept_rows) > 1:
+            print(f"ERROR: Search in NodeSynonymizer for '{unique_concept_curie}' turned up more than one unique_concept. This shouldn't be.")
+
+        # Fill in the unique identifier
+        row = concept_rows[0]
+        id = {
+            'identifier': row[0],
+            'name': row[1],
+            'category': row[2],
+            'SRI_normalizer_curie': row[3],
+            'SRI_normalizer_name': row[4],
+            'SRI_normalizer_category': row[5],
+        }
 
-            # If multiple rows come back, this is probably an error in the database
-            if len(rows) > 1:
-                print(f"ERROR: Search in NodeSynonymizer for '{unique_concept_curie}' turned up more than one unique_concept. This shouldn't be.")
+        return {
+            'nodes': nodes,
+            'equivalent_identifiers': curies,
+            'synonyms': names,
+            'synonym_provenance': [ {'name': row[0], 'uc_curie': row[1], 'source': row[2] } for row in synonym_provenance_rows ],
+            'id': id,
+            'categories': categories
+        }
 
-            # Fill in the unique identifier
-            row = rows[0]
-            id = {
-                'identifier': row[1],
-                'name': row[2],
-                'category': row[3],
-                'SRI_normalizer_curie': row[4],
-                'SRI_normalizer_name': row[5],
-                'SRI_normalizer_category': row[6],
-            }
 
+    # ############################################################################################
+    # Look up many keys in one column of a table at once, returning the value of the first matching row for each key
+    def _get_first_values_by_key(self, table_name, key_column, value_column, keys):
 
-            # Get the synonym provenance information
-            cursor = self.connection.cursor()
-            cursor.execute( f"SELECT * FROM name_curies WHERE unique_concept_curie = ?", (unique_concept_curie,) )
-            rows = cursor.fetchall()
-            synonym_provenance = []
-            for row in rows:
-                synonym_provenance.append( {'name': row[1], 'uc_curie': row[2], 'source': row[4] } )
+        values = {}
+        cursor = self.connection.cursor()
+        keys = list(keys)
+        for start in range(0, len(keys), self.max_sql_variables):
+            batch = keys[start:start + self.max_sql_variables]
+            cursor.execute( f"SELECT {key_column}, {value_column} FROM {table_name} WHERE {key_column} IN ({','.join('?' * len(batch))}) ORDER BY rowid", batch )
+            for key, value in cursor.fetchall():
+                if key in values:
+                    if values[key] != value:
+                        print(f"ERROR: Search in NodeSynonymizer for '{key}' turned up more than one unique_concept. This shouldn't be.")
+                    continue
+                values[key] = value
+        return values
 
 
-            # Add this entry to the final results dict
-            results[entity] = {
-                'nodes': nodes,
-                'equivalent_identifiers': curies,
-                'synonyms': names,
-                'synonym_provenance': synonym_provenance,
-                'id': id,
-                'categories': categories
-            }
+    # ############################################################################################
+    # Run a SELECT (whose first column is the concept) for many concepts at once, returning the remaining columns grouped by concept
+    def _get_rows_by_concept(self, select_sql, concept_column, unique_concept_curies):
 
-        return results
+        rows_by_concept = {}
+        cursor = self.connection.cursor()
+        unique_concept_curies = list(unique_concept_curies)
+        for start in range(0, len(unique_concept_curies), self.max_sql_variables):
+            batch = unique_concept_curies[start:start + self.max_sql_variables]
+            cursor.execute( f"{select_sql} WHERE {concept_column} IN ({','.join('?' * len(batch))}) ORDER BY rowid", batch )
+            for row in cursor.fetchall():
+                rows_by_concept.setdefault(row[0], []).append(row[1:])
+        return rows_by_concept
 
 
     # ############################################################################################
@@ -2546,7 +1434,7 @@ def main():
     import json
 
     parser = argparse.ArgumentParser(
-        description="Tests or rebuilds the ARAX Node Synonymizer. Note that the build process requires 54 GB RAM.", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+        description="Tests or rebuilds the ARAX Node Synonymizer. Note that the build process requires a lot of RAM for the SRI node normalizer cache.", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('-b', '--build', action="store_true",
                         help="If set, (re)build the index from scratch", default=False)
     parser.add_argument('-f', '--filter_file', action="store",
@@ -2573,18 +1461,24 @@ def main():
                         help="Get the config.json field for the filename", default="Production")
     parser.add_argument('-u', '--update', action="store_true",
                         help="If set, update the NodeSynonmizer with improved category information")
+    parser.add_argument('-p', '--processes', action="store", type=int,
+                        help="Number of processes to use for reading the KG2 nodes when building (default is the number of CPUs)", default=None)
+    parser.add_argument('-i', '--concept_index', action="store_true",
+                        help="If set, (re)build the memory-mapped concept index for the existing database", default=False)
+    parser.add_argument('-x', '--category_expansions', action="store_true",
+                        help="If set, (re)build the category expansion table for the existing database", default=False)
     args = parser.parse_args()
 
-    if not args.build and not args.test and not args.recollate and not args.lookup and not args.first_word_lookup and not args.node_list and not args.query and not args.get and not args.update:
+    if not args.build and not args.test and not args.recollate and not args.lookup and not args.first_word_lookup and not args.node_list and not args.query and not args.get and not args.update and not args.concept_index and not args.category_expansions:
         parser.print_help()
         exit()
 
     synonymizer = NodeSynonymizer(live = args.live)
     
-    # FW: If building use "node_synonymizer.sqlite" for the database name and reconnect
-    if args.build or args.recollate:
-        synonymizer.databaseName = "node_synonymizer.sqlite"
-        synonymizer.connect()
+    # If building or updating, reconnect with a writable connection
+    if args.build or args.recollate or args.update:
+        synonymizer.disconnect()
+        synonymizer.connect(read_only=False)
 
     # If the user asks to perform the SELECT statement, do it
     if args.query:
@@ -2594,6 +1488,18 @@ def main():
     # If the user asks to perform the SELECT statement, do it
     if args.update:
         synonymizer.update_categories()
+        synonymizer.build_concept_index()
+        synonymizer.build_category_expansion_table()
+        return
+
+    # If the user asks to rebuild the concept index, do it
+    if args.concept_index:
+        synonymizer.build_concept_index()
+        return
+
+    # If the user asks to rebuild the category expansion table, do it
+    if args.category_expansions:
+        synonymizer.build_category_expansion_table()
         return
 
     # If the user asks to perform the SELECT statement, do it
@@ -2655,41 +1561,38 @@ def main():
 
     # If the recollate option is selected, try to load the previous state
     if args.recollate:
-        if not synonymizer.reload_state():
+        builder = KGMapBuilder.reload_state(synonymizer, processes=args.processes)
+        if builder is None:
             return
 
 
-    # Else if the build option is selected, build the kg_map from scratch
+    # Else if the build option is selected, build the map from scratch
     elif args.build:
-        print("WARNING: Beginning full NodeSynonymizer build process. This requires 54 GB of RAM. If you don't have 54 GB of RAM available, this would be a good time to stop the process!")
-        synonymizer.build_kg_map(filter_file=args.filter_file)
-
-        #print("WARNING: Skipping import_equivalenies because of possible problems")
-        synonymizer.import_equivalencies()
-
-        #print("WARNING: Skipping import_synonyms because of memory constraints")
-        synonymizer.import_synonyms()
+        print("WARNING: Beginning full NodeSynonymizer build process. This requires a lot of RAM; mostly for the SRI node normalizer cache")
+        builder = KGMapBuilder(synonymizer, processes=args.processes)
+        if not builder.read_nodes(filter_file=args.filter_file):
+            return
+        builder.import_equivalencies()
+        builder.import_synonyms()
 
         # If the flag is set, save our state here for later recollate testing
         if args.save_state:
-            synonymizer.save_state()
+            builder.save_state()
 
     # If either one is selected, do the collation and database writing
     if args.build or args.recollate:
 
-        synonymizer.merge_unique_concepts()
-        synonymizer.merge_unique_concepts_by_name()
-        synonymizer.merge_unique_concepts()
-        synonymizer.reprioritize_unique_concepts()
+        builder.merge_concepts()
+        builder.reprioritize_concepts()
 
         synonymizer.create_tables()
-        synonymizer.store_kg_map()
+        builder.store()
         synonymizer.create_indexes()
+        synonymizer.build_concept_index()
+        synonymizer.build_category_expansion_table()
 
-        print(f"INFO: Created a NodeSynonymizer database with\n  {len(synonymizer.kg_map['kg_nodes'])} nodes\n  {len(synonymizer.kg_map['kg_unique_concepts'])} unique concepts\n" +
-            f"  {len(synonymizer.kg_map['kg_curies'])} curies\n  {len(synonymizer.kg_map['kg_names'])} names and abbreviations\n" +
-            f"  {len(synonymizer.kg_map['kg_name_curies'])} name to curie provenance associations")
-        print(f"INFO: Processing complete. Freeing all the memory seems to still take a while though")
+        counts = builder.get_counts()
+        print(f"INFO: Created a NodeSynonymizer database with\n" + "\n".join([ f"  {count} {entity_type}" for entity_type, count in counts.items() ]))
 
     # If requested, run the test examples
     if args.test:
@@ -14,21 +14,124 @@ import time
 import pickle
 import re
 import platform
+import sqlite3
+import asyncio
 
+import aiohttp
 import requests
 import requests_cache
 
 
 BASE_URL = 'https://nodenormalization-sri.renci.org/1.2'
 
+# Marks a curie that is not in the cache (as opposed to one cached as having no normalizer result)
+_NOT_CACHED = object()
+
+
+# Class that holds the local cache of SRI Node normalizer results
+class SriNodeNormalizerCache:
+    """
+    A sqlite table of normalizer results keyed by (normalizer) curie, each stored as JSON, or NULL if the normalizer
+    has nothing for the curie. Results are added incrementally as they are fetched, so an interrupted fill loses
+    nothing and a rerun fetches only the curies that are still missing. Each result is stored with the time it was
+    fetched, and the cache records which normalizer (base URL) it was filled from, so that before a fill the results
+    from another normalizer or older than max_age can be dropped and fetched again. Each process opens its own
+    connection, so a cache may be used by forked workers.
+    """
+
+    filename = 'sri_node_normalizer_curie_cache.sqlite'
+    max_sql_variables = 900
+    max_age = 30 * 24 * 3600  # Seconds
+
+    def __init__(self, filename=None):
+        if filename is not None:
+            self.filename = filename
+        self._connection = None
+        self._connection_pid = None
+
+    def __contains__(self, curie):
+        return self.get(curie, _NOT_CACHED) is not _NOT_CACHED
+
+    def __getitem__(self, curie):
+        result = self.get(curie, _NOT_CACHED)
+        if result is _NOT_CACHED:
+            raise KeyError(curie)
+        return result
+
+    def __len__(self):
+        return self._get_connection().execute("SELECT COUNT(*) FROM normalizer_results").fetchone()[0]
+
+    def get(self, curie, default=None):
+        row = self._get_connection().execute("SELECT result FROM normalizer_results WHERE curie = ?", (curie,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0]) if row[0] is not None else None
+
+    # Return those of the curies that are not in the cache yet
+    def get_missing_curies(self, curies):
+        connection = self._get_connection()
+        missing_curies = []
+        for start in range(0, len(curies), self.max_sql_variables):
+            batch = curies[start:start + self.max_sql_variables]
+            cached_curies = { row[0] for row in connection.execute(f"SELECT curie FROM normalizer_results WHERE curie IN ({','.join('?' * len(batch))})", batch) }
+            missing_curies.extend(curie for curie in batch if curie not in cached_curies)
+        return missing_curies
+
+    # Add (or replace) the results for these curies, as fetched at the given time (default now)
+    def put_many(self, results, fetched_at=None):
+        if fetched_at is None:
+            fetched_at = time.time()
+        connection = self._get_connection()
+        connection.executemany("INSERT OR REPLACE INTO normalizer_results (curie, result, fetched_at) VALUES (?,?,?)",
+            ( (curie, json.dumps(result) if result is not None else None, fetched_at) for curie, result in results.items() ))
+        connection.commit()
+
+    # Drop all the results if the cache was filled from another normalizer, else those older than max_age seconds,
+    # and record that the cache is now filled from base_url. Returns the number of results dropped
+    def invalidate(self, base_url, max_age=None):
+        if max_age is None:
+            max_age = self.max_age
+        connection = self._get_connection()
+        row = connection.execute("SELECT value FROM cache_properties WHERE name = 'base_url'").fetchone()
+        if row is not None and row[0] != base_url:
+            n_dropped = connection.execute("DELETE FROM normalizer_results").rowcount
+        else:
+            n_dropped = connection.execute("DELETE FROM normalizer_results WHERE fetched_at IS NULL OR fetched_at < ?",
+                                           (time.time() - max_age,)).rowcount
+        connection.execute("INSERT OR REPLACE INTO cache_properties (name, value) VALUES ('base_url', ?)", (base_url,))
+        connection.commit()
+        return n_dropped
+
+    def _get_connection(self):
+        if self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(self.filename)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS normalizer_results ( curie TEXT PRIMARY KEY, result TEXT, fetched_at REAL )")
+            # A cache from before results were timestamped gets the column, and its results count as stale
+            column_names = [ row[1] for row in self._connection.execute("PRAGMA table_info(normalizer_results)") ]
+            if 'fetched_at' not in column_names:
+                self._connection.execute("ALTER TABLE normalizer_results ADD COLUMN fetched_at REAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS cache_properties ( name TEXT PRIMARY KEY, value TEXT )")
+            self._connection_pid = os.getpid()
+        return self._connection
+
+
 # Class that provides a simple interface to the SRI Node normalizer
 class SriNodeNormalizer:
 
+    # Settings for fill_cache(): curies per request, concurrent requests, retries of a failed request, and the age
+    # (in seconds) after which a cached result is fetched again
+    batch_size = 1000
+    max_concurrent_requests = 8
+    max_retries = 3
+    retry_delay = 5
+    request_timeout = 300
+    cache_max_age = SriNodeNormalizerCache.max_age
 
     # Constructor
-    def __init__(self):
+    def __init__(self, base_url=None):
         requests_cache.install_cache('sri_node_normalizer_requests_cache')
 
+        self.base_url = base_url if base_url is not None else BASE_URL
         self.supported_types = None
         self.supported_prefixes = None
         self.cache = {}
@@ -48,137 +151,138 @@ class SriNodeNormalizer:
 
 
     # ############################################################################################
-    # Store the cache of all normalizer results
+    # Store any results that were fetched one at a time (results from fill_cache() are stored as they arrive)
     def store_cache(self):
-        if self.cache is None:
+        if self.cache is None or isinstance(self.cache, SriNodeNormalizerCache) or len(self.cache) == 0:
             return
-        filename = f"sri_node_normalizer_curie_cache.pickle"
-        print(f"INFO: Storing SRI normalizer cache to {filename}")
-        with open(filename, "wb") as outfile:
-            pickle.dump(self.cache, outfile)
+        cache = SriNodeNormalizerCache()
+        print(f"INFO: Storing {len(self.cache)} SRI normalizer results to {cache.filename}")
+        cache.put_many(self.cache)
 
 
     # ############################################################################################
-    # Load the cache of all normalizer results
+    # Switch to the local cache of all normalizer results, converting the old pickled cache if it is all there is
     def load_cache(self):
-        filename = f"sri_node_normalizer_curie_cache.pickle"
-        if os.path.exists(filename):
-            print(f"INFO: Reading SRI normalizer cache from {filename}")
-            with open(filename, "rb") as infile:
-                self.cache = pickle.load(infile)
+        cache = SriNodeNormalizerCache()
+        legacy_filename = f"sri_node_normalizer_curie_cache.pickle"
+        if not os.path.exists(cache.filename) and os.path.exists(legacy_filename):
+            print(f"INFO: Converting SRI normalizer cache {legacy_filename} to {cache.filename}")
+            with open(legacy_filename, "rb") as infile:
+                cache.put_many(pickle.load(infile), fetched_at=os.path.getmtime(legacy_filename))
+        if os.path.exists(cache.filename):
+            print(f"INFO: Using SRI normalizer cache {cache.filename}")
         else:
-            print(f"INFO: SRI node normalizer cache {filename} does not yet exist. Need to fill it.")
+            print(f"INFO: SRI node normalizer cache {cache.filename} does not yet exist. Need to fill it.")
+        self.cache = cache
 
 
     # ############################################################################################
-    # Fill the cache with KG nodes
+    # Fill the cache with the normalizer results for all KG nodes that aren't in it yet
     def fill_cache(self):
 
         # Get a hash of curie prefixes supported
-        self.get_supported_prefixes()
+        if self.get_supported_prefixes() is None:
+            return
+        if not isinstance(self.cache, SriNodeNormalizerCache):
+            self.load_cache()
+        n_dropped = self.cache.invalidate(self.base_url, self.cache_max_age)
+        if n_dropped > 0:
+            print(f"INFO: Dropped {n_dropped} cached results that were from another normalizer or older than {self.cache_max_age / 86400:g} days")
 
         filename = 'kg2_node_info.tsv'
-        filesize = os.path.getsize(filename)
-
-        # Correction for Windows line endings
-        extra_bytes = 0
-        fh = open(filename, 'rb')
-        if platform.system() == 'Windows' and b'\r\n' in fh.read():
-            print('WARNING: Windows line ending requires bytes_read compenstation')
-            extra_bytes = 1
-        fh.close()
-
-        # Open the file and read in the curies
-        fh = open(filename, 'r', encoding="latin-1", errors="replace")
         print(f"INFO: Reading {filename} to pre-fill the normalizer cache")
-        previous_percentage = -1
+        curies = {}
         line_counter = 0
-        supported_curies = 0
-        bytes_read = 0
-
-        # Create dicts to hold all the information
-        batch = []
-
-        # Loop over each line in the file
-        for line in fh:
-            bytes_read += len(line) + extra_bytes
-
-            match = re.match(r'^\s*$',line)
-            if match:
-                continue
-            columns = line.strip().split("\t")
-            node_curie = columns[0]
-
-            curie_prefix = node_curie.split(':')[0]
-
-            # If we use different curie prefixes than the normalizer, need to fix
-            normalizer_curie_prefix = curie_prefix
-            normalizer_node_curie = node_curie
-            if curie_prefix in self.curie_prefix_tx_arax2sri:
-                normalizer_curie_prefix = self.curie_prefix_tx_arax2sri[curie_prefix]
-                normalizer_node_curie = re.sub(curie_prefix,normalizer_curie_prefix,node_curie)
-
-            # Decide if we want to keep this curie in the batch of things to look up
-            # By default, no
-            keep = 0
-            # If this is a curie prefix that is supported by the normalizer, then yes
-            if normalizer_curie_prefix in self.supported_prefixes:
-                keep = 1
-            # Unless it's already in the cache, then no
-            if normalizer_node_curie in self.cache:
-                keep = 0
-            # Or if we've reached the end of the file, then set keep to 99 and trigger end-of-file processing of the last batch
-            if bytes_read + 3 > filesize and len(batch) > 0:
-                keep = 99
-
-            # If we want to put this curie in the batch, or drain the batch at end-of-file
-            if keep:
-
-                if keep == 1:
-                    supported_curies += 1
-                    batch.append(normalizer_node_curie)
-
-                if len(batch) > 1000 or keep == 99:
-                    if bytes_read + 3 > filesize:
-                        print("Drain final batch")
-                    results = self.get_node_normalizer_results(batch)
-                    print(".", end='', flush=True)
-                    for curie in batch:
-                        if curie in self.cache:
-                            continue
-                        curie_prefix = curie.split(':')[0]
-                        if curie_prefix not in self.stats:
-                            self.stats[curie_prefix] = { 'found': 0, 'not found': 0, 'total': 0 }
-                        if results is None or curie not in results or results[curie] is  None:
-                            self.cache[curie] = None
-                            self.stats[curie_prefix]['not found'] += 1
-                        else:
-                            self.cache[curie] = results[curie]
-                            self.stats[curie_prefix]['found'] += 1
-                        self.stats[curie_prefix]['total'] += 1
-
-                    # Clear the batch list
-                    batch = []
-
-            # Print out some progress information
-            line_counter += 1
-            percentage = int(bytes_read*100.0/filesize)
-            if percentage > previous_percentage:
-                previous_percentage = percentage
-                print(str(percentage)+"%..", end='', flush=True)
+        with open(filename, 'r', encoding="latin-1", errors="replace") as fh:
+            for line in fh:
+                line_counter += 1
+                node_curie = line.split("\t", 1)[0].strip()
+                if node_curie == '':
+                    continue
+                curie_prefix = node_curie.split(':')[0]
+
+                # If we use different curie prefixes than the normalizer, need to fix
+                normalizer_curie_prefix = curie_prefix
+                normalizer_node_curie = node_curie
+                if curie_prefix in self.curie_prefix_tx_arax2sri:
+                    normalizer_curie_prefix = self.curie_prefix_tx_arax2sri[curie_prefix]
+                    normalizer_node_curie = re.sub(curie_prefix,normalizer_curie_prefix,node_curie)
+
+                # Keep this curie if it is a curie prefix that is supported by the normalizer
+                if normalizer_curie_prefix in self.supported_prefixes:
+                    curies[normalizer_node_curie] = True
+
+        missing_curies = self.cache.get_missing_curies(list(curies))
+        print(f"{line_counter} lines read")
+        print(f"{len(curies)} curies with prefixes supported by the SRI normalizer, of which {len(missing_curies)} are not yet cached")
 
-        # Close and summarize
-        fh.close()
+        t0 = time.time()
+        n_failed = asyncio.run(self._fill_cache_async(missing_curies))
         print("")
-        print(f"{line_counter} lines read")
-        print(f"{bytes_read} bytes read of {filesize} bytes in file")
-        print(f"{supported_curies} curies with prefixes supported by the SRI normalizer")
+        print(f"INFO: Fetched normalizer results for {len(missing_curies) - n_failed} curies in {time.time() - t0:.1f} seconds")
+        if n_failed > 0:
+            print(f"WARNING: Unable to fetch normalizer results for {n_failed} curies. Run the fill again to retry them")
 
         print("Build stats:")
         print(json.dumps(self.stats, indent=2, sort_keys=True))
 
-        # Store or sync the results
-        self.store_cache()
+
+    # ############################################################################################
+    # Fetch the curies in batches, a few batches at a time, storing each batch's results as soon as they arrive.
+    # Returns the number of curies that could not be fetched
+    async def _fill_cache_async(self, curies):
+
+        batches = [ curies[start:start + self.batch_size] for start in range(0, len(curies), self.batch_size) ]
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        n_failed = 0
+        previous_percentage = -1
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            tasks = [ self._fetch_batch(session, semaphore, batch) for batch in batches ]
+            for i_batch, task in enumerate(asyncio.as_completed(tasks)):
+                batch, results = await task
+                if results is None:
+                    n_failed += len(batch)
+                else:
+                    batch_results = { curie: results.get(curie) for curie in batch }
+                    self.cache.put_many(batch_results)
+                    for curie, result in batch_results.items():
+                        curie_prefix = curie.split(':')[0]
+                        if curie_prefix not in self.stats:
+                            self.stats[curie_prefix] = { 'found': 0, 'not found': 0, 'total': 0 }
+                        self.stats[curie_prefix]['found' if result is not None else 'not found'] += 1
+                        self.stats[curie_prefix]['total'] += 1
+                percentage = int((i_batch + 1) * 100.0 / len(batches))
+                if percentage > previous_percentage:
+                    previous_percentage = percentage
+                    print(str(percentage)+"%..", end='', flush=True)
+        return n_failed
+
+
+    # ############################################################################################
+    # POST one batch of curies to the normalizer, retrying with increasing delays. Returns the batch and the results
+    # dict (empty if the normalizer has nothing for any of them), or None for the results if every attempt failed
+    async def _fetch_batch(self, session, semaphore, batch):
+
+        async with semaphore:
+            url = f"{self.base_url}/get_normalized_nodes"
+            sleep_time = self.retry_delay
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with session.post(url, json={ 'curies': batch }, headers={'accept': 'application/json'}) as response:
+                        if response.status == 404:
+                            return batch, {}
+                        if response.status == 200:
+                            return batch, await response.json()
+                        error = f"status {response.status}"
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exception:
+                    error = f"{type(exception).__name__}: {exception}"
+                if attempt < self.max_retries:
+                    eprint(f"WARNING: Request to SRI normalizer for {len(batch)} curies failed ({error}). Trying again after {sleep_time} seconds")
+                    await asyncio.sleep(sleep_time)
+                    sleep_time *= 4
+        eprint(f"ERROR: Giving up on {len(batch)} curies starting with {batch[0]} after {self.max_retries + 1} attempts ({error})")
+        return batch, None
 
 
     # ############################################################################################
@@ -190,7 +294,7 @@ class SriNodeNormalizer:
             return self.supported_types
 
         # Build the URL and fetch the result
-        url = f"{BASE_URL}/get_semantic_types"
+        url = f"{self.base_url}/get_semantic_types"
         response_content = requests.get(url, headers={'accept': 'application/json'})
         status_code = response_content.status_code
 
@@ -232,7 +336,7 @@ class SriNodeNormalizer:
         supported_prefixes = {}
 
         # Build the URL and fetch the result
-        url = f"{BASE_URL}/get_curie_prefixes"
+        url = f"{self.base_url}/get_curie_prefixes"
         response_content = requests.get(url, headers={'accept': 'application/json'})
         status_code = response_content.status_code
 
@@ -263,17 +367,17 @@ class SriNodeNormalizer:
 
         if isinstance(curies,str):
             #print(f"INFO: Looking for curie {curies}")
-            if curies in self.cache:
+            result = self.cache.get(curies, _NOT_CACHED)
+            if result is not _NOT_CACHED:
                 #print(f"INFO: Using prefill cache for lookup on {curies}")
-                result = { curies: self.cache[curies] }
-                return result
+                return { curies: result }
             curies = [ curies ]
 
         if cache_only is not None:
             print(f"ERROR: Call to sri_node_normalizer requested cache_only and we missed the cache with {curies}")
 
         # Build the URL and fetch the result
-        url = f"{BASE_URL}/get_normalized_nodes?"
+        url = f"{self.base_url}/get_normalized_nodes?"
 
         prefix = ''
         for curie in curies:
@@ -413,13 +517,21 @@ def main():
                         help="If set, list the SRI Node Normalizer supported prefixes", default=None)
     parser.add_argument('-t', '--types', action="store_true",
                         help="If set, list the SRI Node Normalizer supported types", default=None)
+    parser.add_argument('-u', '--base_url', action="store",
+                        help="Specify the base URL of the SRI Node Normalizer (e.g., of a local instance)", default=BASE_URL)
+    parser.add_argument('-n', '--concurrency', action="store", type=int,
+                        help="Number of requests to have in flight at once while building the cache", default=SriNodeNormalizer.max_concurrent_requests)
+    parser.add_argument('-a', '--max_age', action="store", type=float,
+                        help="Age in days after which a cached result is fetched again while building the cache", default=SriNodeNormalizer.cache_max_age / 86400)
     args = parser.parse_args()
 
     if not args.build and not args.curie and not args.prefixes and not args.types:
         parser.print_help()
         sys.exit(2)
 
-    normalizer = SriNodeNormalizer()
+    normalizer = SriNodeNormalizer(base_url=args.base_url)
+    normalizer.max_concurrent_requests = args.concurrency
+    normalizer.cache_max_age = args.max_age * 86400
 
     if args.prefixes:
         supported_prefixes = normalizer.get_supported_prefixes()
@@ -433,7 +545,7 @@ def main():
 
     if args.build:
         print("INFO: Beginning SRI Node Normalizer cache building process for KG2. Make sure you have a good network connection as this will download ~2 GB of data.")
-        print("INFO: Note that requests-cache is used, so the sri_node_normalizer_requests_cache.sqlite file should be deleted first if it might be stale.")
+        print(f"INFO: Only curies not already in {SriNodeNormalizerCache.filename} are fetched, after dropping results that are from another normalizer or older than {args.max_age:g} days.")
         normalizer.fill_cache()
         normalizer.store_cache()
         print("INFO: Build process complete")
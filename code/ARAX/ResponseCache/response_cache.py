@@ -19,7 +19,6 @@ import requests
 import requests_cache
 from flask import Flask,redirect
 
-import boto3
 import timeit
 
 import sqlalchemy
@@ -37,11 +36,15 @@ from jsonschema.exceptions import ValidationError
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../..")
 from RTXConfiguration import RTXConfiguration
 from ARAX_attribute_parser import ARAXAttributeParser
+from response_storage import S3ResponseStorage, FilesystemResponseStorage, ResponsePersistenceQueue, encode_response, decode_response
+from response_read_cache import ResponseReadCache
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.response import Response as Envelope
 
 trapi_version = '1.2.0'
+responses_directory = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'
+pending_responses_directory = responses_directory + '/pending'
 
 
 Base = declarative_base()
@@ -61,8 +64,9 @@ class Response(Base):
 class ResponseCache:
 
     #### Constructor
-    def __init__(self):
+    def __init__(self, storages=None):
         self.rtxConfig = RTXConfiguration()
+        self.storages = storages
         self.databaseName = "ResponseCache"
         self.engine_type = 'sqlite'
         if self.rtxConfig.is_production_server:
@@ -187,10 +191,10 @@ class ResponseCache:
             session.flush()
             session.commit()
             response_id = stored_response.response_id
-            response_filename = f"/responses/{response_id}.json"
+            storage_id = response_id
         except:
             response.error(f"Unable to store response record in MySQL", error_code="InternalError")
-            response_filename = f"/responses/error.json"
+            storage_id = 'error'
             response_id = 0
 
         servername = 'localhost'
@@ -198,51 +202,28 @@ class ResponseCache:
             servername = 'arax.ncats.io'
         envelope.id = f"https://{servername}/api/arax/v1.2/response/{response_id}"
 
-        #### New system to store the responses in an S3 bucket
-        rtx_config = RTXConfiguration()
-        KEY_ID = rtx_config.config["Global"]['s3']['access']
-        ACCESS_KEY = rtx_config.config["Global"]['s3']['secret']
-        succeeded_to_s3 = False
+        #### Serialize, compress, and store the response JSON in the background (in S3, or on the filesystem if that fails)
+        response.debug(f"Queueing response JSON for storage")
+        ResponsePersistenceQueue.submit(storage_id, envelope.to_dict(), self.get_storages(), pending_directory=pending_responses_directory)
 
-        try:
-            response.debug(f"Writing response JSON to S3 bucket")
-            s3 = boto3.resource(
-                's3',
-                region_name='us-west-2',
-                aws_access_key_id=KEY_ID,
-                aws_secret_access_key=ACCESS_KEY
-            )
-            serialized_query_graph = json.dumps(envelope.to_dict(), sort_keys=True, indent=2)
-            t0 = timeit.default_timer()
-            s3.Object('arax-response-storage', response_filename).put(Body=serialized_query_graph)
-            t1 = timeit.default_timer()
-            print("Elapsed time: "+str(t1-t0))
-            response.debug(f"Wrote {response_filename} in {t1-t0} seconds")
-            succeeded_to_s3 = True
+        return stored_response.response_id
 
-        except:
-            response.error(f"Unable to store response in S3 bucket as {response_filename}", error_code="InternalError")
 
+    ##################################################################################################
+    #### Get the places where response JSON is stored, in order of preference
+    def get_storages(self):
+        if self.storages is None:
+            s3_config = self.rtxConfig.config["Global"]['s3']
+            self.storages = [ S3ResponseStorage(s3_config['access'], s3_config['secret'], endpoint_url=s3_config.get('endpoint_url')),
+                FilesystemResponseStorage(responses_directory) ]
+        return self.storages
 
-        #### if the S3 write failed, store it as a JSON file on the filesystem
-        if not succeeded_to_s3:
-            response_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'
-            if not os.path.exists(response_dir):
-                try:
-                    os.mkdir(response_dir)
-                except:
-                    eprint(f"ERROR: Unable to create dir {response_dir}")
 
-            if os.path.exists(response_dir):
-                response_filename = f"{stored_response.response_id}.json"
-                response_path = f"{response_dir}/{response_filename}"
-                try:
-                    with open(response_path, 'w') as outfile:
-                        json.dump(envelope.to_dict(), outfile, sort_keys=True, indent=2)
-                except:
-                    eprint(f"ERROR: Unable to write response to file {response_path}")
-
-        return stored_response.response_id
+    ##################################################################################################
+    #### Wait for any responses that are still being stored in the background (call before exiting a query process)
+    @staticmethod
+    def wait_for_pending_responses():
+        ResponsePersistenceQueue.wait_until_done()
 
 
     ##################################################################################################
@@ -262,61 +243,49 @@ class ResponseCache:
             stored_response = session.query(Response).filter(Response.response_id==int(response_id)).first()
             if stored_response is not None:
 
-                found_response_locally = False
-                response_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'
-                response_filename = f"{stored_response.response_id}.json"
-                response_path = f"{response_dir}/{response_filename}"
-                try:
-                    with open(response_path) as infile:
-                        envelope = json.load(infile)
-                    found_response_locally = True
-                except:
-                    eprint(f"ERROR: Unable to read response from file '{response_path}'. Will now try S3")
-
-                #### If the file wasn't local, try it in S3
-                if not found_response_locally:
-                    rtx_config = RTXConfiguration()
-                    KEY_ID = rtx_config.config["Global"]['s3']['access']
-                    ACCESS_KEY = rtx_config.config["Global"]['s3']['secret']
+                #### If the query that made it is still storing it (perhaps in another process), wait for that to finish
+                ResponsePersistenceQueue.wait_until_stored(stored_response.response_id, pending_responses_directory)
 
+                #### Look for it on the filesystem first and then in S3, reusing a recently fetched copy if it is still current
+                envelope = None
+                for storage in reversed(self.get_storages()):
                     try:
-                        s3 = boto3.resource(
-                            's3',
-                            region_name='us-west-2',
-                            aws_access_key_id=KEY_ID,
-                            aws_secret_access_key=ACCESS_KEY
-                        )
-
-                        response_filename = f"/responses/{response_id}.json"
-                        eprint(f"INFO: Attempting to read {response_filename} from S3")
                         t0 = timeit.default_timer()
+                        stored_content = ResponseReadCache.get_stored_content(storage, stored_response.response_id)
+                        if stored_content is None:
+                            continue
+                        content, cache_key = stored_content
+                        envelope = decode_response(content)
+                        eprint(f"INFO: Successfully read response {response_id} from {storage} in {timeit.default_timer()-t0} seconds")
+                        break
+                    except Exception as error:
+                        eprint(f"ERROR: Unable to read response {response_id} from {storage}: {error}")
+                if envelope is None:
+                    return( { "status": 404, "title": "Response not found", "detail": "There is no response corresponding to response_id="+str(response_id), "type": "about:blank" }, 404)
 
-                        content = s3.Object('arax-response-storage', response_filename).get()["Body"].read()
-                        envelope = json.loads(content)
-                        t1 = timeit.default_timer()
-                        print("Elapsed time: "+str(t1-t0))
-                        eprint(f"INFO: Successfully read {response_filename} from S3 in {t1-t0} seconds")
-
-                    except:
-                        eprint(f"ERROR: Unable to read {response_filename} from S3")
-                        return( { "status": 404, "title": "Response not found", "detail": "There is no response corresponding to response_id="+str(response_id), "type": "about:blank" }, 404)
 
+                #### Perform a validation on it (or reuse the result of validating this same content before)
+                is_memoized, validation_error = ResponseReadCache.get_validation_result(cache_key, trapi_version)
+                if not is_memoized:
+                    try:
+                        validate(envelope,'Response',trapi_version)
+                        validation_error = None
+                    except ValidationError as error:
+                        validation_error = str(error)
+                    ResponseReadCache.set_validation_result(cache_key, trapi_version, validation_error)
 
-                #### Perform a validation on it
-                try:
-                    validate(envelope,'Response',trapi_version)
+                if validation_error is None:
                     if 'description' not in envelope or envelope['description'] is None:
                         envelope['description'] = 'reasoner-validator: PASS'
-
-                except ValidationError as error:
+                else:
                     timestamp = str(datetime.now().isoformat())
                     if 'logs' not in envelope or envelope['logs'] is None:
                         envelope['logs'] = []
-                    envelope['logs'].append( { "code": 'InvalidTRAPI', "level": "ERROR", "message": "TRAPI validator reported an error: " + str(error),
+                    envelope['logs'].append( { "code": 'InvalidTRAPI', "level": "ERROR", "message": "TRAPI validator reported an error: " + validation_error,
                         "timestamp": timestamp } )
                     if 'description' not in envelope or envelope['description'] is None:
                         envelope['description'] = ''
-                    envelope['description'] = 'ERROR: TRAPI validator reported an error: ' + str(error) + ' --- ' + envelope['description']
+                    envelope['description'] = 'ERROR: TRAPI validator reported an error: ' + validation_error + ' --- ' + envelope['description']
                 return envelope
 
             else:
@@ -324,6 +293,14 @@ class ResponseCache:
 
         #### Otherwise, see if it is an ARS style response_id
         if len(response_id) > 30:
+
+            #### A finished ARS response does not change, so if it was fetched and processed (validated against this same
+            #### TRAPI version) recently, return that
+            ars_cache_key = f"ARS/{response_id}/TRAPI {trapi_version}"
+            cached_entry = ResponseReadCache.get(ars_cache_key)
+            if cached_entry is not None:
+                return decode_response(cached_entry[0])
+
             ars_hosts = [ 'ars.transltr.io', 'ars-dev.transltr.io', 'ars.ci.transltr.io' ]
             for ars_host in ars_hosts:
                 with requests_cache.disabled():
@@ -478,6 +455,8 @@ class ResponseCache:
                     attribute_parser = ARAXAttributeParser(envelope,envelope['message'])
                     envelope['validation_result']['provenance_summary'] = attribute_parser.summarize_provenance_info()
 
+                if str(response_dict['fields'].get('status')) in [ 'Done', 'Error' ]:
+                    ResponseReadCache.put(ars_cache_key, encode_response(envelope), { 'size': len(response_content.content) })
 
                 return envelope
             return( { "status": 404, "title": "Cannot find Response (in 'fields' and 'data') in ARS response packet", "detail": "Cannot decode ARS response_id="+str(response_id)+" to a Translator Response", "type": "about:blank" }, 404)
@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+# This class keeps recently fetched responses close at hand so that re-fetching the same response id is fast
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResponseReadCache:
+    """
+    Entries are keyed by where a response came from (e.g., 'S3 bucket arax-response-storage/1234') and hold its
+    stored (gzipped) content plus a small metadata dict: the ETag and size it had at its source, which are compared
+    with the source's current ETag/size before an entry is used, and memoized TRAPI validation results per TRAPI
+    version. A per-process LRU of compressed content sits in front of a size-bounded local directory shared by all
+    processes (query processes are forked, so their in-memory entries don't outlive the query); responses from a local
+    storage are only kept in memory, since they are already on disk. Content is decoded afresh by the caller on every
+    hit, so callers may modify what they get.
+    """
+
+    enabled = True
+    memory_cache_size = 256 * 2 ** 20  # Bytes of compressed content to keep in memory per process
+    disk_cache_size = 4 * 2 ** 30  # Bytes of compressed content to keep on disk
+    cache_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/response_read_cache'
+    _memory_cache = OrderedDict()
+    _memory_cache_bytes = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, cache_key, etag=None, size=None):
+        """
+        Returns (content, metadata) for the entry, or None if there isn't one or it doesn't match the given ETag/size
+        (when given)
+        """
+        if not cls.enabled:
+            return None
+        entry = cls._get_from_memory(cache_key)
+        if entry is None:
+            entry = cls._get_from_disk(cache_key)
+            if entry is None:
+                return None
+            cls._add_to_memory(cache_key, entry)
+        content, metadata = entry
+        if (etag is not None and metadata.get('etag') != etag) or (size is not None and metadata.get('size') != size):
+            return None
+        return content, metadata
+
+    @classmethod
+    def get_stored_content(cls, storage, response_id):
+        """
+        Returns (content, cache key) for the response in this storage (an S3ResponseStorage, FilesystemResponseStorage
+        or the like), reusing the cached content if it still has the storage's ETag and size, or None if the storage
+        doesn't have the response
+        """
+        stored_info = storage.head(response_id)
+        if stored_info is None:
+            return None
+        cache_key = f"{storage}/{response_id}"
+        cached_entry = cls.get(cache_key, etag=stored_info['etag'], size=stored_info['size'])
+        if cached_entry is not None:
+            return cached_entry[0], cache_key
+        content = storage.get(response_id)
+        if content is None:
+            return None
+        cls.put(cache_key, content, stored_info, use_disk=not getattr(storage, 'is_local', False))
+        return content, cache_key
+
+    @classmethod
+    def put(cls, cache_key, content, metadata, use_disk=True):
+        if not cls.enabled:
+            return
+        metadata = dict(metadata)
+        metadata.setdefault('validation', dict())
+        cls._add_to_memory(cache_key, (content, metadata))
+        if not use_disk:
+            return
+        content_path, metadata_path = cls._get_paths(cache_key)
+        try:
+            os.makedirs(cls.cache_dir, exist_ok=True)
+            cls._write_atomically(content_path, content)
+            cls._write_atomically(metadata_path, json.dumps(metadata).encode('utf-8'))
+            cls._prune_disk()
+        except OSError:
+            pass  # The disk tier is best-effort
+
+    @classmethod
+    def get_validation_result(cls, cache_key, trapi_version):
+        """
+        Returns (True, result) if validation against this TRAPI version has been memoized for the entry (the result
+        being None if it passed or the validator's error message if not), otherwise (False, None)
+        """
+        entry = cls.get(cache_key)
+        if entry is None or trapi_version not in entry[1].get('validation', dict()):
+            return False, None
+        return True, entry[1]['validation'][trapi_version]
+
+    @classmethod
+    def set_validation_result(cls, cache_key, trapi_version, result):
+        entry = cls.get(cache_key)
+        if entry is None:
+            return
+        content, metadata = entry
+        metadata = {**metadata, 'validation': {**metadata.get('validation', dict()), trapi_version: result}}
+        cls._add_to_memory(cache_key, (content, metadata))
+        content_path, metadata_path = cls._get_paths(cache_key)
+        if not os.path.exists(content_path):
+            return  # Kept only in memory
+        try:
+            cls._write_atomically(metadata_path, json.dumps(metadata).encode('utf-8'))
+        except OSError:
+            pass
+
+    @classmethod
+    def _get_paths(cls, cache_key):
+        file_stem = f"{cls.cache_dir}/{hashlib.sha256(cache_key.encode('utf-8')).hexdigest()}"
+        return f"{file_stem}.json.gz", f"{file_stem}.meta.json"
+
+    @classmethod
+    def _get_from_memory(cls, cache_key):
+        with cls._lock:
+            entry = cls._memory_cache.get(cache_key)
+            if entry is not None:
+                cls._memory_cache.move_to_end(cache_key)
+            return entry
+
+    @classmethod
+    def _add_to_memory(cls, cache_key, entry):
+        entry_size = len(entry[0])
+        if entry_size > cls.memory_cache_size:
+            return
+        with cls._lock:
+            if cache_key in cls._memory_cache:
+                cls._memory_cache_bytes -= len(cls._memory_cache.pop(cache_key)[0])
+            cls._memory_cache[cache_key] = entry
+            cls._memory_cache_bytes += entry_size
+            while cls._memory_cache_bytes > cls.memory_cache_size:
+                _, (evicted_content, _) = cls._memory_cache.popitem(last=False)
+                cls._memory_cache_bytes -= len(evicted_content)
+
+    @classmethod
+    def _get_from_disk(cls, cache_key):
+        content_path, metadata_path = cls._get_paths(cache_key)
+        try:
+            with open(metadata_path, 'r') as infile:
+                metadata = json.load(infile)
+            with open(content_path, 'rb') as infile:
+                content = infile.read()
+            os.utime(content_path)  # Mark it as recently used
+        except (OSError, ValueError):
+            return None
+        return content, metadata
+
+    @staticmethod
+    def _write_atomically(file_path, content):
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as outfile:
+            outfile.write(content)
+        os.replace(temp_path, file_path)
+
+    @classmethod
+    def _prune_disk(cls):
+        # Removes the least recently used entries once the directory holds more than disk_cache_size bytes
+        content_files = []
+        for file_name in os.listdir(cls.cache_dir):
+            if file_name.endswith('.json.gz'):
+                try:
+                    file_stat = os.stat(f"{cls.cache_dir}/{file_name}")
+                except OSError:
+                    continue
+                content_files.append((file_stat.st_mtime, file_stat.st_size, file_name))
+        total_size = sum(file_size for _, file_size, _ in content_files)
+        for _, file_size, file_name in sorted(content_files):
+            if total_size <= cls.disk_cache_size:
+                break
+            file_stem = f"{cls.cache_dir}/{file_name[:-len('.json.gz')]}"
+            for file_path in [f"{file_stem}.json.gz", f"{file_stem}.meta.json"]:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+            total_size -= file_size
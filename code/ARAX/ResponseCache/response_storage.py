@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+# Places to keep stored response JSON (an S3 bucket or a local directory) and a background queue that writes to them
+import sys
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+import os
+import gzip
+import json
+import queue
+import atexit
+import threading
+import time
+import timeit
+
+import boto3
+
+
+def encode_response(envelope_dict):
+    """
+    Serializes a response envelope as compact, gzipped JSON (a large KG compresses ~10x)
+    """
+    return gzip.compress(json.dumps(envelope_dict, separators=(',', ':')).encode('utf-8'), compresslevel=6)
+
+
+def decode_response(content):
+    """
+    Parses stored response content, which may be gzipped (current format) or plain JSON (older responses)
+    """
+    if content[:2] == b'\x1f\x8b':
+        content = gzip.decompress(content)
+    return json.loads(content)
+
+
+class S3ResponseStorage:
+    """
+    Responses stored in an S3 bucket (or any S3-compatible object store, given its endpoint_url). One client is made
+    per process and reused for every request.
+    """
+    bucket_name = 'arax-response-storage'
+    region_name = 'us-west-2'
+    is_local = False
+    _clients = dict()
+    _clients_lock = threading.Lock()
+
+    def __init__(self, key_id, access_key, bucket_name=None, endpoint_url=None):
+        self.key_id = key_id
+        self.access_key = access_key
+        self.bucket_name = bucket_name if bucket_name else S3ResponseStorage.bucket_name
+        self.endpoint_url = endpoint_url
+
+    def __str__(self):
+        return f"S3 bucket {self.bucket_name}"
+
+    def put(self, response_id, content):
+        self._get_client().put_object(Bucket=self.bucket_name, Key=self._get_key(response_id), Body=content,
+                                      ContentType='application/json', ContentEncoding='gzip')
+
+    def get(self, response_id):
+        """
+        Returns the stored content for this response, or None if there is none
+        """
+        client = self._get_client()
+        try:
+            return client.get_object(Bucket=self.bucket_name, Key=self._get_key(response_id))["Body"].read()
+        except client.exceptions.NoSuchKey:
+            return None
+
+    def head(self, response_id):
+        """
+        Returns the ETag and size of the stored content for this response, or None if there is none
+        """
+        client = self._get_client()
+        try:
+            metadata = client.head_object(Bucket=self.bucket_name, Key=self._get_key(response_id))
+        except client.exceptions.ClientError as error:
+            if error.response.get('Error', dict()).get('Code') in ('404', 'NoSuchKey'):
+                return None
+            raise
+        return {'etag': metadata['ETag'], 'size': metadata['ContentLength']}
+
+    @staticmethod
+    def _get_key(response_id):
+        return f"/responses/{response_id}.json"
+
+    def _get_client(self):
+        # boto3 clients can't be shared across a fork, so each process gets its own
+        client_key = (os.getpid(), self.key_id, self.endpoint_url)
+        with S3ResponseStorage._clients_lock:
+            if client_key not in S3ResponseStorage._clients:
+                S3ResponseStorage._clients = {key: client for key, client in S3ResponseStorage._clients.items()
+                                              if key[0] == os.getpid()}
+                S3ResponseStorage._clients[client_key] = boto3.client('s3', region_name=self.region_name,
+                                                                      aws_access_key_id=self.key_id,
+                                                                      aws_secret_access_key=self.access_key,
+                                                                      endpoint_url=self.endpoint_url)
+            return S3ResponseStorage._clients[client_key]
+
+
+class FilesystemResponseStorage:
+    """
+    Responses stored as files in a local directory
+    """
+    is_local = True  # So ResponseReadCache doesn't keep another copy of them on disk
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __str__(self):
+        return f"directory {self.directory}"
+
+    def put(self, response_id, content):
+        os.makedirs(self.directory, exist_ok=True)
+        response_path = f"{self.directory}/{response_id}.json.gz"
+        temp_path = f"{response_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as outfile:
+            outfile.write(content)
+        os.replace(temp_path, response_path)
+
+    def get(self, response_id):
+        """
+        Returns the stored content for this response, or None if there is none
+        """
+        for response_path in self._get_paths(response_id):
+            try:
+                with open(response_path, 'rb') as infile:
+                    return infile.read()
+            except FileNotFoundError:
+                pass
+        return None
+
+    def head(self, response_id):
+        """
+        Returns an ETag (the modification time) and the size of the stored content for this response, or None if
+        there is none
+        """
+        for response_path in self._get_paths(response_id):
+            try:
+                file_stat = os.stat(response_path)
+            except FileNotFoundError:
+                continue
+            return {'etag': str(file_stat.st_mtime_ns), 'size': file_stat.st_size}
+        return None
+
+    def _get_paths(self, response_id):
+        return [f"{self.directory}/{response_id}.json.gz", f"{self.directory}/{response_id}.json"]
+
+
+class ResponsePersistenceQueue:
+    """
+    Serializes, compresses and stores responses on a background thread so that the query that produced a response
+    doesn't have to wait for it to be written. Each response goes to the first of the given storages that accepts
+    it. Since queries run in forked children that leave via os._exit(), a child must call wait_until_done() before
+    exiting (this also happens at normal interpreter exit).
+
+    While a response is queued, a marker file for it sits in the pending directory (if one is given), so that any
+    process serving a request for it can wait for it to be stored rather than report it missing.
+    """
+    pending_max_age = 600  # Seconds; older markers were left by a process that was killed before storing its response
+    _queue = None
+    _thread = None
+    _pid = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def submit(cls, response_id, envelope_dict, storages, pending_directory=None):
+        pending_path = cls._get_pending_path(response_id, pending_directory)
+        if pending_path is not None:
+            try:
+                os.makedirs(pending_directory, exist_ok=True)
+                open(pending_path, 'w').close()
+            except OSError as error:
+                eprint(f"ERROR: Unable to mark response {response_id} as pending: {error}")
+                pending_path = None
+        with cls._lock:
+            if cls._pid != os.getpid():  # The worker thread doesn't survive a fork, so start one for this process
+                cls._queue = queue.Queue()
+                cls._thread = threading.Thread(target=cls._run, args=(cls._queue,), daemon=True)
+                cls._thread.start()
+                cls._pid = os.getpid()
+            cls._queue.put((response_id, envelope_dict, storages, pending_path))
+
+    @classmethod
+    def wait_until_done(cls):
+        """
+        Blocks until every response submitted in this process has been stored (or failed to be)
+        """
+        if cls._pid == os.getpid():
+            cls._queue.join()
+
+    @classmethod
+    def is_pending(cls, response_id, pending_directory):
+        """
+        Returns whether this response has been submitted (by any process) but not yet stored
+        """
+        pending_path = cls._get_pending_path(response_id, pending_directory)
+        try:
+            return pending_path is not None and time.time() - os.stat(pending_path).st_mtime < cls.pending_max_age
+        except FileNotFoundError:
+            return False
+
+    @classmethod
+    def wait_until_stored(cls, response_id, pending_directory, timeout=60):
+        """
+        Blocks while this response is still waiting to be stored, for at most timeout seconds. Returns False if it
+        is still pending after that.
+        """
+        deadline = time.time() + timeout
+        while cls.is_pending(response_id, pending_directory):
+            if time.time() > deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    @staticmethod
+    def _get_pending_path(response_id, pending_directory):
+        if pending_directory is None:
+            return None
+        return f"{pending_directory}/{response_id}.pending"
+
+    @staticmethod
+    def _run(work_queue):
+        while True:
+            response_id, envelope_dict, storages, pending_path = work_queue.get()
+            try:
+                t0 = timeit.default_timer()
+                content = encode_response(envelope_dict)
+                for storage in storages:
+                    try:
+                        storage.put(response_id, content)
+                        eprint(f"INFO: Stored response {response_id} ({len(content)} bytes) in {storage} in {timeit.default_timer() - t0:.2f} seconds")
+                        break
+                    except Exception as error:
+                        eprint(f"ERROR: Unable to store response {response_id} in {storage}: {error}")
+                else:
+                    eprint(f"ERROR: Response {response_id} could not be stored anywhere")
+            except Exception as error:
+                eprint(f"ERROR: Unable to serialize response {response_id}: {error}")
+            finally:
+                if pending_path is not None:
+                    try:
+                        os.remove(pending_path)
+                    except OSError:
+                        pass
+                work_queue.task_done()
+
+
+atexit.register(ResponsePersistenceQueue.wait_until_done)
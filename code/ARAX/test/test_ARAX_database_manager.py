@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_database_manager.py
+# run just certain tests: pytest -v test_ARAX_database_manager.py -k test_update_from_source_dir
+
+import sys
+import os
+import hashlib
+import json
+import shutil
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+import ARAX_database_manager
+from ARAX_database_manager import ARAXDatabaseManager
+
+
+def _write_database(directory, file_name: str, contents: bytes, published_checksum: str = None) -> str:
+    file_path = os.path.join(directory, file_name)
+    with open(file_path, "wb") as fid:
+        fid.write(contents)
+    checksum = published_checksum if published_checksum else hashlib.sha256(contents).hexdigest()
+    with open(f"{file_path}.sha256", "w") as fid:
+        fid.write(f"{checksum}  {file_name}\n")
+    return file_path
+
+
+def _get_test_manager(tmp_path, monkeypatch, database_names) -> ARAXDatabaseManager:
+    source_dir = tmp_path / "source"
+    local_dir = tmp_path / "local"
+    source_dir.mkdir()
+    local_dir.mkdir()
+    monkeypatch.setattr(ARAX_database_manager, "versions_path", str(local_dir / "db_versions.json"))
+    manager = ARAXDatabaseManager(source_dir=str(source_dir))
+    manager.update_lock_path = str(local_dir / "db_update.lock")
+    manager.local_paths = {database_name: str(local_dir / f"{database_name}.sqlite") for database_name in database_names}
+    manager.remote_locations = {database_name: f"arax@arax.example.org:/translator/data/{database_name}.sqlite"
+                                for database_name in database_names}
+    manager.docker_paths = {database_name: None for database_name in database_names}
+    manager.db_versions = {database_name: {'path': manager.local_paths[database_name], 'version': "v2"}
+                           for database_name in database_names}
+    return manager
+
+
+def test_update_from_source_dir(tmp_path, monkeypatch):
+    manager = _get_test_manager(tmp_path, monkeypatch, ["db_a", "db_b", "db_c"])
+    source_dir = manager.source_dir
+    _write_database(source_dir, "db_a.sqlite", b"new a")
+    _write_database(source_dir, "db_b.sqlite", b"new b")
+    _write_database(source_dir, "db_c.sqlite", b"new c", published_checksum=hashlib.sha256(b"other c").hexdigest())
+
+    # db_a is present locally at an old version; db_b and db_c have never been downloaded
+    with open(manager.local_paths["db_a"], "wb") as fid:
+        fid.write(b"old a")
+    with open(ARAX_database_manager.versions_path, "w") as fid:
+        json.dump({"db_a": {'path': manager.local_paths["db_a"], 'version': "v1"}}, fid)
+    old_reader = open(manager.local_paths["db_a"], "rb")
+
+    # All three downloads must be in flight at once to get past the barrier
+    manager.max_parallel_downloads = 3
+    barrier = threading.Barrier(3, timeout=10)
+    download_database = manager.download_database
+    def download_database_in_parallel(*args, **kwargs):
+        barrier.wait()
+        return download_database(*args, **kwargs)
+    manager.download_database = download_database_in_parallel
+
+    manager.update_databases()
+
+    # The new copies were swapped in whole; a reader of the old file still sees the old contents
+    with open(manager.local_paths["db_a"], "rb") as fid:
+        assert fid.read() == b"new a"
+    with open(manager.local_paths["db_b"], "rb") as fid:
+        assert fid.read() == b"new b"
+    assert old_reader.read() == b"old a"
+    old_reader.close()
+
+    # The download whose checksum didn't match the published one was thrown away
+    assert not os.path.exists(manager.local_paths["db_c"])
+    assert not [file_name for file_name in os.listdir(os.path.dirname(manager.local_paths["db_a"])) if file_name.endswith(".partial")]
+
+    with open(ARAX_database_manager.versions_path) as fid:
+        local_versions = json.load(fid)
+    assert set(local_versions) == {"db_a", "db_b"}
+    assert local_versions["db_a"]['version'] == "v2"
+    assert local_versions["db_a"]['sha256'] == hashlib.sha256(b"new a").hexdigest()
+    assert local_versions["db_b"]['size'] == len(b"new b")
+
+    # Only the failed database is still out of date
+    assert manager._get_databases_to_update(local_versions, verify_checksums=True) == ["db_c"]
+
+
+def test_update_lock(tmp_path, monkeypatch):
+    manager = _get_test_manager(tmp_path, monkeypatch, ["db_a"])
+    _write_database(manager.source_dir, "db_a.sqlite", b"new a")
+
+    assert manager._acquire_update_lock()
+    # Another updater (a separate open of the lock file) can't take the lock, and skips the update
+    other_manager = ARAXDatabaseManager(source_dir=manager.source_dir)
+    for attribute_name in ("update_lock_path", "local_paths", "remote_locations", "docker_paths", "db_versions"):
+        setattr(other_manager, attribute_name, getattr(manager, attribute_name))
+    assert not other_manager._acquire_update_lock()
+    other_manager.update_databases()
+    assert not os.path.exists(manager.local_paths["db_a"])
+
+    # Once released (or if its holder dies), the lock can be taken again; the lock file is left in place
+    manager._release_update_lock()
+    assert os.path.exists(manager.update_lock_path)
+    other_manager.update_databases()
+    with open(manager.local_paths["db_a"], "rb") as fid:
+        assert fid.read() == b"new a"
+    assert manager._acquire_update_lock()
+    manager._release_update_lock()
+
+
+def test_update_companions(tmp_path, monkeypatch):
+    manager = _get_test_manager(tmp_path, monkeypatch, ["db_a", "db_b"])
+    manager.companion_suffixes = {"db_a": [(".index", True)], "db_b": [(".index", True)]}
+    source_dir = manager.source_dir
+    _write_database(source_dir, "db_a.sqlite", b"new a")
+    _write_database(source_dir, "db_b.sqlite", b"new b")
+    for database_name, database_size in [("db_a", len(b"new a")), ("db_b", 1)]:
+        os.makedirs(f"{source_dir}/{database_name}.sqlite.index")
+        with open(f"{source_dir}/{database_name}.sqlite.index/metadata.json", "w") as fid:
+            json.dump({'version': 1, 'database_size': database_size}, fid)
+
+    # A stale local index is replaced by the fetched one, or removed if the fetched one doesn't match its database
+    for database_name in ["db_a", "db_b"]:
+        os.makedirs(f"{manager.local_paths[database_name]}.index")
+    manager.update_databases()
+    with open(f"{manager.local_paths['db_a']}.index/metadata.json") as fid:
+        assert json.load(fid)['database_size'] == len(b"new a")
+    assert not os.path.exists(f"{manager.local_paths['db_b']}.index")
+    assert not [file_name for file_name in os.listdir(os.path.dirname(manager.local_paths["db_a"]))
+                if file_name.endswith(".partial") or file_name.endswith(".old")]
+
+    # A companion missing next to an up-to-date database is fetched on its own
+    shutil.rmtree(f"{manager.local_paths['db_a']}.index")
+    manager.update_databases()
+    assert os.path.exists(f"{manager.local_paths['db_a']}.index/metadata.json")
+
+
+def test_version_check_is_memoized(tmp_path, monkeypatch):
+    manager = _get_test_manager(tmp_path, monkeypatch, ["db_a", "db_b"])
+    manager.companion_suffixes = {"db_a": [(".index", True)]}
+    monkeypatch.setattr(ARAX_database_manager, "config_paths", [])
+    monkeypatch.setattr(ARAXDatabaseManager, "_version_check_results", dict())
+    source_dir = manager.source_dir
+    _write_database(source_dir, "db_a.sqlite", b"new a")
+    _write_database(source_dir, "db_b.sqlite", b"new b")
+    os.makedirs(f"{source_dir}/db_a.sqlite.index")
+    with open(f"{source_dir}/db_a.sqlite.index/metadata.json", "w") as fid:
+        json.dump({'version': 1, 'database_size': len(b"new a")}, fid)
+
+    # A manager as configured for these tests, counting the full checks
+    n_checks = []
+    class _CountingManager(ARAXDatabaseManager):
+        def __init__(self, live="Production"):
+            self.__dict__.update(manager.__dict__)
+            self.db_versions = {database_name: dict(db_version) for database_name, db_version in manager.db_versions.items()}
+        def check_versions(self, debug=False):
+            n_checks.append(1)
+            return super().check_versions(debug=debug)
+
+    assert _CountingManager.databases_need_update()
+    _CountingManager().update_databases()
+    assert not _CountingManager.databases_need_update()
+    assert not _CountingManager.databases_need_update()
+    assert len(n_checks) == 2
+
+    # A database that goes missing or is changed in place is noticed, without the versions file changing
+    os.remove(manager.local_paths["db_b"])
+    assert _CountingManager.databases_need_update()
+    _CountingManager().update_databases()
+    assert not _CountingManager.databases_need_update()
+    with open(manager.local_paths["db_b"], "ab") as fid:
+        fid.write(b" and more")
+    assert _CountingManager.databases_need_update()
+    _CountingManager().update_databases()
+    assert not _CountingManager.databases_need_update()
+    assert len(n_checks) == 6
+
+    # And so is a missing companion
+    shutil.rmtree(f"{manager.local_paths['db_a']}.index")
+    assert _CountingManager.databases_need_update()
+    _CountingManager().update_databases()
+    assert os.path.exists(f"{manager.local_paths['db_a']}.index/metadata.json")
+    assert not _CountingManager.databases_need_update()
+
+    # A companion that can't be fetched isn't asked for again (until the database is updated)
+    shutil.rmtree(f"{source_dir}/db_a.sqlite.index")
+    shutil.rmtree(f"{manager.local_paths['db_a']}.index")
+    assert _CountingManager.databases_need_update()
+    _CountingManager().update_databases()
+    assert not _CountingManager.databases_need_update()
+    with open(ARAX_database_manager.versions_path) as fid:
+        assert json.load(fid)["db_a"]['unavailable_companions'] == [".index"]
+    n_checks.clear()
+    assert not _CountingManager.databases_need_update()
+    assert n_checks == []
+
+    ARAXDatabaseManager.invalidate_version_check()
+    assert not _CountingManager.databases_need_update()
+    assert len(n_checks) == 1
+
+
+def test_rsync_starts_from_local_copy(tmp_path, monkeypatch):
+    manager = _get_test_manager(tmp_path, monkeypatch, ["db_a"])
+    manager.source_dir = None
+    local_path = manager.local_paths["db_a"]
+    with open(local_path, "wb") as fid:
+        fid.write(b"old a")
+    old_reader = open(local_path, "rb")
+
+    # Like rsync: the file it's given is the basis for the transfer, and is only ever replaced (never written in place)
+    remote_contents = {"db_a.sqlite": b"new a"}
+    basis_contents = []
+    def rsync_database(remote_location, local_path, debug=False, recursive=False):
+        with open(local_path, "rb") as fid:
+            basis_contents.append(fid.read())
+        new_contents = remote_contents[remote_location.split('/')[-1]]
+        if basis_contents[-1] != new_contents:
+            with open(f"{local_path}.tmp", "wb") as fid:
+                fid.write(new_contents)
+            os.replace(f"{local_path}.tmp", local_path)
+        return True
+    manager.rsync_database = rsync_database
+    monkeypatch.setattr(manager, "_get_published_checksum", lambda remote_location, local_path, debug=False:
+                        hashlib.sha256(remote_contents[remote_location.split('/')[-1]]).hexdigest())
+
+    checksum_info = manager.download_database(manager.remote_locations["db_a"], local_path, None)
+    assert basis_contents == [b"old a"]
+    assert checksum_info == {'sha256': hashlib.sha256(b"new a").hexdigest(), 'size': len(b"new a")}
+    with open(local_path, "rb") as fid:
+        assert fid.read() == b"new a"
+    assert old_reader.read() == b"old a"
+    old_reader.close()
+    assert not os.path.exists(f"{local_path}.partial")
+
+    # Nothing changed, so nothing was transferred
+    assert manager.download_database(manager.remote_locations["db_a"], local_path, None) == checksum_info
+    assert basis_contents == [b"old a", b"new a"]
+    with open(local_path, "rb") as fid:
+        assert fid.read() == b"new a"
+    assert not os.path.exists(f"{local_path}.partial")
+
+    # An earlier partial download is picked up rather than replaced
+    with open(f"{local_path}.partial", "wb") as fid:
+        fid.write(b"newer")
+    remote_contents["db_a.sqlite"] = b"newer a"
+    manager.download_database(manager.remote_locations["db_a"], local_path, None)
+    assert basis_contents[-1] == b"newer"
+    with open(local_path, "rb") as fid:
+        assert fid.read() == b"newer a"
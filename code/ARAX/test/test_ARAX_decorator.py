@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_decorator.py
+# run just certain tests: pytest -v test_ARAX_decorator.py -k test_deferred_decoration
+
+import sys
+import os
+import sqlite3
+from collections import OrderedDict
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+import ARAX_decorator
+from ARAX_decorator import ARAXDecorator
+from ARAX_response import ARAXResponse
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from openapi_server.models.response import Response
+from openapi_server.models.message import Message
+from openapi_server.models.knowledge_graph import KnowledgeGraph
+from openapi_server.models.node import Node
+from openapi_server.models.edge import Edge
+from openapi_server.models.result import Result
+from openapi_server.models.node_binding import NodeBinding
+from openapi_server.models.edge_binding import EdgeBinding
+from openapi_server.models.attribute import Attribute
+
+
+# A toy KG2c: (id, iri, description, all_categories, all_names, equivalent_curies, publications) and
+# (triple, node_pair, publications, publications_info, kg2_ids, knowledge_source), with lists joined by "ǂ"
+toy_nodes = [
+    ("CHEBI:15365", "http://purl.obolibrary.org/obo/CHEBI_15365", "A salicylate", "biolink:SmallMoleculeǂbiolink:Drug",
+     "aspirinǂAspirin", "CHEBI:15365ǂDRUGBANK:DB00945", "PMID:1ǂPMID:2"),
+    ("MONDO:0005148", "http://purl.obolibrary.org/obo/MONDO_0005148", "A diabetes", "biolink:Disease",
+     "type 2 diabetes mellitus", "MONDO:0005148ǂDOID:9352", ""),
+    ("CHEBI:6801", "http://purl.obolibrary.org/obo/CHEBI_6801", "A biguanide", "biolink:SmallMolecule",
+     "metformin", "CHEBI:6801", "PMID:3"),
+]
+toy_edges = [
+    ("CHEBI:15365--biolink:treats--MONDO:0005148", "CHEBI:15365--MONDO:0005148", "PMID:1ǂPMID:2",
+     '{"PMID:1": {"sentence": "Aspirin treats it", "publication date": "2020 Jan 01"}}', "kg2 edge 1", "infores:semmeddb"),
+    ("CHEBI:6801--biolink:treats--MONDO:0005148", "CHEBI:6801--MONDO:0005148", "PMID:3",
+     '{"PMID:3": {"sentence": "Metformin treats it", "publication date": "2021 Jan 01"}}', "kg2 edge 2", "infores:semmeddb"),
+]
+
+
+@pytest.fixture
+def kg2c_sqlite_path(tmp_path, monkeypatch):
+    kg2c_sqlite_path = str(tmp_path / "kg2c.sqlite")
+    connection = sqlite3.connect(kg2c_sqlite_path)
+    connection.execute("CREATE TABLE nodes (id TEXT, iri TEXT, description TEXT, all_categories TEXT, all_names TEXT, equivalent_curies TEXT, publications TEXT)")
+    connection.execute("CREATE TABLE edges (triple TEXT, node_pair TEXT, publications TEXT, publications_info TEXT, kg2_ids TEXT, knowledge_source TEXT)")
+    connection.executemany("INSERT INTO nodes VALUES (?,?,?,?,?,?,?)", toy_nodes)
+    connection.executemany("INSERT INTO edges VALUES (?,?,?,?,?,?)", toy_edges)
+    connection.commit()
+    connection.close()
+    monkeypatch.setattr(ARAXDecorator, "_node_cache", OrderedDict())
+    monkeypatch.setattr(ARAXDecorator, "_edge_cache", OrderedDict())
+    monkeypatch.setattr(ARAXDecorator, "_cache_sqlite_path", None)
+    return kg2c_sqlite_path
+
+
+def _get_decorator(kg2c_sqlite_path) -> ARAXDecorator:
+    decorator = ARAXDecorator()
+    decorator.kg2c_sqlite_path = kg2c_sqlite_path
+    return decorator
+
+
+def _get_response(defer_decoration: bool) -> ARAXResponse:
+    # Aspirin treats diabetes is in the answer; metformin (and its edge) is only in the KG
+    kg2_source = Attribute(attribute_type_id="biolink:aggregator_knowledge_source", value="infores:rtx-kg2")
+    knowledge_graph = KnowledgeGraph(nodes={ "CHEBI:15365": Node(name="aspirin"), "MONDO:0005148": Node(name="type 2 diabetes mellitus"),
+                                             "CHEBI:6801": Node(name="metformin") },
+                                     edges={ "e1": Edge(predicate="biolink:treats", subject="CHEBI:15365", object="MONDO:0005148", attributes=[kg2_source]),
+                                             "e2": Edge(predicate="biolink:treats", subject="CHEBI:6801", object="MONDO:0005148", attributes=[kg2_source]) })
+    results = [ Result(node_bindings={ "n0": [NodeBinding(id="CHEBI:15365")], "n1": [NodeBinding(id="MONDO:0005148")] },
+                       edge_bindings={ "e0": [EdgeBinding(id="e1")] }) ]
+    response = ARAXResponse()
+    response.envelope = Response(message=Message(results=results, knowledge_graph=knowledge_graph))
+    response.defer_decoration = defer_decoration
+    return response
+
+
+def _get_attribute_values(item) -> dict:
+    return { attribute.attribute_type_id: attribute.value for attribute in item.attributes or [] }
+
+
+def test_deferred_decoration(kg2c_sqlite_path):
+    decorator = _get_decorator(kg2c_sqlite_path)
+    eager_response = _get_response(defer_decoration=False)
+    decorator.decorate_nodes(eager_response)
+    decorator.decorate_edges(eager_response)
+    eager_kg = eager_response.envelope.message.knowledge_graph
+    assert _get_attribute_values(eager_kg.nodes["CHEBI:6801"])["biolink:synonym"] == ["metformin"]
+    assert _get_attribute_values(eager_kg.edges["e2"])["bts:sentence"]["PMID:3"]["sentence"] == "Metformin treats it"
+
+    # Lazily, the bulky attributes are left off at first
+    response = _get_response(defer_decoration=True)
+    decorator.decorate_nodes(response)
+    decorator.decorate_edges(response)
+    kg = response.envelope.message.knowledge_graph
+    for node_key in kg.nodes:
+        assert set(_get_attribute_values(kg.nodes[node_key])) == { "biolink:IriType", "biolink:description", "biolink:category" }
+    for edge_key in kg.edges:
+        assert set(_get_attribute_values(kg.edges[edge_key])) == { "biolink:aggregator_knowledge_source", "biolink:original_edge_information", "biolink:publications" }
+
+    # And are then added to the nodes and edges in the results, as eager decoration would have
+    decorator.decorate_deferred_attributes(response)
+    for node_key in [ "CHEBI:15365", "MONDO:0005148" ]:
+        assert _get_attribute_values(kg.nodes[node_key]) == _get_attribute_values(eager_kg.nodes[node_key])
+    assert _get_attribute_values(kg.edges["e1"]) == _get_attribute_values(eager_kg.edges["e1"])
+    assert "biolink:synonym" not in _get_attribute_values(kg.nodes["CHEBI:6801"])
+    assert "bts:sentence" not in _get_attribute_values(kg.edges["e2"])
+
+    # Only once
+    n_attributes = len(kg.nodes["CHEBI:15365"].attributes)
+    decorator.decorate_deferred_attributes(response)
+    assert len(kg.nodes["CHEBI:15365"].attributes) == n_attributes
+
+    # Without results, everything still in the KG is decorated
+    response = _get_response(defer_decoration=True)
+    decorator.decorate_nodes(response)
+    decorator.decorate_edges(response)
+    response.envelope.message.results = []
+    del response.envelope.message.knowledge_graph.nodes["MONDO:0005148"]
+    decorator.decorate_deferred_attributes(response)
+    kg = response.envelope.message.knowledge_graph
+    assert _get_attribute_values(kg.nodes["CHEBI:6801"]) == _get_attribute_values(eager_kg.nodes["CHEBI:6801"])
+    assert _get_attribute_values(kg.edges["e2"]) == _get_attribute_values(eager_kg.edges["e2"])
+
+
+def test_cached_values_are_copied(kg2c_sqlite_path):
+    decorator = _get_decorator(kg2c_sqlite_path)
+    response = _get_response(defer_decoration=False)
+    decorator.decorate_nodes(response)
+    decorator.decorate_edges(response)
+
+    # Changing what one response was given (at any depth) doesn't change what the next one gets from the cache
+    kg = response.envelope.message.knowledge_graph
+    _get_attribute_values(kg.edges["e1"])["bts:sentence"]["PMID:1"]["sentence"] = "Changed"
+    _get_attribute_values(kg.edges["e1"])["biolink:publications"].append("PMID:4")
+    _get_attribute_values(kg.nodes["CHEBI:15365"])["biolink:synonym"].append("ASA")
+    response = _get_response(defer_decoration=False)
+    decorator.decorate_nodes(response)
+    decorator.decorate_edges(response)
+    kg = response.envelope.message.knowledge_graph
+    assert _get_attribute_values(kg.edges["e1"])["bts:sentence"]["PMID:1"]["sentence"] == "Aspirin treats it"
+    assert sorted(_get_attribute_values(kg.edges["e1"])["biolink:publications"]) == [ "PMID:1", "PMID:2" ]
+    assert _get_attribute_values(kg.nodes["CHEBI:15365"])["biolink:synonym"] == [ "aspirin", "Aspirin" ]
+
+
+def test_kg2c_path_is_resolved_once(kg2c_sqlite_path, monkeypatch):
+    decorator = _get_decorator(kg2c_sqlite_path)
+    monkeypatch.setattr(ARAX_decorator, "RTXConfiguration", None)
+    response = _get_response(defer_decoration=False)
+    decorator.decorate_nodes(response)
+    decorator.decorate_edges(response)
+    assert "biolink:publications" in _get_attribute_values(response.envelope.message.knowledge_graph.edges["e1"])
@@ -1061,5 +1061,24 @@ def test_inverted_treats_handling():
     nodes_by_qg_id, edges_by_qg_id = _run_query_and_do_standard_testing(actions)
 
 
+def test_deferred_decoration_of_returned_results():
+    actions = [
+        "add_qnode(key=n0, ids=MONDO:0005077)",
+        "add_qnode(key=n1, categories=biolink:ChemicalEntity)",
+        "add_qedge(key=e0, subject=n0, object=n1, predicates=biolink:treats)",
+        "expand(kp=infores:rtx-kg2)",
+        "resultify()",
+        "filter_results(action=limit_number_of_results, max_results=2, prune_kg=false)",
+        "return(message=true, store=false)"
+    ]
+    nodes_by_qg_id, edges_by_qg_id = _run_query_and_do_standard_testing(actions)
+    # The pinned node is bound in every result, so it should have received the deferred attributes
+    assert all(any(attribute.attribute_type_id == "biolink:xref" for attribute in node.attributes or [])
+               for node in nodes_by_qg_id["n0"].values())
+    # Nodes that were cut from the results (but left in the KG) shouldn't have received the bulky attributes
+    assert len(nodes_by_qg_id["n1"]) > 2
+    assert not all(any(attribute.attribute_type_id == "biolink:xref" for attribute in node.attributes or [])
+                   for node in nodes_by_qg_id["n1"].values())
+
 if __name__ == "__main__":
     pytest.main(['-v', 'test_ARAX_expand.py'])
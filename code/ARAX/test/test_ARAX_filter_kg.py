@@ -18,6 +18,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
 from ARAX_filter_kg import ARAXFilterKG
 from ARAX_query import ARAXQuery
 from ARAX_response import ARAXResponse
+from kg_attribute_index import KGAttributeIndex
+from Filter_KG.kg_pruner import KGPruner
 
 PACKAGE_PARENT = '../../UI/OpenAPI/python-flask-server'
 sys.path.append(os.path.normpath(os.path.join(os.getcwd(), PACKAGE_PARENT)))
@@ -31,6 +33,7 @@ from openapi_server.models.node_binding import NodeBinding
 from openapi_server.models.edge_binding import EdgeBinding
 from openapi_server.models.result import Result
 from openapi_server.models.message import Message
+from openapi_server.models.attribute import Attribute
 
 
 def _do_arax_query(query: dict, print_response: bool=True) -> List[Union[ARAXResponse, Message]]:
@@ -332,5 +335,62 @@ def test_tuple_bug():
     [response, message] = _do_arax_query(query)
     assert response.status == 'OK'
 
+def test_attribute_index_reuse_and_invalidation():
+    edges = {f"e{i}": Edge(subject="n0", object=f"n{i + 1}", predicate="biolink:related_to",
+                           attributes=[Attribute(original_attribute_name="normalized_google_distance",
+                                                 attribute_type_id="EDAM:data_2526", value=str(i / 10))])
+             for i in range(5)}
+    message = Message(knowledge_graph=KnowledgeGraph(nodes={}, edges=edges))
+    attribute_index = KGAttributeIndex.for_message(message)
+    ngd_column = attribute_index.get_edge_column("normalized_google_distance")
+    assert list(ngd_column.keys) == list(edges)
+    assert list(ngd_column.values) == [0.0, 0.1, 0.2, 0.3, 0.4]
+    assert list(attribute_index.get_edge_column("EDAM:data_2526").values) == list(ngd_column.values)
+    assert KGAttributeIndex.for_message(message) is attribute_index
+    # Removing edges or adding attributes should trigger a rebuild
+    del message.knowledge_graph.edges["e0"]
+    assert KGAttributeIndex.for_message(message) is not attribute_index
+    # Deleting one edge and adding another (same count of edges and attributes) should too
+    attribute_index = KGAttributeIndex.for_message(message)
+    del message.knowledge_graph.edges["e4"]
+    message.knowledge_graph.edges["e9"] = Edge(subject="n0", object="n9", predicate="biolink:related_to",
+                                               attributes=[Attribute(original_attribute_name="normalized_google_distance",
+                                                                     attribute_type_id="EDAM:data_2526", value="0.9")])
+    ngd_column = KGAttributeIndex.for_message(message).get_edge_column("normalized_google_distance")
+    assert set(ngd_column.keys) == set(message.knowledge_graph.edges)
+    message.knowledge_graph.edges["e1"].attributes.append(Attribute(original_attribute_name="normalized_google_distance", value="nan?"))
+    ngd_column = KGAttributeIndex.for_message(message).get_edge_column("normalized_google_distance")
+    assert not ngd_column.all_numeric()
+    assert ngd_column.last_value_by_key()["e1"] == "nan?"
+
+
+def test_kg_pruner_cascades_and_updates_results():
+    nodes = {"n0_0": Node(name="hub")}
+    nodes["n0_0"].qnode_keys = ["n0"]
+    edges = dict()
+    for i in range(4):
+        nodes[f"n1_{i}"] = Node(name=f"leaf {i}")
+        nodes[f"n1_{i}"].qnode_keys = ["n1"]
+        edges[f"e{i}"] = Edge(subject="n0_0", object=f"n1_{i}", predicate="biolink:related_to")
+        edges[f"e{i}"].qedge_keys = ["e0"]
+    results = [Result(node_bindings={"n0": [NodeBinding(id="n0_0")], "n1": [NodeBinding(id=f"n1_{i}")]},
+                      edge_bindings={"e0": [EdgeBinding(id=f"e{i}")]}) for i in range(4)]
+    message = Message(query_graph=QueryGraph(nodes={"n0": QNode(), "n1": QNode()},
+                                             edges={"e0": QEdge(subject="n0", object="n1")}),
+                      knowledge_graph=KnowledgeGraph(nodes=nodes, edges=edges),
+                      results=results)
+    response = ARAXResponse()
+    # Removing a node should take its edge (and any result bound to it) with it
+    KGPruner(response, message).prune(node_keys={"n1_0"})
+    assert "e0" not in message.knowledge_graph.edges
+    assert len(message.results) == 3
+    # Removing edges with remove_orphaned_nodes should cascade to the leaf nodes they leave behind
+    KGPruner(response, message).prune(edge_keys={"e1", "e2"}, remove_orphaned_nodes=True)
+    assert set(message.knowledge_graph.nodes) == {"n0_0", "n1_3"}
+    assert set(message.knowledge_graph.edges) == {"e3"}
+    assert [result.edge_bindings["e0"][0].id for result in message.results] == ["e3"]
+    assert response.status == 'OK'
+
+
 if __name__ == "__main__":
     pytest.main(['-v'])
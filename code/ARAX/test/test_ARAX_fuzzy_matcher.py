@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_fuzzy_matcher.py
+# run just certain tests: pytest -v test_ARAX_fuzzy_matcher.py -k test_edit_distances_match_dynamic_programming
+
+import sys
+import os
+import random
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../autocomplete")
+from term_index import TermIndex
+from fuzzy_matcher import FuzzyMatcher
+
+
+def _get_levenshtein_distance(pattern, text):
+    previous_row = list(range(len(text) + 1))
+    for i_pattern, pattern_byte in enumerate(pattern, 1):
+        row = [ i_pattern ]
+        for i_text, text_byte in enumerate(text, 1):
+            row.append(min(previous_row[i_text] + 1, row[i_text - 1] + 1, previous_row[i_text - 1] + (pattern_byte != text_byte)))
+        previous_row = row
+    return previous_row[-1]
+
+
+def _get_random_string(generator, alphabet, min_length, max_length):
+    return "".join(generator.choice(alphabet) for _ in range(generator.randint(min_length, max_length)))
+
+
+def _get_trigram_codes(encoded_string):
+    return { encoded_string[position:position + 3] for position in range(len(encoded_string) - 2) }
+
+
+@pytest.fixture
+def toy_index(tmp_path):
+    generator = random.Random(7)
+    terms = []
+    uc_terms = set()
+    while len(terms) < 800:
+        term = _get_random_string(generator, "abcde", 1, 9)
+        if term.upper() not in uc_terms:
+            uc_terms.add(term.upper())
+            terms.append(term.capitalize() if generator.random() < 0.3 else term)
+    popularity = [ generator.randint(1, 5) for _ in terms ]
+    database_path = str(tmp_path / "autocomplete.sqlite")
+    open(database_path, "w").close()
+    TermIndex.build(terms, popularity, database_path)
+    return TermIndex.get(database_path)
+
+
+def test_edit_distances_match_dynamic_programming():
+    generator = random.Random(11)
+    for _ in range(200):
+        # Include the longest patterns (all 64 bits of the words in use), empty texts and texts longer than the pattern
+        pattern = _get_random_string(generator, "abc", 1, 64).encode('utf-8')
+        if generator.random() < 0.1:
+            pattern = _get_random_string(generator, "abc", 64, 64).encode('utf-8')
+        texts = [ _get_random_string(generator, "abc", 0, 70).encode('utf-8') for _ in range(20) ]
+        texts += [ pattern, pattern[1:], pattern + b"a", b"" ]
+        distances = FuzzyMatcher.get_edit_distances(pattern, texts)
+        assert distances.tolist() == [ _get_levenshtein_distance(pattern, text) for text in texts ], pattern
+
+
+def test_length_range(toy_index):
+    term_lengths = [ len(toy_index.get_term(term_id)) for term_id in range(toy_index.n_terms) ]
+    for min_length, max_length in [ (1, 1), (3, 5), (-2, 2), (8, 20), (10, 12), (5, 4) ]:
+        lo, hi = toy_index.get_length_range(min_length, max_length)
+        assert [ term_id for term_id, length in enumerate(term_lengths) if min_length <= length <= max_length ] == list(range(lo, hi))
+
+
+def test_matches_are_the_closest_candidates(toy_index):
+    generator = random.Random(13)
+    terms = [ toy_index.get_term(term_id) for term_id in range(toy_index.n_terms) ]
+    words = [ _get_random_string(generator, "abcde", 1, 10) for _ in range(150) ] + [ "ab", "abc", "abcde", "ABCDEABCDE", "xyz" ]
+
+    def get_expected_matches(word, limit):
+        pattern = word.upper().encode('utf-8')
+        if len(pattern) < 3:
+            return []
+        max_distance = FuzzyMatcher.get_max_distance(len(pattern))
+        codes = _get_trigram_codes(pattern)
+        min_shared = max(1, len(codes) - 3 * max_distance)
+        matches = []
+        for term_id, term in enumerate(terms):
+            encoded_term = term.upper().encode('utf-8')
+            distance = _get_levenshtein_distance(pattern, encoded_term)
+            if distance <= max_distance and len(codes & _get_trigram_codes(encoded_term)) >= min_shared:
+                matches.append((distance, term_id))
+        return [ term_id for _, term_id in sorted(matches) ][:limit]
+
+    # With room for all the candidates, the matches are exactly the closest terms sharing enough trigrams with the word
+    matcher = FuzzyMatcher(toy_index)
+    matcher.candidate_budget = 10 ** 6
+    matcher.max_candidates = 10 ** 6
+    n_matched_words = 0
+    for word in words:
+        for limit in (1, 5, 1000):
+            expected_matches = get_expected_matches(word, limit)
+            assert matcher.get_matches(word, limit) == expected_matches, (word, limit)
+        n_matched_words += len(expected_matches) > 0
+    assert n_matched_words > 50
+
+    # With the postings and the candidates capped, some matches may be missed, but those found are still the closest
+    # of what was checked, in order
+    capped_matcher = FuzzyMatcher(toy_index)
+    capped_matcher.candidate_budget = 20
+    capped_matcher.max_candidates = 5
+    for word in words:
+        expected_matches = get_expected_matches(word, 1000)
+        capped_matches = capped_matcher.get_matches(word, 1000)
+        assert len(capped_matches) <= capped_matcher.max_candidates
+        assert set(capped_matches) <= set(expected_matches), word
+        assert capped_matches == [ term_id for term_id in expected_matches if term_id in set(capped_matches) ], word
+
+
+def test_matches_cache(toy_index, monkeypatch):
+    matcher = FuzzyMatcher(toy_index)
+    matcher.cache_size = 2
+    calls = []
+    find_matches = matcher._find_matches
+    monkeypatch.setattr(matcher, "_find_matches", lambda uc_word, limit: calls.append((uc_word, limit)) or find_matches(uc_word, limit))
+
+    matches = matcher.get_matches("abcd", 10)
+    matches.append(-1)
+    assert matcher.get_matches("ABCD", 10) == matches[:-1]
+    assert calls == [ ("ABCD", 10) ]
+
+    # The least recently used entry is evicted
+    matcher.get_matches("abcd", 5)
+    matcher.get_matches("abcd", 10)
+    matcher.get_matches("bcde", 10)
+    assert list(matcher._cache) == [ ("ABCD", 10), ("BCDE", 10) ]
+    matcher.get_matches("abcd", 5)
+    assert calls == [ ("ABCD", 10), ("ABCD", 5), ("BCDE", 10), ("ABCD", 5) ]
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_kg_map_builder.py
+# run just certain tests: pytest -v test_ARAX_kg_map_builder.py -k test_build_matches_original_builder
+
+import sys
+import os
+import json
+import copy
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../NodeSynonymizer")
+from node_synonymizer import NodeSynonymizer
+from kg_map_builder import KGMapBuilder
+
+
+# A toy KG2: kg2_node_info.tsv lines (curie, name, full name, category)
+toy_nodes = [
+    ("MONDO:0005148", "type 2 diabetes mellitus (disease)", "type 2 diabetes mellitus", "biolink:Disease"),
+    ("DOID:9352", "type 2 diabetes mellitus", "type 2 diabetes mellitus", "biolink:Disease"),
+    ("UniProtKB:P04637", "Cellular tumor antigen p53", "Cellular tumor antigen p53", "biolink:Protein"),
+    ("NCBIGene:7157", "TP53", "tumor protein p53", "biolink:Gene"),
+    ("HGNC:11998", "TP53 (human)", "tumor protein p53", "biolink:Gene"),
+    ("CHEBI:15365", "aspirin", "aspirin", "biolink:SmallMolecule"),
+    ("DRUGBANK:DB00945", "Aspirin", "Aspirin", "biolink:Drug"),
+    ("MESH:D004921", "Erythropoietin", "Erythropoietin", "biolink:Protein"),
+    ("UMLS:C0015967", "Fever", "Fever", "biolink:PhenotypicFeature"),
+    ("HP:0001945", "Fever", "Fever", "biolink:PhenotypicFeature"),
+    ("NCBIGene:43", "ACHE", "acetylcholinesterase (Cartwright blood group)", "biolink:Gene"),
+    ("NCBIGene:100000001", "LOC100000001", "Genetic locus associated with fever", "biolink:Gene"),
+    ("OMIM:601019", "TOY SYNDROME; TS1", "TOY SYNDROME", "biolink:Disease"),
+    ("REACT:R-HSA-0000001", "Toy signaling pathway (TSP1)", "Toy signaling pathway", "biolink:Pathway"),
+    ("NOTSUPPORTED:0001", "unsupported thing", "unsupported thing", "biolink:NamedThing"),
+    ("biolink:Disease", "Disease", "Disease", "biolink:NamedThing"),
+]
+
+toy_equivalencies = [
+    ("CHEBI:15365", "DRUGBANK:DB00945"),
+    ("UMLS:C0015967", "MESH:D005334"),
+    ("OMIM:601019", "MONDO:0005148"),
+    ("UNKNOWN:0001", "UNKNOWN:0002"),
+]
+
+toy_synonyms = {
+    "CHEBI:15365": ["acetylsalicylic acid", "ASA"],
+    "NCBIGene:7157": ["p53", "TP53"],
+    "UNKNOWN:0001": ["nothing"],
+}
+
+toy_exceptions = """# Toy exceptions
+skip_SRI MESH:D004921
+rename NCBIGENE:43 AChE (human)
+"""
+
+# What the SRI node normalizer knows: preferred (curie, label), type, and the other equivalent (curie, label)s
+toy_normalizer_concepts = [
+    (("MONDO:0005148", "type 2 diabetes mellitus"), "biolink:Disease", [("DOID:9352", "type 2 diabetes mellitus"),
+                                                                        ("UMLS:C0011860", "Diabetes Mellitus, Non-Insulin-Dependent")]),
+    (("NCBIGene:7157", "TP53"), "biolink:Gene", [("UniProtKB:P04637", "Cellular tumor antigen p53"), ("HGNC:11998", "TP53"),
+                                                 ("ENSEMBL:ENSG00000141510", None)]),
+    (("CHEBI:15365", "aspirin"), "biolink:SmallMolecule", [("PUBCHEM.COMPOUND:2244", "Aspirin")]),
+    (("UMLS:C0015967", "Fever"), "biolink:PhenotypicFeature", []),
+    (("NCBIGene:43", "ACHE"), "biolink:Gene", [("UniProtKB:P22303", "Acetylcholinesterase")]),
+    (("MESH:D004921", "Erythropoietin"), "biolink:Protein", [("NCBIGene:2056", "EPO")]),
+]
+
+
+class _ToyNormalizer:
+    """
+    Stands in for SriNodeNormalizer with a loaded cache, answering from toy_normalizer_concepts
+    """
+
+    curie_prefix_tx_arax2sri = {}
+
+    def __init__(self):
+        self.equivalences = {}
+        for (preferred_curie, preferred_name), category, others in toy_normalizer_concepts:
+            identifiers = [(preferred_curie, preferred_name)] + others
+            equivalence = { 'status': 'OK', 'preferred_curie': preferred_curie, 'preferred_curie_name': preferred_name, 'type': category,
+                'equivalent_identifiers': [ { 'identifier': curie, 'label': name } if name is not None else { 'identifier': curie }
+                                            for curie, name in identifiers ],
+                'equivalent_names': [ name for _, name in identifiers if name is not None ] }
+            for curie, _ in identifiers:
+                self.equivalences[curie] = equivalence
+
+    def get_supported_types(self):
+        return { category: 1 for _, category, _ in toy_normalizer_concepts }
+
+    def get_supported_prefixes(self):
+        return [ 'MONDO', 'DOID', 'NCBIGene', 'UniProtKB', 'HGNC', 'CHEBI', 'DRUGBANK', 'MESH', 'UMLS', 'HP', 'OMIM', 'REACT', 'biolink' ]
+
+    def get_curie_equivalence(self, curie, cache_only=None):
+        equivalence = self.equivalences.get(curie)
+        if equivalence is None:
+            return { 'status': 'no information', 'curie': curie, 'preferred_curie': '', 'preferred_curie_name': '', 'type': '',
+                     'equivalent_identifiers': [], 'equivalent_names': [] }
+        return dict(copy.deepcopy(equivalence), curie=curie)
+
+
+def _write_toy_kg2_files(directory):
+    with open(f"{directory}/kg2_node_info.tsv", "w") as fid:
+        fid.writelines("\t".join(node) + "\n" for node in toy_nodes)
+    with open(f"{directory}/kg2_equivalencies.tsv", "w") as fid:
+        fid.write("n1.id\tn2.id\n")
+        fid.writelines("\t".join(equivalency) + "\n" for equivalency in toy_equivalencies)
+    with open(f"{directory}/kg2_synonyms.json", "w") as fid:
+        json.dump(toy_synonyms, fid)
+    with open(f"{directory}/Exceptions.txt", "w") as fid:
+        fid.write(toy_exceptions)
+
+
+# The tables built from the toy KG2 by the NodeSynonymizer's original (dict-based) builder
+expected_tables = {
+    'nodes': [
+        ('BIOLINK:DISEASE', 'biolink:Disease', 'Disease', 'Disease', 'Disease', 'biolink:NamedThing', 'BIOLINK:DISEASE'),
+        ('CHEBI:15365', 'CHEBI:15365', 'aspirin', 'aspirin', 'aspirin', 'biolink:SmallMolecule', 'DRUGBANK:DB00945'),
+        ('DOID:9352', 'DOID:9352', 'type 2 diabetes mellitus', 'type 2 diabetes mellitus', 'type 2 diabetes mellitus', 'biolink:Disease', 'MONDO:0005148'),
+        ('DRUGBANK:DB00945', 'DRUGBANK:DB00945', 'Aspirin', 'Aspirin', 'Aspirin', 'biolink:Drug', 'DRUGBANK:DB00945'),
+        ('HGNC:11998', 'HGNC:11998', 'TP53 (human)', 'TP53', 'tumor protein p53', 'biolink:Gene', 'UNIPROTKB:P04637'),
+        ('HP:0001945', 'HP:0001945', 'Fever', 'Fever', 'Fever', 'biolink:PhenotypicFeature', 'UMLS:C0015967'),
+        ('MESH:D004921', 'MESH:D004921', 'Erythropoietin', 'Erythropoietin', 'Erythropoietin', 'biolink:Protein', 'MESH:D004921'),
+        ('MONDO:0005148', 'MONDO:0005148', 'type 2 diabetes mellitus (disease)', 'type 2 diabetes mellitus', 'type 2 diabetes mellitus', 'biolink:Disease', 'MONDO:0005148'),
+        ('NCBIGENE:100000001', 'NCBIGene:100000001', 'LOC100000001', 'LOC100000001', 'Genetic locus associated with fever', 'biolink:Gene', 'NCBIGENE:100000001'),
+        ('NCBIGENE:43', 'NCBIGene:43', 'ACHE', 'AChE (human)', 'acetylcholinesterase (Cartwright blood group)', 'biolink:Gene', 'NCBIGENE:43'),
+        ('NCBIGENE:7157', 'NCBIGene:7157', 'TP53', 'TP53', 'tumor protein p53', 'biolink:Gene', 'UNIPROTKB:P04637'),
+        ('NOTSUPPORTED:0001', 'NOTSUPPORTED:0001', 'unsupported thing', 'unsupported thing', 'unsupported thing', 'biolink:NamedThing', 'NOTSUPPORTED:0001'),
+        ('OMIM:601019', 'OMIM:601019', 'TOY SYNDROME; TS1', 'TOY SYNDROME; TS1', 'TOY SYNDROME', 'biolink:Disease', 'MONDO:0005148'),
+        ('REACT:R-HSA-0000001', 'REACT:R-HSA-0000001', 'Toy signaling pathway (TSP1)', 'Toy signaling pathway (TSP1)', 'Toy signaling pathway', 'biolink:Pathway', 'REACT:R-HSA-0000001'),
+        ('UMLS:C0015967', 'UMLS:C0015967', 'Fever', 'Fever', 'Fever', 'biolink:PhenotypicFeature', 'UMLS:C0015967'),
+        ('UNIPROTKB:P04637', 'UniProtKB:P04637', 'Cellular tumor antigen p53', 'Cellular tumor antigen p53', 'Cellular tumor antigen p53', 'biolink:Protein', 'UNIPROTKB:P04637'),
+    ],
+    'unique_concepts': [
+        ('BIOLINK:DISEASE', 'biolink:Disease', 'Disease', 'biolink:NamedThing', None, None, None),
+        ('DRUGBANK:DB00945', 'DRUGBANK:DB00945', 'Aspirin', 'biolink:Drug', 'CHEBI:15365', 'aspirin', 'biolink:SmallMolecule'),
+        ('MESH:D004921', 'MESH:D004921', 'Erythropoietin', 'biolink:Protein', None, None, None),
+        ('MONDO:0005148', 'MONDO:0005148', 'type 2 diabetes mellitus', 'biolink:Disease', 'MONDO:0005148', 'type 2 diabetes mellitus', 'biolink:Disease'),
+        ('NCBIGENE:100000001', 'NCBIGene:100000001', 'Genetic locus associated with fever', 'biolink:Gene', None, None, None),
+        ('NCBIGENE:43', 'NCBIGene:43', 'AChE (human)', 'biolink:Gene', 'NCBIGene:43', 'AChE (human)', 'biolink:Gene'),
+        ('NOTSUPPORTED:0001', 'NOTSUPPORTED:0001', 'unsupported thing', 'biolink:NamedThing', None, None, None),
+        ('REACT:R-HSA-0000001', 'REACT:R-HSA-0000001', 'Toy signaling pathway (TSP1)', 'biolink:Pathway', None, None, None),
+        ('UMLS:C0015967', 'UMLS:C0015967', 'Fever', 'biolink:PhenotypicFeature', 'UMLS:C0015967', 'Fever', 'biolink:PhenotypicFeature'),
+        ('UNIPROTKB:P04637', 'UniProtKB:P04637', 'Cellular tumor antigen p53', 'biolink:Protein', 'NCBIGene:7157', 'TP53', 'biolink:Gene'),
+    ],
+    'curies': [
+        ('BIOLINK:DISEASE', 'biolink:Disease', 'BIOLINK:DISEASE', 'Disease', 'Disease', 'biolink:NamedThing', '', '', 'KG2'),
+        ('CHEBI:15365', 'CHEBI:15365', 'DRUGBANK:DB00945', 'aspirin', 'aspirin', 'biolink:SmallMolecule', 'aspirin', 'biolink:SmallMolecule', 'KG2,SRI_NN'),
+        ('DOID:9352', 'DOID:9352', 'MONDO:0005148', 'type 2 diabetes mellitus', 'type 2 diabetes mellitus', 'biolink:Disease', 'type 2 diabetes mellitus', 'biolink:Disease', 'KG2,SRI_NN'),
+        ('DRUGBANK:DB00945', 'DRUGBANK:DB00945', 'DRUGBANK:DB00945', 'Aspirin', 'Aspirin', 'biolink:Drug', '', '', 'KG2,KG2equivs'),
+        ('ENSEMBL:ENSG00000141510', 'ENSEMBL:ENSG00000141510', 'UNIPROTKB:P04637', None, None, None, None, 'biolink:Gene', 'SRI_NN'),
+        ('HGNC:11998', 'HGNC:11998', 'UNIPROTKB:P04637', 'TP53', 'tumor protein p53', 'biolink:Gene', 'TP53', 'biolink:Gene', 'KG2,SRI_NN'),
+        ('HP:0001945', 'HP:0001945', 'UMLS:C0015967', 'Fever', 'Fever', 'biolink:PhenotypicFeature', '', '', 'KG2'),
+        ('MESH:D004921', 'MESH:D004921', 'MESH:D004921', 'Erythropoietin', 'Erythropoietin', 'biolink:Protein', '', '', 'KG2'),
+        ('MESH:D005334', 'MESH:D005334', 'UMLS:C0015967', None, None, 'biolink:PhenotypicFeature', None, None, 'KG2equivs'),
+        ('MONDO:0005148', 'MONDO:0005148', 'MONDO:0005148', 'type 2 diabetes mellitus', 'type 2 diabetes mellitus', 'biolink:Disease', 'type 2 diabetes mellitus', 'biolink:Disease', 'KG2,SRI_NN,KG2equivs'),
+        ('NCBIGENE:100000001', 'NCBIGene:100000001', 'NCBIGENE:100000001', 'LOC100000001', 'Genetic locus associated with fever', 'biolink:Gene', '', '', 'KG2'),
+        ('NCBIGENE:43', 'NCBIGene:43', 'NCBIGENE:43', 'AChE (human)', 'acetylcholinesterase (Cartwright blood group)', 'biolink:Gene', 'ACHE', 'biolink:Gene', 'KG2,SRI_NN'),
+        ('NCBIGENE:7157', 'NCBIGene:7157', 'UNIPROTKB:P04637', 'TP53', 'tumor protein p53', 'biolink:Gene', 'TP53', 'biolink:Gene', 'KG2,SRI_NN'),
+        ('NOTSUPPORTED:0001', 'NOTSUPPORTED:0001', 'NOTSUPPORTED:0001', 'unsupported thing', 'unsupported thing', 'biolink:NamedThing', '', '', 'KG2'),
+        ('OMIM:601019', 'OMIM:601019', 'MONDO:0005148', 'TOY SYNDROME; TS1', 'TOY SYNDROME', 'biolink:Disease', '', '', 'KG2'),
+        ('PUBCHEM.COMPOUND:2244', 'PUBCHEM.COMPOUND:2244', 'DRUGBANK:DB00945', None, None, None, 'Aspirin', 'biolink:SmallMolecule', 'SRI_NN'),
+        ('REACT:R-HSA-0000001', 'REACT:R-HSA-0000001', 'REACT:R-HSA-0000001', 'Toy signaling pathway (TSP1)', 'Toy signaling pathway', 'biolink:Pathway', '', '', 'KG2'),
+        ('UMLS:C0011860', 'UMLS:C0011860', 'MONDO:0005148', None, None, None, 'Diabetes Mellitus, Non-Insulin-Dependent', 'biolink:Disease', 'SRI_NN'),
+        ('UMLS:C0015967', 'UMLS:C0015967', 'UMLS:C0015967', 'Fever', 'Fever', 'biolink:PhenotypicFeature', 'Fever', 'biolink:PhenotypicFeature', 'KG2,SRI_NN'),
+        ('UNIPROTKB:P04637', 'UniProtKB:P04637', 'UNIPROTKB:P04637', 'Cellular tumor antigen p53', 'Cellular tumor antigen p53', 'biolink:Protein', 'Cellular tumor antigen p53', 'biolink:Protein', 'KG2,SRI_NN'),
+        ('UNIPROTKB:P22303', 'UniProtKB:P22303', 'NCBIGENE:43', None, None, None, 'Acetylcholinesterase', 'biolink:Protein', 'SRI_NN'),
+    ],
+    'names': [
+        ('acetylsalicylic acid', 'acetylsalicylic acid', 'DRUGBANK:DB00945', 'KG2syn', 'acetylsalicylic'),
+        ('ache (human)', 'AChE (human)', 'NCBIGENE:43', 'SRI', 'ache'),
+        ('asa', 'ASA', 'DRUGBANK:DB00945', 'KG2syn', 'asa'),
+        ('aspirin', 'aspirin', 'DRUGBANK:DB00945', 'SRI', 'aspirin'),
+        ('cellular tumor antigen p53', 'Cellular tumor antigen p53', 'UNIPROTKB:P04637', 'SRI', 'cellular'),
+        ('diabetes mellitus, non-insulin-dependent', 'Diabetes Mellitus, Non-Insulin-Dependent', 'MONDO:0005148', 'SRI', 'diabetes'),
+        ('disease', 'Disease', 'BIOLINK:DISEASE', 'KG2', 'disease'),
+        ('erythropoietin', 'Erythropoietin', 'MESH:D004921', 'KG2', 'erythropoietin'),
+        ('fever', 'Fever', 'UMLS:C0015967', 'SRI', 'fever'),
+        ('loc100000001', 'LOC100000001', 'NCBIGENE:100000001', 'KG2', 'loc100000001'),
+        ('p04637', 'P04637', 'UNIPROTKB:P04637', 'KG2', 'p04637'),
+        ('p53', 'p53', 'UNIPROTKB:P04637', 'KG2syn', 'p53'),
+        ('toy signaling pathway', 'Toy signaling pathway', 'REACT:R-HSA-0000001', 'KG2', 'toy'),
+        ('toy signaling pathway (tsp1)', 'Toy signaling pathway (TSP1)', 'REACT:R-HSA-0000001', 'KG2', 'toy'),
+        ('toy syndrome; ts1', 'TOY SYNDROME; TS1', 'MONDO:0005148', 'KG2', 'toy'),
+        ('tp53', 'TP53', 'UNIPROTKB:P04637', 'SRI', 'tp53'),
+        ('tsp1', 'TSP1', 'REACT:R-HSA-0000001', 'KG2', 'tsp1'),
+        ('type 2 diabetes mellitus', 'type 2 diabetes mellitus', 'MONDO:0005148', 'SRI', 'type'),
+        ('unsupported thing', 'unsupported thing', 'NOTSUPPORTED:0001', 'KG2', 'unsupported'),
+    ],
+    'name_curies': [
+        ('acetylsalicylic acid', 'acetylsalicylic acid', 'CHEBI:15365', 'DRUGBANK:DB00945', 'KG2syn'),
+        ('asa', 'ASA', 'CHEBI:15365', 'DRUGBANK:DB00945', 'KG2syn'),
+        ('p53', 'p53', 'NCBIGENE:7157', 'UNIPROTKB:P04637', 'KG2syn'),
+        ('tp53', 'TP53', 'NCBIGENE:7157', 'UNIPROTKB:P04637', 'KG2syn'),
+    ],
+}
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_build_matches_original_builder(tmp_path, monkeypatch, processes):
+    monkeypatch.chdir(tmp_path)
+    _write_toy_kg2_files(str(tmp_path))
+    synonymizer = NodeSynonymizer()
+    synonymizer.disconnect()
+    synonymizer.databaseLocation = str(tmp_path)
+    synonymizer.databaseName = "toy_node_synonymizer.sqlite"
+    synonymizer.connect(read_only=False)
+    synonymizer.normalizer = _ToyNormalizer()
+
+    builder = KGMapBuilder(synonymizer, processes=processes)
+    assert builder.read_nodes()
+    builder.import_equivalencies()
+    builder.import_synonyms()
+    builder.merge_concepts()
+    builder.reprioritize_concepts()
+    synonymizer.create_tables()
+    builder.store()
+
+    for table_name, expected_rows in expected_tables.items():
+        assert sorted(synonymizer.connection.execute(f"SELECT * FROM {table_name}")) == expected_rows, table_name
+    synonymizer.disconnect()
+
+
+def test_empty_normalizer_name_is_an_error(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_toy_kg2_files(str(tmp_path))
+    synonymizer = NodeSynonymizer()
+    synonymizer.databaseLocation = str(tmp_path)
+    synonymizer.normalizer = _ToyNormalizer()
+    synonymizer.normalizer.equivalences["CHEBI:15365"]['equivalent_names'].append('')
+
+    with pytest.raises(ValueError, match="CHEBI:15365"):
+        KGMapBuilder(synonymizer, processes=1).read_nodes()
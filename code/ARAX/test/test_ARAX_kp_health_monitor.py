@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_kp_health_monitor.py
+# run just certain tests: pytest -v test_ARAX_kp_health_monitor.py -k test_circuit_breaker
+
+import sys
+import os
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Expand")
+from kp_health_monitor import KPHealthMonitor
+
+
+@pytest.fixture(autouse=True)
+def empty_monitor(tmp_path, monkeypatch):
+    monkeypatch.setattr(KPHealthMonitor, "enabled", True)
+    monkeypatch.setattr(KPHealthMonitor, "sqlite_path", str(tmp_path / "kp_health.sqlite"))
+    monkeypatch.setattr(KPHealthMonitor, "_thread_local", threading.local())
+    monkeypatch.setattr(KPHealthMonitor, "_stats_cache", dict())
+
+
+def _get_request_body(num_ids):
+    return {"message": {"query_graph": {"nodes": {"n0": {"ids": [f"CHEBI:{i}" for i in range(num_ids)], "categories": ["biolink:Drug"]},
+                                                  "n1": {"categories": ["biolink:Disease"]}},
+                                        "edges": {"e0": {"subject": "n0", "object": "n1", "predicates": ["biolink:treats"]}}}}}
+
+
+def test_query_shape():
+    assert KPHealthMonitor.get_query_shape(_get_request_body(3)) == "biolink:Drug(4ids)|biolink:Disease(unpinned)|biolink:treats"
+    assert KPHealthMonitor.get_query_shape(_get_request_body(4)) == KPHealthMonitor.get_query_shape(_get_request_body(3))
+    assert KPHealthMonitor.get_query_shape(_get_request_body(5)) != KPHealthMonitor.get_query_shape(_get_request_body(4))
+
+
+def test_circuit_breaker(monkeypatch):
+    # Closed: failures below the threshold (or interrupted by a success) don't stop queries
+    for _ in range(KPHealthMonitor.circuit_failure_threshold - 1):
+        KPHealthMonitor.record_outcome("infores:kp", "shape", 10, "Error")
+    assert KPHealthMonitor.get_open_circuit_message("infores:kp") is None
+    KPHealthMonitor.record_outcome("infores:kp", "shape", 1, "Done")
+    KPHealthMonitor.record_outcome("infores:kp", "shape", 10, "Timed out")
+    assert KPHealthMonitor.get_open_circuit_message("infores:kp") is None
+
+    # Open: enough consecutive failures (of any query shape) stop queries to that KP only
+    for _ in range(KPHealthMonitor.circuit_failure_threshold - 1):
+        KPHealthMonitor.record_outcome("infores:kp", "other shape", 10, "Error")
+    message = KPHealthMonitor.get_open_circuit_message("infores:kp")
+    assert message.startswith(f"Not querying this KP for now; its last {KPHealthMonitor.circuit_failure_threshold} queries failed")
+    assert KPHealthMonitor.get_open_circuit_message("infores:other-kp") is None
+    assert KPHealthMonitor.get_latency_summary("infores:kp")["consecutive_failures"] == KPHealthMonitor.circuit_failure_threshold
+
+    # Half-open: once the cool-down has passed queries are let through again, with the full timeout
+    monkeypatch.setattr(KPHealthMonitor, "circuit_cooldown", 0)
+    assert KPHealthMonitor.get_open_circuit_message("infores:kp") is None
+    assert KPHealthMonitor.get_deadline("infores:kp", "shape", 300) == 300
+
+    # Another failure keeps it open; one success closes it
+    monkeypatch.setattr(KPHealthMonitor, "circuit_cooldown", 5 * 60)
+    KPHealthMonitor.record_outcome("infores:kp", "shape", 10, "Timed out")
+    assert KPHealthMonitor.get_open_circuit_message("infores:kp") is not None
+    KPHealthMonitor.record_outcome("infores:kp", "shape", 1, "Done")
+    assert KPHealthMonitor.get_open_circuit_message("infores:kp") is None
+    assert KPHealthMonitor.get_latency_summary("infores:kp") == {"num_queries": 12, "num_timeouts": 2, "num_errors": 8,
+                                                                "consecutive_failures": 0, "p50_seconds": 1.0,
+                                                                "p90_seconds": 1.0, "p95_seconds": 1.0, "p99_seconds": 1.0}
+
+
+def test_deadline(monkeypatch):
+    # Without enough history the default timeout is used
+    for _ in range(KPHealthMonitor.min_samples - 1):
+        KPHealthMonitor.record_outcome("infores:kp", "fast shape", 2, "Done")
+    assert KPHealthMonitor.get_deadline("infores:kp", "fast shape", 300) == 300
+
+    # Then a padded percentile of the successful durations, per query shape where there's enough history for it
+    KPHealthMonitor.record_outcome("infores:kp", "fast shape", 2, "Done")
+    assert KPHealthMonitor.get_deadline("infores:kp", "fast shape", 300) == KPHealthMonitor.min_deadline
+    for _ in range(KPHealthMonitor.min_samples):
+        KPHealthMonitor.record_outcome("infores:kp", "slow shape", 100, "Done")
+    assert KPHealthMonitor.get_deadline("infores:kp", "slow shape", 300) == 155
+    assert KPHealthMonitor.get_deadline("infores:kp", "slow shape", 120) == 120
+    assert KPHealthMonitor.get_deadline("infores:kp", "rare shape", 300) == 155
+
+    # Stats are reused for a little while, but not past a new outcome for the KP
+    KPHealthMonitor.record_outcome("infores:kp", "fast shape", 10, "Timed out")
+    assert KPHealthMonitor.get_deadline("infores:kp", "fast shape", 300) == 300
+
+    monkeypatch.setattr(KPHealthMonitor, "enabled", False)
+    assert KPHealthMonitor.get_deadline("infores:kp", "slow shape", 300) == 300
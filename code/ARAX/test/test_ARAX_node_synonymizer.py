@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_node_synonymizer.py
+# run just certain tests: pytest -v test_ARAX_node_synonymizer.py -k test_concept_index_matches_sql
+
+import sys
+import os
+import shutil
+import json
+import sqlite3
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../NodeSynonymizer")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+from node_synonymizer import NodeSynonymizer
+from sqlite_connection_registry import SqliteConnectionRegistry
+from concept_index import ConceptIndex
+from category_manager import CategoryManager
+
+
+# A toy synonymizer: (concept curie, name, category, [(curie, name, category), ...], [names])
+toy_concepts = [
+    ("CHEBI:15365", "aspirin", "biolink:SmallMolecule", [("CHEBI:15365", "aspirin", "biolink:SmallMolecule"),
+                                                         ("DRUGBANK:DB00945", "Aspirin", "biolink:Drug"),
+                                                         ("MESH:D001241", "Aspirin", None)], ["Aspirin", "acetylsalicylic acid"]),
+    ("NCBIGene:7157", "TP53", "biolink:Gene", [("NCBIGene:7157", "TP53", "biolink:Gene"),
+                                               ("UniProtKB:P04637", "Cellular tumor antigen p53", "biolink:Protein"),
+                                               ("HGNC:11998", "TP53", "biolink:Gene")], ["TP53", "p53"]),
+    ("MONDO:0005148", "type 2 diabetes mellitus", "biolink:Disease", [("MONDO:0005148", "type 2 diabetes mellitus", "biolink:Disease"),
+                                                                      ("DOID:9352", "type 2 diabetes mellitus", "biolink:Disease")], []),
+    ("UMLS:C0015967", "Fever", "biolink:PhenotypicFeature", [("UMLS:C0015967", "Fever", "biolink:PhenotypicFeature")], ["fever", "pyrexia"]),
+]
+
+
+# A toy Biolink hierarchy: category -> ancestors
+toy_ancestors = {
+    "biolink:NamedThing": ["biolink:NamedThing", "biolink:Entity"],
+    "biolink:BiologicalEntity": ["biolink:BiologicalEntity", "biolink:NamedThing", "biolink:Entity"],
+    "biolink:ChemicalEntity": ["biolink:ChemicalEntity", "biolink:NamedThing", "biolink:Entity"],
+    "biolink:SmallMolecule": ["biolink:SmallMolecule", "biolink:ChemicalEntity", "biolink:NamedThing", "biolink:Entity"],
+    "biolink:Drug": ["biolink:Drug", "biolink:ChemicalEntity", "biolink:NamedThing", "biolink:Entity"],
+    "biolink:Gene": ["biolink:Gene", "biolink:BiologicalEntity", "biolink:NamedThing", "biolink:Entity"],
+    "biolink:Protein": ["biolink:Protein", "biolink:BiologicalEntity", "biolink:NamedThing", "biolink:Entity"],
+    "biolink:DiseaseOrPhenotypicFeature": ["biolink:DiseaseOrPhenotypicFeature", "biolink:BiologicalEntity", "biolink:NamedThing", "biolink:Entity"],
+    "biolink:Disease": ["biolink:Disease", "biolink:DiseaseOrPhenotypicFeature", "biolink:BiologicalEntity", "biolink:NamedThing", "biolink:Entity"],
+    "biolink:PhenotypicFeature": ["biolink:PhenotypicFeature", "biolink:DiseaseOrPhenotypicFeature", "biolink:BiologicalEntity", "biolink:NamedThing", "biolink:Entity"],
+}
+
+
+@pytest.fixture
+def toy_biolink(monkeypatch):
+    monkeypatch.setattr(CategoryManager, "get_ancestors", lambda self, category: toy_ancestors.get(category, [category]) if category is not None else None)
+    monkeypatch.setattr(CategoryManager, "get_descendants", lambda self, category: sorted(toy_ancestors))
+    monkeypatch.setattr(CategoryManager, "_computed_expansions", {})
+
+
+def _get_toy_synonymizer(tmp_path) -> NodeSynonymizer:
+    synonymizer = NodeSynonymizer()
+    synonymizer.disconnect()
+    synonymizer.databaseLocation = str(tmp_path)
+    synonymizer.databaseName = "toy_node_synonymizer.sqlite"
+    synonymizer.connect(read_only=False)
+    synonymizer.create_tables()
+    for concept_curie, concept_name, concept_category, nodes, names in toy_concepts:
+        synonymizer.connection.execute("INSERT INTO unique_concepts VALUES (?,?,?,?,?,?,?)",
+                                       (concept_curie.upper(), concept_curie, concept_name, concept_category, concept_curie, concept_name, concept_category))
+        for curie, name, category in nodes:
+            synonymizer.connection.execute("INSERT INTO nodes VALUES (?,?,?,?,?,?,?)",
+                                           (curie.upper(), curie, name, name, name, category, concept_curie.upper()))
+            synonymizer.connection.execute("INSERT INTO curies VALUES (?,?,?,?,?,?,?,?,?)",
+                                           (curie.upper(), curie, concept_curie.upper(), name, name, category, concept_name, concept_category, "KG2"))
+            names = names + [name]
+        for name in names:
+            synonymizer.connection.execute("INSERT INTO names VALUES (?,?,?,?,?)",
+                                           (name.lower(), name, concept_curie.upper(), "KG2", name.lower().split()[0]))
+    synonymizer.connection.commit()
+    synonymizer.create_indexes()
+    synonymizer.disconnect()
+    synonymizer.connect()
+    return synonymizer
+
+
+def test_concept_index_matches_sql(tmp_path):
+    synonymizer = _get_toy_synonymizer(tmp_path)
+    database_path = f"{synonymizer.databaseLocation}/{synonymizer.databaseName}"
+    curies = [curie for _, _, _, nodes, _ in toy_concepts for curie, _, _ in nodes]
+    curies += ["CHEBI:0000000", "NOT A CURIE"]
+    other_case_curies = ["drugbank:db00945", "Hgnc:11998", "mondo:0005148"]
+    names = ["ASPIRIN", "p53", "pyrexia", "type 2 diabetes mellitus", "no such name"]
+
+    def get_results():
+        return [synonymizer.get_canonical_curies(curies),
+                synonymizer.get_canonical_curies(other_case_curies),
+                synonymizer.get_canonical_curies(names=names),
+                synonymizer.get_equivalent_nodes(curies),
+                synonymizer.get_equivalent_nodes(other_case_curies),
+                synonymizer.get_curie_names(curies + other_case_curies),
+                synonymizer.get_normalizer_results(curies + names)]
+
+    assert synonymizer.get_concept_index() is None
+    sql_results = get_results()
+    assert sql_results[0]["DRUGBANK:DB00945"]["preferred_curie"] == "CHEBI:15365"
+    assert sql_results[0]["CHEBI:0000000"] is None
+    assert sql_results[1]["drugbank:db00945"]["preferred_curie"] == "CHEBI:15365"
+    assert sql_results[2]["pyrexia"]["preferred_curie"] == "UMLS:C0015967"
+
+    synonymizer.build_concept_index()
+    assert synonymizer.get_concept_index() is not None
+    assert get_results() == sql_results
+
+    # Unlike the SQL version, which only resolves one of several inputs that differ just in case, the index resolves all
+    results = synonymizer.get_canonical_curies(["CHEBI:15365", "chebi:15365"])
+    assert results["chebi:15365"] == results["CHEBI:15365"] == sql_results[0]["CHEBI:15365"]
+
+    # An index that doesn't go with the database (e.g., it was fetched or built for another version) isn't used
+    with open(database_path, "ab") as fid:
+        fid.write(b"\0" * 1024)
+    assert synonymizer.get_concept_index() is None
+    shutil.rmtree(ConceptIndex.get_index_path(database_path))
+    assert synonymizer.get_concept_index() is None
+
+
+def test_writable_connection_bypasses_registry(tmp_path):
+    synonymizer = _get_toy_synonymizer(tmp_path)
+    database_path = f"{synonymizer.databaseLocation}/{synonymizer.databaseName}"
+    read_only_connection = synonymizer.connection
+    assert read_only_connection is SqliteConnectionRegistry.get_connection(database_path)
+    with pytest.raises(sqlite3.OperationalError):
+        read_only_connection.execute("DELETE FROM names")
+
+    # As for --build, --recollate and --update: a connection of its own that can write
+    statistics = SqliteConnectionRegistry.get_statistics()[database_path]
+    synonymizer.disconnect()
+    synonymizer.connect(read_only=False)
+    assert synonymizer.connection is not read_only_connection
+    assert synonymizer.connection is synonymizer.connection
+    synonymizer.connection.execute("DELETE FROM names WHERE lc_name = 'pyrexia'")
+    synonymizer.connection.commit()
+    assert SqliteConnectionRegistry.get_statistics()[database_path] == statistics
+    synonymizer.disconnect()
+
+
+def test_batched_normalizer_results_match_single(tmp_path):
+    synonymizer = _get_toy_synonymizer(tmp_path)
+    entities = ["DRUGBANK:DB00945", "hgnc:11998", "MONDO:0005148", "p53", "Pyrexia", "type 2 diabetes mellitus",
+                "CHEBI:0000000", "no such name", None, "UMLS:C0015967"]
+
+    batched_results = synonymizer.get_normalizer_results(entities)
+    assert list(batched_results) == entities
+    for entity in entities:
+        assert batched_results[entity] == synonymizer.get_normalizer_results([entity])[entity]
+        if entity is not None:
+            assert synonymizer.get_normalizer_results(entity) == { entity: batched_results[entity] }
+
+    assert batched_results["CHEBI:0000000"] is None
+    assert batched_results["no such name"] is None
+    assert batched_results[None] is None
+    assert batched_results["p53"]["id"]["identifier"] == "NCBIGene:7157"
+    assert { curie['identifier'] for curie in batched_results["hgnc:11998"]['equivalent_identifiers'] } == {"NCBIGene:7157", "UniProtKB:P04637", "HGNC:11998"}
+    assert batched_results["DRUGBANK:DB00945"]['categories'] == {"biolink:SmallMolecule": 3, "biolink:Drug": 1}
+    assert synonymizer.get_normalizer_results(None) is None
+
+
+def test_category_expansion_table_matches_computed(tmp_path, toy_biolink):
+    synonymizer = _get_toy_synonymizer(tmp_path)
+    expansion_table_path = synonymizer.get_category_expansion_table_path()
+    categories = sorted(toy_ancestors) + ["biolink:NotInBiolink"]
+
+    computed_expansions = { category: CategoryManager().get_expansive_categories(category) for category in categories }
+    assert set(computed_expansions["biolink:Gene"]) == {"biolink:Gene", "biolink:Protein", "biolink:BiologicalEntity", "biolink:NamedThing"}
+    sql_results = synonymizer.get_canonical_curies(curies=["DRUGBANK:DB00945", "HGNC:11998", "DOID:9352"], return_all_categories=True)
+
+    synonymizer.build_category_expansion_table()
+    category_manager = CategoryManager(expansion_table_path)
+    assert set(category_manager.expansion_table) == set(toy_ancestors) | {"biolink:SmallMolecule", "biolink:Gene", "biolink:Disease", "biolink:PhenotypicFeature"}
+    for category in categories:
+        assert category_manager.get_expansive_categories(category) == computed_expansions[category]
+    assert synonymizer.get_canonical_curies(curies=["DRUGBANK:DB00945", "HGNC:11998", "DOID:9352"], return_all_categories=True) == sql_results
+
+    # A table for another Biolink version isn't used
+    with open(expansion_table_path) as fid:
+        expansion_table = json.load(fid)
+    expansion_table['biolink_version'] = "0.0.1"
+    with open(expansion_table_path, "w") as fid:
+        json.dump(expansion_table, fid)
+    assert CategoryManager(expansion_table_path).expansion_table == {}
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_query_tracker.py
+# run just certain tests: pytest -v test_ARAX_query_tracker.py -k test_summary_of_recent_queries
+
+import sys
+import os
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+from ARAX_query_tracker import ARAXQueryTracker, ARAXQuery, Base
+
+
+#### The arax_query table as it was before start/end datetimes were stored as timestamps
+old_table_sql = """CREATE TABLE arax_query ( query_id INTEGER NOT NULL PRIMARY KEY, status VARCHAR(255) NOT NULL,
+    start_datetime VARCHAR(25) NOT NULL, end_datetime VARCHAR(25), elapsed FLOAT, pid INTEGER NOT NULL, domain VARCHAR(255),
+    hostname VARCHAR(255), instance_name VARCHAR(255) NOT NULL, origin VARCHAR(255) NOT NULL, input_query BLOB NOT NULL,
+    message_id INTEGER, message_code VARCHAR(255), code_description VARCHAR(255), remote_address VARCHAR(50) NOT NULL )"""
+
+
+@pytest.fixture
+def tracker(tmp_path, monkeypatch):
+    monkeypatch.setattr(ARAXQueryTracker, "_summary_cache", {})
+    tracker = ARAXQueryTracker()
+    tracker.engine_type = 'sqlite'
+    tracker.engine = create_engine(f"sqlite:///{tmp_path}/QueryTracker.sqlite")
+    tracker.session = sessionmaker(bind=tracker.engine)()
+    yield tracker
+    tracker.disconnect()
+
+
+def _add_old_entry(tracker, query_id, start_datetime, elapsed, origin, status='Completed'):
+    # As older versions stored them: ISO formatted strings
+    with tracker.engine.begin() as connection:
+        connection.execute(text("INSERT INTO arax_query (query_id, status, start_datetime, end_datetime, elapsed, pid, instance_name, origin, input_query, remote_address) "
+                                "VALUES (:query_id, :status, :start_datetime, :end_datetime, :elapsed, 1, 'ARAX', :origin, :input_query, '127.0.0.1')"),
+                           { 'query_id': query_id, 'status': status, 'start_datetime': start_datetime.isoformat(' ', 'seconds'),
+                             'end_datetime': (start_datetime + timedelta(seconds=elapsed)).isoformat(' ', 'seconds') if elapsed is not None else None,
+                             'elapsed': elapsed, 'origin': origin, 'input_query': b'\x80\x04N.' })
+
+
+def _add_entry(tracker, start_datetime, elapsed, origin, status='Completed'):
+    tracker.session.add(ARAXQuery(status=status, start_datetime=start_datetime, elapsed=elapsed, pid=1, instance_name='ARAX',
+                                  origin=origin, input_query={}, remote_address='127.0.0.1',
+                                  end_datetime=start_datetime + timedelta(seconds=elapsed) if elapsed is not None else None))
+    tracker.session.commit()
+
+
+@pytest.mark.parametrize("old_table", [ False, True ])
+def test_summary_of_recent_queries(tracker, old_table):
+    if old_table:
+        with tracker.engine.begin() as connection:
+            connection.execute(text(old_table_sql))
+        tracker.upgrade_table(tracker.engine, sqlalchemy.inspect(tracker.engine))
+        assert { index['name'] for index in sqlalchemy.inspect(tracker.engine).get_indexes(ARAXQuery.__tablename__) } == { 'ix_arax_query_start_datetime_status' }
+    else:
+        Base.metadata.create_all(tracker.engine)
+
+    now = datetime.now().replace(microsecond=0)
+    for i_query in range(20):
+        if old_table:
+            _add_old_entry(tracker, 1000 + i_query, now - timedelta(minutes=10 + i_query), i_query + 1, 'ARAX GUI')
+        else:
+            _add_entry(tracker, now - timedelta(minutes=10 + i_query), i_query + 1, 'ARAX GUI')
+    for elapsed in [ 100, 5 ]:
+        _add_entry(tracker, now - timedelta(hours=2), elapsed, 'infores:ars')
+    _add_entry(tracker, now - timedelta(minutes=1), None, 'infores:ars', status='started')
+    _add_entry(tracker, now - timedelta(minutes=1), 30, 'infores:ars', status='Running Async')
+    # Older than the range asked for
+    _add_entry(tracker, now - timedelta(hours=30), 1000, 'ARAX GUI')
+    if old_table:
+        _add_old_entry(tracker, 2000, now - timedelta(hours=30), 1000, 'ARAX GUI')
+
+    entries = tracker.get_entries(last_n_hours=24)
+    assert len(entries) == 24
+    assert [ entry.start_datetime for entry in entries ] == sorted(entry.start_datetime for entry in entries)
+    assert all(isinstance(entry.start_datetime, datetime) for entry in entries)
+    assert len(tracker.get_entries(last_n_hours=24, incomplete_only=True)) == 2
+    assert len(tracker.get_entries(last_n_hours=1)) == 22
+
+    summary = tracker.get_summary(last_n_hours=24)
+    assert summary == { 'n_running': 2, 'n_finished': 22, 'elapsed_by_submitter': {
+        'ARAX GUI': { 'n_queries': 20, 'p50': 10, 'p90': 18, 'p95': 19, 'max': 20 },
+        'infores:ars': { 'n_queries': 2, 'p50': 5, 'p90': 100, 'p95': 100, 'max': 100 } } }
+    assert tracker.get_summary(last_n_hours=1)['elapsed_by_submitter'] == { 'ARAX GUI': { 'n_queries': 20, 'p50': 10, 'p90': 18, 'p95': 19, 'max': 20 } }
+
+    # The summary is reused for a little while
+    _add_entry(tracker, now, 1, 'ARAX GUI')
+    assert tracker.get_summary(last_n_hours=24) is summary
+
+    status = tracker.get_status(last_n_hours=24)
+    assert len(status['recent_queries']) == 25
+    assert status['recent_queries'][0]['start_datetime'] == now.strftime("%Y-%m-%d %H:%M:%S")
+    assert status['recent_queries'][-1]['start_datetime'] == (now - timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def test_percentile():
+    assert ARAXQueryTracker._get_percentile([ 7 ], 50) == 7
+    assert ARAXQueryTracker._get_percentile([ 7 ], 95) == 7
+    values = list(range(1, 101))
+    for percentile in [ 1, 50, 90, 95, 99, 100 ]:
+        assert ARAXQueryTracker._get_percentile(values, percentile) == percentile
+    assert ARAXQueryTracker._get_percentile([ 1, 2, 3 ], 50) == 2
+    assert ARAXQueryTracker._get_percentile([ 1, 2, 3, 4 ], 50) == 2
+    assert ARAXQueryTracker._get_percentile([ 1, 2, 3, 4 ], 51) == 3
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_response_read_cache.py
+# run just certain tests: pytest -v test_ARAX_response_read_cache.py -k test_revalidated_against_storage
+
+import sys
+import os
+import time
+from collections import OrderedDict
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ResponseCache")
+from response_read_cache import ResponseReadCache
+
+
+class _FakeStorage:
+    """
+    A stand-in for S3ResponseStorage (or, with is_local, FilesystemResponseStorage) that counts the contents fetched
+    """
+
+    def __init__(self, is_local=False):
+        self.is_local = is_local
+        self.responses = dict()
+        self.n_gets = 0
+
+    def __str__(self):
+        return "fake storage"
+
+    def put(self, response_id, content, etag):
+        self.responses[response_id] = (content, etag)
+
+    def get(self, response_id):
+        self.n_gets += 1
+        return self.responses[response_id][0] if response_id in self.responses else None
+
+    def head(self, response_id):
+        if response_id not in self.responses:
+            return None
+        content, etag = self.responses[response_id]
+        return {'etag': etag, 'size': len(content)}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ResponseReadCache, "enabled", True)
+    monkeypatch.setattr(ResponseReadCache, "cache_dir", str(tmp_path / "cache"))
+    _start_new_process(monkeypatch)
+
+
+def _start_new_process(monkeypatch):
+    # A new (forked) query process starts out without any in-memory entries
+    monkeypatch.setattr(ResponseReadCache, "_memory_cache", OrderedDict())
+    monkeypatch.setattr(ResponseReadCache, "_memory_cache_bytes", 0)
+
+
+def _get_disk_files():
+    return sorted(os.listdir(ResponseReadCache.cache_dir)) if os.path.exists(ResponseReadCache.cache_dir) else []
+
+
+def test_revalidated_against_storage(monkeypatch):
+    storage = _FakeStorage()
+    assert ResponseReadCache.get_stored_content(storage, 1) is None
+    storage.put(1, b"response 1", "etag 1")
+
+    content, cache_key = ResponseReadCache.get_stored_content(storage, 1)
+    assert (content, cache_key) == (b"response 1", "fake storage/1")
+    assert ResponseReadCache.get_stored_content(storage, 1) == (b"response 1", cache_key)
+    assert storage.n_gets == 1
+
+    # Another process finds it on disk
+    _start_new_process(monkeypatch)
+    assert ResponseReadCache.get_stored_content(storage, 1) == (b"response 1", cache_key)
+    assert storage.n_gets == 1
+    assert len(_get_disk_files()) == 2
+
+    # A replaced response (a new ETag, or the same ETag but another size) is fetched again
+    storage.put(1, b"response 1, again", "etag 2")
+    assert ResponseReadCache.get_stored_content(storage, 1) == (b"response 1, again", cache_key)
+    assert storage.n_gets == 2
+    storage.put(1, b"response 1, once more", "etag 2")
+    assert ResponseReadCache.get_stored_content(storage, 1) == (b"response 1, once more", cache_key)
+    assert storage.n_gets == 3
+    _start_new_process(monkeypatch)
+    assert ResponseReadCache.get_stored_content(storage, 1) == (b"response 1, once more", cache_key)
+    assert storage.n_gets == 3
+
+    assert ResponseReadCache.get(cache_key, etag="etag 1") is None
+    assert ResponseReadCache.get(cache_key, etag="etag 2", size=1) is None
+
+
+def test_local_storage_is_not_copied_to_disk(monkeypatch):
+    storage = _FakeStorage(is_local=True)
+    storage.put(1, b"response 1", "etag 1")
+    assert ResponseReadCache.get_stored_content(storage, 1) == (b"response 1", "fake storage/1")
+    assert ResponseReadCache.get_stored_content(storage, 1) == (b"response 1", "fake storage/1")
+    assert storage.n_gets == 1
+    ResponseReadCache.set_validation_result("fake storage/1", "1.2.0", None)
+    assert ResponseReadCache.get_validation_result("fake storage/1", "1.2.0") == (True, None)
+    assert _get_disk_files() == []
+
+    # So another process reads it from the storage again
+    _start_new_process(monkeypatch)
+    assert ResponseReadCache.get_stored_content(storage, 1) == (b"response 1", "fake storage/1")
+    assert storage.n_gets == 2
+
+
+def test_validation_results_are_memoized(monkeypatch):
+    storage = _FakeStorage()
+    storage.put(1, b"response 1", "etag 1")
+    _, cache_key = ResponseReadCache.get_stored_content(storage, 1)
+    assert ResponseReadCache.get_validation_result(cache_key, "1.2.0") == (False, None)
+    ResponseReadCache.set_validation_result(cache_key, "1.2.0", None)
+    ResponseReadCache.set_validation_result(cache_key, "1.1.0", "'message' is a required property")
+    _start_new_process(monkeypatch)
+    assert ResponseReadCache.get_validation_result(cache_key, "1.2.0") == (True, None)
+    assert ResponseReadCache.get_validation_result(cache_key, "1.1.0") == (True, "'message' is a required property")
+
+    # But not for replaced content
+    storage.put(1, b"response 1, again", "etag 2")
+    ResponseReadCache.get_stored_content(storage, 1)
+    assert ResponseReadCache.get_validation_result(cache_key, "1.2.0") == (False, None)
+    assert ResponseReadCache.get_validation_result("fake storage/2", "1.2.0") == (False, None)
+    ResponseReadCache.set_validation_result("fake storage/2", "1.2.0", None)
+    assert ResponseReadCache.get("fake storage/2") is None
+
+
+def test_memory_lru_eviction(monkeypatch):
+    monkeypatch.setattr(ResponseReadCache, "memory_cache_size", 25)
+    for cache_key in [ "a", "b" ]:
+        ResponseReadCache.put(cache_key, cache_key.encode('utf-8') * 10, {'size': 10}, use_disk=False)
+    assert ResponseReadCache.get("a") == (b"a" * 10, {'size': 10, 'validation': {}})
+    ResponseReadCache.put("c", b"c" * 10, {'size': 10}, use_disk=False)
+    assert list(ResponseReadCache._memory_cache) == [ "a", "c" ]
+    assert ResponseReadCache._memory_cache_bytes == 20
+    assert ResponseReadCache.get("b") is None
+
+    # Replacing an entry doesn't count it twice, and one too big for memory is only kept on disk
+    ResponseReadCache.put("c", b"c" * 5, {'size': 5}, use_disk=False)
+    assert ResponseReadCache._memory_cache_bytes == 15
+    ResponseReadCache.put("d", b"d" * 30, {'size': 30})
+    assert list(ResponseReadCache._memory_cache) == [ "a", "c" ]
+    assert ResponseReadCache.get("d") == (b"d" * 30, {'size': 30, 'validation': {}})
+    assert list(ResponseReadCache._memory_cache) == [ "a", "c" ]
+
+
+def test_disk_lru_eviction(monkeypatch):
+    monkeypatch.setattr(ResponseReadCache, "disk_cache_size", 25)
+    ResponseReadCache.put("a", b"a" * 10, {'size': 10})
+    ResponseReadCache.put("b", b"b" * 10, {'size': 10})
+
+    # Reading "a" marks it as more recently used than "b"
+    now = time.time()
+    for age, cache_key in [ (100, "a"), (50, "b") ]:
+        os.utime(ResponseReadCache._get_paths(cache_key)[0], (now - age, now - age))
+    _start_new_process(monkeypatch)
+    assert ResponseReadCache.get("a") is not None
+
+    ResponseReadCache.put("c", b"c" * 10, {'size': 10})
+    _start_new_process(monkeypatch)
+    assert ResponseReadCache.get("b") is None
+    assert ResponseReadCache.get("a") is not None
+    assert ResponseReadCache.get("c") is not None
+    assert len(_get_disk_files()) == 4
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(ResponseReadCache, "enabled", False)
+    storage = _FakeStorage()
+    storage.put(1, b"response 1", "etag 1")
+    assert ResponseReadCache.get_stored_content(storage, 1) == (b"response 1", "fake storage/1")
+    assert ResponseReadCache.get_stored_content(storage, 1) == (b"response 1", "fake storage/1")
+    assert storage.n_gets == 2
+    assert ResponseReadCache.get("fake storage/1") is None
+    assert _get_disk_files() == []
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_response_storage.py
+# run just certain tests: pytest -v test_ARAX_response_storage.py -k test_filesystem_storage_round_trip
+
+import sys
+import os
+import json
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ResponseCache")
+from response_storage import FilesystemResponseStorage, ResponsePersistenceQueue, encode_response, decode_response
+
+
+def _get_envelope(response_id: int) -> dict:
+    return {"id": f"https://localhost/api/arax/v1.2/response/{response_id}", "status": "OK", "description": "Test",
+            "message": {"results": [{"node_bindings": {"n0": [{"id": "CHEBI:15365"}]}}]}}
+
+
+def test_filesystem_storage_round_trip(tmp_path):
+    storage = FilesystemResponseStorage(str(tmp_path / "responses"))
+    assert storage.get(1) is None
+    assert storage.head(1) is None
+
+    envelope = _get_envelope(1)
+    storage.put(1, encode_response(envelope))
+    assert decode_response(storage.get(1)) == envelope
+    stored_info = storage.head(1)
+    assert stored_info['size'] == len(storage.get(1))
+    assert os.listdir(storage.directory) == ["1.json.gz"]
+
+    # Replacing a response is reflected in what head() reports
+    envelope["description"] = "Test again"
+    storage.put(1, encode_response(envelope))
+    assert decode_response(storage.get(1)) == envelope
+    assert storage.head(1) != stored_info
+
+    # Responses stored by older versions as plain JSON can still be read
+    with open(f"{storage.directory}/2.json", "w") as fid:
+        json.dump(_get_envelope(2), fid)
+    assert decode_response(storage.get(2)) == _get_envelope(2)
+    assert storage.head(2) is not None
+
+
+class _BlockingStorage(FilesystemResponseStorage):
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.may_store = threading.Event()
+
+    def put(self, response_id, content):
+        self.may_store.wait(10)
+        super().put(response_id, content)
+
+
+class _FailingStorage(FilesystemResponseStorage):
+    def put(self, response_id, content):
+        raise IOError("Storage unavailable")
+
+
+def test_persistence_queue(tmp_path):
+    pending_directory = str(tmp_path / "pending")
+    storage = _BlockingStorage(str(tmp_path / "responses"))
+
+    ResponsePersistenceQueue.submit(3, _get_envelope(3), [_FailingStorage(str(tmp_path / "unused")), storage],
+                                    pending_directory=pending_directory)
+    # Until it's stored, the response is reported as pending, and waiting for it times out
+    assert ResponsePersistenceQueue.is_pending(3, pending_directory)
+    assert not ResponsePersistenceQueue.wait_until_stored(3, pending_directory, timeout=0.2)
+    assert storage.get(3) is None
+
+    storage.may_store.set()
+    assert ResponsePersistenceQueue.wait_until_stored(3, pending_directory, timeout=10)
+    assert decode_response(storage.get(3)) == _get_envelope(3)
+    ResponsePersistenceQueue.wait_until_done()
+    assert not os.listdir(pending_directory)
+    assert not ResponsePersistenceQueue.is_pending(4, pending_directory)
+
+
+def test_persistence_queue_failure_is_not_pending(tmp_path):
+    pending_directory = str(tmp_path / "pending")
+    ResponsePersistenceQueue.submit(5, _get_envelope(5), [_FailingStorage(str(tmp_path / "responses"))],
+                                    pending_directory=pending_directory)
+    ResponsePersistenceQueue.wait_until_done()
+    assert not ResponsePersistenceQueue.is_pending(5, pending_directory)
+    assert ResponsePersistenceQueue.wait_until_stored(5, pending_directory, timeout=0)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_rtxcomplete.py
+# run just certain tests: pytest -v test_ARAX_rtxcomplete.py -k test_reload_when_database_is_replaced
+
+import sys
+import os
+import json
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+import tornado.web
+import tornado.netutil
+import tornado.httpserver
+import tornado.httpclient
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../autocomplete")
+from term_index import TermIndex
+import rtxcomplete
+import server
+
+
+toy_terms = [ "aspirin", "asprin", "asparagine", "aspirine tablet", "apsirin", "acetaminophen", "ibuprofen", "ibuprofen lysine" ]
+
+
+def _write_database(database_path, terms):
+    # Write the database next to where it goes and move it into place, as ARAXDatabaseManager does, so it is a new file
+    connection = sqlite3.connect(f"{database_path}.new")
+    connection.execute("CREATE TABLE terms(term VARCHAR(255) COLLATE NOCASE, n_nodes INTEGER, preferred_curie TEXT, preferred_name TEXT, preferred_category TEXT)")
+    connection.executemany("INSERT INTO terms(term,n_nodes) VALUES(?,?)", [ (term, 1) for term in terms ])
+    connection.commit()
+    connection.close()
+    os.replace(f"{database_path}.new", database_path)
+
+
+@pytest.fixture
+def database_path(tmp_path, monkeypatch):
+    # Point rtxcomplete at a toy database, and put back its state afterwards
+    monkeypatch.setattr(rtxcomplete, "autocomplete_filepath", str(tmp_path))
+    for attribute_name in [ "database_name", "term_index", "fuzzy_matcher", "database_key", "load_count" ]:
+        monkeypatch.setattr(rtxcomplete, attribute_name, getattr(rtxcomplete, attribute_name))
+    monkeypatch.setattr(rtxcomplete, "thread_data", threading.local())
+    database_path = f"{tmp_path}/{rtxcomplete.RTXConfig.autocomplete_path.split('/')[-1]}"
+    _write_database(database_path, toy_terms)
+    rtxcomplete.load()
+    return database_path
+
+
+def test_prefix_and_autofuzzy(database_path, monkeypatch):
+    assert rtxcomplete.term_index is not None
+    assert rtxcomplete.prefix("asp", 10) == [ "asprin", "aspirin", "asparagine", "aspirine tablet" ]
+    assert rtxcomplete.prefix("ASP", "2") == [ "asprin", "aspirin" ]
+    assert rtxcomplete.prefix("", 10) == []
+    assert rtxcomplete.prefix("asp", 0) == []
+
+    # Prefix matches come first, then the closest terms fill up to the limit, without repeats
+    for word in [ "aspirn", "aspir", "ibuprofen", "ibuprofn", "xyz" ]:
+        for limit in (1, 2, 5, 10):
+            expected_terms = rtxcomplete.prefix(word, limit)
+            expected_terms += [ term for term in rtxcomplete.fuzzy(word, limit) if term not in expected_terms ]
+            assert rtxcomplete.autofuzzy(word, limit) == expected_terms[:limit], (word, limit)
+    assert rtxcomplete.autofuzzy("aspirn", 3)[0] == "aspirin"
+    assert rtxcomplete.autofuzzy("ibuprofen", 3) == [ "ibuprofen", "ibuprofen lysine" ]
+
+    # Without a term index, there is nothing to fill up with
+    monkeypatch.setattr(rtxcomplete, "term_index", None)
+    monkeypatch.setattr(rtxcomplete, "fuzzy_matcher", None)
+    assert rtxcomplete.autofuzzy("aspir", 10) == [ "aspirin", "aspirine tablet" ]
+    assert rtxcomplete.autofuzzy("aspirn", 10) == []
+
+
+def test_reload_when_database_is_replaced(database_path):
+    load_count = rtxcomplete.load_count
+    connection = rtxcomplete.get_connection()
+    assert rtxcomplete.reload_if_changed() is False
+    assert rtxcomplete.get_connection() is connection
+
+    # A new database (with enough terms that its term index is told apart by size) is loaded, with a new index
+    _write_database(database_path, [ "aspirin", "aspartame" ] + [ f"term {i_term}" for i_term in range(2000) ])
+    assert rtxcomplete.reload_if_changed() is True
+    assert rtxcomplete.load_count == load_count + 1
+    assert rtxcomplete.prefix("asp", 10) == [ "aspirin", "aspartame" ]
+    assert rtxcomplete.reload_if_changed() is False
+
+    # And the connections from before are replaced
+    new_connection = rtxcomplete.get_connection()
+    assert new_connection is not connection
+    with pytest.raises(sqlite3.ProgrammingError):
+        connection.execute("SELECT COUNT(*) FROM terms")
+    assert new_connection.execute("SELECT COUNT(*) FROM terms").fetchone()[0] == 2002
+
+    # A replaced term index is loaded too
+    TermIndex.build_from_database(database_path)
+    assert rtxcomplete.reload_if_changed() is True
+    assert rtxcomplete.load_count == load_count + 2
+
+    # But a check made while another reload is underway does nothing
+    _write_database(database_path, toy_terms)
+    with rtxcomplete.reload_lock:
+        assert rtxcomplete.reload_if_changed() is False
+    assert rtxcomplete.load_count == load_count + 2
+    assert rtxcomplete.reload_if_changed() is True
+
+
+def test_connections_are_per_thread(database_path):
+    connection = rtxcomplete.get_connection()
+    assert rtxcomplete.get_connection() is connection
+    thread_results = []
+
+    def look_up():
+        thread_connection = rtxcomplete.get_connection()
+        thread_results.append((thread_connection is rtxcomplete.get_connection(), thread_connection is connection,
+                               thread_connection.execute("SELECT COUNT(*) FROM terms").fetchone()[0]))
+
+    threads = [ threading.Thread(target=look_up) for _ in range(3) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert thread_results == [ (True, False, len(toy_terms)) ] * 3
+    assert connection.execute("SELECT COUNT(*) FROM terms").fetchone()[0] == len(toy_terms)
+
+
+def test_response_cache(monkeypatch):
+    monkeypatch.setattr(rtxcomplete, "load_count", rtxcomplete.load_count)
+    load_count = rtxcomplete.load_count
+    cache = server.ResponseCache(size=2)
+    cache.put(("auto", "a", 10), "[1]", load_count)
+    cache.put(("auto", "b", 10), "[2]", load_count)
+    assert cache.get(("auto", "a", 10)) == "[1]"
+    cache.put(("auto", "c", 10), "[3]", load_count)
+    assert cache.get(("auto", "b", 10)) is None
+    assert (cache.get(("auto", "a", 10)), cache.get(("auto", "c", 10))) == ("[1]", "[3]")
+    assert (cache.n_hits, cache.n_misses) == (3, 1)
+
+    # A reload empties the cache, and a result looked up before the reload is not kept
+    monkeypatch.setattr(rtxcomplete, "load_count", load_count + 1)
+    assert cache.get(("auto", "a", 10)) is None
+    cache.put(("auto", "a", 10), "[1]", load_count)
+    assert cache.get(("auto", "a", 10)) is None
+    cache.put(("auto", "a", 10), "[4]", load_count + 1)
+    assert cache.get(("auto", "a", 10)) == "[4]"
+
+
+def _fetch(paths):
+    application = tornado.web.Application([ (r"/autofuzzy(.*)", server.autofuzzySearch), (r"/auto(.*)", server.autoSearch),
+                                             (r"/nolookup(.*)", server.lookupHandler) ])
+
+    async def fetch_all():
+        sockets = tornado.netutil.bind_sockets(0, "127.0.0.1")
+        http_server = tornado.httpserver.HTTPServer(application)
+        http_server.add_sockets(sockets)
+        client = tornado.httpclient.AsyncHTTPClient()
+        responses = []
+        for path in paths:
+            response = await client.fetch(f"http://127.0.0.1:{sockets[0].getsockname()[1]}{path}", raise_error=False)
+            responses.append((response.code, response.body.decode()))
+        http_server.stop()
+        return responses
+
+    return asyncio.run(fetch_all())
+
+
+def test_server_lookups(database_path, monkeypatch):
+    monkeypatch.setattr(server, "response_cache", server.ResponseCache())
+    responses = _fetch([ "/auto?word=asp&limit=2&callback=cb", "/autofuzzy?word=aspirn&limit=3&callback=cb",
+                         "/auto?word=asp&limit=2&callback=cb", "/nolookup?word=asp&limit=2&callback=cb" ])
+    assert responses[0] == (200, f"cb({json.dumps(rtxcomplete.prefix('asp', 2))});")
+    assert responses[1] == (200, f"cb({json.dumps(rtxcomplete.autofuzzy('aspirn', 3))});")
+    assert responses[2] == responses[0]
+    assert server.response_cache.n_hits == 1
+    assert responses[3][0] == 404
+
+    # After the database is replaced and reloaded, the cached responses are not served
+    _write_database(database_path, [ "aspartame" ] + [ f"term {i_term}" for i_term in range(2000) ])
+    assert rtxcomplete.reload_if_changed() is True
+    assert _fetch([ "/auto?word=asp&limit=2&callback=cb" ]) == [ (200, 'cb(["aspartame"]);') ]
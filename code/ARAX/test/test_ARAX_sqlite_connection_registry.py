@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_sqlite_connection_registry.py
+# run just certain tests: pytest -v test_ARAX_sqlite_connection_registry.py -k test_reopened_when_file_is_replaced
+
+import sys
+import os
+import sqlite3
+import threading
+import multiprocessing
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+from sqlite_connection_registry import SqliteConnectionRegistry
+
+
+def _write_database(database_path, values):
+    # Write the database next to where it goes and move it into place, as ARAXDatabaseManager does
+    connection = sqlite3.connect(f"{database_path}.new")
+    connection.execute("CREATE TABLE things ( value INTEGER )")
+    connection.executemany("INSERT INTO things VALUES (?)", [ (value,) for value in values ])
+    connection.commit()
+    connection.close()
+    os.replace(f"{database_path}.new", database_path)
+
+
+def _get_values(connection):
+    return [ row[0] for row in connection.execute("SELECT value FROM things ORDER BY value") ]
+
+
+@pytest.fixture
+def database_path(tmp_path, monkeypatch):
+    # Start each test without any connections or statistics
+    monkeypatch.setattr(SqliteConnectionRegistry, "_thread_local", threading.local())
+    monkeypatch.setattr(SqliteConnectionRegistry, "_statistics", dict())
+    database_path = str(tmp_path / "things.sqlite")
+    _write_database(database_path, [ 1, 2, 3 ])
+    return database_path
+
+
+def test_connection_is_shared_and_read_only(database_path):
+    connection = SqliteConnectionRegistry.get_connection(database_path)
+    assert _get_values(connection) == [ 1, 2, 3 ]
+    assert SqliteConnectionRegistry.get_connection(database_path) is connection
+    assert SqliteConnectionRegistry.get_connection(os.path.relpath(database_path)) is connection
+    assert connection.execute("PRAGMA mmap_size").fetchone()[0] == SqliteConnectionRegistry.mmap_size
+    assert connection.execute("PRAGMA cache_size").fetchone()[0] == -SqliteConnectionRegistry.cache_size
+    with pytest.raises(sqlite3.OperationalError):
+        connection.execute("INSERT INTO things VALUES (4)")
+    assert SqliteConnectionRegistry.get_statistics() == { database_path: { "num_opens": 1, "num_hits": 2 } }
+
+    # The statistics are a copy
+    SqliteConnectionRegistry.get_statistics()[database_path]["num_opens"] = 100
+    assert SqliteConnectionRegistry.get_statistics()[database_path]["num_opens"] == 1
+
+
+def test_missing_file_is_an_error(tmp_path, database_path):
+    with pytest.raises(sqlite3.OperationalError):
+        SqliteConnectionRegistry.get_connection(str(tmp_path / "missing.sqlite"))
+
+
+def test_reopened_when_file_is_replaced(database_path):
+    connection = SqliteConnectionRegistry.get_connection(database_path)
+
+    # A new file in its place (a new inode)
+    _write_database(database_path, [ 4, 5 ])
+    new_connection = SqliteConnectionRegistry.get_connection(database_path)
+    assert new_connection is not connection
+    assert _get_values(new_connection) == [ 4, 5 ]
+    with pytest.raises(sqlite3.ProgrammingError):
+        connection.execute("SELECT value FROM things")
+
+    # The same file, changed in place (a new modification time and size)
+    with sqlite3.connect(database_path) as writable_connection:
+        writable_connection.executemany("INSERT INTO things VALUES (?)", [ (value,) for value in range(6, 1000) ])
+    writable_connection.close()
+    newer_connection = SqliteConnectionRegistry.get_connection(database_path)
+    assert newer_connection is not new_connection
+    assert len(_get_values(newer_connection)) == 996
+    assert SqliteConnectionRegistry.get_statistics()[database_path] == { "num_opens": 3, "num_hits": 0 }
+
+
+def test_connections_are_per_thread(database_path):
+    connection = SqliteConnectionRegistry.get_connection(database_path)
+    thread_results = []
+
+    def look_up():
+        thread_connection = SqliteConnectionRegistry.get_connection(database_path)
+        thread_results.append((thread_connection is connection, thread_connection is SqliteConnectionRegistry.get_connection(database_path),
+                               _get_values(thread_connection)))
+
+    threads = [ threading.Thread(target=look_up) for _ in range(3) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert thread_results == [ (False, True, [ 1, 2, 3 ]) ] * 3
+    assert SqliteConnectionRegistry.get_connection(database_path) is connection
+    assert SqliteConnectionRegistry.get_statistics()[database_path] == { "num_opens": 4, "num_hits": 4 }
+
+
+def _look_up_in_child(database_path, queue):
+    connection = SqliteConnectionRegistry.get_connection(database_path)
+    queue.put((SqliteConnectionRegistry.get_statistics()[database_path], _get_values(connection)))
+
+
+def test_reopened_after_fork(database_path):
+    connection = SqliteConnectionRegistry.get_connection(database_path)
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    process = context.Process(target=_look_up_in_child, args=(database_path, queue))
+    process.start()
+    child_statistics, child_values = queue.get(timeout=60)
+    process.join()
+
+    # The child doesn't use the connection it inherited, and the parent's is still fine
+    assert child_statistics == { "num_opens": 2, "num_hits": 0 }
+    assert child_values == [ 1, 2, 3 ]
+    assert SqliteConnectionRegistry.get_connection(database_path) is connection
+    assert _get_values(connection) == [ 1, 2, 3 ]
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_sri_node_normalizer.py
+# run just certain tests: pytest -v test_ARAX_sri_node_normalizer.py -k test_build_cache_from_stand_in_normalizer
+
+import sys
+import os
+import time
+import socket
+import asyncio
+import sqlite3
+import threading
+import subprocess
+
+import pytest
+from aiohttp import web
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../NodeSynonymizer")
+from sri_node_normalizer import SriNodeNormalizerCache
+
+sri_node_normalizer_path = os.path.dirname(os.path.abspath(__file__)) + "/../NodeSynonymizer/sri_node_normalizer.py"
+
+
+class _StandInNormalizer:
+    """
+    A local stand-in for the SRI node normalizer, serving a made-up result for CHEBI curies (and nothing for the
+    others) under two base URLs, and counting the curies it is asked for
+    """
+
+    def __init__(self):
+        self.label = "v1"
+        self.fetched_curies = []
+        self.n_failures = 1
+        with socket.socket() as server_socket:
+            server_socket.bind(("127.0.0.1", 0))
+            self.port = server_socket.getsockname()[1]
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self._serve, daemon=True).start()
+        for _ in range(50):
+            try:
+                socket.create_connection(("127.0.0.1", self.port)).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+    def get_base_url(self, version="1.2"):
+        return f"http://127.0.0.1:{self.port}/{version}"
+
+    def _serve(self):
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        app.router.add_post("/{version}/get_normalized_nodes", self._get_normalized_nodes)
+        app.router.add_get("/{version}/get_curie_prefixes", self._get_curie_prefixes)
+        runner = web.AppRunner(app)
+        self.loop.run_until_complete(runner.setup())
+        self.loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", self.port).start())
+        self.loop.run_forever()
+
+    async def _get_normalized_nodes(self, request):
+        # The first request fails, to be retried
+        if self.n_failures > 0:
+            self.n_failures -= 1
+            return web.Response(status=503)
+        curies = (await request.json())["curies"]
+        self.fetched_curies.extend(curies)
+        return web.json_response({ curie: { "id": { "identifier": curie, "label": f"{curie} {self.label}" } }
+                                   if curie.startswith("CHEBI:") else None for curie in curies })
+
+    async def _get_curie_prefixes(self, request):
+        return web.json_response({ "biolink:ChemicalEntity": { "curie_prefix": { "CHEBI": 100, "MESH": 10, "UMLS": "Not found" } } })
+
+
+@pytest.fixture(scope="module")
+def stand_in_normalizer():
+    return _StandInNormalizer()
+
+
+def _build_cache(directory, base_url, *options):
+    completed_process = subprocess.run([sys.executable, sri_node_normalizer_path, "--build", "--base_url", base_url, *options],
+                                       cwd=directory, capture_output=True, text=True, timeout=120)
+    assert completed_process.returncode == 0, completed_process.stdout + completed_process.stderr
+    return SriNodeNormalizerCache(f"{directory}/{SriNodeNormalizerCache.filename}")
+
+
+def test_build_cache_from_stand_in_normalizer(tmp_path, stand_in_normalizer):
+    stand_in_normalizer.fetched_curies.clear()
+    with open(tmp_path / "kg2_node_info.tsv", "w") as fid:
+        for i_curie in range(1, 1501):
+            fid.write(f"CHEBI:{i_curie}\tchemical {i_curie}\tchemical {i_curie}\tbiolink:ChemicalEntity\n")
+        fid.write("MESH:D000001\tsomething\tsomething\tbiolink:ChemicalEntity\n")
+        fid.write("UMLS:C0000001\tunsupported\tunsupported\tbiolink:NamedThing\n")
+
+    # All the supported curies are fetched in batches (the failed one retried), and those the normalizer knows nothing about are cached as None
+    cache = _build_cache(tmp_path, stand_in_normalizer.get_base_url(), "--concurrency", "2")
+    assert sorted(stand_in_normalizer.fetched_curies) == sorted([f"CHEBI:{i_curie}" for i_curie in range(1, 1501)] + ["MESH:D000001"])
+    assert len(cache) == 1501
+    assert cache["CHEBI:7"]["id"]["label"] == "CHEBI:7 v1"
+    assert cache["MESH:D000001"] is None
+    assert "UMLS:C0000001" not in cache
+
+    # Nothing is fetched again while the cached results are fresh
+    stand_in_normalizer.fetched_curies.clear()
+    stand_in_normalizer.label = "v2"
+    _build_cache(tmp_path, stand_in_normalizer.get_base_url())
+    assert stand_in_normalizer.fetched_curies == []
+
+    # Results older than the maximum age are fetched again
+    with sqlite3.connect(str(tmp_path / SriNodeNormalizerCache.filename)) as connection:
+        connection.execute("UPDATE normalizer_results SET fetched_at = ? WHERE curie IN ('CHEBI:7', 'MESH:D000001')", (time.time() - 3 * 86400,))
+    cache = _build_cache(tmp_path, stand_in_normalizer.get_base_url(), "--max_age", "2")
+    assert sorted(stand_in_normalizer.fetched_curies) == ["CHEBI:7", "MESH:D000001"]
+    assert cache["CHEBI:7"]["id"]["label"] == "CHEBI:7 v2"
+    assert cache["CHEBI:8"]["id"]["label"] == "CHEBI:8 v1"
+
+    # And all the results are fetched again from another normalizer
+    stand_in_normalizer.fetched_curies.clear()
+    cache = _build_cache(tmp_path, stand_in_normalizer.get_base_url(version="1.3"))
+    assert len(stand_in_normalizer.fetched_curies) == 1501
+    assert cache["CHEBI:8"]["id"]["label"] == "CHEBI:8 v2"
+    assert len(cache) == 1501
+
+
+def test_cache_from_before_timestamps_is_stale(tmp_path):
+    with sqlite3.connect(str(tmp_path / "old_cache.sqlite")) as connection:
+        connection.execute("CREATE TABLE normalizer_results ( curie TEXT PRIMARY KEY, result TEXT )")
+        connection.execute("INSERT INTO normalizer_results (curie, result) VALUES ('CHEBI:1', NULL)")
+
+    cache = SriNodeNormalizerCache(str(tmp_path / "old_cache.sqlite"))
+    assert "CHEBI:1" in cache
+    cache.put_many({ "CHEBI:2": None })
+    assert cache.invalidate("http://127.0.0.1/1.2") == 1
+    assert cache.get_missing_curies(["CHEBI:1", "CHEBI:2"]) == ["CHEBI:1"]
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# Usage:
+# run all: pytest -v test_ARAX_term_index.py
+# run just certain tests: pytest -v test_ARAX_term_index.py -k test_term_index_matches_sql_fallback
+
+import sys
+import os
+import random
+import sqlite3
+import threading
+import subprocess
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../autocomplete")
+from term_index import TermIndex
+import rtxcomplete
+from test_ARAX_node_synonymizer import _get_toy_synonymizer
+
+create_load_db_path = os.path.dirname(os.path.abspath(__file__)) + "/../../autocomplete/create_load_db.py"
+
+# Terms with LIKE wildcards and non-ASCII characters in them, besides the random ones
+special_terms = [ "50% solution", "500 mg tablet", "50_percent", "5000", "a_b", "a%b", "axb", "100%", "Ménière disease",
+                  "méningite", "Ölsäure", "naïve T cell", "β-catenin", "β-alanine", "alpha-β", "Ü" ]
+
+
+def _get_toy_terms(n_terms=600, seed=42):
+    generator = random.Random(seed)
+    syllables = [ "a", "b", "ab", "ac", "ba", "ca", "ra", " ", "-" ]
+    terms = list(special_terms)
+    uc_terms = { term.upper() for term in terms }
+    while len(terms) < n_terms:
+        term = "".join(generator.choice(syllables) for _ in range(generator.randint(1, 6))).strip()
+        if term != "" and term.upper() not in uc_terms:
+            uc_terms.add(term.upper())
+            terms.append(term.capitalize() if generator.random() < 0.3 else term)
+    popularity = [ generator.randint(1, 5) for _ in terms ]
+    return terms, popularity
+
+
+def _write_terms_database(database_path, terms, popularity, concepts=None):
+    connection = sqlite3.connect(database_path)
+    connection.execute("CREATE TABLE terms(term VARCHAR(255) COLLATE NOCASE, n_nodes INTEGER, preferred_curie TEXT, preferred_name TEXT, preferred_category TEXT)")
+    concepts = concepts if concepts is not None else [ None ] * len(terms)
+    connection.executemany("INSERT INTO terms(term,n_nodes,preferred_curie,preferred_name,preferred_category) VALUES(?,?,?,?,?)",
+                           ( (term, n_nodes, *(concept if concept is not None else (None, None, None)))
+                             for term, n_nodes, concept in zip(terms, popularity, concepts) ))
+    connection.commit()
+    connection.close()
+
+
+def _get_ranked_matches(terms, popularity, is_match):
+    # The best matches first: shorter, then more popular, then alphabetically (case-insensitively)
+    return sorted(( i_term for i_term, term in enumerate(terms) if is_match(term.upper()) ),
+                  key=lambda i_term: (len(terms[i_term]), -popularity[i_term], terms[i_term].upper()))
+
+
+def _get_words(terms):
+    words = { term[:length] for term in terms for length in (1, 2, 3) if len(term) >= length }
+    return sorted(words | { "50%", "50_", "a_", "a%", "%", "_", "Mén", "mén", "β", "β-", "-β", "ï", "xyz", "Ü" })
+
+
+@pytest.fixture
+def small_tables(monkeypatch):
+    # Make the heavy prefix table, the bigram cap and the candidate chunks all come into play with a few hundred terms
+    monkeypatch.setattr(TermIndex, "heavy_prefix_size", 12)
+    monkeypatch.setattr(TermIndex, "heavy_prefix_n_terms", 5)
+    monkeypatch.setattr(TermIndex, "bigram_n_terms", 8)
+    monkeypatch.setattr(TermIndex, "candidate_chunk_size", 4)
+
+
+def test_term_index_matches_ranked_search(tmp_path, small_tables):
+    terms, popularity = _get_toy_terms()
+    database_path = str(tmp_path / "autocomplete.sqlite")
+    _write_terms_database(database_path, terms, popularity)
+    TermIndex.build_from_database(database_path)
+    index = TermIndex.get(database_path)
+    assert index.n_terms == len(terms)
+    assert len(index.heavy_prefix_ranges) > 0
+
+    # Term ids are ranks
+    ranked_terms = [ terms[i_term] for i_term in _get_ranked_matches(terms, popularity, lambda uc_term: True) ]
+    assert [ index.get_term(term_id) for term_id in range(index.n_terms) ] == ranked_terms
+
+    for word in _get_words(terms):
+        uc_word = word.upper()
+        prefix_matches = [ ranked_terms.index(terms[i_term]) for i_term in _get_ranked_matches(terms, popularity, lambda uc_term: uc_term.startswith(uc_word)) ]
+        substring_matches = [ ranked_terms.index(terms[i_term]) for i_term in _get_ranked_matches(terms, popularity, lambda uc_term: uc_word in uc_term) ]
+        if len(uc_word.encode('utf-8')) == 2:
+            substring_matches = substring_matches[:TermIndex.bigram_n_terms]
+        for limit in (1, 3, 5, 6, 20, 1000):
+            assert index.get_prefix_matches(word, limit) == prefix_matches[:limit], (word, limit)
+            exclude_ids = set(prefix_matches[:limit])
+            expected_substring_matches = [ term_id for term_id in substring_matches if term_id not in exclude_ids ][:limit]
+            if len(uc_word.encode('utf-8')) < 2:
+                expected_substring_matches = []
+            assert index.get_substring_matches(word, limit, exclude_ids=exclude_ids) == expected_substring_matches, (word, limit)
+
+
+def test_term_index_matches_sql_fallback(tmp_path, monkeypatch, small_tables):
+    terms, popularity = _get_toy_terms()
+    concepts = [ (f"TOY:{i_term}", f"concept {i_term}", "biolink:NamedThing") if i_term % 3 else None for i_term in range(len(terms)) ]
+    monkeypatch.setattr(rtxcomplete, "autocomplete_filepath", str(tmp_path))
+    database_path = f"{tmp_path}/{rtxcomplete.RTXConfig.autocomplete_path.split('/')[-1]}"
+    _write_terms_database(database_path, terms, popularity, concepts)
+
+    # load() builds the missing index
+    rtxcomplete.load()
+    assert rtxcomplete.term_index is not None
+    index_results = {}
+    for word in _get_words(terms):
+        index_results[word] = (rtxcomplete.prefix(word, 10), rtxcomplete.prefix(word, 1000), rtxcomplete.get_nodes_like(word, 10),
+                               rtxcomplete.get_nodes_like(word, 1000))
+    assert rtxcomplete.prefix("50%", 10) == [ "50% solution" ]
+    assert rtxcomplete.prefix("a_", 10) == [ "a_b" ]
+    assert rtxcomplete.prefix("Mén", 10) == [ "méningite", "Ménière disease" ]
+    assert { node["name"] for node in rtxcomplete.get_nodes_like("β-", 10) } == { "β-alanine", "β-catenin" }
+    assert [ node["name"] for node in rtxcomplete.get_nodes_like("a-β", 10) ] == [ "alpha-β" ]
+
+    monkeypatch.setattr(rtxcomplete, "term_index", None)
+    monkeypatch.setattr(rtxcomplete, "fuzzy_matcher", None)
+    for word, (index_prefixes, all_index_prefixes, index_nodes, all_index_nodes) in index_results.items():
+        sql_prefixes = rtxcomplete.prefix(word, 10)
+        all_sql_prefixes = rtxcomplete.prefix(word, 1000)
+        assert sorted(all_index_prefixes) == sorted(all_sql_prefixes), word
+        assert [ len(term) for term in index_prefixes ] == [ len(term) for term in sql_prefixes ], word
+        assert set(index_prefixes) <= set(all_sql_prefixes)
+
+        # The same terms are found (as prefixes and then substrings), with the same concept annotations; except that
+        # for a two-byte word the index only looks among the best terms containing it
+        all_sql_nodes = rtxcomplete.get_nodes_like(word, 1000)
+        if len(word.encode('utf-8')) == 2:
+            assert all(node in all_sql_nodes for node in all_index_nodes), word
+        else:
+            assert sorted(all_index_nodes, key=lambda node: node["name"]) == sorted(all_sql_nodes, key=lambda node: node["name"]), word
+            assert len(index_nodes) == len(rtxcomplete.get_nodes_like(word, 10)), word
+        assert all(node in all_sql_nodes for node in index_nodes)
+
+
+def test_stale_term_index_is_skipped(tmp_path):
+    terms, popularity = _get_toy_terms(n_terms=50)
+    database_path = str(tmp_path / "autocomplete.sqlite")
+    _write_terms_database(database_path, terms, popularity)
+    assert TermIndex.get(database_path) is None
+    TermIndex.build_from_database(database_path)
+    assert TermIndex.get(database_path) is not None
+
+    # The index doesn't go with a database that has since changed
+    with open(database_path, "ab") as fid:
+        fid.write(b"\0" * 1024)
+    assert TermIndex.get(database_path) is None
+
+
+def test_terms_carry_synonymizer_concepts(tmp_path, monkeypatch):
+    synonymizer = _get_toy_synonymizer(tmp_path)
+    synonymizer.build_concept_index()
+    with open(tmp_path / "node_names.tsv", "w", encoding="latin-1") as fid:
+        for curie, name, category in [ ("DRUGBANK:DB00945", "Aspirin", "biolink:Drug"), ("HGNC:11998", "TP53", "biolink:Gene"),
+                                       ("CHEBI:0000000", "unknown compound", "biolink:ChemicalEntity"), ("MESH:D001241", "aspirin", None) ]:
+            fid.write(f"{curie}\t{name}\t{name}\t{category}\n")
+
+    # Build the autocomplete database and its term index, resolving the nodes with the toy synonymizer
+    monkeypatch.setattr(rtxcomplete, "autocomplete_filepath", str(tmp_path))
+    monkeypatch.setattr(rtxcomplete, "thread_data", threading.local())
+    database_path = f"{tmp_path}/{rtxcomplete.RTXConfig.autocomplete_path.split('/')[-1]}"
+    completed_process = subprocess.run([sys.executable, create_load_db_path, "--input", str(tmp_path / "node_names.tsv"), "--output", database_path,
+                                        "--synonymizer", f"{synonymizer.databaseLocation}/{synonymizer.databaseName}"],
+                                       cwd=tmp_path, capture_output=True, text=True, timeout=120)
+    assert completed_process.returncode == 0, completed_process.stdout + completed_process.stderr
+    assert TermIndex.get(database_path) is not None
+    rtxcomplete.load()
+
+    # Terms complete to the preferred concepts of their (first) nodes, or to the nodes themselves if they don't resolve
+    aspirin = { "curie": "CHEBI:15365", "name": None, "type": "biolink:SmallMolecule", "preferred_name": "aspirin" }
+    assert rtxcomplete.get_nodes_like("aspi", 10) == [ { **aspirin, "name": "Aspirin" } ]
+    assert rtxcomplete.get_nodes_like("DB00945", 10) == [ { **aspirin, "name": "DRUGBANK:DB00945" } ]
+    assert rtxcomplete.get_nodes_like("MESH:", 10) == [ { **aspirin, "name": "MESH:D001241" } ]
+    assert rtxcomplete.get_nodes_like("hgnc", 10) == [ { "curie": "NCBIGene:7157", "name": "HGNC:11998", "type": "biolink:Gene", "preferred_name": "TP53" } ]
+    unknown_compound = { "curie": "CHEBI:0000000", "name": None, "type": "biolink:ChemicalEntity", "preferred_name": "unknown compound" }
+    assert rtxcomplete.get_nodes_like("unknown", 10) == [ { **unknown_compound, "name": "unknown compound" } ]
+    assert rtxcomplete.get_nodes_like("CHEBI", 10) == [ { **unknown_compound, "name": "CHEBI:0000000" } ]
+
+    # The terms table has the same annotations as the term index
+    words = [ "aspi", "DB00945", "MESH:", "hgnc", "unknown", "CHEBI", "TP", "in", "00", "compound" ]
+    index_results = { word: rtxcomplete.get_nodes_like(word, 10) for word in words }
+    monkeypatch.setattr(rtxcomplete, "term_index", None)
+    monkeypatch.setattr(rtxcomplete, "fuzzy_matcher", None)
+    for word in words:
+        assert len(index_results[word]) > 0
+        assert sorted(rtxcomplete.get_nodes_like(word, 10), key=lambda node: node["name"]) == sorted(index_results[word], key=lambda node: node["name"]), word
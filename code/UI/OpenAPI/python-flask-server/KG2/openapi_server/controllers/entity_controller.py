@@ -8,6 +8,28 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../../../../ARAX/NodeSynonymizer")
 from node_synonymizer import NodeSynonymizer
+import threading
+
+#### NodeSynonymizer sqlite connections can't be shared between threads, so each request-handling thread keeps its own
+synonymizers = threading.local()
+
+
+def _get_database_key(synonymizer):
+    try:
+        database_stat = os.stat(f"{synonymizer.databaseLocation}/{synonymizer.databaseName}")
+    except OSError:
+        return None
+    return database_stat.st_ino, database_stat.st_mtime_ns
+
+
+#### Reuse this thread's synonymizer until its database file goes away or is replaced (e.g., by ARAXDatabaseManager)
+def get_synonymizer():
+    synonymizer = getattr(synonymizers, 'synonymizer', None)
+    if synonymizer is None or synonymizers.database_key is None or _get_database_key(synonymizer) != synonymizers.database_key:
+        synonymizer = NodeSynonymizer()
+        synonymizers.synonymizer = synonymizer
+        synonymizers.database_key = _get_database_key(synonymizer)
+    return synonymizer
 
 
 def get_entity(q):  # noqa: E501
@@ -20,7 +42,7 @@ def get_entity(q):  # noqa: E501
 
     :rtype: object
     """
-    synonymizer = NodeSynonymizer()
+    synonymizer = get_synonymizer()
     response = synonymizer.get_normalizer_results(q)
 
     return response
@@ -37,7 +59,7 @@ def post_entity(body):  # noqa: E501
     :rtype: EntityQuery
     """
 
-    synonymizer = NodeSynonymizer()
+    synonymizer = get_synonymizer()
     response = synonymizer.get_normalizer_results(body)
 
     return response
@@ -10,14 +10,23 @@ rlimit_child_process_bytes = 34359738368  # 32 GiB
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../../../../ARAX/ARAXQuery")
 import ARAX_query
+from response_cache import ResponseCache
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../models")
 import response
 
 
+def _wait_for_pending_responses():
+    # responses are stored in the background, so a child has to let that finish before it exits
+    try:
+        ResponseCache.wait_for_pending_responses()
+    except BaseException as e:
+        print(f"Exception while storing responses in query_controller: {type(e)}: {e}", file=sys.stderr)
+
 def child_receive_sigpipe(signal_number, frame):
     if signal_number == signal.SIGPIPE:
         logging.info("[query_controller]: child process detected a SIGPIPE; exiting python")
+        _wait_for_pending_responses()
         os._exit(0)
 
 def run_query_dict_in_child_process(query_dict: dict,
@@ -46,7 +55,9 @@ def run_query_dict_in_child_process(query_dict: dict,
                     write_fo.flush()
         except BaseException as e:
             print(f"Exception in query_controller.run_query_dict_in_child_process: {type(e)}\n{traceback.print_exc()}", file=sys.stderr)
+            _wait_for_pending_responses()
             os._exit(1)
+        _wait_for_pending_responses()  # the pipe is closed, so the client already has its response; finish storing it before exiting
         os._exit(0)
     elif pid > 0: # I am the parent process
         os.close(write_fd)  # the parent does not write to the pipe, it reads from it
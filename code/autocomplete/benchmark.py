@@ -0,0 +1,83 @@
+#!/bin/env python3
+#
+# Replay typeahead keystroke sequences against a running autocomplete server and report the response latencies
+#
+import argparse
+import asyncio
+import json
+import timeit
+import urllib.parse
+
+from tornado.httpclient import AsyncHTTPClient
+
+default_words = [ 'acetaminophen', 'ibuprofen', 'insulin', 'malaria', 'parkinson disease', 'alzheimer', 'lovastatin',
+                  'NCBIGene:3630', 'CHEMBL.COMPOUND:CHEMBL112', 'breast cancer', 'metformin', 'hypertension',
+                  'acetylsalicylic acid', 'TP53', 'cystic fibrosis', 'glucose' ]
+
+
+# ############################################################################################
+# Type each word one keystroke at a time, as a typeahead would, recording the latency of every response
+async def replay_user(client, base_url, endpoint, words, limit, delay, latencies, errors):
+
+    for word in words:
+        for n_characters in range(1, len(word) + 1):
+            url = f"{base_url}/{endpoint}?" + urllib.parse.urlencode({ 'word': word[:n_characters], 'limit': limit, 'callback': 'cb' })
+            t0 = timeit.default_timer()
+            try:
+                response = await client.fetch(url, raise_error=False)
+                if response.code != 200 or response.body.decode('utf-8') == 'error':
+                    errors.append(url)
+                else:
+                    latencies.append(timeit.default_timer() - t0)
+            except Exception:
+                errors.append(url)
+            await asyncio.sleep(delay)
+
+
+# ############################################################################################
+async def run_benchmark(base_url, endpoint, words, limit, n_users, delay):
+
+    AsyncHTTPClient.configure(None, max_clients=n_users)
+    client = AsyncHTTPClient()
+    latencies = []
+    errors = []
+
+    #### Each simulated user types the words in a different order, so that they are not all on the same prefix
+    t0 = timeit.default_timer()
+    await asyncio.gather(*[ replay_user(client, base_url, endpoint, words[i_user % len(words):] + words[:i_user % len(words)],
+                                        limit, delay, latencies, errors) for i_user in range(n_users) ])
+    elapsed = timeit.default_timer() - t0
+
+    latencies.sort()
+    def percentile(fraction):
+        return 1000 * latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] if latencies else 0.0
+    return { 'endpoint': endpoint, 'n_users': n_users, 'n_requests': len(latencies) + len(errors), 'n_errors': len(errors),
+             'elapsed_sec': round(elapsed, 3), 'requests_per_sec': round((len(latencies) + len(errors)) / elapsed, 1),
+             'p50_ms': round(percentile(0.50), 2), 'p90_ms': round(percentile(0.90), 2),
+             'p99_ms': round(percentile(0.99), 2), 'max_ms': round(percentile(1.0), 2) }
+
+
+# ############################################################################################
+def main():
+    parser = argparse.ArgumentParser(description="Replays typeahead keystroke sequences against an autocomplete server",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-u', '--url', action="store", default="http://localhost:4999", help='Base URL of the autocomplete server')
+    parser.add_argument('-e', '--endpoint', action="store", default="nodeslike", choices=[ 'auto', 'fuzzy', 'autofuzzy', 'nodeslike' ],
+                        help='Endpoint to query with each keystroke')
+    parser.add_argument('-n', '--users', action="store", type=int, default=8, help='Number of users typing at the same time')
+    parser.add_argument('-l', '--limit', action="store", type=int, default=10, help='Number of completions requested')
+    parser.add_argument('-d', '--delay', action="store", type=float, default=0.05, help='Seconds between keystrokes')
+    parser.add_argument('-w', '--words_file', action="store", help='File with one word per line to type (default: a built-in list)')
+    args = parser.parse_args()
+
+    words = default_words
+    if args.words_file is not None:
+        with open(args.words_file) as infile:
+            words = [ line.strip() for line in infile if line.strip() != '' ]
+
+    results = asyncio.run(run_benchmark(args.url.rstrip('/'), args.endpoint, words, args.limit, args.users, args.delay))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,21 @@
 
 import os
 import re
+import sys
 import sqlite3
 import argparse
 
+from term_index import TermIndex
+
+pathlist = os.path.realpath(__file__).split(os.path.sep)
+RTXindex = pathlist.index("RTX")
+sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'ARAX', 'NodeSynonymizer']))
+from concept_index import ConceptIndex
+
 parser = argparse.ArgumentParser()
 parser.add_argument("-o", "--output", type=str, help="Output database path", default="autocomplete.sqlite", required=False)
 parser.add_argument("-i", "--input", type=str, help="Input file path", default="../../data/KGmetadata/NodeNamesDescriptions_KG2.tsv", required=False)
+parser.add_argument("-s", "--synonymizer", type=str, help="NodeSynonymizer database (with its concept index) to resolve terms to preferred concepts", default=None, required=False)
 arguments = parser.parse_args()
 
 database_name = arguments.output
@@ -23,13 +32,15 @@ c = conn.cursor()
 
 print(f"Creating tables")
 #c.execute(f"CREATE TABLE {tablename}(curie TEXT, name TEXT, type TEXT, rank INTEGER)")
-c.execute(f"CREATE TABLE terms(term VARCHAR(255) COLLATE NOCASE)")
-c.execute(f"CREATE TABLE cached_fragments(fragment VARCHAR(255) COLLATE NOCASE)")
-c.execute(f"CREATE TABLE cached_fragment_terms(fragment_id INT, term VARCHAR(255) COLLATE NOCASE)")
+c.execute(f"CREATE TABLE terms(term VARCHAR(255) COLLATE NOCASE, n_nodes INTEGER, preferred_curie TEXT, preferred_name TEXT, preferred_category TEXT)")
 
 rank = 1
 row_count = 0
 uc_terms = {}
+terms = []
+popularity = []
+term_nodes = []
+categories = {}
 
 with open(arguments.input, 'r', encoding="latin-1", errors="replace") as nodeData:
     print("Loading node names")
@@ -41,8 +52,12 @@ with open(arguments.input, 'r', encoding="latin-1", errors="replace") as nodeDat
 
             uc_term = term.upper()
             if uc_term not in uc_terms:
-                c.execute("INSERT INTO terms(term) VALUES(?)", (term,))
-                uc_terms[uc_term] = 1
+                uc_terms[uc_term] = len(terms)
+                terms.append(term)
+                popularity.append(1)
+                term_nodes.append((curie, name, categories.setdefault(type, type)))
+            else:
+                popularity[uc_terms[uc_term]] += 1
 
         row_count += 1
         if row_count == int(row_count/1000000) * 1000000:
@@ -50,9 +65,37 @@ with open(arguments.input, 'r', encoding="latin-1", errors="replace") as nodeDat
             #break
 
 print()
+
+#### Annotate each term with the concept of the (first) node it came from: the preferred curie, name and category
+#### given by the NodeSynonymizer's concept index if there is one, else the node's own
+concept_index = None
+if arguments.synonymizer is not None:
+    concept_index = ConceptIndex.get(arguments.synonymizer)
+    if concept_index is None:
+        print(f"WARNING: There is no concept index for {arguments.synonymizer}, so terms are annotated with their own nodes")
+concepts = {}
+if concept_index is not None:
+    print(f"Resolving the nodes of {len(terms)} terms to concepts")
+    node_curies = list({ node[0] for node in term_nodes })
+    batch_size = 100000
+    for start in range(0, len(node_curies), batch_size):
+        batch = node_curies[start:start + batch_size]
+        for curie, concept_id in zip(batch, concept_index.get_curie_concepts([ curie.upper() for curie in batch ])):
+            if concept_id >= 0:
+                concepts[curie] = concept_index.get_concept(concept_id)
+    print(f"Resolved {len(concepts)} of {len(node_curies)} distinct node curies")
+term_concepts = [ concepts.get(node[0], node) for node in term_nodes ]
+del term_nodes, concepts
+
+print(f"Storing {len(terms)} terms")
+c.executemany("INSERT INTO terms(term,n_nodes,preferred_curie,preferred_name,preferred_category) VALUES(?,?,?,?,?)",
+              ( (term, n_nodes, *concept) for term, n_nodes, concept in zip(terms, popularity, term_concepts) ))
+
 print(f"Creating indexes")
 c.execute(f"CREATE INDEX idx_terms_term ON terms(term)")
-c.execute(f"CREATE INDEX idx_cached_fragments_fragment ON cached_fragments(fragment)")
 
 conn.commit()
 conn.close()
+
+del uc_terms
+TermIndex.build(terms, popularity, database_name, term_concepts)
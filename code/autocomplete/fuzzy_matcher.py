@@ -0,0 +1,154 @@
+#!/bin/env python3
+#
+# Class to find the autocomplete terms that are within a small edit distance of a (possibly misspelled) word
+#
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class FuzzyMatcher:
+    """
+    Fuzzy matching over the terms of a TermIndex, using its trigram posting lists:
+      - candidates are terms whose length is within the allowed edit distance of the word's, and that share enough of
+        the word's trigrams (each edit destroys at most 3 trigrams); they are gathered from the posting lists of the
+        word's rarest trigrams, since any term within the distance must contain at least one of those. To bound the
+        work, at most candidate_budget postings are gathered, so for a word made of very common trigrams (e.g., a
+        curie) some distant matches may be missed
+      - the most promising candidates are checked with a bit-parallel (Myers) edit distance computed for all of them
+        at once, on the upper case UTF-8 bytes
+      - matches are ranked by edit distance and then by term rank
+    Results are kept in a bounded LRU cache per word and limit, shared by all threads.
+    """
+
+    max_pattern_length = 64  # Bytes; the edit distance computation uses one 64-bit word per candidate
+    candidate_budget = 20000
+    max_candidates = 1000
+    cache_size = 10000
+
+    def __init__(self, term_index):
+        self.term_index = term_index
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    # ############################################################################################
+    # Return the largest edit distance at which a word of this many bytes is still considered a match
+    @staticmethod
+    def get_max_distance(n_bytes):
+        if n_bytes < 3:
+            return 0
+        if n_bytes <= 5:
+            return 1
+        return 2
+
+
+    # ############################################################################################
+    # Return the ids of the best (at most limit) terms within the allowed edit distance of the word (case-insensitively)
+    def get_matches(self, word, limit):
+
+        key = (word.upper(), limit)
+        with self._lock:
+            matches = self._cache.get(key)
+            if matches is not None:
+                self._cache.move_to_end(key)
+                return list(matches)
+
+        matches = tuple(self._find_matches(key[0], limit))
+        with self._lock:
+            self._cache[key] = matches
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return list(matches)
+
+
+    # ############################################################################################
+    def _find_matches(self, uc_word, limit):
+
+        pattern = uc_word.encode('utf-8')
+        if len(pattern) < 3 or len(pattern) > self.max_pattern_length or limit <= 0:
+            return []
+        max_distance = self.get_max_distance(len(pattern))
+        lo, hi = self.term_index.get_length_range(len(uc_word) - max_distance, len(uc_word) + max_distance)
+
+        # The posting lists (within the length range) of the word's distinct trigrams, shortest first
+        codes = { pattern[position] << 16 | pattern[position + 1] << 8 | pattern[position + 2] for position in range(len(pattern) - 2) }
+        posting_lists = []
+        for code in codes:
+            posting_list = self.term_index.get_trigram_terms(code)
+            if posting_list is None:
+                posting_list = np.zeros(0, dtype=np.uint32)
+            posting_lists.append(posting_list[np.searchsorted(posting_list, lo):np.searchsorted(posting_list, hi)])
+        posting_lists.sort(key=len)
+
+        # Gather candidates from the lists of the rarest trigrams and count how many of the word's trigrams each has
+        min_shared = max(1, len(codes) - 3 * max_distance)
+        candidate_lists = [ posting_lists[0][:self.candidate_budget] ]
+        n_postings = len(candidate_lists[0])
+        for posting_list in posting_lists[1:len(codes) - min_shared + 1]:
+            n_postings += len(posting_list)
+            if n_postings > self.candidate_budget:
+                break
+            candidate_lists.append(posting_list)
+        candidates = np.unique(np.concatenate(candidate_lists))
+        if len(candidates) == 0:
+            return []
+        n_shared = np.zeros(len(candidates), dtype=np.int64)
+        for posting_list in posting_lists:
+            if len(posting_list) == 0:
+                continue
+            positions = np.searchsorted(posting_list, candidates)
+            positions[positions == len(posting_list)] = 0
+            n_shared += posting_list[positions] == candidates
+        candidates = candidates[n_shared >= min_shared]
+        n_shared = n_shared[n_shared >= min_shared]
+        if len(candidates) > self.max_candidates:
+            best = np.lexsort(( candidates, -n_shared ))[:self.max_candidates]
+            candidates = np.sort(candidates[best])
+
+        # Compute the edit distances and keep the closest terms
+        texts = [ self.term_index.get_term(term_id).upper().encode('utf-8') for term_id in candidates.tolist() ]
+        distances = self.get_edit_distances(pattern, texts)
+        is_match = distances <= max_distance
+        candidates, distances = candidates[is_match], distances[is_match]
+        return candidates[np.lexsort(( candidates, distances ))][:limit].tolist()
+
+
+    # ############################################################################################
+    # Return the edit (Levenshtein) distance between the pattern (at most 64 bytes) and each of the texts (bytes),
+    # computed for all the texts at once with Myers' bit-parallel algorithm (as formulated by Hyyrö)
+    @staticmethod
+    def get_edit_distances(pattern, texts):
+
+        n_texts = len(texts)
+        lengths = np.array([ len(text) for text in texts ], dtype=np.int64)
+        max_length = int(lengths.max(initial=0))
+        text_bytes = np.zeros((n_texts, max_length), dtype=np.uint8)
+        for i_text, text in enumerate(texts):
+            text_bytes[i_text, :len(text)] = np.frombuffer(text, dtype=np.uint8)
+
+        # The bit mask of the positions in the pattern where each byte value occurs
+        peq = np.zeros(256, dtype=np.uint64)
+        for position, byte in enumerate(pattern):
+            peq[byte] |= np.uint64(1 << position)
+
+        one = np.uint64(1)
+        last_bit = np.uint64(1 << (len(pattern) - 1))
+        vp = np.full(n_texts, (1 << len(pattern)) - 1, dtype=np.uint64)
+        vn = np.zeros(n_texts, dtype=np.uint64)
+        scores = np.full(n_texts, len(pattern), dtype=np.int64)
+        for position in range(max_length):
+            is_active = position < lengths
+            eq = peq[text_bytes[:, position]]
+            xv = eq | vn
+            xh = (((eq & vp) + vp) ^ vp) | eq
+            ph = vn | ~(xh | vp)
+            mh = vp & xh
+            scores += is_active & ((ph & last_bit) != 0)
+            scores -= is_active & ((mh & last_bit) != 0)
+            ph = (ph << one) | one
+            mh = mh << one
+            vp = np.where(is_active, mh | ~(xv | ph), vp)
+            vn = np.where(is_active, ph & xv, vn)
+        return scores
@@ -3,29 +3,139 @@ import re
 import timeit
 import sys
 import os
+import threading
 
 pathlist = os.path.realpath(__file__).split(os.path.sep)
 RTXindex = pathlist.index("RTX")
 sys.path.append(os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code']))
 from RTXConfiguration import RTXConfiguration
+from term_index import TermIndex
+from fuzzy_matcher import FuzzyMatcher
 
 RTXConfig = RTXConfiguration()
 autocomplete_filepath = os.path.sep.join([*pathlist[:(RTXindex + 1)], 'code', 'autocomplete'])
 
 
-conn = None
-cursor = None
+database_name = None
+term_index = None
+fuzzy_matcher = None
+thread_data = threading.local()
+
+#### Which database file and term index were loaded, and how many times load() has run (so that connections and
+#### cached responses from before a reload can be told apart)
+database_key = None
+load_count = 0
+reload_lock = threading.Lock()
 
 
 def load():
-    global conn
-    global cursor
-    database_name = f"{autocomplete_filepath}{os.path.sep}{RTXConfig.autocomplete_path.split('/')[-1]}"
-    conn = sqlite3.connect(database_name)
-    cursor = conn.cursor()
+    global database_name
+    global term_index
+    global fuzzy_matcher
+    global database_key
+    global load_count
+    new_database_name = f"{autocomplete_filepath}{os.path.sep}{RTXConfig.autocomplete_path.split('/')[-1]}"
+    new_term_index = TermIndex.get(new_database_name)
+
+    #### If the database came without a term index that goes with it, build one from its terms table
+    if new_term_index is None and os.path.exists(new_database_name):
+        try:
+            TermIndex.build_from_database(new_database_name)
+            new_term_index = TermIndex.get(new_database_name)
+        except (OSError, sqlite3.Error) as error:
+            print(f"WARNING: Unable to build the term index for {new_database_name}, so falling back to the database: {error}")
+
+    database_name = new_database_name
+    term_index = new_term_index
+    fuzzy_matcher = FuzzyMatcher(term_index) if term_index is not None else None
+    database_key = get_database_key()
+    load_count += 1
     return True
 
 
+#### Return the identity of the database file and of its term index, which changes when either one is replaced
+def get_database_key():
+    database_path = f"{autocomplete_filepath}{os.path.sep}{RTXConfig.autocomplete_path.split('/')[-1]}"
+    key = []
+    for path in [ database_path, f"{TermIndex.get_index_path(database_path)}/metadata.json" ]:
+        try:
+            file_stat = os.stat(path)
+            key.append((file_stat.st_ino, file_stat.st_mtime_ns))
+        except OSError:
+            key.append(None)
+    return tuple(key)
+
+
+#### Load again if the database or its term index has been replaced (e.g., by ARAXDatabaseManager) since the last
+#### load. Returns True if it was reloaded
+def reload_if_changed():
+    if not reload_lock.acquire(blocking=False):
+        return False
+    try:
+        if get_database_key() == database_key:
+            return False
+        print(f"INFO: {database_name} or its term index has been replaced, so reloading")
+        return load()
+    finally:
+        reload_lock.release()
+
+
+#### Return this thread's read-only connection to the database (lookups may run on several threads at once),
+#### opening a new one after a reload
+def get_connection():
+    conn = getattr(thread_data, 'conn', None)
+    if conn is None or thread_data.load_count != load_count:
+        if conn is not None:
+            conn.close()
+        conn = sqlite3.connect(f"file:{database_name}?mode=ro", uri=True)
+        thread_data.conn = conn
+        thread_data.load_count = load_count
+    return conn
+
+
+def prefix(word,requested_limit):
+
+    requested_limit = int(requested_limit)
+    if len(word) < 1 or requested_limit <= 0:
+        return []
+
+    #### Without a term index, fall back to a (slower) query of the terms table
+    if term_index is None:
+        cursor = get_connection().cursor()
+        cursor.execute("SELECT term FROM terms WHERE term LIKE ? ESCAPE '\\' ORDER BY length(term),term LIMIT ?",
+                       (escape_like(word) + '%', requested_limit))
+        return [ row[0] for row in cursor.fetchall() ]
+
+    term_ids = term_index.get_prefix_matches(word, requested_limit)
+    return [ term_index.get_term(term_id) for term_id in term_ids ]
+
+
+def autofuzzy(word,requested_limit):
+
+    requested_limit = int(requested_limit)
+
+    #### Complete the word as a prefix first, then fill up with terms that are close to it
+    terms = prefix(word, requested_limit)
+    if len(terms) < requested_limit:
+        found_terms = set(terms)
+        for term in fuzzy(word, requested_limit):
+            if term not in found_terms:
+                terms.append(term)
+                if len(terms) >= requested_limit:
+                    break
+    return terms
+
+
+def fuzzy(word,requested_limit):
+
+    #### Fuzzy matching needs the term index
+    if fuzzy_matcher is None:
+        return []
+
+    term_ids = fuzzy_matcher.get_matches(word, int(requested_limit))
+    return [ term_index.get_term(term_id) for term_id in term_ids ]
+
+
 def get_nodes_like(word,requested_limit):
 
     debug = False
@@ -34,103 +144,72 @@ def get_nodes_like(word,requested_limit):
     requested_limit = int(requested_limit)
 
     values = []
-    n_values = 0
 
     if len(word) < 2:
         return values
 
-    floor = word[:-1]
-    ceiling = floor + 'zz'
+    #### Without a term index, fall back to (slower) queries of the terms table
+    if term_index is None:
+        return get_nodes_like_from_database(word, requested_limit)
 
     #### Get a list of matching node names that begin with these letters
-    if debug:
-        print(f"INFO: Query 1")
-    #cursor.execute("SELECT term FROM term WHERE term LIKE \"%s%%\" ORDER BY length(term),term LIMIT %s" % (word,1000))
-    cursor.execute(f"SELECT term FROM terms WHERE term > \"{floor}\" AND term < \"{ceiling}\" AND term LIKE \"{word}%%\" ORDER BY length(term),term LIMIT {requested_limit}")
-    rows = cursor.fetchall()
-    values_dict = {}
-    for row in rows:
-        term = row[0]
-        if term.upper() not in values_dict:
-            if debug:
-                print(f"    - {term}")
-            properties = { "curie": '??', "name": term, "type": '??' }
-            values.append(properties)
-            values_dict[term.upper()] = 1
-            n_values += 1
-            if n_values >= requested_limit:
-                break
+    term_ids = term_index.get_prefix_matches(word, requested_limit)
     t1 = timeit.default_timer()
     if debug:
-        print(f"INFO: Query 1 in {t1-t0} sec")
+        print(f"INFO: Found {len(term_ids)} prefix matches in {t1-t0} sec")
 
     #### If we haven't reached the limit yet, add a list of matching terms that contain this string
-    if n_values < requested_limit:
+    if len(term_ids) < requested_limit:
+        term_ids += term_index.get_substring_matches(word, requested_limit - len(term_ids), exclude_ids=set(term_ids))
+        t2 = timeit.default_timer()
         if debug:
-            print(f"INFO: Query 2")
-
-        #### See if there is a cached entry already
-        word_part = word
-        found_fragment = None
-        while len(word_part) > 2:
-            cursor.execute(f"SELECT rowid, fragment FROM cached_fragments WHERE fragment == \"{word_part}\"")
-            rows = cursor.fetchall()
-            if len(rows) > 0:
-                fragment_id = rows[0][0]
-                found_fragment = rows[0][1]
-                break
-            word_part = word_part[:-1]
-
-        if found_fragment:
-            if debug:
-                print(f"Found matching fragment {found_fragment} as fragment_id {fragment_id}")
-
-            cursor.execute(f"SELECT term FROM cached_fragment_terms WHERE fragment_id = {fragment_id} AND term LIKE \"%%{word}%%\"")
-            rows = cursor.fetchall()
+            print(f"INFO: Found {len(term_ids)} prefix and substring matches in {t2-t1} sec")
 
-            for row in rows:
-                term = row[0]
-                if term.upper() not in values_dict:
+    for term_id in term_ids:
+        values.append(get_node_properties(term_index.get_term(term_id), term_index.get_term_concept(term_id)))
 
-                    if n_values < requested_limit:
-                        if debug:
-                            print(f"    - {term}")
-                        properties = { "curie": '??', "name": term, "type": '??' }
-                        values.append(properties)
-                        n_values += 1
+    return(values)
 
 
-        if found_fragment is None:
+def get_nodes_like_from_database(word,requested_limit):
 
-            #### Cache this fragment in the database
-            cursor.execute("INSERT INTO cached_fragments(fragment) VALUES(?)", (word,))
-            fragment_id = cursor.lastrowid
-            if debug:
-                print(f"fragment_id = {fragment_id}")
+    values = []
+    values_dict = {}
 
-            #### Execute an expensive LIKE query
-            cursor.execute("SELECT term FROM terms WHERE term LIKE \"%%%s%%\" ORDER BY length(term),term LIMIT %s" % (word,10000))
-            rows = cursor.fetchall()
+    #### Get a list of matching node names that begin with these letters
+    floor = word[:-1]
+    ceiling = floor + 'zz'
+    cursor = get_connection().cursor()
+    columns = [ row[1] for row in cursor.execute("PRAGMA table_info(terms)") ]
+    concept_columns = 'preferred_curie, preferred_name, preferred_category' if 'preferred_curie' in columns else 'NULL, NULL, NULL'
+    cursor.execute(f"SELECT term, {concept_columns} FROM terms WHERE term > ? AND term < ? AND term LIKE ? ESCAPE '\\' ORDER BY length(term),term LIMIT ?",
+                   (floor, ceiling, escape_like(word) + '%', requested_limit))
+    rows = cursor.fetchall()
 
-            for row in rows:
-                term = row[0]
-                if term.upper() not in values_dict:
+    #### If we haven't reached the limit yet, add a list of matching terms that contain this string
+    if len(rows) < requested_limit:
+        cursor.execute(f"SELECT term, {concept_columns} FROM terms WHERE term LIKE ? ESCAPE '\\' ORDER BY length(term),term LIMIT ?",
+                       ('%' + escape_like(word) + '%', requested_limit * 2))
+        rows += cursor.fetchall()
 
-                    if n_values < requested_limit:
-                        if debug:
-                            print(f"    - {term}")
-                        properties = { "curie": '??', "name": term, "type": '??' }
-                        values.append(properties)
-                        n_values += 1
+    for row in rows:
+        term = row[0]
+        if term.upper() not in values_dict:
+            values.append(get_node_properties(term, row[1:] if row[1] is not None else None))
+            values_dict[term.upper()] = 1
+            if len(values) >= requested_limit:
+                break
 
-                    values_dict[term.upper()] = 1
-                    cursor.execute("INSERT INTO cached_fragment_terms(fragment_id, term) VALUES(?,?)", (fragment_id, term,))
-            conn.commit()
+    return(values)
 
-        t2 = timeit.default_timer()
-        if debug:
-            print(f"INFO: Query 2 in {t2-t1} sec")
 
+#### Return the completion of a term, with the preferred curie, name and category of the concept it resolves to (if any)
+def get_node_properties(term, concept):
+    if concept is None:
+        return { "curie": None, "name": term, "type": None, "preferred_name": None }
+    preferred_curie, preferred_name, preferred_category = concept
+    return { "curie": preferred_curie, "name": term, "type": preferred_category, "preferred_name": preferred_name }
 
-    return(values)
 
+def escape_like(word):
+    return word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
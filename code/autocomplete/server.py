@@ -1,113 +1,120 @@
 import tornado.ioloop
 import tornado.web
+import tornado.httpserver
 import os
-#import sqlite3
 import json
 import sys
-import rtxcomplete
+import threading
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import rtxcomplete
 
-#class MainHandler(tornado.web.RequestHandler):
-#    def get(self):
-#        self.write("Hello, world")
 #print __file__
 
 root = os.path.dirname(os.path.abspath(__file__))
 rtxcomplete.load()
-#conn = sqlite3.connect('dict.db')
-#conn.enable_load_extension(True)
-#conn.load_extension("./spellfix")
-#cursor = conn.cursor()
 
-class autoSearch(tornado.web.RequestHandler):
-
-    def get(self, arg,word=None):
-        #print "match auto"
+#### Lookups run on a pool of threads so that a slow one does not stall the IOLoop (and every other user's typeahead)
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('RTXCOMPLETE_WORKERS', 8)))
+
+#### How often (in seconds) to check whether the database or its term index has been replaced, and reload if so
+reload_check_interval = int(os.environ.get('RTXCOMPLETE_RELOAD_CHECK_INTERVAL', 60))
+
+
+class ResponseCache:
+    """
+    A bounded LRU cache of lookup results keyed by the endpoint, word and limit, so that hot prefixes (the first few
+    keystrokes that every user types) are answered on the IOLoop without a trip through the executor. The cache is
+    emptied whenever rtxcomplete reloads the database, and results looked up before a reload are not stored
+    """
+
+    def __init__(self, size=20000):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_count = rtxcomplete.load_count
+        self.n_hits = 0
+        self.n_misses = 0
+
+    def _clear_if_reloaded(self):
+        if self._load_count != rtxcomplete.load_count:
+            self._entries.clear()
+            self._load_count = rtxcomplete.load_count
+
+    def get(self, key):
+        with self._lock:
+            self._clear_if_reloaded()
+            result = self._entries.get(key)
+            if result is None:
+                self.n_misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.n_hits += 1
+            return result
+
+    def put(self, key, result, load_count):
+        with self._lock:
+            self._clear_if_reloaded()
+            if load_count != self._load_count:
+                return
+            self._entries[key] = result
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+response_cache = ResponseCache()
+
+
+class lookupHandler(tornado.web.RequestHandler):
+    """
+    Base class for the jsonp lookup endpoints: subclasses name their endpoint and the rtxcomplete function to call
+    """
+
+    endpoint = None
+    lookup = None
+
+    async def get(self, arg, word=None):
+        if self.lookup is None:
+            raise tornado.web.HTTPError(404)
         try:
-            limit = self.get_argument("limit")
+            limit = int(self.get_argument("limit"))
             word = self.get_argument("word")
             callback = self.get_argument("callback") #jsonp
 
-            result = rtxcomplete.prefix(word,limit)
+            key = (self.endpoint, word, limit)
+            result = response_cache.get(key)
+            if result is None:
+                load_count = rtxcomplete.load_count
+                result = json.dumps(await tornado.ioloop.IOLoop.current().run_in_executor(executor, self.lookup, word, limit))
+                response_cache.put(key, result, load_count)
 
-            result = callback+"("+json.dumps(result)+");" #jsonp
-            #result = json.dumps(result) #typeahead
-            
-            self.write(result)
-            
-        except:
-            print(sys.exc_info()[:])
-            traceback.print_tb(sys.exc_info()[-1])
-            #print sys.exc_info()[2]
-            self.write("error")
+            self.write(callback+"("+result+");") #jsonp
 
-class fuzzySearch(tornado.web.RequestHandler):
-    def get(self, arg,word=None):
-        #print "matched fuzzy"
-        try:
-            limit = self.get_argument("limit")
-            word = self.get_argument("word")
-            callback = self.get_argument("callback")
-            #print word
-            #cursor.execute("SELECT word FROM spell WHERE word MATCH \"" + word + "\" LIMIT " + limit)
-            #cursor.execute("SELECT word FROM spell WHERE word MATCH \"" + word + "*\" LIMIT " + limit)
-            result = rtxcomplete.fuzzy(word,limit);
-            #rows = cursor.fetchall()
-            #print type(rows)
-            result = callback+"("+json.dumps(result)+");"
-            #print arg, result
-            #if (len(rows) > 0):
-            self.write(result)
-            #else:
-            #self.write(callback+"("+json.dumps([["NO SUGGESTIONS"]])+");")
-            #self.write(json.dumps(rows))
-        except:
+        except Exception:
             print(sys.exc_info()[:])
             traceback.print_tb(sys.exc_info()[-1])
-            #print sys.exc_info()[:]
             self.write("error")
 
-class autofuzzySearch(tornado.web.RequestHandler):
-    def get(self, arg,word=None):
-        #print "matched autofuzzy"
-        try:
-            limit = self.get_argument("limit")
-            word = self.get_argument("word")
-            callback = self.get_argument("callback")
-            #print word
-            #cursor.execute("SELECT word FROM spell WHERE word MATCH \"" + word + "\" LIMIT " + limit)
-            #cursor.execute("SELECT word FROM spell WHERE word MATCH \"" + word + "*\" LIMIT " + limit)
-            result = rtxcomplete.autofuzzy(word,limit);
-            #rows = cursor.fetchall()
-            #print type(rows)
-            result = callback+"("+json.dumps(result)+");"
-            #print arg, result
-            #if (len(rows) > 0):
-            self.write(result)
-            #else:
-            #self.write(callback+"("+json.dumps([["NO SUGGESTIONS"]])+");")
-            #self.write(json.dumps(rows))
-        except:
-            print(sys.exc_info()[:])
-            traceback.print_tb(sys.exc_info()[-1])
-            #print sys.exc_info()[:]
-            self.write("error")
 
+class autoSearch(lookupHandler):
+    endpoint = 'auto'
+    lookup = staticmethod(rtxcomplete.prefix)
 
-class nodesLikeSearch(tornado.web.RequestHandler):
-    def get(self, arg,word=None):
-        #try:
-        if 1 == 1:
-            limit = self.get_argument("limit")
-            word = self.get_argument("word")
-            callback = self.get_argument("callback")
-            result = rtxcomplete.get_nodes_like(word,limit);
-            result = callback+"("+json.dumps(result)+");"
-            self.write(result)
-        #except:
-        #    print(sys.exc_info()[:])
-        #    traceback.print_tb(sys.exc_info()[-1])
-        #    self.write("error")
+
+class fuzzySearch(lookupHandler):
+    endpoint = 'fuzzy'
+    lookup = staticmethod(rtxcomplete.fuzzy)
+
+
+class autofuzzySearch(lookupHandler):
+    endpoint = 'autofuzzy'
+    lookup = staticmethod(rtxcomplete.autofuzzy)
+
+
+class nodesLikeSearch(lookupHandler):
+    endpoint = 'nodeslike'
+    lookup = staticmethod(rtxcomplete.get_nodes_like)
 
 
 class defineSearch(tornado.web.RequestHandler):
@@ -162,4 +169,7 @@ if __name__ == "__main__":
             })
         https_server.listen(443)
 
+    #### Reloading (and possibly building a term index) is done on the executor, so as not to stall the IOLoop
+    tornado.ioloop.PeriodicCallback(lambda: executor.submit(rtxcomplete.reload_if_changed), reload_check_interval * 1000).start()
+
     tornado.ioloop.IOLoop.current().start()
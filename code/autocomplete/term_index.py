@@ -0,0 +1,454 @@
+#!/bin/env python3
+#
+# Class to build and read a memory-mapped index of the autocomplete terms for prefix and substring lookups
+#
+import sys
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+import os
+import json
+import shutil
+import sqlite3
+import argparse
+import threading
+
+import numpy as np
+
+
+class TermIndex:
+    """
+    An immutable index of all autocomplete terms (node names and curies), written by create_load_db.py next to the
+    autocomplete database as a directory of .npy arrays that are memory-mapped when loaded:
+      - terms are numbered by rank (shorter first, then more popular, i.e. shared by more nodes, then alphabetically),
+        so that for any set of matching term ids, the smallest ids are the best completions
+      - the terms themselves are stored in rank order in a byte blob plus offsets, along with the first id of each
+        term length (so terms of a given range of lengths are a range of ids)
+      - prefix lookups binary-search a list of term ids sorted by (upper case) term; since the matches of a short
+        prefix can number in the millions, the best few matches of every prefix with many matches are precomputed
+      - substring lookups intersect the (rank-ordered) posting lists of the byte trigrams of the substring, a chunk at
+        a time, checking each candidate until enough matches are found. Two-byte substrings are looked up in a table
+        of the best matches of each byte bigram
+      - each term can be annotated with the concept it resolves to (preferred curie, name and category, as given by
+        the NodeSynonymizer), so that a completion needs no further lookup; the concepts are numbered and their strings
+        are stored once each in a string table (-1 for none)
+    """
+
+    version = 3
+    array_names = [ 'term_offsets', 'term_blob', 'length_starts', 'prefix_order',
+                    'heavy_prefix_ranges', 'heavy_prefix_offsets', 'heavy_prefix_terms',
+                    'trigram_codes', 'trigram_offsets', 'trigram_terms',
+                    'bigram_codes', 'bigram_offsets', 'bigram_terms',
+                    'string_offsets', 'string_blob', 'concept_curies', 'concept_names', 'concept_categories', 'term_concepts' ]
+
+    # Prefixes matching more than this many terms get their best matches precomputed, this many of them
+    heavy_prefix_size = 2048
+    heavy_prefix_n_terms = 100
+
+    # Number of best matches kept for each bigram
+    bigram_n_terms = 200
+
+    # Number of candidate terms to take from the shortest trigram posting list at a time
+    candidate_chunk_size = 4096
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, arrays):
+        # Plain array views of any memory-mapped arrays, since indexing a numpy memmap is comparatively slow
+        for array_name in self.array_names:
+            setattr(self, array_name, np.asarray(arrays[array_name]))
+        self.n_terms = len(self.term_offsets) - 1
+        self._term_bytes = memoryview(self.term_blob)
+
+
+    # ############################################################################################
+    @staticmethod
+    def get_index_path(database_path):
+        return f"{database_path}.term_index"
+
+
+    # ############################################################################################
+    # Return the (shared, per-process) index for this database, or None if there isn't one that goes with it
+    @classmethod
+    def get(cls, database_path):
+
+        index_path = cls.get_index_path(database_path)
+        try:
+            cache_key = (os.stat(f"{index_path}/metadata.json").st_mtime_ns, os.path.getsize(database_path))
+        except OSError:
+            return None
+        with cls._instances_lock:
+            cached = cls._instances.get(index_path)
+            if cached is not None and cached[0] == cache_key:
+                return cached[1]
+
+        try:
+            with open(f"{index_path}/metadata.json") as infile:
+                metadata = json.load(infile)
+            if metadata.get('version') != cls.version or metadata.get('database_size') != cache_key[1]:
+                eprint(f"WARNING: Term index {index_path} is out of date with respect to {database_path}; not using it")
+                index = None
+            else:
+                index = cls({ array_name: np.load(f"{index_path}/{array_name}.npy", mmap_mode='r', allow_pickle=False) for array_name in cls.array_names })
+        except (OSError, ValueError) as error:
+            eprint(f"WARNING: Unable to load term index {index_path}: {error}")
+            index = None
+
+        with cls._instances_lock:
+            cls._instances[index_path] = (cache_key, index)
+        return index
+
+
+    # ############################################################################################
+    # Build the index from a list of distinct (case-insensitively) terms, the number of nodes that have each term and
+    # optionally the (preferred curie, name, category) of the concept of each term (or None), and write it next to the
+    # database
+    @classmethod
+    def build(cls, terms, popularity, database_path, concepts=None):
+
+        print(f"INFO: Building term index for {len(terms)} terms")
+        n_terms = len(terms)
+        arrays = {}
+
+        # Rank the terms
+        uc_terms = [ term.upper() for term in terms ]
+        alphabetical_order = sorted(range(n_terms), key=uc_terms.__getitem__)
+        alphabetical_ranks = np.empty(n_terms, dtype=np.int64)
+        alphabetical_ranks[alphabetical_order] = np.arange(n_terms, dtype=np.int64)
+        lengths = np.fromiter(( len(term) for term in terms ), dtype=np.int64, count=n_terms)
+        ranked_order = np.lexsort(( alphabetical_ranks, -np.asarray(popularity, dtype=np.int64), lengths ))
+        term_ids = np.empty(n_terms, dtype=np.int64)
+        term_ids[ranked_order] = np.arange(n_terms, dtype=np.int64)
+
+        # The terms, in rank order
+        encoded_terms = [ terms[i].encode('utf-8') for i in ranked_order ]
+        arrays['term_offsets'] = cls._get_offsets(encoded_terms)
+        arrays['term_blob'] = np.frombuffer(b''.join(encoded_terms), dtype=np.uint8)
+        del encoded_terms
+        arrays['length_starts'] = np.searchsorted(lengths[ranked_order], np.arange(lengths.max(initial=0) + 2)).astype(np.int64)
+
+        # Prefix lookups
+        arrays['prefix_order'] = term_ids[alphabetical_order].astype(np.uint32)
+        sorted_uc_terms = [ uc_terms[i] for i in alphabetical_order ]
+        del alphabetical_order, alphabetical_ranks
+        cls._add_heavy_prefix_arrays(arrays, sorted_uc_terms)
+        del sorted_uc_terms
+        print(f"INFO: Precomputed the best matches of {len(arrays['heavy_prefix_ranges'])} prefixes with more than {cls.heavy_prefix_size} matches")
+
+        # Substring lookups
+        get_encoded_uc_terms = lambda start, end: [ uc_terms[i].encode('utf-8') for i in ranked_order[start:end] ]
+        cls._add_ngram_arrays(arrays, 'trigram', get_encoded_uc_terms, n_terms, 3)
+        print(f"INFO: Indexed {len(arrays['trigram_codes'])} distinct trigrams ({len(arrays['trigram_terms'])} postings)")
+        cls._add_ngram_arrays(arrays, 'bigram', get_encoded_uc_terms, n_terms, 2, max_terms=cls.bigram_n_terms)
+        print(f"INFO: Indexed {len(arrays['bigram_codes'])} distinct bigrams")
+
+        # Concept annotations
+        cls._add_concept_arrays(arrays, concepts, ranked_order)
+        print(f"INFO: Annotated {int(np.count_nonzero(arrays['term_concepts'] >= 0))} terms with {len(arrays['concept_curies'])} distinct concepts")
+
+        # Write everything into a new directory and then swap it in place of any previous one
+        index_path = cls.get_index_path(database_path)
+        new_index_path = f"{index_path}.{os.getpid()}.tmp"
+        shutil.rmtree(new_index_path, ignore_errors=True)
+        os.makedirs(new_index_path)
+        for array_name in cls.array_names:
+            np.save(f"{new_index_path}/{array_name}.npy", arrays[array_name], allow_pickle=False)
+        with open(f"{new_index_path}/metadata.json", 'w') as outfile:
+            json.dump({ 'version': cls.version, 'n_terms': n_terms, 'database_size': os.path.getsize(database_path) }, outfile)
+        old_index_path = f"{index_path}.{os.getpid()}.old"
+        if os.path.exists(index_path):
+            os.rename(index_path, old_index_path)
+        os.rename(new_index_path, index_path)
+        shutil.rmtree(old_index_path, ignore_errors=True)
+        print(f"INFO: Wrote term index to {index_path}")
+
+
+    # ############################################################################################
+    # Build the index from the terms table of an existing autocomplete database
+    @classmethod
+    def build_from_database(cls, database_path):
+        connection = sqlite3.connect(database_path)
+        columns = [ row[1] for row in connection.execute("PRAGMA table_info(terms)") ]
+        n_nodes_column = 'n_nodes' if 'n_nodes' in columns else '1'
+        concept_columns = 'preferred_curie, preferred_name, preferred_category' if 'preferred_curie' in columns else 'NULL, NULL, NULL'
+        terms, popularity, concepts = [], [], []
+        for term, n_nodes, preferred_curie, preferred_name, preferred_category in connection.execute(f"SELECT term, {n_nodes_column}, {concept_columns} FROM terms ORDER BY rowid"):
+            terms.append(term)
+            popularity.append(n_nodes)
+            concepts.append((preferred_curie, preferred_name, preferred_category) if preferred_curie is not None else None)
+        connection.close()
+        cls.build(terms, popularity, database_path, concepts)
+
+
+    # ############################################################################################
+    @staticmethod
+    def _get_offsets(encoded_strings):
+        offsets = np.zeros(len(encoded_strings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([ len(encoded_string) for encoded_string in encoded_strings ], dtype=np.int64)
+        return offsets
+
+
+    # ############################################################################################
+    # Number the distinct concepts, store their strings once each, and store the concept of each term (by id)
+    @classmethod
+    def _add_concept_arrays(cls, arrays, concepts, ranked_order):
+
+        strings = {}
+        def get_string_id(string):
+            if string is None:
+                return -1
+            string_id = strings.get(string)
+            if string_id is None:
+                string_id = strings[string] = len(strings)
+            return string_id
+
+        concept_ids = {}
+        term_concepts = np.full(len(ranked_order), -1, dtype=np.int32)
+        if concepts is not None:
+            for term_id, i_term in enumerate(ranked_order.tolist()):
+                concept = concepts[i_term]
+                if concept is None:
+                    continue
+                concept_id = concept_ids.get(concept)
+                if concept_id is None:
+                    concept_id = concept_ids[concept] = len(concept_ids)
+                term_concepts[term_id] = concept_id
+
+        concept_strings = np.array([ [ get_string_id(string) for string in concept ] for concept in concept_ids ], dtype=np.int32).reshape(-1, 3)
+        encoded_strings = [ string.encode('utf-8') for string in strings ]
+        arrays['string_offsets'] = cls._get_offsets(encoded_strings)
+        arrays['string_blob'] = np.frombuffer(b''.join(encoded_strings), dtype=np.uint8)
+        arrays['concept_curies'] = np.ascontiguousarray(concept_strings[:, 0])
+        arrays['concept_names'] = np.ascontiguousarray(concept_strings[:, 1])
+        arrays['concept_categories'] = np.ascontiguousarray(concept_strings[:, 2])
+        arrays['term_concepts'] = term_concepts
+
+
+    # ############################################################################################
+    # For each prefix matching more than heavy_prefix_size terms, store the best matches under the range of
+    # prefix_order that it matches. Prefixes are extended one character at a time, but only those of heavy prefixes
+    # are examined, and each child prefix's range is found by binary search
+    @classmethod
+    def _add_heavy_prefix_arrays(cls, arrays, sorted_uc_terms):
+
+        prefix_order = arrays['prefix_order']
+        heavy_prefixes = {}
+        ranges = [ ('', 0, len(sorted_uc_terms)) ]
+        while len(ranges) > 0:
+            prefix, lo, hi = ranges.pop()
+            position = lo
+            while position < hi:
+                if len(sorted_uc_terms[position]) == len(prefix):  # The term that is the prefix itself
+                    position += 1
+                    continue
+                child_prefix = sorted_uc_terms[position][:len(prefix) + 1]
+                child_hi = cls._bisect_prefix_end(sorted_uc_terms.__getitem__, child_prefix, position, hi)
+                if child_hi - position > cls.heavy_prefix_size:
+                    if (position, child_hi) not in heavy_prefixes:
+                        best_terms = np.partition(prefix_order[position:child_hi], cls.heavy_prefix_n_terms)[:cls.heavy_prefix_n_terms]
+                        heavy_prefixes[(position, child_hi)] = np.sort(best_terms)
+                    ranges.append((child_prefix, position, child_hi))
+                position = child_hi
+
+        keys = sorted(heavy_prefixes)
+        arrays['heavy_prefix_ranges'] = np.array([ lo * (len(sorted_uc_terms) + 1) + hi for lo, hi in keys ], dtype=np.int64)
+        arrays['heavy_prefix_offsets'] = np.arange(len(keys) + 1, dtype=np.int64) * cls.heavy_prefix_n_terms
+        arrays['heavy_prefix_terms'] = np.concatenate([ heavy_prefixes[key] for key in keys ]).astype(np.uint32) if len(keys) > 0 else np.zeros(0, dtype=np.uint32)
+
+
+    # ############################################################################################
+    # Store, for each byte n-gram (n being 2 or 3) of the (upper case, encoded) terms returned by
+    # get_encoded_uc_terms(start, end), the ids of the terms containing it, in rank order (only the first max_terms of
+    # them, if given)
+    @classmethod
+    def _add_ngram_arrays(cls, arrays, kind, get_encoded_uc_terms, n_terms, n, max_terms=None, chunk_size=250000):
+
+        # Make the distinct (n-gram << 32 | term id) keys a chunk of terms at a time, then sort them all at once
+        key_chunks = []
+        for start in range(0, n_terms, chunk_size):
+            chunk = get_encoded_uc_terms(start, start + chunk_size)
+            offsets = cls._get_offsets(chunk)
+            if offsets[-1] < n:
+                continue
+            chunk_bytes = np.frombuffer(b''.join(chunk), dtype=np.uint8)
+            del chunk
+            n_positions = len(chunk_bytes) - n + 1
+            codes = np.zeros(n_positions, dtype=np.uint32)
+            for position in range(n):
+                codes |= chunk_bytes[position:n_positions + position].astype(np.uint32) << np.uint32(8 * (n - 1 - position))
+            position_terms = np.repeat(np.arange(start, start + len(offsets) - 1, dtype=np.uint32), np.diff(offsets))[:n_positions]
+            is_whole = np.arange(n, n_positions + n, dtype=np.int64) <= offsets[1:][position_terms - np.uint32(start)]
+            keys = codes[is_whole].astype(np.uint64) << np.uint64(32) | position_terms[is_whole]
+            del codes, position_terms, is_whole
+            key_chunks.append(np.unique(keys))
+        keys = np.concatenate(key_chunks) if len(key_chunks) > 0 else np.zeros(0, dtype=np.uint64)
+        del key_chunks
+        keys.sort()
+
+        codes = (keys >> np.uint64(32)).astype(np.uint32)
+        term_ids = (keys & np.uint64(0xffffffff)).astype(np.uint32)
+        del keys
+        first_positions = cls._get_group_starts(codes)
+        if max_terms is not None:
+            is_kept = np.arange(len(codes)) - np.repeat(first_positions, np.diff(np.append(first_positions, len(codes)))) < max_terms
+            codes, term_ids = codes[is_kept], term_ids[is_kept]
+            first_positions = cls._get_group_starts(codes)
+        arrays[f"{kind}_terms"] = term_ids
+        arrays[f"{kind}_codes"] = codes[first_positions]
+        arrays[f"{kind}_offsets"] = np.append(first_positions, len(codes)).astype(np.int64)
+
+
+    # ############################################################################################
+    # Return the positions in a sorted array where each run of equal values starts
+    @staticmethod
+    def _get_group_starts(sorted_values):
+        if len(sorted_values) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(np.concatenate(( [ True ], sorted_values[1:] != sorted_values[:-1] )))
+
+
+    # ############################################################################################
+    # Return the end of the range [lo, hi) of sorted keys (as fetched by get_key) that start with the prefix, given
+    # that the range starts at lo
+    @staticmethod
+    def _bisect_prefix_end(get_key, prefix, lo, hi):
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = get_key(mid)
+            if key[:len(prefix)] <= prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+    # ############################################################################################
+    def get_term(self, term_id):
+        start, end = self.term_offsets[term_id:term_id + 2].tolist()
+        return bytes(self._term_bytes[start:end]).decode('utf-8')
+
+
+    # ############################################################################################
+    # Return the string with this id (None for -1)
+    def get_string(self, string_id):
+        if string_id < 0:
+            return None
+        start, end = self.string_offsets[string_id:string_id + 2].tolist()
+        return bytes(self.string_blob[start:end]).decode('utf-8')
+
+
+    # ############################################################################################
+    # Return the (preferred curie, name, category) of the concept that the term resolves to, or None if it has none
+    def get_term_concept(self, term_id):
+        concept_id = int(self.term_concepts[term_id])
+        if concept_id < 0:
+            return None
+        return ( self.get_string(int(self.concept_curies[concept_id])), self.get_string(int(self.concept_names[concept_id])),
+                 self.get_string(int(self.concept_categories[concept_id])) )
+
+
+    # ############################################################################################
+    # Return the range of ids [lo, hi) of the terms whose lengths are from min_length to max_length
+    def get_length_range(self, min_length, max_length):
+        n_lengths = len(self.length_starts)
+        lo = int(self.length_starts[min(max(min_length, 0), n_lengths - 1)])
+        hi = int(self.length_starts[min(max(max_length + 1, 0), n_lengths - 1)])
+        return lo, max(lo, hi)
+
+
+    # ############################################################################################
+    # Return the (rank-ordered) ids of the terms containing the trigram with this code (in upper case UTF-8 bytes), or
+    # None if there are none
+    def get_trigram_terms(self, code):
+        code_position = np.searchsorted(self.trigram_codes, code)
+        if code_position >= len(self.trigram_codes) or self.trigram_codes[code_position] != code:
+            return None
+        return self.trigram_terms[self.trigram_offsets[code_position]:self.trigram_offsets[code_position + 1]]
+
+
+    # ############################################################################################
+    def _get_sorted_uc_term(self, position):
+        return self.get_term(self.prefix_order[position]).upper()
+
+
+    # ############################################################################################
+    # Return the ids of the best (at most limit) terms that start with the word (case-insensitively), best first
+    def get_prefix_matches(self, word, limit):
+
+        uc_word = word.upper()
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._get_sorted_uc_term(mid) < uc_word:
+                lo = mid + 1
+            else:
+                hi = mid
+        hi = self._bisect_prefix_end(self._get_sorted_uc_term, uc_word, lo, self.n_terms)
+        if hi - lo <= limit:
+            return np.sort(self.prefix_order[lo:hi]).tolist()
+
+        if hi - lo > self.heavy_prefix_size and limit <= self.heavy_prefix_n_terms:
+            position = np.searchsorted(self.heavy_prefix_ranges, lo * (self.n_terms + 1) + hi)
+            if position < len(self.heavy_prefix_ranges) and self.heavy_prefix_ranges[position] == lo * (self.n_terms + 1) + hi:
+                return self.heavy_prefix_terms[self.heavy_prefix_offsets[position]:self.heavy_prefix_offsets[position] + limit].tolist()
+
+        return np.sort(np.partition(self.prefix_order[lo:hi], limit)[:limit]).tolist()
+
+
+    # ############################################################################################
+    # Return the ids of the best (at most limit) terms that contain the word (case-insensitively) other than those in
+    # exclude_ids, best first. The word must be at least 2 bytes long (in UTF-8); for a 2-byte word, only the best
+    # bigram_n_terms terms containing it are considered
+    def get_substring_matches(self, word, limit, exclude_ids=None):
+
+        uc_word = word.upper()
+        encoded_word = uc_word.encode('utf-8')
+        if len(encoded_word) < 2 or limit <= 0:
+            return []
+        exclude_ids = exclude_ids if exclude_ids is not None else set()
+
+        if len(encoded_word) == 2:
+            code_position = np.searchsorted(self.bigram_codes, encoded_word[0] << 8 | encoded_word[1])
+            if code_position >= len(self.bigram_codes) or self.bigram_codes[code_position] != (encoded_word[0] << 8 | encoded_word[1]):
+                return []
+            term_ids = self.bigram_terms[self.bigram_offsets[code_position]:self.bigram_offsets[code_position + 1]].tolist()
+            return [ term_id for term_id in term_ids if term_id not in exclude_ids ][:limit]
+
+        # Get the posting list of each trigram in the word, shortest first
+        posting_lists = []
+        for position in range(len(encoded_word) - 2):
+            posting_list = self.get_trigram_terms(encoded_word[position] << 16 | encoded_word[position + 1] << 8 | encoded_word[position + 2])
+            if posting_list is None:
+                return []
+            posting_lists.append(posting_list)
+        posting_lists.sort(key=len)
+
+        # Go through the shortest list a chunk at a time (in rank order), keeping the terms in all the other lists
+        # that really contain the word
+        matches = []
+        shortest_list = posting_lists[0]
+        for start in range(0, len(shortest_list), self.candidate_chunk_size):
+            candidates = np.asarray(shortest_list[start:start + self.candidate_chunk_size])
+            for posting_list in posting_lists[1:]:
+                if len(candidates) == 0:
+                    break
+                positions = np.searchsorted(posting_list, candidates)
+                positions[positions == len(posting_list)] = 0
+                candidates = candidates[posting_list[positions] == candidates]
+            for term_id in candidates.tolist():
+                if term_id not in exclude_ids and uc_word in self.get_term(term_id).upper():
+                    matches.append(term_id)
+                    if len(matches) >= limit:
+                        return matches
+        return matches
+
+
+# ############################################################################################
+# Command line interface, to (re)build the index for an existing autocomplete database
+def main():
+    parser = argparse.ArgumentParser(description="Builds the term index for an autocomplete database")
+    parser.add_argument("database", type=str, help="Autocomplete database path")
+    arguments = parser.parse_args()
+    TermIndex.build_from_database(arguments.database)
+
+if __name__ == "__main__": main()
@@ -11,11 +11,14 @@ synonymizer_name=$2
 
 cd ${arax_dir}/NodeSynonymizer
 scp ${synonymizer_name} rtxconfig@arax.ncats.io:${remote_destination}
+scp -r ${synonymizer_name}.concept_index rtxconfig@arax.ncats.io:${remote_destination}
+scp ${synonymizer_name}.category_expansions.json rtxconfig@arax.ncats.io:${remote_destination}
 scp kg2_node_info.tsv rtxconfig@arax.ncats.io:${remote_destination}
 scp kg2_equivalencies.tsv rtxconfig@arax.ncats.io:${remote_destination}
 scp kg2_synonyms.json rtxconfig@arax.ncats.io:${remote_destination}
 scp Problems.tsv rtxconfig@arax.ncats.io:${remote_destination}
 scp Exceptions.txt rtxconfig@arax.ncats.io:${remote_destination}
-scp sri_node_normalizer_curie_cache.pickle rtxconfig@arax.ncats.io:${remote_destination}
+scp sri_node_normalizer_curie_cache.sqlite rtxconfig@arax.ncats.io:${remote_destination}
 scp sri_node_normalizer_requests_cache.sqlite rtxconfig@arax.ncats.io:${remote_destination}
-scp autocomplete.sqlite rtxconfig@arax.ncats.io:${remote_destination}
\ No newline at end of file
+scp autocomplete.sqlite rtxconfig@arax.ncats.io:${remote_destination}
+scp -r autocomplete.sqlite.term_index rtxconfig@arax.ncats.io:${remote_destination}
\ No newline at end of file